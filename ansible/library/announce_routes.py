@@ -5,10 +5,14 @@ import os
 import yaml
 import re
 import requests
+import threading
 import time
 import ipaddress
 import sys
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
 from ansible.module_utils.basic import *
 
 if sys.version_info.major == 3:
@@ -38,6 +42,15 @@ Options:
     - option-name: path
       description: to figure out the path of topo_{}.yml
       required: False
+
+    - option-name: max_workers
+      description: max number of exabgp processes the routes are sent to concurrently
+      required: False
+
+    - option-name: chunk_size
+      description: max number of routes sent to an exabgp process in one HTTP request, or in one chunk of a streamed
+          request
+      required: False
 '''
 
 EXAMPLES = '''
@@ -64,6 +77,9 @@ LEAF_ASN_START = 64600
 TOR_ASN_START = 65500
 IPV4_BASE_PORT = 5000
 IPV6_BASE_PORT = 6000
+MAX_WORKERS = 8
+CHUNK_SIZE = 1000
+CONVERGENCE_TIMEOUT = 300
 
 # Describe default number of COLOs
 COLO_NUMBER = 30
@@ -127,18 +143,188 @@ def read_topo(topo_name, path):
         return {}
 
 
-def change_routes(action, ptf_ip, port, routes):
+def route_messages(action, routes):
     messages = []
     for prefix, nexthop, aspath in routes:
         if aspath:
             messages.append("{} route {} next-hop {} as-path [ {} ]".format(action, prefix, nexthop, aspath))
         else:
             messages.append("{} route {} next-hop {}".format(action, prefix, nexthop))
+    return messages
+
+
+def get_api_stats(ptf_ip, port, session=None):
+    """Return the counters of the exabgp HTTP API listening on port.
+
+    Returns:
+        dict: Counters of the exabgp HTTP API, None if the HTTP API is too old to report them or to read streamed
+            commands.
+    """
+    url = "http://%s:%d/stats" % (ptf_ip, port)
+    http = session or requests.Session()
+    try:
+        r = http.get(url, timeout=30)
+    finally:
+        if session is None:
+            http.close()
+    if r.status_code == 404:
+        return None
+    assert r.status_code == 200
+    return r.json()
+
+
+def change_routes(action, ptf_ip, port, routes, chunk_size=CHUNK_SIZE, session=None, stream=False):
+    """Send the route changes to the exabgp process listening on port.
+
+    With stream, the commands are posted in one chunked request with a command per line, exabgp starts processing the
+    first commands while the next ones are sent. Otherwise they are posted in chunks of chunk_size over one HTTP
+    connection.
+    """
+    messages = route_messages(action, routes)
     wait_for_http(ptf_ip, port, timeout=60)
     url = "http://%s:%d" % (ptf_ip, port)
-    data = { "commands": ";".join(messages) }
-    r = requests.post(url, data=data, timeout=90)
+    http = session or requests.Session()
+
+    def iter_lines():
+        for i in range(0, len(messages), chunk_size):
+            yield ("\n".join(messages[i:i + chunk_size]) + "\n").encode("utf-8")
+
+    try:
+        if stream:
+            r = http.post(url, data=iter_lines(), headers={"Content-Type": "text/plain"}, timeout=90)
+            assert r.status_code == 200
+        else:
+            for i in range(0, len(messages), chunk_size):
+                data = {"commands": ";".join(messages[i:i + chunk_size])}
+                r = http.post(url, data=data, timeout=90)
+                assert r.status_code == 200
+    finally:
+        if session is None:
+            http.close()
+    return len(messages)
+
+
+def wait_for_convergence(ptf_ip, port, timeout=CONVERGENCE_TIMEOUT, session=None, baseline=None):
+    """Wait till the exabgp process listening on port has acknowledged all the route changes sent to it.
+
+    Fails if exabgp answered errors to route changes, counted since the baseline counters taken before sending them,
+    or since exabgp started.
+
+    Returns:
+        dict: Counters of the exabgp HTTP API, None if the HTTP API can't report the convergence.
+    """
+    url = "http://%s:%d/convergence" % (ptf_ip, port)
+    http = session or requests.Session()
+    try:
+        r = http.get(url, params={"timeout": timeout}, timeout=timeout + 30)
+    finally:
+        if session is None:
+            http.close()
+    if r.status_code == 404:
+        return None
     assert r.status_code == 200
+    stats = r.json()
+    if not stats["converged"]:
+        raise Exception("exabgp on port {} not converged in {}s: {}".format(port, timeout, stats))
+    errors = stats["errors"] - (baseline["errors"] if baseline else 0)
+    if errors:
+        raise Exception("exabgp on port {} failed {} route changes: {}".format(port, errors, stats))
+    return stats
+
+
+class RouteAnnouncer(object):
+    """Announce or withdraw the routes of the exabgp processes in the PTF container.
+
+    The route changes are collected by change_routes() and sent by run(). The changes of an exabgp process are sent
+    in order over one HTTP connection, up to max_workers exabgp processes are updated concurrently. The changes of an
+    exabgp process are done once exabgp has acknowledged all of them.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, chunk_size=CHUNK_SIZE, log=None):
+        self.max_workers = max(int(max_workers), 1)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.log = log
+        self.changes = OrderedDict()
+        self.lock = threading.Lock()
+        self.ports_done = 0
+        self.routes_done = 0
+
+    def change_routes(self, action, ptf_ip, port, routes):
+        self.changes.setdefault((ptf_ip, port), []).append((action, routes))
+
+    def _send(self, key):
+        ptf_ip, port = key
+        start = time.time()
+        session = requests.Session()
+        try:
+            wait_for_http(ptf_ip, port, timeout=60)
+            # The HTTP APIs reporting their counters read streamed commands, the older ones only forms
+            baseline = get_api_stats(ptf_ip, port, session=session)
+            stream = baseline is not None
+            count = 0
+            for action, routes in self.changes[key]:
+                count += change_routes(action, ptf_ip, port, routes, chunk_size=self.chunk_size, session=session,
+                                       stream=stream)
+            stats = wait_for_convergence(ptf_ip, port, session=session, baseline=baseline)
+        finally:
+            session.close()
+        elapsed = time.time() - start
+
+        with self.lock:
+            self.ports_done += 1
+            self.routes_done += count
+            progress = "{}:{} {} routes in {:.2f}s, {}/{} exabgp done, {} routes".format(
+                ptf_ip, port, count, elapsed, self.ports_done, len(self.changes), self.routes_done)
+        if self.log:
+            self.log(progress)
+        result = {"port": port, "routes": count, "seconds": round(elapsed, 3)}
+        if stats:
+            result["updates_per_sec"] = stats["avg_updates_per_sec"]
+        return result
+
+    def run(self):
+        """Send the collected route changes.
+
+        Returns:
+            dict: Number of routes and exabgp processes, time taken and the routes per second.
+        """
+        start = time.time()
+        keys = list(self.changes.keys())
+        if len(keys) > 1 and self.max_workers > 1:
+            pool = ThreadPool(min(len(keys), self.max_workers))
+            try:
+                results = pool.map(self._send, keys)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = [self._send(key) for key in keys]
+        elapsed = time.time() - start
+
+        routes = sum(result["routes"] for result in results)
+        return {
+            "exabgp": len(results),
+            "routes": routes,
+            "seconds": round(elapsed, 3),
+            "routes_per_sec": int(routes / elapsed) if elapsed > 0 else routes,
+            "slowest": max(results, key=lambda result: result["seconds"]) if results else None
+        }
+
+
+def cached_routes(func):
+    """Cache the routes generated by func, the routes only depend on the arguments.
+
+    The same list is returned for the same arguments, it must not be modified.
+    """
+    cache = {}
+
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = func(*args, **kwargs)
+        return cache[key]
+    wrapper.__doc__ = func.__doc__
+    return wrapper
 
 
 # AS path from Leaf router for T0 topology
@@ -253,6 +439,7 @@ def generate_m0_routes(nexthop, colo_number, m0_number, m0_subnet_number, m0_asn
     return []
 
 
+@cached_routes
 def generate_routes(family, podset_number, tor_number, tor_subnet_number,
                     spine_asn, leaf_asn_start, tor_asn_start, nexthop,
                     nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
@@ -367,7 +554,7 @@ def generate_routes(family, podset_number, tor_number, tor_subnet_number,
     return routes
 
 
-def fib_t0(topo, ptf_ip, no_default_route=False, action="announce"):
+def fib_t0(topo, ptf_ip, announcer, no_default_route=False, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -395,11 +582,11 @@ def fib_t0(topo, ptf_ip, no_default_route=False, action="announce"):
                                     nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number, "t0",
                                     no_default_route=no_default_route)
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        announcer.change_routes(action, ptf_ip, port, routes_v4)
+        announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
 
-def fib_t1_lag(topo, ptf_ip, no_default_route=False, action="announce"):
+def fib_t1_lag(topo, ptf_ip, announcer, no_default_route=False, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -435,14 +622,14 @@ def fib_t1_lag(topo, ptf_ip, no_default_route=False, action="announce"):
                                         None, leaf_asn_start, tor_asn_start,
                                         nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t1",
                                         router_type=router_type, tor_index=tor_index, no_default_route=no_default_route)
-            change_routes(action, ptf_ip, port, routes_v4)
-            change_routes(action, ptf_ip, port6, routes_v6)
+            announcer.change_routes(action, ptf_ip, port, routes_v4)
+            announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
         if 'vips' in v:
             routes_vips = []
             for prefix in v["vips"]["ipv4"]["prefixes"]:
                 routes_vips.append((prefix, nhipv4, v["vips"]["ipv4"]["asn"]))
-            change_routes(action, ptf_ip, port, routes_vips)
+            announcer.change_routes(action, ptf_ip, port, routes_vips)
 
 
 def get_new_ip(curr_ip, skip_count):
@@ -522,7 +709,7 @@ We would have the following distribution:
 """
 
 
-def fib_m0(topo, ptf_ip, action="announce"):
+def fib_m0(topo, ptf_ip, announcer, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     colo_number = common_config.get("colo_number", COLO_NUMBER)
     m0_number = common_config.get("m0_number", M0_NUMBER)
@@ -585,8 +772,8 @@ def fib_m0(topo, ptf_ip, action="announce"):
                 m1_routes_v4 = routes_v4
                 m1_routes_v6 = routes_v6
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        announcer.change_routes(action, ptf_ip, port, routes_v4)
+        announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
 
 def generate_m0_subnet_routes(m0_subnet_number, m0_subnet_size, ip_base, nexthop, base_offset=0, m0_asn=None):
@@ -685,7 +872,7 @@ Routes announced by M0 can be broken down to 5 sets:
 """
 
 
-def fib_mx(topo, ptf_ip, action="announce"):
+def fib_mx(topo, ptf_ip, announcer, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     colo_number = common_config.get("colo_number", COLO_NUMBER)
     m0_number = common_config.get("m0_number", M0_NUMBER)
@@ -737,8 +924,8 @@ def fib_mx(topo, ptf_ip, action="announce"):
             m0_routes_v4 = routes_v4
             m0_routes_v6 = routes_v6
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        announcer.change_routes(action, ptf_ip, port, routes_v4)
+        announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
 
 """
@@ -772,7 +959,7 @@ We would have the following distribution:
 """
 
 
-def fib_t2_lag(topo, ptf_ip, action="announce"):
+def fib_t2_lag(topo, ptf_ip, announcer, action="announce"):
     vms = topo['topology']['VMs']
     # T1 VMs per linecard(asic) - key is the dut index, and value is a list of T1 VMs
     t1_vms = {}
@@ -791,11 +978,11 @@ def fib_t2_lag(topo, ptf_ip, action="announce"):
             if dut_index not in t3_vms:
                 t3_vms[dut_index] = list()
             t3_vms[dut_index].append(key)
-    generate_t2_routes(t1_vms, topo, ptf_ip, action="announce")
-    generate_t2_routes(t3_vms, topo, ptf_ip, action="announce")
+    generate_t2_routes(t1_vms, topo, ptf_ip, announcer, action="announce")
+    generate_t2_routes(t3_vms, topo, ptf_ip, announcer, action="announce")
 
 
-def generate_t2_routes(dut_vm_dict, topo, ptf_ip, action="announce"):
+def generate_t2_routes(dut_vm_dict, topo, ptf_ip, announcer, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     vms = topo['topology']['VMs']
     vms_config = topo['configuration']
@@ -849,16 +1036,16 @@ def generate_t2_routes(dut_vm_dict, topo, ptf_ip, action="announce"):
                                             nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t2",
                                             router_type=router_type, tor_index=tor_index, set_num=set_num,
                                             core_ra_asn=core_ra_asn)
-                change_routes(action, ptf_ip, port, routes_v4)
-                change_routes(action, ptf_ip, port6, routes_v6)
+                announcer.change_routes(action, ptf_ip, port, routes_v4)
+                announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
                 if 'vips' in vms_config[a_vm]:
                     routes_vips = []
                     for prefix in vms_config[a_vm]["vips"]["ipv4"]["prefixes"]:
                         routes_vips.append((prefix, nhipv4, vms_config[a_vm]["vips"]["ipv4"]["asn"]))
-                    change_routes(action, ptf_ip, port, routes_vips)
+                    announcer.change_routes(action, ptf_ip, port, routes_vips)
 
-def fib_t0_mclag(topo, ptf_ip, action="announce"):
+def fib_t0_mclag(topo, ptf_ip, announcer, action="announce"):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -893,8 +1080,8 @@ def fib_t0_mclag(topo, ptf_ip, action="announce"):
                                     nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number,
                                     "t0-mclag", set_num=set_num)
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        announcer.change_routes(action, ptf_ip, port, routes_v4)
+        announcer.change_routes(action, ptf_ip, port6, routes_v6)
 
 def main():
     module = AnsibleModule(
@@ -902,7 +1089,9 @@ def main():
             topo_name=dict(required=True, type='str'),
             ptf_ip=dict(required=True, type='str'),
             action=dict(required=False, type='str', default='announce', choices=["announce", "withdraw"]),
-            path=dict(required=False, type='str', default='')
+            path=dict(required=False, type='str', default=''),
+            max_workers=dict(required=False, type='int', default=MAX_WORKERS),
+            chunk_size=dict(required=False, type='int', default=CHUNK_SIZE)
         ),
         supports_check_mode=False)
 
@@ -916,28 +1105,29 @@ def main():
         module.fail_json(msg='Unable to load topology "{}"'.format(topo_name))
 
     is_storage_backend = "backend" in topo_name
+    announcer = RouteAnnouncer(module.params['max_workers'], module.params['chunk_size'], log=module.log)
 
     topo_type = get_topo_type(topo_name)
 
     try:
         if topo_type == "t0":
-            fib_t0(topo, ptf_ip, no_default_route=is_storage_backend, action=action)
-            module.exit_json(changed=True)
+            fib_t0(topo, ptf_ip, announcer, no_default_route=is_storage_backend, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         elif topo_type == "t1":
-            fib_t1_lag(topo, ptf_ip, no_default_route=is_storage_backend, action=action)
-            module.exit_json(changed=True)
+            fib_t1_lag(topo, ptf_ip, announcer, no_default_route=is_storage_backend, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         elif topo_type == "t2":
-            fib_t2_lag(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            fib_t2_lag(topo, ptf_ip, announcer, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         elif topo_type == "t0-mclag":
-            fib_t0_mclag(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            fib_t0_mclag(topo, ptf_ip, announcer, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         elif topo_type == "m0":
-            fib_m0(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            fib_m0(topo, ptf_ip, announcer, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         elif topo_type == "mx":
-            fib_mx(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            fib_mx(topo, ptf_ip, announcer, action=action)
+            module.exit_json(changed=True, report=announcer.run())
         else:
             module.exit_json(msg='Unsupported topology "{}" - skipping announcing routes'.format(topo_name))
     except Exception as e:
@@ -46,29 +46,230 @@ from ansible.module_utils.basic import *
 DEFAULT_BGP_LISTEN_PORT = 179
 
 http_api_py = '''\
-from flask import Flask, request
+from flask import Flask, request, jsonify
+import json
 import sys
+import threading
+import time
+from collections import deque
 
 #Disable banner msg from app.run, or the output might be caught by exabgp and run as command
 cli = sys.modules['flask.cli']
 cli.show_server_banner = lambda *x: None
 
+BATCH_SIZE = 1000       # Max number of commands written to exabgp at once
+MAX_QUEUED = 100000     # Receiving commands is blocked while so many commands are queued
+MAX_PENDING = 10000     # Max number of commands written to exabgp and not acknowledged yet
+RATE_WINDOW = 5.0       # Seconds the updates per second are calculated over
+
 app = Flask(__name__)
 
+
+def parse_answer(line):
+    """Return "done" or "error" if line is exabgp's acknowledgement of a command, text or json encoded"""
+    line = line.strip()
+    if line in ('done', 'error'):
+        return line
+    if line.startswith('{'):
+        try:
+            answer = json.loads(line).get('answer')
+        except ValueError:
+            return None
+        if answer in ('done', 'error'):
+            return answer
+    return None
+
+
+class Commands(object):
+    """
+    Commands to exabgp, queued by the requests and written to exabgp in batches by a writer thread.
+
+    exabgp acknowledges each command on our stdin. Once an acknowledgement is received, no more than
+    MAX_PENDING commands are written ahead of the acknowledgements, so that large announcements don't
+    overrun exabgp. If exabgp doesn't acknowledge the commands, they are written as they come.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.received = 0
+        self.written = 0
+        self.acked = 0
+        self.errors = 0
+        self.acks = False
+        self.writing = False
+        self.start_time = None
+        self.start_completed = 0
+        self.last_time = None
+        self.last_completed = 0
+        self.samples = deque()
+
+    def put(self, cmds):
+        """Queue the commands, return the sequence number of the last one"""
+        with self.cond:
+            for cmd in cmds:
+                while len(self.queue) >= MAX_QUEUED:
+                    self.cond.wait()
+                self.queue.append(cmd)
+                self.received += 1
+            self.cond.notify_all()
+            return self.received
+
+    def wait_written(self, seq):
+        with self.cond:
+            while self.written < seq:
+                self.cond.wait()
+
+    def pending(self):
+        return self.written - self.acked - self.errors if self.acks else 0
+
+    def completed(self):
+        return self.acked + self.errors if self.acks else self.written
+
+    def _sample(self):
+        now = time.time()
+        completed = self.completed()
+        if completed != self.last_completed:
+            self.last_time = now
+            self.last_completed = completed
+        if not self.samples or now - self.samples[-1][0] >= 0.1:
+            self.samples.append((now, completed))
+            while len(self.samples) > 1 and now - self.samples[1][0] > RATE_WINDOW:
+                self.samples.popleft()
+
+    def write_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue or self.pending() >= MAX_PENDING:
+                    self.cond.wait()
+                count = min(len(self.queue), BATCH_SIZE)
+                if self.acks:
+                    count = min(count, MAX_PENDING - self.pending())
+                batch = [self.queue.popleft() for _ in range(count)]
+                if self.start_time is None:
+                    self.start_time = time.time()
+                    self.start_completed = self.completed()
+                self.writing = True
+                self.cond.notify_all()
+
+            sys.stdout.write('\\n'.join(batch) + '\\n')
+            sys.stdout.flush()
+
+            with self.cond:
+                self.writing = False
+                self.written += count
+                self._sample()
+                self.cond.notify_all()
+
+    def read_acks(self):
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            answer = parse_answer(line)
+            if answer is None:
+                continue
+            with self.cond:
+                self.acks = True
+                if answer == 'done':
+                    self.acked += 1
+                else:
+                    self.errors += 1
+                self._sample()
+                # Wake up the writer once there is room for a batch, and the requests waiting for convergence
+                pending = self.pending()
+                if pending <= MAX_PENDING - BATCH_SIZE:
+                    self.cond.notify_all()
+
+    def converged(self):
+        return not self.queue and not self.writing and self.pending() <= 0
+
+    def wait_converged(self, timeout):
+        end = time.time() + timeout
+        with self.cond:
+            while not self.converged():
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return self.converged()
+
+    def convergence(self, timeout):
+        """Wait till converged, return the stats, the average rate is restarted once converged"""
+        with self.cond:
+            converged = self.wait_converged(timeout)
+            stats = self.stats()
+            if converged:
+                self.start_time = None
+            return stats
+
+    def stats(self):
+        with self.cond:
+            now = time.time()
+            completed = self.completed()
+            rate = 0.0
+            if self.samples and now - self.samples[0][0] > 0:
+                rate = (completed - self.samples[0][1]) / (now - self.samples[0][0])
+            avg_rate = 0.0
+            if self.start_time is not None and self.last_time is not None and self.last_time > self.start_time:
+                avg_rate = (self.last_completed - self.start_completed) / (self.last_time - self.start_time)
+            return {
+                'received': self.received,
+                'written': self.written,
+                'acked': self.acked,
+                'errors': self.errors,
+                'queued': len(self.queue),
+                'pending': self.pending(),
+                'acks': self.acks,
+                'converged': self.converged(),
+                'updates_per_sec': round(rate, 1),
+                'avg_updates_per_sec': round(avg_rate, 1)
+            }
+
+
+commands = Commands()
+
+
 # Setup a command route to listen for prefix advertisements
 @app.route('/', methods=['POST'])
 def run_command():
-    if request.form.has_key('commands'):
-        cmds = request.form['commands'].split(';')
+    if request.mimetype in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        if 'commands' in request.form:
+            cmds = request.form['commands'].split(';')
+        else:
+            cmds = [ request.form['command'] ]
+        seq = commands.put([cmd for cmd in cmds if cmd.strip()])
     else:
-        cmds = [ request.form['command'] ]
-    for cmd in cmds:
-        sys.stdout.write("%s\\n" % cmd)
-    sys.stdout.flush()
+        # Streamed body with a command per line, the commands are queued as the lines are received
+        seq = 0
+        rest = b''
+        for chunk in iter(lambda: request.stream.read(65536), b''):
+            lines = (rest + chunk).split(b'\\n')
+            rest = lines.pop()
+            seq = commands.put([line.decode('utf-8') for line in lines if line.strip()])
+        if rest.strip():
+            seq = commands.put([rest.decode('utf-8')])
+    commands.wait_written(seq)
     return "OK\\n"
 
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify(commands.stats())
+
+
+# Wait till all the commands received are acknowledged by exabgp
+@app.route('/convergence', methods=['GET'])
+def convergence():
+    return jsonify(commands.convergence(float(request.args.get('timeout', 60))))
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=sys.argv[1])
+    for target in [commands.write_loop, commands.read_acks]:
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+    app.run(host='0.0.0.0', port=sys.argv[1], threaded=True)
 '''
 
 dump_config_tmpl='''\
@@ -88,6 +289,7 @@ group exabgp {
 
     process http-api {
         run /usr/bin/python /usr/share/exabgp/http_api.py {{ port }};
+        encoder json;
     }
 
     neighbor {{ peer_ip }} {
@@ -68,6 +68,7 @@ import ast
 
 from arista import Arista
 import sad_path as sp
+import capture_analysis
 
 
 class StateMachine():
@@ -1528,6 +1529,11 @@ class ReloadTest(BaseTest):
         capture_pcap, "-l", capture_log, "-t" , str(wait)]
         subprocess.call(["rm", "-rf", capture_pcap]) # remove old capture
         subprocess.call(sniffer_command)
+        self.capture_pcap = capture_pcap
+        if self.use_fast_examine():
+            # examine_flow() reads the capture file directly
+            self.packets = None
+            return
         self.packets = scapyall.rdpcap(capture_pcap)
         self.log("Number of all packets captured: {}".format(len(self.packets)))
 
@@ -1572,6 +1578,13 @@ class ReloadTest(BaseTest):
         else:
             return False
 
+    def use_fast_examine(self):
+        """
+        Whether examine_flow() can analyze the capture file with NumPy, without building scapy packets.
+        VNET captures need decapsulation of the VXLAN packets, they are examined with scapy.
+        """
+        return capture_analysis.HAS_NUMPY and not self.vnet
+
     def examine_flow(self, filename = None):
         """
         This method examines pcap file (if given), or self.packets scapy file.
@@ -1580,6 +1593,11 @@ class ReloadTest(BaseTest):
         All disruptions are saved to self.lost_packets dictionary, in format:
         disrupt_start_id = (missing_packets_count, disrupt_time, disrupt_start_timestamp, disrupt_stop_timestamp)
         """
+        if not filename and self.packets is None:
+            filename = self.capture_pcap
+        if filename and self.use_fast_examine():
+            self.examine_flow_fast(filename)
+            return
         if filename:
             all_packets = scapyall.rdpcap(filename)
         elif self.packets:
@@ -1684,6 +1702,54 @@ class ReloadTest(BaseTest):
             self.log("*********** Missed received packets - t1-to-vlan - {}".format(missed_t1_to_vlan))
             self.log("*********** Missed received packets - vlan-to-t1 - {}".format(missed_vlan_to_t1))
             self.log("**************************************************************")
+        self.summarize_disruptions(received_counter)
+        if packets:
+            filename = '/tmp/capture_filtered.pcap' if self.logfile_suffix is None else "/tmp/capture_filtered_%s.pcap" % self.logfile_suffix
+            scapyall.wrpcap(filename, packets)
+            self.log("Filtered pcap dumped to %s" % filename)
+
+    def examine_flow_fast(self, filename):
+        """
+        Same as examine_flow(), but the pcap file is memory mapped and only the needed fields of the packets are
+        extracted into NumPy arrays, the disruptions are found vectorially. Warm reboot captures have millions of
+        packets, building scapy packets for all of them takes many minutes and GBs of memory.
+        """
+        with capture_analysis.PcapFile(filename) as pcap:
+            self.log("Number of all packets captured: {}".format(len(pcap)))
+            flow = capture_analysis.extract_tcp_flow(pcap)
+            result = capture_analysis.analyze_disruptions(flow, [self.dut_mac, self.vlan_mac])
+            self.lost_packets = result.lost_packets
+            self.max_disrupt, self.total_disruption = 0, 0
+            self.fails['dut'].add("Sniffer failed to capture any traffic")
+            self.assertTrue(len(result.sorted_records), "Sniffer failed to capture any traffic")
+            self.fails['dut'].clear()
+
+            self.disruption_start, self.disruption_stop = None, None
+            for prev_payload, received_payload, prev_time, received_time in result.gaps:
+                self.log("Disruption between packet ID %d and %d. For %.4f " % \
+                    (prev_payload, received_payload, self.lost_packets[prev_payload][1]))
+                if not self.disruption_start:
+                    self.disruption_start = datetime.datetime.fromtimestamp(prev_time)
+                self.disruption_stop = datetime.datetime.fromtimestamp(received_time)
+            self.log("**************** Packet received summary: ********************")
+            self.log("*********** Sent packets captured - {}".format(result.sent_counter))
+            self.log("*********** received packets captured - t1-to-vlan - {}".format(result.received_t1_to_vlan))
+            self.log("*********** received packets captured - vlan-to-t1 - {}".format(result.received_vlan_to_t1))
+            self.log("*********** Missed received packets - t1-to-vlan - {}".format(result.missed_t1_to_vlan))
+            self.log("*********** Missed received packets - vlan-to-t1 - {}".format(result.missed_vlan_to_t1))
+            self.log("*********** Duplicated received packets - {}".format(result.duplicated))
+            self.log("*********** Reordered received packets - {}".format(result.reordered))
+            self.log("**************************************************************")
+            self.summarize_disruptions(result.received_counter)
+
+            filename = '/tmp/capture_filtered.pcap' if self.logfile_suffix is None else "/tmp/capture_filtered_%s.pcap" % self.logfile_suffix
+            pcap.write(filename, result.sorted_records)
+            self.log("Filtered pcap dumped to %s" % filename)
+
+    def summarize_disruptions(self, received_counter):
+        """
+        Find the longest and the total disruption in self.lost_packets.
+        """
         self.fails['dut'].add("Sniffer failed to filter any traffic from DUT")
         self.assertTrue(received_counter, "Sniffer failed to filter any traffic from DUT")
         self.fails['dut'].clear()
@@ -1703,10 +1769,6 @@ class ReloadTest(BaseTest):
             self.total_disrupt_time = 0
             self.log("Gaps in forwarding not found.")
         self.log("Total incoming packets captured %d" % received_counter)
-        if packets:
-            filename = '/tmp/capture_filtered.pcap' if self.logfile_suffix is None else "/tmp/capture_filtered_%s.pcap" % self.logfile_suffix
-            scapyall.wrpcap(filename, packets)
-            self.log("Filtered pcap dumped to %s" % filename)
 
     def check_forwarding_stop(self, signal):
         self.asic_start_recording_vlan_reachability()
@@ -0,0 +1,479 @@
+"""
+Fast analysis of the TCP flows captured by the dataplane disruption tests.
+
+The tests send TCP packets (sport 1234, dport 5000) with consecutive integer payload IDs through the DUT and capture
+both the sent and the received copies on the PTF. Instead of building a scapy object for every captured packet,
+the pcap file is memory mapped, its records are indexed once, and the few fields the analysis needs (timestamp,
+MAC and IP addresses, TCP ports, payload ID) are extracted with NumPy in chunks of bounded size.
+
+Without NumPy, iter_tcp_flow streams the same fields packet by packet with struct, which is still much cheaper than
+scapy and keeps only the extracted fields in memory.
+
+The module is used by the PTF tests (python2) and by tests/common through the symbolic link
+tests/common/helpers/capture_analysis.py, it has to stay self-contained. NumPy is optional, check HAS_NUMPY before
+using extract_tcp_flow and analyze_disruptions.
+"""
+
+import mmap
+import struct
+from collections import namedtuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+LINKTYPE_ETHERNET = 1
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_IPV6 = 0x86dd
+ETH_TYPE_DOT1Q = 0x8100
+IP_PROTO_TCP = 6
+
+CHUNK_SIZE = 1 << 18            # Packets extracted at a time, bounds the memory of the temporary arrays
+MAX_PAYLOAD_DIGITS = 96         # Longer payloads are not payload IDs
+MAX_ID_DIGITS = 18              # Significant digits of a payload ID which fit in int64
+
+# Fields extracted from each packet, one array per field.
+FLOW_FIELDS = (
+    ("record", "int64"),        # Index of the record in the pcap file
+    ("time", "float64"),
+    ("eth_src", "uint64"),
+    ("eth_dst", "uint64"),
+    ("ip_version", "uint8"),
+    ("ip_src", "uint32"),        # Last 32 bits of IPv6 addresses, iter_tcp_flow gives the whole address
+    ("ip_dst", "uint32"),
+    ("payload_id", "int64"),
+)
+
+FlowPacket = namedtuple("FlowPacket", [name for name, _ in FLOW_FIELDS])
+
+
+def mac_to_int(mac):
+    """
+    @summary: Convert MAC address string like '4c:76:25:f5:48:80' to integer.
+    """
+    return int(mac.replace(":", "").replace("-", ""), 16)
+
+
+class PcapFile(object):
+    """
+    @summary: Memory mapped classic pcap file with an index of its records.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file can't be mapped
+            self._mmap = b""
+        self.data = np.frombuffer(self._mmap, dtype=np.uint8) if HAS_NUMPY else None
+        self._parse_global_header()
+        self._index_records()
+
+    def close(self):
+        self.data = None
+        if not isinstance(self._mmap, bytes):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _parse_global_header(self):
+        if len(self._mmap) == 0:
+            # Nothing was captured, scapy doesn't write the header for an empty packet list
+            self.endian, self.ts_scale, self.linktype = "<", 1e-6, LINKTYPE_ETHERNET
+            return
+        if len(self._mmap) < PCAP_GLOBAL_HEADER_LEN:
+            raise ValueError("{} is not a pcap file".format(self.filename))
+        magic = self._mmap[:4]
+        for endian in ("<", ">"):
+            value = struct.unpack(endian + "I", magic)[0]
+            if value in (0xa1b2c3d4, 0xa1b23c4d):
+                break
+        else:
+            raise ValueError("{} is not a pcap file or is in pcapng format".format(self.filename))
+        self.endian = endian
+        self.ts_scale = 1e-6 if value == 0xa1b2c3d4 else 1e-9
+        self.linktype = struct.unpack_from(endian + "I", self._mmap, 20)[0]
+        if self.linktype != LINKTYPE_ETHERNET:
+            raise ValueError("Unsupported link type {} of {}".format(self.linktype, self.filename))
+
+    def _index_records(self):
+        """
+        @summary: Walk the record headers once. This is the only loop over packets in python.
+        """
+        unpack_from = struct.Struct(self.endian + "IIII").unpack_from
+        buf = self._mmap
+        size = len(buf)
+        offsets, sec, frac, caplen = [], [], [], []
+        off = PCAP_GLOBAL_HEADER_LEN
+        while off + PCAP_RECORD_HEADER_LEN <= size:
+            ts_sec, ts_frac, incl_len, _ = unpack_from(buf, off)
+            if off + PCAP_RECORD_HEADER_LEN + incl_len > size:
+                # Truncated last record, capture was interrupted
+                break
+            offsets.append(off)
+            sec.append(ts_sec)
+            frac.append(ts_frac)
+            caplen.append(incl_len)
+            off += PCAP_RECORD_HEADER_LEN + incl_len
+
+        if HAS_NUMPY:
+            self.offsets = np.array(offsets, dtype=np.int64)
+            self.caplen = np.array(caplen, dtype=np.int64)
+            self.time = np.array(sec, dtype=np.float64) + np.array(frac, dtype=np.float64) * self.ts_scale
+        else:
+            self.offsets = offsets
+            self.caplen = caplen
+            self.time = [ts_sec + ts_frac * self.ts_scale for ts_sec, ts_frac in zip(sec, frac)]
+
+    def record(self, index):
+        """
+        @summary: Get the raw bytes of a packet.
+        """
+        start = int(self.offsets[index]) + PCAP_RECORD_HEADER_LEN
+        return self._mmap[start:start + int(self.caplen[index])]
+
+    def write(self, filename, records):
+        """
+        @summary: Write the given records to a new pcap file, in the given order, without decoding them.
+        @param records: Indexes of the records.
+        """
+        with open(filename, "wb") as out:
+            out.write(self._mmap[:PCAP_GLOBAL_HEADER_LEN])
+            for record in records:
+                start = int(self.offsets[record])
+                out.write(self._mmap[start:start + PCAP_RECORD_HEADER_LEN + int(self.caplen[record])])
+
+
+def _gather(data, start, caplen, rel):
+    """
+    @summary: Get the byte at packet relative offset 'rel' of each packet, 0 if beyond the captured length.
+    """
+    valid = rel < caplen
+    return np.where(valid, data[np.where(valid, start + rel, 0)], 0).astype(np.int64)
+
+
+def _gather_be(data, start, caplen, rel, length):
+    value = np.zeros(len(start), dtype=np.int64)
+    for i in range(length):
+        value = (value << 8) | _gather(data, start, caplen, rel + i)
+    return value
+
+
+def _parse_payload_ids(data, start, end, payload_pad=None):
+    """
+    @summary: Parse payloads consisting of decimal digits only, like int(str(packet[TCP].payload)) does.
+    @param payload_pad: Padding character which is removed from the payload before parsing it.
+    @return: Payload IDs and a mask of the packets with a valid payload ID.
+    """
+    length = end - start
+    valid = (length > 0) & (length <= MAX_PAYLOAD_DIGITS)
+    ids = np.zeros(len(start), dtype=np.int64)
+    if not valid.any():
+        return ids, valid
+
+    seen_digit = np.zeros(len(start), dtype=bool)
+    significant_digits = np.zeros(len(start), dtype=np.int64)
+    # Loop over the character positions, each step handles all the packets
+    for col in range(int(length[valid].max())):
+        in_payload = valid & (col < length)
+        char = data[np.where(in_payload, start + col, 0)]
+        is_digit = (char >= ord("0")) & (char <= ord("9"))
+        if payload_pad is None:
+            valid &= is_digit | ~in_payload
+        else:
+            valid &= is_digit | (char == ord(payload_pad)) | ~in_payload
+        digit = in_payload & is_digit
+        ids = np.where(digit, ids * 10 + (char.astype(np.int64) - ord("0")), ids)
+        seen_digit |= digit
+        significant_digits += digit & (ids != 0)
+        # Leading zeros are fine, but the value has to fit in int64
+        valid &= significant_digits <= MAX_ID_DIGITS
+    valid &= seen_digit
+    return np.where(valid, ids, 0), valid
+
+
+def _extract_chunk(pcap, records, sport, dport, payload_pad):
+    data = pcap.data
+    start = pcap.offsets[records] + PCAP_RECORD_HEADER_LEN
+    caplen = pcap.caplen[records]
+
+    ether_type = _gather_be(data, start, caplen, 12, 2)
+    l3 = np.where(ether_type == ETH_TYPE_DOT1Q, 18, 14)
+    ether_type = np.where(ether_type == ETH_TYPE_DOT1Q, _gather_be(data, start, caplen, 16, 2), ether_type)
+
+    ver_ihl = _gather(data, start, caplen, l3)
+    ihl = (ver_ihl & 0x0f) * 4
+    total_len = _gather_be(data, start, caplen, l3 + 2, 2)
+    frag_offset = _gather_be(data, start, caplen, l3 + 6, 2) & 0x1fff
+    proto = _gather(data, start, caplen, l3 + 9)
+    ipv4 = (ether_type == ETH_TYPE_IPV4) & ((ver_ihl >> 4) == 4) & (ihl >= 20) & (proto == IP_PROTO_TCP) & \
+        (frag_offset == 0)
+
+    # IPv6 TCP without extension headers
+    ipv6 = (ether_type == ETH_TYPE_IPV6) & ((ver_ihl >> 4) == 6) & \
+        (_gather(data, start, caplen, l3 + 6) == IP_PROTO_TCP)
+    ip_end = np.where(ipv6, l3 + 40 + _gather_be(data, start, caplen, l3 + 4, 2), l3 + total_len)
+
+    l4 = np.where(ipv6, l3 + 40, l3 + ihl)
+    mask = (ipv4 | ipv6) & (l4 + 20 <= caplen)
+    mask &= (_gather_be(data, start, caplen, l4, 2) == sport) & (_gather_be(data, start, caplen, l4 + 2, 2) == dport)
+
+    # Payload is limited by IP length, the rest of the frame is Ethernet padding.
+    payload_start = l4 + (_gather(data, start, caplen, l4 + 12) >> 4) * 4
+    payload_end = np.minimum(ip_end, caplen)
+    ids, valid_id = _parse_payload_ids(data, start + payload_start,
+                                       start + np.where(mask, payload_end, payload_start), payload_pad)
+    mask &= valid_id
+
+    keep = np.nonzero(mask)[0]
+    start, caplen = start[keep], caplen[keep]
+    l3, ipv6 = l3[keep], ipv6[keep]
+    return {
+        "record": records[keep],
+        "time": pcap.time[records[keep]],
+        "eth_dst": _gather_be(data, start, caplen, 0, 6).astype(np.uint64),
+        "eth_src": _gather_be(data, start, caplen, 6, 6).astype(np.uint64),
+        "ip_version": np.where(ipv6, 6, 4),
+        "ip_src": _gather_be(data, start, caplen, l3 + np.where(ipv6, 20, 12), 4).astype(np.uint32),
+        "ip_dst": _gather_be(data, start, caplen, l3 + np.where(ipv6, 36, 16), 4).astype(np.uint32),
+        "payload_id": ids[keep],
+    }
+
+
+def extract_tcp_flow(pcap, sport=1234, dport=5000, payload_pad=None, chunk_size=CHUNK_SIZE):
+    """
+    @summary: Extract the packets of the test TCP flow from a pcap file.
+
+    Only IPv4 and IPv6 TCP packets (optionally 802.1Q tagged, not ICMP, no IPv6 extension headers) with the given
+    ports and a payload consisting of decimal digits are kept, the same as the scapy based filter of the tests.
+
+    @param pcap: PcapFile instance.
+    @param payload_pad: Padding character of the payload, like 'X' of the dual ToR I/O payloads.
+    @return: Dictionary of arrays keyed by the names in FLOW_FIELDS, packets are in capture order.
+    """
+    chunks = []
+    for first in range(0, len(pcap), chunk_size):
+        records = np.arange(first, min(first + chunk_size, len(pcap)), dtype=np.int64)
+        chunks.append(_extract_chunk(pcap, records, sport, dport, payload_pad))
+    flow = {}
+    for name, dtype in FLOW_FIELDS:
+        if chunks:
+            flow[name] = np.concatenate([chunk[name] for chunk in chunks]).astype(dtype)
+        else:
+            flow[name] = np.zeros(0, dtype=dtype)
+    return flow
+
+
+def _parse_payload_id(payload, payload_pad):
+    if payload_pad is not None:
+        payload = payload.replace(payload_pad, b"")
+    try:
+        return int(payload)
+    except ValueError:
+        return None
+
+
+def iter_tcp_flow(pcap, sport=1234, dport=5000, payload_pad=None):
+    """
+    @summary: Stream the packets of the test TCP flow from a pcap file, without NumPy.
+
+    Same filter and fields as extract_tcp_flow, packets are yielded in capture order.
+
+    @param pcap: PcapFile instance.
+    @param payload_pad: Padding character of the payload, like 'X' of the dual ToR I/O payloads.
+    @return: Generator of FlowPacket. MAC and IP addresses are integers.
+    """
+    unpack_l2 = struct.Struct("!HIHIH").unpack_from
+    unpack_ip = struct.Struct("!BBHHHBBHII").unpack_from
+    unpack_ipv6 = struct.Struct("!BBHHBBQQQQ").unpack_from
+    unpack_tcp = struct.Struct("!HHIIB").unpack_from
+    if payload_pad is not None and not isinstance(payload_pad, bytes):
+        payload_pad = payload_pad.encode()
+    for index in range(len(pcap)):
+        packet = pcap.record(index)
+        caplen = len(packet)
+        if caplen < 14:
+            continue
+        dst_hi, dst_lo, src_hi, src_lo, ether_type = unpack_l2(packet, 0)
+        l3 = 14
+        if ether_type == ETH_TYPE_DOT1Q:
+            if caplen < 18:
+                continue
+            ether_type = struct.unpack_from("!H", packet, 16)[0]
+            l3 = 18
+        if ether_type == ETH_TYPE_IPV4 and caplen >= l3 + 20:
+            ver_ihl, _, total_len, _, frag, _, proto, _, ip_src, ip_dst = unpack_ip(packet, l3)
+            ip_version, ihl, ip_end = 4, (ver_ihl & 0x0f) * 4, l3 + total_len
+            if ver_ihl >> 4 != 4 or ihl < 20 or proto != IP_PROTO_TCP or frag & 0x1fff:
+                continue
+        elif ether_type == ETH_TYPE_IPV6 and caplen >= l3 + 40:
+            # IPv6 TCP without extension headers
+            ver_tc, _, _, payload_len, proto, _, ip_src_hi, ip_src_lo, ip_dst_hi, ip_dst_lo = unpack_ipv6(packet, l3)
+            ip_version, ihl, ip_end = 6, 40, l3 + 40 + payload_len
+            if ver_tc >> 4 != 6 or proto != IP_PROTO_TCP:
+                continue
+            ip_src, ip_dst = (ip_src_hi << 64) | ip_src_lo, (ip_dst_hi << 64) | ip_dst_lo
+        else:
+            continue
+        l4 = l3 + ihl
+        if caplen < l4 + 20:
+            continue
+        tcp_sport, tcp_dport, _, _, data_offset = unpack_tcp(packet, l4)
+        if tcp_sport != sport or tcp_dport != dport:
+            continue
+        # Payload is limited by IP length, the rest of the frame is Ethernet padding.
+        payload_id = _parse_payload_id(packet[l4 + (data_offset >> 4) * 4:min(ip_end, caplen)], payload_pad)
+        if payload_id is None:
+            continue
+        yield FlowPacket(index, float(pcap.time[index]), (src_hi << 32) | src_lo, (dst_hi << 32) | dst_lo,
+                         ip_version, ip_src, ip_dst, payload_id)
+
+
+def find_sequence_gaps(received):
+    """
+    @summary: Find the gaps and the duplicates in a sequence of received packets.
+    @param received: List of (payload_id, timestamp) of the received packets, sorted by payload ID and timestamp.
+    @return: Two lists. Gaps as (prev_payload_id, prev_timestamp, payload_id, timestamp) of the packets around each
+        gap, and duplicates as (payload_id, timestamp) of each packet with the same payload ID as its predecessor.
+    """
+    gaps = []
+    duplicates = []
+    for (prev_payload, prev_time), (payload, timestamp) in zip(received, received[1:]):
+        if prev_payload == payload:
+            duplicates.append((payload, timestamp))
+        elif prev_payload + 1 < payload:
+            gaps.append((prev_payload, prev_time, payload, timestamp))
+    return gaps, duplicates
+
+
+class FlowDisruptions(object):
+    """
+    @summary: Result of analyze_disruptions.
+
+    lost_packets: Dictionary in format of
+        disrupt_start_id = (missing_packets_count, disrupt_time, disrupt_start_timestamp, disrupt_stop_timestamp)
+    """
+
+    def __init__(self):
+        self.lost_packets = {}
+        self.gaps = []                  # (prev_payload, received_payload, prev_time, received_time) of each loss
+        self.sorted_records = None      # pcap records of the filtered packets, sorted by payload ID and time
+        self.sent_counter = 0
+        self.received_counter = 0
+        self.received_vlan_to_t1 = 0
+        self.received_t1_to_vlan = 0
+        self.missed_vlan_to_t1 = 0
+        self.missed_t1_to_vlan = 0
+        self.duplicated = 0             # Received copies of already received payload IDs (floods)
+        self.reordered = 0              # Received packets captured after a packet with a higher payload ID
+
+
+def _count_multiples_of_5(first, last):
+    """
+    @summary: Count the integers in range [first, last] which are multiples of 5.
+    """
+    return last // 5 - (first - 1) // 5
+
+
+def analyze_disruptions(flow, local_macs):
+    """
+    @summary: Find the dataplane disruptions in a flow extracted by extract_tcp_flow.
+
+    A packet with destination MAC in local_macs is a sent packet, a packet with source MAC in local_macs is a
+    received one. Only the first received copy of a payload ID is kept, the rest are floods. The kept packets are
+    sorted by (payload ID, timestamp) and the gaps in received payload IDs are the disruptions. The duration of a
+    disruption is the time between sending the first lost packet and sending the packet received after the gap.
+
+    This is the vectorized equivalent of the per packet loop of ReloadTest.examine_flow in advanced-reboot.py and
+    gives exactly the same result.
+
+    @param flow: Dictionary of arrays returned by extract_tcp_flow.
+    @param local_macs: MAC addresses (strings) of the DUT, the traffic is sent to and received from them.
+    @return: FlowDisruptions instance.
+    """
+    macs = np.array([mac_to_int(mac) for mac in local_macs], dtype=np.uint64)
+    ids = flow["payload_id"]
+    times = flow["time"]
+    src_ok = np.isin(flow["eth_src"], macs)
+    dst_ok = np.isin(flow["eth_dst"], macs)
+
+    # Keep the first received copy of each payload ID, and all the sent packets.
+    src_ok_idx = np.nonzero(src_ok)[0]
+    _, first = np.unique(ids[src_ok_idx], return_index=True)
+    first_received = np.zeros(len(ids), dtype=bool)
+    first_received[src_ok_idx[first]] = True
+    keep = np.nonzero(first_received | dst_ok)[0]
+
+    result = FlowDisruptions()
+    result.duplicated = int(len(src_ok_idx) - len(first))
+    # Reordering is seen in capture order
+    capture_ids = ids[first_received & ~dst_ok]
+    if len(capture_ids) > 1:
+        result.reordered = int(np.count_nonzero(capture_ids[1:] < np.maximum.accumulate(capture_ids)[:-1]))
+
+    # Re-arrange packets, if delayed, by Payload ID and Timestamp. lexsort is stable, so is sorted() of the loop.
+    order = keep[np.lexsort((times[keep], ids[keep]))]
+    result.sorted_records = flow["record"][order]
+    ids, times, is_sent = ids[order], times[order], dst_ok[order]
+    result.sent_counter = int(is_sent.sum())
+
+    received = np.nonzero(~is_sent)[0]
+    received_ids = ids[received]
+    received_times = times[received]
+    result.received_counter = len(received)
+    result.received_vlan_to_t1 = int(np.count_nonzero(received_ids % 5 == 0))
+    result.received_t1_to_vlan = result.received_counter - result.received_vlan_to_t1
+
+    if not len(received):
+        return result
+
+    # The loop starts with previous payload ID 0 and time 0
+    prev_ids = np.concatenate(([0], received_ids[:-1]))
+    prev_times = np.concatenate(([0.0], received_times[:-1]))
+    gaps = np.nonzero(received_ids - prev_ids > 1)[0]
+    if not len(gaps):
+        return result
+
+    # Send time of the received packet, as seen by the loop: the last sent copy sorted before it.
+    positions = np.arange(len(ids))
+    last_sent = np.maximum.accumulate(np.where(is_sent, positions, -1))
+    # Send time of the first lost packet: the last sent copy of its payload ID.
+    sent_ids = ids[is_sent]
+    sent_times = times[is_sent]
+    last_of_id = np.nonzero(np.append(sent_ids[1:] != sent_ids[:-1], True))[0] if len(sent_ids) else sent_ids
+
+    for gap in gaps:
+        received_payload = int(received_ids[gap])
+        prev_payload = int(prev_ids[gap])
+        received_time = float(received_times[gap])
+        sent_pos = last_sent[received[gap]]
+        if sent_pos < 0 or ids[sent_pos] != received_payload:
+            raise KeyError(received_payload)
+        lookup = np.searchsorted(sent_ids[last_of_id], prev_payload + 1)
+        if lookup >= len(last_of_id) or sent_ids[last_of_id[lookup]] != prev_payload + 1:
+            raise KeyError(prev_payload + 1)
+        disrupt = float(times[sent_pos] - sent_times[last_of_id[lookup]])
+        lost_id = (received_payload - 1) - prev_payload
+        result.lost_packets[prev_payload] = (lost_id, disrupt, received_time - disrupt, received_time)
+        result.gaps.append((prev_payload, received_payload, float(prev_times[gap]), received_time))
+        vlan_to_t1 = _count_multiples_of_5(prev_payload + 1, received_payload - 1)
+        result.missed_vlan_to_t1 += vlan_to_t1
+        result.missed_t1_to_vlan += lost_id - vlan_to_t1
+
+    return result
@@ -1,7 +1,6 @@
 import re
 import six
 
-from ipaddress import ip_address, ip_network
 from lpm import LpmDict
 
 # These subnets are excluded from FIB test
@@ -53,33 +52,53 @@ class Fib():
         for ip in EXCLUDE_IPV6_PREFIXES:
             self._ipv6_lpm_dict[ip] = self.NextHop()
 
-        # filter out empty lines and lines starting with '#'
-        pattern = re.compile("^#.*$|^[ \t]*$")
+        # Routes of a big FIB share a small number of next hops, parse each of them once
+        next_hops = {}
+        ipv4_prefixes = []
+        ipv6_prefixes = []
 
         with open(file_path, 'r') as f:
-            for line in f.readlines():
-                if pattern.match(line): continue
-                entry = line.split(' ', 1)
-                prefix = ip_network(six.text_type(entry[0]))
-                next_hop = self.NextHop(entry[1])
-                if prefix.version is 4:
-                    self._ipv4_lpm_dict[str(prefix)] = next_hop
-                elif prefix.version is 6:
-                    self._ipv6_lpm_dict[str(prefix)] = next_hop
+            for line in f:
+                # filter out empty lines and lines starting with '#'
+                if line.startswith('#') or not line.strip(): continue
+                prefix, next_hop_str = line.split(' ', 1)
+                next_hop = next_hops.get(next_hop_str)
+                if next_hop is None:
+                    next_hop = next_hops[next_hop_str] = self.NextHop(next_hop_str)
+                if ':' in prefix:
+                    ipv6_prefixes.append((prefix, next_hop))
+                else:
+                    ipv4_prefixes.append((prefix, next_hop))
+
+        # The LPM lookup tables are built once, after all the prefixes are added
+        self._ipv4_lpm_dict.update(ipv4_prefixes)
+        self._ipv6_lpm_dict.update(ipv6_prefixes)
+
+    def _get_lpm_dict(self, ip):
+        if ':' in six.text_type(ip):
+            return self._ipv6_lpm_dict
+        return self._ipv4_lpm_dict
 
     def __getitem__(self, ip):
-        ip = ip_address(six.text_type(ip))
-        if ip.version is 4:
-            return self._ipv4_lpm_dict[str(ip)]
-        elif ip.version is 6:
-            return self._ipv6_lpm_dict[str(ip)]
+        return self._get_lpm_dict(ip)[ip]
 
     def __contains__(self, ip):
-        ip_obj = ip_address(six.text_type(ip))
-        if ip_obj.version == 4:
-            return self._ipv4_lpm_dict.contains(ip)
-        elif ip_obj.version == 6:
-            return self._ipv6_lpm_dict.contains(ip)
+        return self._get_lpm_dict(ip).contains(ip)
+
+    def get_next_hops(self, ips):
+        """
+        @summary: Get the next hops of a list of IPs with batched lookups.
+        @param ips: List of IPv4 and/or IPv6 addresses in string.
+        @return: List of NextHop in the order of the IPs. None for the IPs not in the FIB.
+        """
+        result = [None] * len(ips)
+        for lpm_dict in (self._ipv4_lpm_dict, self._ipv6_lpm_dict):
+            indexes = [index for index, ip in enumerate(ips) if self._get_lpm_dict(ip) is lpm_dict]
+            if not indexes:
+                continue
+            for index, next_hop in zip(indexes, lpm_dict.lookup_many([ips[index] for index in indexes])):
+                result[index] = next_hop
+        return result
 
     def ipv4_ranges(self):
         return self._ipv4_lpm_dict.ranges()
@@ -0,0 +1,134 @@
+'''
+Description:    Benchmark of loading a FIB file and LPM lookups of fib.Fib.
+
+                Generates a FIB file with full-table size (500k prefixes by default) in the format of the FIB files
+                of FibTest, or uses the given one. Reports the time spent on loading the FIB, generating the IP
+                ranges and looking up random IPs one by one and in batch, and verifies the results of the lookups
+                against a per prefix length hash table.
+
+Usage:          python fib_benchmark.py --prefixes 500000
+                python fib_benchmark.py --file /tmp/fib_info_dut0.txt
+'''
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fib      # noqa: E402
+import lpm      # noqa: E402
+
+
+def generate_fib_file(path, prefixes, ipv6_ratio, next_hop_count):
+    next_hops = []
+    for _ in range(next_hop_count):
+        ports = random.sample(range(64), random.randint(1, 8))
+        next_hops.append(' '.join('[{}]'.format(port) for port in ports))
+
+    ipv6_prefixes = int(prefixes * ipv6_ratio)
+    with open(path, 'w') as f:
+        f.write('# Generated by fib_benchmark.py\n')
+        f.write('0.0.0.0/0 {}\n'.format(next_hops[0]))
+        for _ in range(prefixes - ipv6_prefixes):
+            prefixlen = random.choice((16, 20, 22, 23, 24, 24, 24, 24, 25, 26, 28, 32))
+            network = random.getrandbits(prefixlen) << (32 - prefixlen)
+            f.write('{}/{} {}\n'.format(lpm.IPv4Address(network), prefixlen, random.choice(next_hops)))
+        f.write('::/0 {}\n'.format(next_hops[0]))
+        for _ in range(ipv6_prefixes):
+            prefixlen = random.choice((32, 40, 44, 48, 48, 48, 56, 64, 128))
+            network = (0x2 << 124 | random.getrandbits(prefixlen - 4) << (128 - prefixlen))
+            f.write('{}/{} {}\n'.format(lpm.IPv6Address(network), prefixlen, random.choice(next_hops)))
+
+
+def reference_lookup(tables, ip, ipv4):
+    '''
+    @summary: LPM by probing a hash table of each prefix length, from the longest prefix length.
+    '''
+    max_prefixlen = 32 if ipv4 else 128
+    ip_int = lpm.ip_to_int(ip, ipv4)
+    for prefixlen in range(max_prefixlen, -1, -1):
+        table = tables.get(prefixlen)
+        if table is None:
+            continue
+        host_bits = max_prefixlen - prefixlen
+        value = table.get(ip_int >> host_bits << host_bits)
+        if value is not None:
+            return value
+    return None
+
+
+def reference_tables(lpm_dict):
+    tables = {}
+    for (start, prefixlen), value in lpm_dict._prefixes.items():
+        tables.setdefault(prefixlen, {})[start] = value
+    return tables
+
+
+def measure(name, count, func):
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    print('  {:<24} {:>9.3f} s {:>14,.0f} /sec'.format(name, elapsed, count / elapsed if elapsed else 0))
+    return result
+
+
+def benchmark(fib_file, lookups):
+    with open(fib_file) as f:
+        lines = sum(1 for _ in f)
+    print('FIB file {} ({:,} lines)'.format(fib_file, lines))
+    fib_obj = measure('load', lines, lambda: fib.Fib(fib_file))
+    ok = True
+    for ipv4, lpm_dict in ((True, fib_obj._ipv4_lpm_dict), (False, fib_obj._ipv6_lpm_dict)):
+        if not len(lpm_dict):
+            continue
+        print('IPv{} ({:,} prefixes)'.format(4 if ipv4 else 6, len(lpm_dict)))
+        ranges = measure('ranges', len(lpm_dict), lpm_dict.ranges)
+        print('  {:,} ranges'.format(len(ranges)))
+
+        ips = [random.choice(ranges).get_random_ip() for _ in range(lookups)]
+        single = measure('lookup one by one', lookups, lambda: [fib_obj[ip] for ip in ips])
+        batch = measure('lookup in batch', lookups, lambda: fib_obj.get_next_hops(ips))
+
+        tables = reference_tables(lpm_dict)
+        sample = random.sample(range(lookups), min(lookups, 10000))
+        # The first and the last IP of a range are the corner cases of the LPM
+        corners = [ip for r in random.sample(ranges, min(len(ranges), 5000))
+                   for ip in (r.get_first_ip(), r.get_last_ip())]
+        expected = [reference_lookup(tables, ips[i], ipv4) for i in sample]
+        if [single[i] for i in sample] != expected or [batch[i] for i in sample] != expected or \
+                fib_obj.get_next_hops(corners) != [reference_lookup(tables, ip, ipv4) for ip in corners]:
+            print('ERROR: LPM results differ from the reference')
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FIB loading and LPM lookup benchmark')
+    parser.add_argument('--prefixes', type=int, default=500000, help='number of prefixes of the generated FIB')
+    parser.add_argument('--ipv6-ratio', type=float, default=0.2, help='ratio of IPv6 prefixes of the generated FIB')
+    parser.add_argument('--next-hops', type=int, default=256, help='number of next hops of the generated FIB')
+    parser.add_argument('--lookups', type=int, default=100000, help='number of random IPs to look up')
+    parser.add_argument('--file', help='FIB file to load instead of a generated one')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.file:
+        return 0 if benchmark(args.file, args.lookups) else 1
+
+    fd, fib_file = tempfile.mkstemp(prefix='fib_benchmark_', suffix='.txt')
+    os.close(fd)
+    try:
+        generate_fib_file(fib_file, args.prefixes, args.ipv6_ratio, args.next_hops)
+        return 0 if benchmark(fib_file, args.lookups) else 1
+    finally:
+        os.remove(fib_file)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
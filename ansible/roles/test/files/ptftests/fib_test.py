@@ -37,6 +37,9 @@ from ptf.testutils import verify_no_packet_any
 import fib
 import macsec
 
+from traffic_pipeline import DEFAULT_WINDOW
+from traffic_pipeline import TrafficPipeline
+
 class FibTest(BaseTest):
     '''
     @summary: Overview of functionality
@@ -110,6 +113,9 @@ class FibTest(BaseTest):
          - dst_vid                vlan tag id of dst pkts. Default: None(untag)
          - ignore_ttl:            mask the ttl field in the expected packet
          - single_fib_for_duts:   have a single fib file for all DUTs in multi-dut case. Default: False
+         - pipelined:             send the packets of balancing test back-to-back and verify them by the tag in
+                                  payload, instead of one by one. Default: False
+         - pipeline_window:       max number of packets in flight in pipelined mode. Default: 1000
         '''
         self.dataplane = ptf.dataplane_instance
         self.asic_type = self.test_params.get('asic_type')
@@ -159,6 +165,8 @@ class FibTest(BaseTest):
 
         self.ignore_ttl = self.test_params.get('ignore_ttl', False)
         self.single_fib = self.test_params.get('single_fib_for_duts', "multiple-fib")
+        self.pipelined = self.test_params.get('pipelined', False)
+        self.pipeline_window = self.test_params.get('pipeline_window', DEFAULT_WINDOW)
 
     def check_ip_ranges(self, ipv4=True):
         for dut_index, fib in enumerate(self.fibs):
@@ -168,12 +176,15 @@ class FibTest(BaseTest):
                 ip_ranges = fib.ipv6_ranges()
 
             if len(ip_ranges) > 150:
-                covered_ip_ranges = ip_ranges[:100] + random.sample(ip_ranges[100:], 50)  # Limit test execution time
+                # Limit test execution time
+                sampled = random.sample(range(100, len(ip_ranges)), 50)
+                covered_ip_ranges = ip_ranges[:100] + [ip_ranges[i] for i in sampled]
             else:
                 covered_ip_ranges = ip_ranges[:]
 
-            for ip_range in covered_ip_ranges:
-                if ip_range.get_first_ip() in fib:
+            next_hops = fib.get_next_hops([ip_range.get_first_ip() for ip_range in covered_ip_ranges])
+            for ip_range, next_hop in zip(covered_ip_ranges, next_hops):
+                if next_hop is not None:
                     self.check_ip_range(ip_range, dut_index, ipv4)
 
             random.shuffle(covered_ip_ranges)
@@ -255,9 +266,13 @@ class FibTest(BaseTest):
                 # Change balancing_test_times according to number of next hop groups
                 logging.info('Checking ip range balancing {}, src_port={}, exp_ports={}, dst_ip={}, dut_index={}'\
                     .format(ip_range, src_port, exp_port_lists, dst_ip, dut_index))
-                for i in range(0, self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))):
-                    (matched_port, _) = self.check_ip_route(src_port, dst_ip, exp_port_lists, ipv4)
-                    hit_count_map[matched_port] = hit_count_map.get(matched_port, 0) + 1
+                count = self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))
+                if self.pipelined:
+                    hit_count_map = self.check_ip_route_pipelined(src_port, dst_ip, exp_port_lists, count, ipv4)
+                else:
+                    for i in range(0, count):
+                        (matched_port, _) = self.check_ip_route(src_port, dst_ip, exp_port_lists, ipv4)
+                        hit_count_map[matched_port] = hit_count_map.get(matched_port, 0) + 1
                 for next_hop in next_hops:
                     # only check balance on a DUT
                     self.check_hit_count_map(next_hop.get_next_hop(), hit_count_map)
@@ -283,12 +298,12 @@ class FibTest(BaseTest):
 
         return (matched_port, received)
 
-    def check_ipv4_route(self, src_port, dst_ip_addr, dst_port_lists):
+    def create_ipv4_packets(self, src_port, dst_ip_addr):
         '''
-        @summary: Check IPv4 route works.
+        @summary: Create an IPv4 packet with random L4 ports and its expected packet.
         @param src_port: index of port to use for sending packet to switch
         @param dest_ip_addr: destination IP to build packet with.
-        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        @return (pkt, masked_exp_pkt)
         '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
@@ -330,6 +345,21 @@ class FibTest(BaseTest):
             masked_exp_pkt.set_do_not_care_scapy(scapy.IP, "chksum")
             masked_exp_pkt.set_do_not_care_scapy(scapy.TCP, "chksum")
 
+        return pkt, masked_exp_pkt
+
+    def check_ipv4_route(self, src_port, dst_ip_addr, dst_port_lists):
+        '''
+        @summary: Check IPv4 route works.
+        @param src_port: index of port to use for sending packet to switch
+        @param dest_ip_addr: destination IP to build packet with.
+        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        '''
+        pkt, masked_exp_pkt = self.create_ipv4_packets(src_port, dst_ip_addr)
+        ip_src = pkt['IP'].src
+        ip_dst = pkt['IP'].dst
+        sport = pkt['TCP'].sport
+        dport = pkt['TCP'].dport
+
         send_packet(self, src_port, pkt)
         logging.info('Sent Ether(src={}, dst={})/IP(src={}, dst={})/TCP(sport={}, dport={}) on port {}'\
             .format(pkt.src,
@@ -354,33 +384,19 @@ class FibTest(BaseTest):
             len_rcvd_pkt = len(rcvd_pkt)
             logging.info('Recieved packet at port {} and packet is {} bytes'.format(rcvd_port,len_rcvd_pkt))
             logging.info('Recieved packet with length of {}'.format(len_rcvd_pkt))
-            exp_src_mac = None
-            if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
-                # active-active dualtor, the packet could be received from either ToR, so use the received
-                # port to find the corresponding ToR
-                for dut_index, port_list in enumerate(dst_port_lists):
-                    if rcvd_port in port_list:
-                        exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][dut_index]
-            else:
-                exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][0]
-            actual_src_mac = Ether(rcvd_pkt).src
-            if exp_src_mac != actual_src_mac:
-                raise Exception("Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
-                                "but the src mac doesn't match, expected {}, got {}".
-                                format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+            self.check_rcvd_src_mac(ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
             return (rcvd_port, rcvd_pkt)
         elif self.pkt_action == self.ACTION_DROP:
             verify_no_packet_any(self, masked_exp_pkt, dst_ports)
             return (None, None)
     #---------------------------------------------------------------------
 
-    def check_ipv6_route(self, src_port, dst_ip_addr, dst_port_lists):
+    def create_ipv6_packets(self, src_port, dst_ip_addr):
         '''
-        @summary: Check IPv6 route works.
-        @param source_port_index: index of port to use for sending packet to switch
+        @summary: Create an IPv6 packet with random L4 ports and its expected packet.
+        @param src_port: index of port to use for sending packet to switch
         @param dest_ip_addr: destination IP to build packet with.
-        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
-        @return Boolean
+        @return (pkt, masked_exp_pkt)
         '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
@@ -419,6 +435,22 @@ class FibTest(BaseTest):
             masked_exp_pkt.set_do_not_care_scapy(scapy.IPv6, "hlim")
             masked_exp_pkt.set_do_not_care_scapy(scapy.TCP, "chksum")
 
+        return pkt, masked_exp_pkt
+
+    def check_ipv6_route(self, src_port, dst_ip_addr, dst_port_lists):
+        '''
+        @summary: Check IPv6 route works.
+        @param source_port_index: index of port to use for sending packet to switch
+        @param dest_ip_addr: destination IP to build packet with.
+        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        @return Boolean
+        '''
+        pkt, masked_exp_pkt = self.create_ipv6_packets(src_port, dst_ip_addr)
+        ip_src = pkt['IPv6'].src
+        ip_dst = pkt['IPv6'].dst
+        sport = pkt['TCP'].sport
+        dport = pkt['TCP'].dport
+
         send_packet(self, src_port, pkt)
         logging.info('Sent Ether(src={}, dst={})/IPv6(src={}, dst={})/TCP(sport={}, dport={}) on port {}'\
             .format(pkt.src,
@@ -443,25 +475,56 @@ class FibTest(BaseTest):
             len_rcvd_pkt = len(rcvd_pkt)
             logging.info('Recieved packet at port {} and packet is {} bytes'.format(rcvd_port,len_rcvd_pkt))
             logging.info('Recieved packet with length of {}'.format(len_rcvd_pkt))
-            exp_src_mac = None
-            if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
-                # active-active dualtor, the packet could be received from either ToR, so use the received
-                # port to find the corresponding ToR
-                for dut_index, port_list in enumerate(dst_port_lists):
-                    if rcvd_port in port_list:
-                        exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][dut_index]
-            else:
-                exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][0]
-            actual_src_mac = Ether(rcvd_pkt).src
-            if exp_src_mac != actual_src_mac:
-                raise Exception("Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
-                                "but the src mac doesn't match, expected {}, got {}".
-                                format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+            self.check_rcvd_src_mac(ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
             return (rcvd_port, rcvd_pkt)
         elif self.pkt_action == self.ACTION_DROP:
             verify_no_packet_any(self, masked_exp_pkt, dst_ports)
             return (None, None)
 
+    def check_rcvd_src_mac(self, ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists):
+        '''
+        @summary: Check the source MAC of a received packet is the MAC of the DUT which forwarded it.
+        '''
+        exp_src_mac = None
+        if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
+            # active-active dualtor, the packet could be received from either ToR, so use the received
+            # port to find the corresponding ToR
+            for dut_index, port_list in enumerate(dst_port_lists):
+                if rcvd_port in port_list:
+                    exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][dut_index]
+        else:
+            exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][0]
+        actual_src_mac = scapy.Ether(rcvd_pkt).src
+        if exp_src_mac != actual_src_mac:
+            raise Exception("Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
+                            "but the src mac doesn't match, expected {}, got {}".
+                            format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+
+    def check_ip_route_pipelined(self, src_port, dst_ip_addr, dst_port_lists, count, ipv4=True):
+        '''
+        @summary: Send packets with random L4 ports to an IP back-to-back and verify them, see traffic_pipeline.
+        @param src_port: index of port to use for sending packets to switch
+        @param dst_ip_addr: destination IP to build packets with.
+        @param dst_port_lists: list of ports on which to expect packets to come back from the switch
+        @param count: number of packets to send
+        @return dict of the number of packets received on each port
+        '''
+        dst_ports = list(itertools.chain(*dst_port_lists))
+        pipeline = TrafficPipeline(self, window=self.pipeline_window)
+        for _ in range(count):
+            if ipv4:
+                pkt, masked_exp_pkt = self.create_ipv4_packets(src_port, dst_ip_addr)
+            else:
+                pkt, masked_exp_pkt = self.create_ipv6_packets(src_port, dst_ip_addr)
+            pipeline.add(src_port, pkt, masked_exp_pkt, dst_ports)
+
+        ip_src = pkt['IP'].src if ipv4 else pkt['IPv6'].src
+        hit_count_map = {}
+        for rcvd_port, rcvd_pkt in pipeline.run():
+            self.check_rcvd_src_mac(ip_src, dst_ip_addr, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
+            hit_count_map[rcvd_port] = hit_count_map.get(rcvd_port, 0) + 1
+        return hit_count_map
+
     def check_within_expected_range(self, actual, expected):
         '''
         @summary: Check if the actual number is within the accepted range of the expected number
@@ -1,29 +1,85 @@
 import random
+import socket
+import struct
 import six
 
-from ipaddress import ip_address, ip_network
-from SubnetTree import SubnetTree
+from array import array
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+from binascii import hexlify
+from bisect import bisect_right
+from ipaddress import IPv4Address, IPv6Address
 
 '''
 LpmDict is a class used in FIB test for LPM and IP segmentation.
 
-This class contains a class variable SubnetTree() _subnet_tree to solve the
-LPM search functionality, which is achieved using Patricia tree. In order to
-have IP segmentation functionality: segment the whole IP space into different
-segments from start to end according to the prefixes (networks) it reads.
+Prefixes are stored with integer keys: (first address of the prefix, prefix
+length). The whole IP space is segmented into ranges from start to end
+according to the prefixes (networks) it reads: each range starts at the first
+address of a prefix or right after the last address of a prefix.
 
 Initially, the whole IP space contains only one range. After inserting
-prefixes, the IP space is segmented into multiple ranges. The ranges()
-function returns all ranges in the LpmDict with a list of IpIntervals. The
-sub-class IpInterval then could be used to get the first/last/random IP within
-this range. It could also check the length of the range and if an IP is within
-this range.
+prefixes, the IP space is segmented into multiple ranges. Because every address
+of a range has the same longest matching prefix, the LPM search is done on the
+ranges too: the range boundaries are kept in a sorted list with the index of
+the matching prefix of each range in a parallel array, a lookup is a binary
+search on the boundaries. Both are built in bulk, with one sort of all the
+prefixes, the first time they are needed after the prefixes are changed.
+
+The ranges() function returns all ranges in the LpmDict with a list of
+IpIntervals (IpRanges, which creates the IpIntervals when they are accessed),
+iter_ranges() yields them one by one. The sub-class IpInterval
+then could be used to get the first/last/random IP within this range. It could
+also check the length of the range and if an IP is within this range.
 
 To achieve the LPM functionality, use the LpmDict as a dictionary and use
-[] operator to get the corresponding value using the key (IP).
+[] operator to get the corresponding value using the key (IP). Use
+lookup_many() to get the values of a list of IPs at once.
 
 Please check the test_lpm.py file to see the details of how this class works.
 '''
+
+IPV4_MAX = 2 ** 32 - 1
+IPV6_MAX = 2 ** 128 - 1
+
+
+def ip_to_int(ip, ipv4=True):
+    '''
+    @summary: Convert an IP address to integer.
+    @param ip: IP address, in string, ip_address or integer.
+    @param ipv4: Whether the IP address is IPv4 or IPv6.
+    @return: The IP address in integer.
+    '''
+    if isinstance(ip, six.integer_types):
+        return ip
+    if not isinstance(ip, six.string_types):
+        return int(ip)
+    try:
+        if ipv4:
+            return struct.unpack('!I', socket.inet_pton(socket.AF_INET, str(ip)))[0]
+        return int(hexlify(socket.inet_pton(socket.AF_INET6, str(ip))), 16)
+    except (socket.error, ValueError):
+        raise ValueError('{} is not a valid IPv{} address'.format(ip, 4 if ipv4 else 6))
+
+
+def parse_prefix(prefix, ipv4=True):
+    '''
+    @summary: Parse a prefix in string, like '192.168.0.0/24'. Host bits are ignored.
+    @param prefix: The prefix. An address without prefix length is a host prefix.
+    @param ipv4: Whether the prefix is IPv4 or IPv6.
+    @return: Tuple of (first address of the prefix in integer, prefix length).
+    '''
+    address, _, prefixlen = six.text_type(prefix).partition(u'/')
+    max_prefixlen = 32 if ipv4 else 128
+    prefixlen = int(prefixlen) if prefixlen else max_prefixlen
+    if not 0 <= prefixlen <= max_prefixlen:
+        raise ValueError('{} has invalid prefix length'.format(prefix))
+    host_bits = max_prefixlen - prefixlen
+    return ip_to_int(address, ipv4) >> host_bits << host_bits, prefixlen
+
+
 class LpmDict():
     class IpInterval:
         def __init__(self, s):
@@ -55,55 +111,170 @@ class LpmDict():
         def __str__(self):
             return str(self._start) + ' - ' + str(self._end)
 
+    class IpRanges(Sequence):
+        '''
+        Read-only list of the ranges, the IpIntervals are created when they are accessed.
+        '''
+        def __init__(self, boundaries, max_ip, address):
+            self._boundaries = boundaries
+            self._max_ip = max_ip
+            self._address = address
+
+        def __len__(self):
+            return len(self._boundaries)
+
+        def __getitem__(self, index):
+            if isinstance(index, slice):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            if index < 0:
+                index += len(self)
+            start = self._boundaries[index]
+            end = self._boundaries[index + 1] - 1 if index + 1 < len(self._boundaries) else self._max_ip
+            return LpmDict.IpInterval(self._address(start), self._address(end))
+
     def __init__(self, ipv4=True):
         self._ipv4 = ipv4
-        self._prefix_set = set()
-        self._subnet_tree = SubnetTree()
-        # 0.0.0.0 is a non-routable meta-address that needs to be skipped
-        self._boundaries = { ip_address(u'0.0.0.0') : 1} if ipv4 else { ip_address(u'::') : 1}
+        self._max_ip = IPV4_MAX if ipv4 else IPV6_MAX
+        self._max_prefixlen = 32 if ipv4 else 128
+        self._address = IPv4Address if ipv4 else IPv6Address
+        # (first address, prefix length) -> value of each prefix
+        self._prefixes = {}
+        self._build_clear()
+
+    def _build_clear(self):
+        # Lookup tables built by _build(), None until the prefixes are changed and looked up again
+        self._boundaries = None
+        self._owners = None
+        self._values = None
+
+    def _build(self):
+        '''
+        @summary: Build the range boundaries and the index of the longest matching prefix of each range.
+
+        Prefixes are sorted by first address, the shorter prefix first when the first addresses are the same. A stack
+        of the nested prefixes containing the current address is kept while walking through the sorted prefixes, the
+        top of the stack is the longest matching prefix from the address.
+        '''
+        if self._boundaries is not None:
+            return
+        items = sorted(self._prefixes.items())
+        max_ip = self._max_ip
+        max_prefixlen = self._max_prefixlen
+        count = len(items)
+
+        starts = [start for (start, _), _ in items]
+        ends = [start + (1 << (max_prefixlen - prefixlen)) - 1 for (start, prefixlen), _ in items]
+
+        # 0.0.0.0 is a non-routable meta-address, it's always the start of the first range
+        boundaries = [0]
+        owners = array('l', [-1])
+        stack = []
+        for index in range(count + 1):
+            start = starts[index] if index < count else max_ip + 1
+            # Close the prefixes ending before this prefix, a range starts after each of them
+            while stack and ends[stack[-1]] < start:
+                position = ends[stack.pop()] + 1
+                owner = stack[-1] if stack else -1
+                if position > max_ip:
+                    continue
+                if boundaries[-1] == position:
+                    owners[-1] = owner
+                else:
+                    boundaries.append(position)
+                    owners.append(owner)
+            if index == count:
+                break
+            if boundaries[-1] == start:
+                owners[-1] = index
+            else:
+                boundaries.append(start)
+                owners.append(index)
+            stack.append(index)
+
+        self._boundaries = boundaries
+        self._owners = owners
+        self._values = [value for _, value in items]
+
+    def _lookup_index(self, key):
+        self._build()
+        if isinstance(key, six.string_types):
+            # Same as SubnetTree, prefix length of the key is ignored
+            key = key.split('/', 1)[0]
+        return self._owners[bisect_right(self._boundaries, ip_to_int(key, self._ipv4)) - 1]
+
+    def insert(self, start, prefixlen, value):
+        '''
+        @summary: Insert a prefix with integer key, same as self[prefix] = value.
+        @param start: First address of the prefix in integer.
+        @param prefixlen: Prefix length.
+        @param value: Value of the prefix.
+        '''
+        self._prefixes[(start, prefixlen)] = value
+        self._build_clear()
+
+    def update(self, items):
+        '''
+        @summary: Insert prefixes in bulk.
+        @param items: Iterable of (prefix, value) pairs.
+        '''
+        for key, value in items:
+            self._prefixes[parse_prefix(key, self._ipv4)] = value
+        self._build_clear()
 
     def __setitem__(self, key, value):
-        prefix = ip_network(six.text_type(key))
-        # add the current key to self._prefix_set only when it is not the default route and it is not a duplicate key
-        if prefix.prefixlen and key not in self._prefix_set:
-            boundary = prefix[0]
-            self._boundaries[boundary] = self._boundaries.get(boundary, 0) + 1
-            if prefix[-1] != ip_address(u'255.255.255.255') and prefix[-1] != ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'):
-                next_boundary = prefix[-1] + 1
-                self._boundaries[next_boundary] = self._boundaries.get(next_boundary, 0) + 1
-            self._prefix_set.add(key)
-        self._subnet_tree.__setitem__(key, value)
+        self.insert(*parse_prefix(key, self._ipv4), value=value)
 
     def __getitem__(self, key):
-        return self._subnet_tree[key]
+        index = self._lookup_index(key)
+        if index == -1:
+            raise KeyError(key)
+        return self._values[index]
 
     def __delitem__(self, key):
-        if '/0' not in key:
-            prefix = ip_network(six.text_type(key))
-            boundary = prefix[0]
-            next_boundary = prefix[-1] + 1
-            self._boundaries[boundary] = self._boundaries.get(boundary) - 1
-            if not self._boundaries[boundary]:
-                del self._boundaries[boundary]
-            self._boundaries[next_boundary] = self._boundaries.get(next_boundary) - 1
-            if not self._boundaries[next_boundary]:
-                del self._boundaries[next_boundary]
-            self._prefix_set.remove(key)
-        self._subnet_tree.__delitem__(key)
+        del self._prefixes[parse_prefix(key, self._ipv4)]
+        self._build_clear()
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def lookup_many(self, ips, default=None):
+        '''
+        @summary: Longest prefix match of a list of IPs.
+        @param ips: List of IP addresses, in string, ip_address or integer.
+        @param default: Value for the IPs not matching any prefix.
+        @return: List of the values of the longest matching prefixes, in the order of the IPs.
+        '''
+        self._build()
+        boundaries = self._boundaries
+        owners = self._owners
+        values = self._values
+        ipv4 = self._ipv4
+        result = []
+        for ip in ips:
+            index = owners[bisect_right(boundaries, ip_to_int(ip, ipv4)) - 1]
+            result.append(default if index == -1 else values[index])
+        return result
+
+    def iter_ranges(self):
+        '''
+        @summary: Generate the ranges one by one, in the order of the IP space.
+        '''
+        self._build()
+        boundaries = self._boundaries
+        address = self._address
+        last = len(boundaries) - 1
+        for index, boundary in enumerate(boundaries):
+            end = boundaries[index + 1] - 1 if index != last else self._max_ip
+            yield self.IpInterval(address(boundary), address(end))
 
     def ranges(self):
-        sorted_boundaries = sorted(self._boundaries.keys())
-        ranges = []
-        for index, boundary in enumerate(sorted_boundaries):
-            if index != len(sorted_boundaries) - 1:
-                interval = self.IpInterval(sorted_boundaries[index], sorted_boundaries[index + 1] - 1)
-            else:
-                if self._ipv4:
-                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'255.255.255.255'))
-                else:
-                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'))
-            ranges.append(interval)
-        return ranges
+        '''
+        @summary: Get all the ranges, in the order of the IP space.
+        @return: IpRanges, which can be used as a read-only list of IpIntervals. Changes of the prefixes made later are
+            not reflected in it.
+        '''
+        self._build()
+        return self.IpRanges(self._boundaries, self._max_ip, self._address)
 
     def contains(self, key):
-        return key in self._subnet_tree
+        return self._lookup_index(key) != -1
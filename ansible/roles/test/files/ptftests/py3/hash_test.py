@@ -29,6 +29,9 @@ from ptf.testutils import verify_packet_any_port
 import fib
 import lpm
 
+from traffic_pipeline import DEFAULT_WINDOW
+from traffic_pipeline import TrafficPipeline
+
 class HashTest(BaseTest):
 
     #---------------------------------------------------------------------
@@ -90,6 +93,9 @@ class HashTest(BaseTest):
 
         self.ignore_ttl = self.test_params.get('ignore_ttl', False)
         self.single_fib = self.test_params.get('single_fib_for_duts', 'multiple-fib')
+        # Send the packets of balancing check back-to-back, and verify them by the tag in payload
+        self.pipelined = self.test_params.get('pipelined', False)
+        self.pipeline_window = self.test_params.get('pipeline_window', DEFAULT_WINDOW)
 
         # set the base mac here to make it persistent across calls of check_ip_route
         self.base_mac = self.dataplane.get_mac(*random.choice(list(self.dataplane.ports.keys())))
@@ -164,11 +170,17 @@ class HashTest(BaseTest):
             # in the hit count map.
             assert len(hit_count_map.keys()) == len(self.ptf_test_port_map[str(ingress_port)]["target_dut"])
         else:
-            for _ in range(0, self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))):
-                logging.info('Checking hash key {}, src_port={}, exp_ports={}, dst_ip={}'\
-                    .format(hash_key, src_port, exp_port_lists, dst_ip))
-                (matched_port, _) = self.check_ip_route(hash_key, src_port, dst_ip, exp_port_lists)
-                hit_count_map[matched_port] = hit_count_map.get(matched_port, 0) + 1
+            count = self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))
+            if self.pipelined:
+                logging.info('Checking hash key {} with {} pipelined packets, src_port={}, exp_ports={}, dst_ip={}'
+                             .format(hash_key, count, src_port, exp_port_lists, dst_ip))
+                hit_count_map = self.check_ip_route_pipelined(hash_key, src_port, dst_ip, exp_port_lists, count)
+            else:
+                for _ in range(0, count):
+                    logging.info('Checking hash key {}, src_port={}, exp_ports={}, dst_ip={}'
+                                 .format(hash_key, src_port, exp_port_lists, dst_ip))
+                    (matched_port, _) = self.check_ip_route(hash_key, src_port, dst_ip, exp_port_lists)
+                    hit_count_map[matched_port] = hit_count_map.get(matched_port, 0) + 1
             logging.info("hash_key={}, hit count map: {}".format(hash_key, hit_count_map))
 
             for next_hop in next_hops:
@@ -203,12 +215,12 @@ class HashTest(BaseTest):
             if ip_proto not in skip_protos:
                 return ip_proto
 
-    def check_ipv4_route(self, hash_key, src_port, dst_port_lists):
+    def create_ipv4_packets(self, hash_key, src_port):
         '''
-        @summary: Check IPv4 route works.
+        @summary: Create an IPv4 packet with random value of the hash key and its expected packet.
         @param hash_key: hash key to build packet with.
         @param src_port: index of port to use for sending packet to switch
-        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        @return (pkt, masked_exp_pkt)
         '''
         ip_src = self.src_ip_interval.get_random_ip() if hash_key == 'src-ip' else self.src_ip_interval.get_first_ip()
         ip_dst = self.dst_ip_interval.get_random_ip() if hash_key == 'dst-ip' else self.dst_ip_interval.get_first_ip()
@@ -253,6 +265,22 @@ class HashTest(BaseTest):
             masked_exp_pkt.set_do_not_care_scapy(scapy.TCP, "chksum")
         masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "src")
 
+        return pkt, masked_exp_pkt
+
+    def check_ipv4_route(self, hash_key, src_port, dst_port_lists):
+        '''
+        @summary: Check IPv4 route works.
+        @param hash_key: hash key to build packet with.
+        @param src_port: index of port to use for sending packet to switch
+        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        '''
+        pkt, masked_exp_pkt = self.create_ipv4_packets(hash_key, src_port)
+        ip_src = pkt['IP'].src
+        ip_dst = pkt['IP'].dst
+        ip_proto = pkt['IP'].proto if hash_key == 'ip-proto' else None
+        sport = pkt['TCP'].sport
+        dport = pkt['TCP'].dport
+
         send_packet(self, src_port, pkt)
         logging.info('Sent Ether(src={}, dst={})/IP(src={}, dst={}, proto={})/TCP(sport={}, dport={} on port {})'\
             .format(pkt.src,
@@ -276,30 +304,15 @@ class HashTest(BaseTest):
         rcvd_port_index, rcvd_pkt = verify_packet_any_port(self, masked_exp_pkt, dst_ports)
         rcvd_port = dst_ports[rcvd_port_index]
 
-        exp_src_mac = None
-        if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
-            # active-active dualtor, the packet could be received from either ToR, so use the received
-            # port to find the corresponding ToR
-            for dut_index, port_list in enumerate(dst_port_lists):
-                if rcvd_port in port_list:
-                    exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][dut_index]
-        else:
-            exp_src_mac = self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"][0]
-
-        actual_src_mac = Ether(rcvd_pkt).src
-        if exp_src_mac != actual_src_mac:
-            raise Exception("Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
-                            "but the src mac doesn't match, expected {}, got {}".
-                            format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+        self.check_rcvd_src_mac(ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
         return (rcvd_port, rcvd_pkt)
 
-    def check_ipv6_route(self, hash_key, src_port, dst_port_lists):
+    def create_ipv6_packets(self, hash_key, src_port):
         '''
-        @summary: Check IPv6 route works.
+        @summary: Create an IPv6 packet with random value of the hash key and its expected packet.
         @param hash_key: hash key to build packet with.
-        @param in_port: index of port to use for sending packet to switch
-        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
-        @return Boolean
+        @param src_port: index of port to use for sending packet to switch
+        @return (pkt, masked_exp_pkt)
         '''
         ip_src = self.src_ip_interval.get_random_ip() if hash_key == 'src-ip' else self.src_ip_interval.get_first_ip()
         ip_dst = self.dst_ip_interval.get_random_ip() if hash_key == 'dst-ip' else self.dst_ip_interval.get_first_ip()
@@ -344,6 +357,23 @@ class HashTest(BaseTest):
             masked_exp_pkt.set_do_not_care_scapy(scapy.TCP, "chksum")
         masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "src")
 
+        return pkt, masked_exp_pkt
+
+    def check_ipv6_route(self, hash_key, src_port, dst_port_lists):
+        '''
+        @summary: Check IPv6 route works.
+        @param hash_key: hash key to build packet with.
+        @param in_port: index of port to use for sending packet to switch
+        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        @return Boolean
+        '''
+        pkt, masked_exp_pkt = self.create_ipv6_packets(hash_key, src_port)
+        ip_src = pkt['IPv6'].src
+        ip_dst = pkt['IPv6'].dst
+        ip_proto = pkt['IPv6'].nh if hash_key == 'ip-proto' else None
+        sport = pkt['TCP'].sport
+        dport = pkt['TCP'].dport
+
         send_packet(self, src_port, pkt)
         logging.info('Sent Ether(src={}, dst={})/IPv6(src={}, dst={}, proto={})/TCP(sport={}, dport={} on port {})'\
             .format(pkt.src,
@@ -367,6 +397,13 @@ class HashTest(BaseTest):
         rcvd_port_index, rcvd_pkt = verify_packet_any_port(self, masked_exp_pkt, dst_ports)
         rcvd_port = dst_ports[rcvd_port_index]
 
+        self.check_rcvd_src_mac(ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
+        return (rcvd_port, rcvd_pkt)
+
+    def check_rcvd_src_mac(self, ip_src, ip_dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists):
+        '''
+        @summary: Check the source MAC of a received packet is the MAC of the DUT which forwarded it.
+        '''
         exp_src_mac = None
         if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
             # active-active dualtor, the packet could be received from either ToR, so use the received
@@ -382,7 +419,35 @@ class HashTest(BaseTest):
             raise Exception("Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
                             "but the src mac doesn't match, expected {}, got {}".
                             format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
-        return (rcvd_port, rcvd_pkt)
+
+    def check_ip_route_pipelined(self, hash_key, src_port, dst_ip, dst_port_lists, count):
+        '''
+        @summary: Send packets with random values of the hash key back-to-back and verify them, see traffic_pipeline.
+        @param hash_key: hash key to build packets with.
+        @param src_port: index of port to use for sending packets to switch
+        @param dst_ip: destination IP of the route.
+        @param dst_port_lists: list of ports on which to expect packets to come back from the switch
+        @param count: number of packets to send
+        @return dict of the number of packets received on each port
+        '''
+        ipv4 = ip_network(six.text_type(dst_ip)).version == 4
+        dst_ports = list(itertools.chain(*dst_port_lists))
+        pipeline = TrafficPipeline(self, window=self.pipeline_window)
+        sent_pkts = []
+        for _ in range(count):
+            if ipv4:
+                pkt, masked_exp_pkt = self.create_ipv4_packets(hash_key, src_port)
+            else:
+                pkt, masked_exp_pkt = self.create_ipv6_packets(hash_key, src_port)
+            pipeline.add(src_port, pkt, masked_exp_pkt, dst_ports)
+            sent_pkts.append(pkt)
+
+        hit_count_map = {}
+        for pkt, (rcvd_port, rcvd_pkt) in zip(sent_pkts, pipeline.run()):
+            ip_layer = pkt['IP'] if ipv4 else pkt['IPv6']
+            self.check_rcvd_src_mac(ip_layer.src, ip_layer.dst, src_port, rcvd_port, rcvd_pkt, dst_port_lists)
+            hit_count_map[rcvd_port] = hit_count_map.get(rcvd_port, 0) + 1
+        return hit_count_map
 
     def check_within_expected_range(self, actual, expected):
         '''
@@ -0,0 +1 @@
+../traffic_pipeline.py
\ No newline at end of file
@@ -0,0 +1,217 @@
+'''
+Description:    Pipelined send/verify of tagged packets.
+
+                PTF tests checking traffic balancing send thousands of packets, one by one: send a packet, wait for
+                it with verify_packet_any_port, sleep, repeat. TrafficPipeline sends the packets back-to-back
+                instead. A unique tag is written at the start of the payload of each packet and its expected
+                packet, a receive thread takes all the packets received by the dataplane and demultiplexes them by
+                tag.
+
+                The verdict of each packet is the same as verify_packet_any_port: the packet passes if a packet
+                matching its expected packet is received on one of the expected ports. The number of packets in
+                flight is limited by a window, so the receive queues of the dataplane don't overflow.
+
+Usage:          pipeline = TrafficPipeline(self)
+                for pkt, masked_exp_pkt in packets:
+                    pipeline.add(src_port, pkt, masked_exp_pkt, dst_ports)
+                for rcvd_port, rcvd_pkt in pipeline.run():
+                    hit_count_map[rcvd_port] = hit_count_map.get(rcvd_port, 0) + 1
+'''
+
+import itertools
+import logging
+import threading
+import time
+
+from binascii import hexlify
+
+import ptf
+import ptf.packet as scapy
+
+from ptf.mask import Mask
+from ptf.testutils import dp_poll
+from ptf.testutils import send_packet
+
+TAG_MAGIC = b'PTAG'
+TAG_DIGITS = 10
+TAG_LENGTH = len(TAG_MAGIC) + TAG_DIGITS
+DEFAULT_WINDOW = 1000
+POLL_INTERVAL = 0.1
+
+# Tags are unique in the test process, late packets of a previous pipeline are never taken as received
+_tag_counter = itertools.count()
+
+
+def set_tag(pkt, tag):
+    '''
+    @summary: Write a tag at the start of the payload of a packet. The length of the packet is not changed.
+    @param pkt: scapy packet with a payload of at least TAG_LENGTH bytes, like the packets of simple_tcp_packet.
+    @param tag: The tag, an integer.
+    '''
+    raw = pkt.lastlayer()
+    if len(getattr(raw, 'load', b'')) < TAG_LENGTH:
+        raise ValueError('Packet payload is too short for a tag of {} bytes'.format(TAG_LENGTH))
+    raw.load = TAG_MAGIC + ('%0*d' % (TAG_DIGITS, tag)).encode() + raw.load[TAG_LENGTH:]
+
+
+def get_tag(pkt):
+    '''
+    @summary: Get the tag of a received packet.
+    @param pkt: The packet in bytes.
+    @return: The tag, None if the packet doesn't have a tag.
+    '''
+    pos = pkt.find(TAG_MAGIC)
+    if pos < 0:
+        return None
+    try:
+        return int(pkt[pos + len(TAG_MAGIC):pos + TAG_LENGTH])
+    except ValueError:
+        return None
+
+
+def _to_int(data):
+    return int(hexlify(data), 16) if data else 0
+
+
+def compile_exp_pkt(exp_pkt):
+    '''
+    @summary: Compile an expected packet to a function matching received packets, with the same result as
+        ptf.dataplane.match_exp_pkt. The expected packet is only built once, and the masked comparison is done on
+        integers instead of byte by byte.
+    @param exp_pkt: The expected packet, a scapy packet or a Mask.
+    @return: Function taking a received packet in bytes, returns True if it matches the expected packet.
+    '''
+    if isinstance(exp_pkt, Mask):
+        if not exp_pkt.is_valid():
+            return lambda pkt: False
+        size = exp_pkt.size
+        ignore_extra_bytes = exp_pkt.ignore_extra_bytes
+        mask = _to_int(bytes(bytearray(exp_pkt.mask)))
+        exp_value = _to_int(bytes(exp_pkt.exp_pkt)[:size]) & mask
+
+        def match(pkt):
+            if len(pkt) < size or (not ignore_extra_bytes and len(pkt) != size):
+                return False
+            return _to_int(pkt[:size]) & mask == exp_value
+        return match
+
+    exp_bytes = bytes(exp_pkt)
+    if len(exp_bytes) < 60:
+        # Padding bytes of the received packet are ignored
+        return lambda pkt: pkt[:len(exp_bytes)] == exp_bytes
+    return lambda pkt: pkt == exp_bytes
+
+
+class TrafficPipeline(object):
+
+    def __init__(self, test, device_number=0, window=DEFAULT_WINDOW, timeout=None):
+        '''
+        @summary: Constructor
+        @param test: The PTF test.
+        @param device_number: Device number of the dataplane ports.
+        @param window: Max number of packets sent and not received yet.
+        @param timeout: Seconds to wait for the packets after the last packet is sent or received. Default is the
+            timeout of verify_packet_any_port.
+        '''
+        self.test = test
+        self.device_number = device_number
+        self.window = window
+        self.timeout = timeout if timeout else ptf.ptfutils.default_timeout
+        self._packets = []
+        self._cond = threading.Condition()
+
+    def add(self, src_port, pkt, exp_pkt, exp_ports):
+        '''
+        @summary: Add a packet to send.
+        @param src_port: Port to send the packet to.
+        @param pkt: The packet, a scapy packet. Its payload is changed by the tag.
+        @param exp_pkt: The expected packet, a scapy packet or a Mask. Its payload is changed by the tag.
+        @param exp_ports: List of ports the packet is expected on.
+        '''
+        tag = next(_tag_counter)
+        set_tag(pkt, tag)
+        set_tag(exp_pkt.exp_pkt if isinstance(exp_pkt, Mask) else exp_pkt, tag)
+        self._packets.append((tag, src_port, bytes(pkt), compile_exp_pkt(exp_pkt), exp_ports))
+
+    def __len__(self):
+        return len(self._packets)
+
+    def run(self):
+        '''
+        @summary: Send all the packets and wait for them. The test fails if any packet is not received on its
+            expected ports.
+        @return: List of (rcvd_port, rcvd_pkt) of the packets, in the order they were added.
+        '''
+        self._pending = dict((tag, index) for index, (tag, _, _, _, _) in enumerate(self._packets))
+        self._results = [None] * len(self._packets)
+        self._errors = []
+        self._other_packets = 0
+        self._deadline = None
+
+        start = time.time()
+        receiver = threading.Thread(target=self._receive, name='TrafficPipelineReceiver')
+        receiver.daemon = True
+        receiver.start()
+        try:
+            for sent, (tag, src_port, pkt, _, _) in enumerate(self._packets):
+                with self._cond:
+                    # Wait for the receiver when the window is full, give up waiting if no packet arrives in time
+                    if sent - (len(self._packets) - len(self._pending)) >= self.window:
+                        self._cond.wait(self.timeout)
+                send_packet(self.test, src_port, pkt)
+            with self._cond:
+                self._deadline = time.time() + self.timeout
+                self._cond.notify_all()
+            receiver.join()
+        finally:
+            with self._cond:
+                self._deadline = 0
+            receiver.join()
+
+        elapsed = time.time() - start
+        received = len(self._packets) - len(self._pending)
+        logging.info('Pipelined {} packets in {:.2f}s, received {}, other packets {}'
+                     .format(len(self._packets), elapsed, received, self._other_packets))
+
+        if self._errors:
+            self.test.fail('\n'.join(self._errors))
+        if self._pending:
+            missing = sorted(self._pending.values())
+            _, src_port, pkt, _, exp_ports = self._packets[missing[0]]
+            self.test.fail('Did not receive {} of {} expected packets on any of ports {} for device {}. '
+                           'First missing packet was sent on port {}:\n{}'
+                           .format(len(missing), len(self._packets), exp_ports, self.device_number, src_port,
+                                   scapy.Ether(pkt).summary()))
+        return self._results
+
+    def _receive(self):
+        while True:
+            with self._cond:
+                if self._deadline is not None and (not self._pending or time.time() > self._deadline):
+                    return
+            result = dp_poll(self.test, device_number=self.device_number, timeout=POLL_INTERVAL)
+            if not isinstance(result, self.test.dataplane.PollSuccess):
+                continue
+            rcvd_pkt = bytes(result.packet)
+            tag = get_tag(rcvd_pkt)
+            with self._cond:
+                index = self._pending.get(tag)
+                if index is None:
+                    self._other_packets += 1
+                    continue
+                _, _, _, match, exp_ports = self._packets[index]
+                if not match(rcvd_pkt):
+                    # Not the expected packet, e.g. TTL not decremented. Same as verify_packet_any_port, wait for
+                    # the expected one.
+                    self._other_packets += 1
+                    continue
+                del self._pending[tag]
+                if result.port in exp_ports:
+                    self._results[index] = (result.port, rcvd_pkt)
+                else:
+                    self._errors.append('Received expected packet on port {} for device {}, but it should have '
+                                        'arrived on one of these ports: {}.'
+                                        .format(result.port, self.device_number, exp_ports))
+                if self._deadline is not None:
+                    self._deadline = time.time() + self.timeout
+                self._cond.notify_all()
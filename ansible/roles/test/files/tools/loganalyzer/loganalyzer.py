@@ -23,13 +23,22 @@ import re
 import os
 import os.path
 import csv
+import json
 import time
 import pprint
 import logging
 import logging.handlers
+import multiprocessing
 import subprocess
 from datetime import datetime
 
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
 #---------------------------------------------------------------------
 # Global variables
 #---------------------------------------------------------------------
@@ -37,6 +46,10 @@ tokenizer = ','
 comment_key = '#'
 system_log_file = '/var/log/syslog'
 re_rsyslog_pid = re.compile("PID:\s+(\d+)")
+reverse_read_block_size = 1024 * 1024
+copy_block_size = 1024 * 1024
+# the analysis runs on the DUT next to the tests, don't take all its cores
+default_processes = 4
 
 #-- List of ERROR codes to be returned by AnsibleLogAnalyzer
 err_duplicate_start_marker = -1
@@ -48,6 +61,182 @@ err_invalid_input = -6
 err_end_ignore_marker = -7
 err_start_ignore_marker = -8
 
+def required_literals(pattern, flags=0):
+    '''
+    @summary: Extract literal substrings required by a regular expression.
+
+    Every top level alternative of the pattern contributes its longest run of
+    literal characters. A line can match the pattern only if it contains at least
+    one of the returned literals, so they can be used to cheaply discard lines
+    before running the full regular expression.
+
+    @param pattern: regular expression string.
+    @param flags: flags the regular expression is compiled with.
+
+    @return: List of literals, or None if some alternative has no usable literal.
+    '''
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] is sre_constants.BRANCH:
+        branches = [list(branch) for branch in items[0][1][1]]
+    else:
+        branches = [items]
+
+    literals = []
+    for branch in branches:
+        literal = _longest_literal_run(branch)
+        if not literal:
+            return None
+        literals.append(literal)
+
+    return literals
+#---------------------------------------------------------------------
+
+def _longest_literal_run(items):
+    longest = ''
+    run = []
+    for op, av in _flatten_subpatterns(items):
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if len(run) > len(longest):
+            longest = ''.join(run)
+        run = []
+    if len(run) > len(longest):
+        longest = ''.join(run)
+    return longest
+#---------------------------------------------------------------------
+
+def _flatten_subpatterns(items):
+    for op, av in items:
+        # Groups without inline flags are transparent for the literal search
+        if op is sre_constants.SUBPATTERN and not any(av[1:-1]):
+            for item in _flatten_subpatterns(av[-1]):
+                yield item
+        else:
+            yield op, av
+#---------------------------------------------------------------------
+
+class MessageMatcher:
+    '''
+    @summary: Classify log lines against match/ignore/expect regular expressions.
+
+    All literals required by match and expect expressions are merged into one
+    prefilter expression, so the vast majority of lines is discarded with a single
+    search. The full expressions are evaluated only for the remaining lines, with
+    the same precedence as AnsibleLogAnalyzer.line_is_expected() and
+    AnsibleLogAnalyzer.line_matches(): expected messages first, then matching
+    messages which are not ignored.
+
+    When the list of expect messages is passed, the matcher also records which of
+    them were hit, so unused expect messages are known right after the analysis
+    without rescanning the expected lines. When the list of ignore messages is
+    passed, only ignore expressions whose literals are present in the line are run.
+    '''
+
+    MATCH = 'match'
+    EXPECT = 'expect'
+
+    def __init__(self, match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                 expect_messages=None, ignore_messages=None):
+        self.match_messages_regex = match_messages_regex
+        self.ignore_messages_regex = ignore_messages_regex
+        self.expect_messages_regex = expect_messages_regex
+        self.prefilter = self._build_prefilter([match_messages_regex, expect_messages_regex])
+        # Ignore expressions are many and usually start with '.*', which is slow to
+        # search for. Run only those whose literals are present in the line.
+        self.ignore_index = self._build_index(ignore_messages) if ignore_messages else None
+
+        self.expect_messages = list(expect_messages or [])
+        self._pending_expect = [(message, re.compile(message)) for message in set(self.expect_messages)]
+        self.hit_expect_messages = set()
+
+    def _build_prefilter(self, regex_list):
+        literals = set()
+        for regex in regex_list:
+            if regex is None:
+                continue
+            if regex.flags & re.IGNORECASE:
+                return None
+            regex_literals = required_literals(regex.pattern, regex.flags)
+            if regex_literals is None:
+                return None
+            literals.update(regex_literals)
+
+        if not literals:
+            return None
+
+        # Longer literals first, the alternation is tried left to right
+        return re.compile('|'.join(re.escape(literal) for literal in sorted(literals, key=len, reverse=True)))
+
+    def _build_index(self, messages):
+        index = []
+        for message in set(messages):
+            regex = re.compile(message)
+            literals = None if regex.flags & re.IGNORECASE else required_literals(message, regex.flags)
+            index.append((literals, regex))
+        return index
+
+    def is_ignored(self, line):
+        if self.ignore_index is None:
+            return self.ignore_messages_regex is not None and self.ignore_messages_regex.search(line) is not None
+
+        for literals, regex in self.ignore_index:
+            if literals is not None and not any(literal in line for literal in literals):
+                continue
+            if regex.search(line):
+                return True
+        return False
+
+    def record_expect_hits(self, messages):
+        '''
+        @summary: Mark expect messages as hit, e.g. by a matcher copy in another process.
+        '''
+        self.hit_expect_messages.update(messages)
+        self._pending_expect = [(message, regex) for message, regex in self._pending_expect
+                                if message not in self.hit_expect_messages]
+
+    def _record_expect(self, line):
+        still_pending = []
+        for message, regex in self._pending_expect:
+            if regex.search(line):
+                self.hit_expect_messages.add(message)
+            else:
+                still_pending.append((message, regex))
+        self._pending_expect = still_pending
+
+    def classify(self, line):
+        '''
+        @summary: Classify single log line.
+
+        @return: MessageMatcher.EXPECT, MessageMatcher.MATCH or None.
+        '''
+        if self.prefilter is not None and self.prefilter.search(line) is None:
+            return None
+
+        if self.expect_messages_regex is not None and self.expect_messages_regex.search(line):
+            if self._pending_expect:
+                self._record_expect(line)
+            return self.EXPECT
+
+        if self.match_messages_regex is not None and self.match_messages_regex.search(line):
+            if not self.is_ignored(line):
+                return self.MATCH
+
+        return None
+
+    def unused_expect_messages(self):
+        '''
+        @summary: Return expect messages which did not match any expected line, in
+                  the order they were passed to the constructor.
+        '''
+        return [message for message in self.expect_messages if message not in self.hit_expect_messages]
+#---------------------------------------------------------------------
+
 class AnsibleLogAnalyzer:
     '''
     @summary: Overview of functionality
@@ -194,42 +383,94 @@ class AnsibleLogAnalyzer:
         syslogger.info('\n')
         self.flush_rsyslogd()
 
-    def wait_for_marker(self, marker, timeout=120, polling_interval=10):
+    def get_file_position(self, file_path):
+        '''
+        @summary: Get current position of the end of the file.
+        @param file_path: Path to the file.
+        @return: Tuple (inode, size) or None if the file does not exist.
+        '''
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def find_rotated_file(self, file_path, inode):
+        '''
+        @summary: Find the file with given inode among rotated copies of the file.
+
+        logrotate renames the file (e.g. syslog -> syslog.1), which preserves the
+        inode. Compressed copies are new files and can not be followed.
+
+        @param file_path: Path to the original file.
+        @param inode: Inode of the file before rotation.
+        @return: Path to the rotated file or None if it is not found.
+        '''
+        directory, file_name = os.path.split(file_path)
+        try:
+            candidates = sorted(os.listdir(directory or '.'))
+        except OSError:
+            return None
+
+        for candidate in candidates:
+            if not candidate.startswith(file_name) or candidate.endswith('.gz'):
+                continue
+            candidate_path = os.path.join(directory, candidate)
+            try:
+                if os.stat(candidate_path).st_ino == inode:
+                    return candidate_path
+            except OSError:
+                continue
+        return None
+
+    def search_from_position(self, file_path, position, marker):
+        '''
+        @summary: Search for the marker in complete lines written after the position.
+        @return: Tuple (found, position of the end of the last complete line).
+        '''
+        marker = marker.encode('utf-8')
+        with open(file_path, 'rb') as fp:
+            fp.seek(position)
+            for line in fp:
+                if not line.endswith(b'\n'):
+                    # Line is still being written, check it on the next iteration
+                    break
+                if marker in line:
+                    return True, position + len(line)
+                position += len(line)
+        return False, position
+
+    def wait_for_marker(self, marker, timeout=120, polling_interval=10, start_position=None):
         '''
         @summary: Wait the marker to appear in the /var/log/syslog file
         @param marker:         Marker to be placed into log files.
         @param timeout:        Maximum time in seconds to wait till Marker in /var/log/syslog
         @param polling_interval:  Polling interval during the wait
+        @param start_position: (inode, offset) of /var/log/syslog before the marker was placed.
+                               If not specified, the whole file is searched.
         '''
 
         wait_time = 0
-        last_check_pos = 0
-        syslog_file = "/var/log/syslog"
-        prev_syslog_file = "/var/log/syslog.1"
-        last_dt = os.path.getctime(syslog_file)
+        syslog_file = system_log_file
+        if start_position is None:
+            start_position = self.get_file_position(syslog_file)
+            if start_position is not None:
+                start_position = (start_position[0], 0)
+        inode, position = start_position if start_position is not None else (None, 0)
         while wait_time <= timeout:
-            with open(syslog_file, 'r') as fp:
-                dt = os.path.getctime(syslog_file)
-                if last_dt != dt:
-                    try:
-                        with open(prev_syslog_file, 'r') as pfp:
-                            pfp.seek(last_check_pos)
-                            for l in fp:
-                                if marker in l:
-                                    return True
-                    except FileNotFoundError:
-                        print("cannot find file {}".format(prev_syslog_file))
-                    last_check_pos = 0
-                    last_dt = dt
-                # resume from last search position
-                if last_check_pos:
-                    fp.seek(last_check_pos)
-                # check if marker in the file
-                for l in fp:
-                    if marker in l:
+            current_position = self.get_file_position(syslog_file)
+            if current_position is not None:
+                if current_position[0] != inode:
+                    # syslog was rotated, finish the search in the renamed file
+                    rotated_file = self.find_rotated_file(syslog_file, inode) if inode is not None else None
+                    if rotated_file is not None and self.search_from_position(rotated_file, position, marker)[0]:
                         return True
-                # record last search position
-                last_check_pos = fp.tell()
+                    if rotated_file is None and inode is not None:
+                        print("cannot find rotated file of {}".format(syslog_file))
+                    inode, position = current_position[0], 0
+                found, position = self.search_from_position(syslog_file, position, marker)
+                if found:
+                    return True
             time.sleep(polling_interval)
             wait_time += polling_interval
 
@@ -245,14 +486,92 @@ class AnsibleLogAnalyzer:
         for log_file in log_file_list:
             self.place_marker_to_file(log_file, marker)
 
+        syslog_position = self.get_file_position(system_log_file)
         self.place_marker_to_syslog(marker)
         if wait_for_marker:
-            if self.wait_for_marker(marker) is False:
+            if self.wait_for_marker(marker, start_position=syslog_position) is False:
                 raise RuntimeError("cannot find marker {} in /var/log/syslog".format(marker))
 
         return
     #---------------------------------------------------------------------
 
+    def save_file_positions(self, log_file_list, offsets_file):
+        '''
+        @summary: Record inode and size of each log file, so content appended to the
+                  files later can be extracted without searching for markers.
+        @param log_file_list: List of file paths to record positions of.
+        @param offsets_file:  Path to the file to store positions in.
+        '''
+        positions = {}
+        for log_file in log_file_list:
+            position = self.get_file_position(log_file)
+            if position is None:
+                self.print_diagnostic_message('Log file {} not found. Skip recording position.'.format(log_file))
+                continue
+            positions[log_file] = position
+
+        with open(offsets_file, 'w') as fp:
+            json.dump(positions, fp)
+    #---------------------------------------------------------------------
+
+    def extract_appended(self, offsets_file, out_dir):
+        '''
+        @summary: Copy content appended to log files since save_file_positions().
+
+        If a log file was rotated by rename in the meantime, the rest of the renamed
+        file is copied first, followed by the whole new file. Each file is saved into
+        out_dir under its base name.
+
+        @param offsets_file: Path to the file created by save_file_positions().
+        @param out_dir:      Directory to save extracted content in.
+
+        @return: Map <file_name, True if extracted>. Files which could not be followed
+                 (e.g. rotated with compression or truncated) are reported as False, the
+                 caller should fall back to marker based extraction for them.
+        '''
+        try:
+            with open(offsets_file) as fp:
+                positions = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        result = {}
+        for log_file, (inode, offset) in positions.items():
+            current_position = self.get_file_position(log_file)
+            if current_position is None:
+                result[log_file] = False
+                continue
+
+            sources = []
+            if current_position[0] == inode:
+                if current_position[1] < offset:
+                    self.print_diagnostic_message('Log file {} was truncated'.format(log_file))
+                    result[log_file] = False
+                    continue
+                sources.append((log_file, offset))
+            else:
+                rotated_file = self.find_rotated_file(log_file, inode)
+                if rotated_file is None:
+                    self.print_diagnostic_message('Rotated copy of log file {} not found'.format(log_file))
+                    result[log_file] = False
+                    continue
+                sources.extend([(rotated_file, offset), (log_file, 0)])
+
+            with open(os.path.join(out_dir, os.path.basename(log_file)), 'wb') as out_file:
+                for source, source_offset in sources:
+                    with open(source, 'rb') as in_file:
+                        in_file.seek(source_offset)
+                        while True:
+                            block = in_file.read(copy_block_size)
+                            if not block:
+                                break
+                            out_file.write(block)
+            result[log_file] = True
+
+        os.remove(offsets_file)
+        return result
+    #---------------------------------------------------------------------
+
     def error_to_regx(self, error_string):
         '''
         This method converts a (list of) strings to one regular expression.
@@ -392,7 +711,47 @@ class AnsibleLogAnalyzer:
 
         return ret_code
 
-    def analyze_file(self, log_file_path, match_messages_regex, ignore_messages_regex, expect_messages_regex):
+    def read_lines_reversed(self, log_file_path, block_size=reverse_read_block_size):
+        '''
+        @summary: Yield lines of the file starting from the last one.
+
+        The file is read backwards in blocks of block_size bytes, so memory usage
+        does not depend on the log file size and reading stops as soon as the caller
+        stops iterating (e.g. when start marker is found).
+
+        @param log_file_path: Path to the log file.
+
+        @param block_size: Size of the block read from the file at once.
+        '''
+        with open(log_file_path, 'rb') as log_file:
+            log_file.seek(0, os.SEEK_END)
+            position = log_file.tell()
+            remainder = b''
+            last_line = True
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                log_file.seek(position)
+                pieces = (log_file.read(read_size) + remainder).split(b'\n')
+                # First piece may be incomplete, keep it until the previous block is read
+                remainder = pieces[0]
+                for piece in reversed(pieces[1:]):
+                    if last_line:
+                        last_line = False
+                        if piece:
+                            yield piece.decode('utf-8', 'replace')
+                        continue
+                    yield (piece + b'\n').decode('utf-8', 'replace')
+
+            if last_line:
+                if remainder:
+                    yield remainder.decode('utf-8', 'replace')
+            else:
+                yield (remainder + b'\n').decode('utf-8', 'replace')
+    #---------------------------------------------------------------------
+
+    def analyze_file(self, log_file_path, match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                     matcher=None):
         '''
         @summary: Analyze input file content for messages matching input regex
                   expressions. See line_matches() for details on matching criteria.
@@ -408,7 +767,8 @@ class AnsibleLogAnalyzer:
         @param expect_messages_regex:
             regex class instance containing messages that are expected to appear in logfile.
 
-        @param end_marker_regex - end marker
+        @param matcher: MessageMatcher instance to classify lines with. If not
+            specified, it is built from the regex parameters.
 
         @return: List of strings match search criteria.
         '''
@@ -416,6 +776,9 @@ class AnsibleLogAnalyzer:
 
         self.print_diagnostic_message('analyzing file: %s'% log_file_path)
 
+        if matcher is None:
+            matcher = MessageMatcher(match_messages_regex, ignore_messages_regex, expect_messages_regex)
+
         #-- indicates whether log analyzer currently is in the log range between start
         #-- and end marker. see analyze_file method.
         check_marker = self.require_marker_check(log_file_path)
@@ -426,18 +789,22 @@ class AnsibleLogAnalyzer:
         found_start_marker = False
         found_end_marker = False
         if stdin_as_input:
-            log_file = sys.stdin
+            log_lines = reversed(sys.stdin.readlines())
         else:
-            log_file = open(log_file_path, 'r')
+            log_lines = self.read_lines_reversed(log_file_path)
 
         start_marker = self.create_start_marker()
         end_marker = self.create_end_marker()
+        #-- One search per line tells whether detailed marker checks are needed
+        marker_regex = re.compile('|'.join(re.escape(marker) for marker in
+                                           [end_marker, self.end_ignore_marker_prefix,
+                                            self.start_ignore_marker_prefix, start_marker]))
 
         ignore_marker_run_ids = []
-        for rev_line in reversed(log_file.readlines()):
+        for rev_line in log_lines:
             if stdin_as_input:
                 in_analysis_range = True
-            else:
+            elif marker_regex.search(rev_line):
                 if end_marker in rev_line:
                     self.print_diagnostic_message('found end marker: %s' % end_marker)
                     if (found_end_marker):
@@ -467,7 +834,6 @@ class AnsibleLogAnalyzer:
                     in_analysis_range = True
                     continue
 
-            if not stdin_as_input:
                 if rev_line.find(start_marker) != -1 and 'extract_log' not in rev_line:
                     self.print_diagnostic_message('found start marker: %s' % start_marker)
                     if (found_start_marker):
@@ -486,10 +852,13 @@ class AnsibleLogAnalyzer:
                 # without much insight while they are time consuming to analyze
                 if not check_marker and len(rev_line) > 1000:
                     continue
-                if self.line_is_expected(rev_line, expect_messages_regex):
+                verdict = matcher.classify(rev_line)
+                if verdict is None:
+                    continue
+                if verdict == MessageMatcher.EXPECT:
                     expected_lines.append(rev_line)
-
-                elif self.line_matches(rev_line, match_messages_regex, ignore_messages_regex):
+                else:
+                    self.print_diagnostic_message('matching line: %s' % rev_line)
                     matching_lines.append(rev_line)
 
         # care about the markers only if input is not stdin or no need to check start marker
@@ -505,7 +874,8 @@ class AnsibleLogAnalyzer:
         return matching_lines, expected_lines
     #---------------------------------------------------------------------
 
-    def analyze_file_list(self, log_file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex):
+    def analyze_file_list(self, log_file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                          matcher=None, processes=1):
         '''
         @summary: Analyze input files messages matching input regex expressions.
             See line_matches() for details on matching criteria.
@@ -521,14 +891,33 @@ class AnsibleLogAnalyzer:
         @param expect_messages_regex:
             regex class instance containing messages that are expected to appear in logfile.
 
+        @param matcher: MessageMatcher instance shared by all files. Pass it to get
+            unused expect messages via matcher.unused_expect_messages() afterwards.
+
+        @param processes: Maximum number of files analyzed concurrently in separate processes.
+
         @return: Returns map <file_name, list_of_matching_strings>
         '''
         res = {}
 
-        for log_file in log_file_list:
-            if not len(log_file):
-                continue
-            match_strings, expect_strings = self.analyze_file(log_file, match_messages_regex, ignore_messages_regex, expect_messages_regex)
+        if matcher is None:
+            matcher = MessageMatcher(match_messages_regex, ignore_messages_regex, expect_messages_regex)
+
+        log_file_list = [log_file for log_file in log_file_list if len(log_file)]
+        if processes > 1 and len(log_file_list) > 1 and not any(map(self.is_filename_stdin, log_file_list)):
+            pool = multiprocessing.Pool(min(processes, len(log_file_list)))
+            try:
+                outputs = pool.map(analyze_file_worker, [(self, log_file, matcher) for log_file in log_file_list])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            outputs = [analyze_file_worker((self, log_file, matcher)) for log_file in log_file_list]
+
+        for log_file, (exit_code, match_strings, expect_strings, hit_expect_messages) in zip(log_file_list, outputs):
+            if exit_code:
+                sys.exit(exit_code)
+            matcher.record_expect_hits(hit_expect_messages)
 
             match_strings.reverse()
             expect_strings.reverse()
@@ -537,6 +926,25 @@ class AnsibleLogAnalyzer:
         return res
     #---------------------------------------------------------------------
 
+def analyze_file_worker(args):
+    '''
+    @summary: Analyze single log file, possibly in a worker process of analyze_file_list().
+
+    Marker errors terminate analyze_file() with sys.exit(), which must not kill
+    the worker process, so the exit code is returned to the caller instead.
+
+    @param args: Tuple (analyzer, log file path, matcher), Pool.map passes a single argument.
+
+    @return: Tuple (exit code, matching lines, expected lines, hit expect messages).
+    '''
+    analyzer, log_file, matcher = args
+    try:
+        match_strings, expect_strings = analyzer.analyze_file(log_file, None, None, None, matcher=matcher)
+    except SystemExit as e:
+        return e.code, [], [], set()
+    return 0, match_strings, expect_strings, matcher.hit_expect_messages
+#---------------------------------------------------------------------
+
 def usage():
     print('loganalyzer input parameters:')
     print('--help                           Print usage')
@@ -546,6 +954,8 @@ def usage():
     print('                                 to all log files specified in --logs parameter.')
     print('                                 analyze - perform log analysis of files specified in --logs parameter.')
     print('                                 add_end_marker - add end marker to all log files specified in --logs parameter.')
+    print('                                 extract - extract content appended to log files since init')
+    print('                                 with --offsets_file into files with the same names in --out_dir.')
     print('--out_dir path                   Directory path where to place output files, ')
     print('                                 must be present when --action == analyze')
     print('--logs path{,path}               List of full paths to log files to be analyzed.')
@@ -560,6 +970,14 @@ def usage():
     print('                                 A string from log file matching any string from these')
     print('                                 files will be ignored during analysis. Must be present')
     print('                                 when action == analyze.')
+    print('--offsets_file path              Path to the file with inode and byte offset of log files.')
+    print('                                 init - record positions of system log and --track_logs before')
+    print('                                 placing markers.')
+    print('                                 extract - read positions and extract appended content, the file')
+    print('                                 is removed.')
+    print('--track_logs path{,path}         List of log files to record positions of in addition to system log.')
+    print('--processes num                  Maximum number of log files analyzed concurrently, default %d.'
+          % default_processes)
     print('--expect_files_in path{,path}    List of path to files containing string. ')
     print('                                 All the strings from these files will be expected to present')
     print('                                 in one of specified log files during the analysis. Must be present')
@@ -579,6 +997,10 @@ def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in,
 
     if action in ['init', 'add_end_marker', 'add_start_ignore_mark', 'add_end_ignore_mark']:
         ret_code = True
+    elif action == 'extract':
+        if out_dir is None or len(out_dir) == 0:
+            print('ERROR: missing required out_dir for extract action')
+            ret_code = False
     elif action == 'analyze':
         if out_dir is None or len(out_dir) == 0:
             print('ERROR: missing required out_dir for analyze action')
@@ -614,7 +1036,7 @@ def check_run_id(run_id):
     return ret_code
 #---------------------------------------------------------------------
 
-def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_e, unused_regex_messages):
+def write_result_file(run_id, out_dir, analysis_result_per_file, unused_regex_messages):
     '''
     @summary: Write results of analysis into a file.
 
@@ -624,12 +1046,13 @@ def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_
 
     @param analysis_result_per_file: map file_name: [list of found matching strings]
 
+    @param unused_regex_messages: list of expect messages not found in any file
+
     @return: void
     '''
 
     match_cnt = 0
     expected_cnt = 0
-    expected_lines_total = []
 
     with open(out_dir + "/result.loganalysis." + run_id + ".log", 'w') as out_file:
         for key, val in analysis_result_per_file.items():
@@ -645,20 +1068,11 @@ def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_
 
             for i in expected_lines:
                 out_file.write(i)
-                expected_lines_total.append(i)
             out_file.write('\nExpected and found matches:%d\n' % len(expected_lines))
             expected_cnt += len(expected_lines)
 
         out_file.write("\n-------------------------------------------------\n\n")
         out_file.write('Total matches:%d\n' % match_cnt)
-        # Find unused regex matches
-        for regex in messages_regex_e:
-            for line in expected_lines_total:
-                if re.search(regex, line):
-                    break
-            else:
-                unused_regex_messages.append(regex)
-
         out_file.write('Total expected and found matches:%d\n' % expected_cnt)
         out_file.write('Total expected but not found matches: %d\n\n' % len(unused_regex_messages))
         for regex in unused_regex_messages:
@@ -715,10 +1129,16 @@ def main(argv):
     match_files_in = None
     ignore_files_in = None
     expect_files_in = None
+    offsets_file = None
+    track_logs_in = ""
+    processes = default_processes
     verbose = False
 
+    long_opts = ["action=", "run_id=", "start_marker=", "logs=", "out_dir=", "match_files_in=", "ignore_files_in=",
+                 "expect_files_in=", "offsets_file=", "track_logs=", "processes=", "verbose", "help"]
+
     try:
-        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh", ["action=", "run_id=", "start_marker=", "logs=", "out_dir=", "match_files_in=", "ignore_files_in=", "expect_files_in=", "verbose", "help"])
+        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh", long_opts)
 
     except getopt.GetoptError:
         print("Invalid option specified")
@@ -754,6 +1174,15 @@ def main(argv):
         elif (opt in ("-e", "--expect_files_in")):
             expect_files_in = arg
 
+        elif (opt == "--offsets_file"):
+            offsets_file = arg
+
+        elif (opt == "--track_logs"):
+            track_logs_in = arg
+
+        elif (opt == "--processes"):
+            processes = int(arg)
+
         elif (opt in ("-v", "--verbose")):
             verbose = True
 
@@ -767,8 +1196,17 @@ def main(argv):
 
     result = {}
     if action == "init":
+        if offsets_file:
+            track_log_list = [system_log_file] + list(filter(None, track_logs_in.split(tokenizer)))
+            analyzer.save_file_positions(track_log_list, offsets_file)
         analyzer.place_marker(log_file_list, analyzer.create_start_marker())
         return 0
+    elif action == "extract":
+        if not offsets_file:
+            print('ERROR: missing required offsets_file for extract action')
+            sys.exit(err_invalid_input)
+        print(json.dumps(analyzer.extract_appended(offsets_file, out_dir)))
+        return 0
     elif action == "analyze":
         match_file_list = match_files_in.split(tokenizer)
         ignore_file_list = ignore_files_in.split(tokenizer)
@@ -784,10 +1222,13 @@ def main(argv):
         if not log_file_list:
             log_file_list.append(system_log_file)
 
+        matcher = MessageMatcher(match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                                 expect_messages=messages_regex_e, ignore_messages=messages_regex_i)
         result = analyzer.analyze_file_list(log_file_list, match_messages_regex,
-                                            ignore_messages_regex, expect_messages_regex)
-        unused_regex_messages = []
-        write_result_file(run_id, out_dir, result, messages_regex_e, unused_regex_messages)
+                                            ignore_messages_regex, expect_messages_regex, matcher=matcher,
+                                            processes=processes)
+        unused_regex_messages = matcher.unused_expect_messages()
+        write_result_file(run_id, out_dir, result, unused_regex_messages)
         write_summary_file(run_id, out_dir, result, unused_regex_messages)
     elif action == "add_end_marker":
         analyzer.place_marker(log_file_list, analyzer.create_end_marker(), wait_for_marker=True)
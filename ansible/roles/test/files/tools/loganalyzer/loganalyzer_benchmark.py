@@ -0,0 +1,140 @@
+'''
+Description:    Benchmark for the log analyzer line classification.
+
+                Generates synthetic syslog between start/end markers, analyzes it
+                with the per-line reference path (line_is_expected + line_matches)
+                and with AnsibleLogAnalyzer.analyze_file, verifies both produce the
+                same result and reports throughput in lines/sec.
+
+Usage:          python loganalyzer_benchmark.py --lines 2000000 --error_ratio 0.001
+'''
+
+from __future__ import print_function
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loganalyzer import AnsibleLogAnalyzer, MessageMatcher  # noqa: E402
+
+RUN_ID = 'loganalyzer-benchmark'
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+COMMON_MATCH = os.path.join(TOOLS_DIR, 'loganalyzer_common_match.txt')
+COMMON_IGNORE = os.path.join(TOOLS_DIR, 'loganalyzer_common_ignore.txt')
+COMMON_EXPECT = os.path.join(TOOLS_DIR, 'loganalyzer_common_expect.txt')
+
+NORMAL_MESSAGES = [
+    'INFO systemd[1]: Started Daily apt download activities.',
+    'NOTICE swss#orchagent: :- setPortAdminStatus: Set admin status UP to port pid:{n}',
+    'INFO bgp#bgpd[{n}]: %ADJCHANGE: neighbor 10.0.0.{n} Up',
+    'INFO kernel: [{n}.123456] Bridge firewalling registered',
+    'NOTICE syncd#syncd: :- processQuadEvent: attr: SAI_PORT_ATTR_ADMIN_STATE: true',
+    'INFO lldp#lldpmgrd: Unable to retrieve description for port Ethernet{n}. Not adding port description',
+    'DEBUG pmon#xcvrd: Receive PORT_CONFIG_DONE, port {n}',
+]
+ERROR_MESSAGES = [
+    'ERR swss#orchagent: :- doTask: Failed to set port Ethernet{n} attribute',
+    'ERR syncd#syncd: :- sendApiResponse: api failed: SAI_STATUS_FAILURE',
+    'ERR kernel: [{n}.654321] BUG: soft lockup - CPU#{n} stuck',
+    'ERR route_check.py: Failure results: {n}',
+    'WARNING kernel: [{n}.000001] kmemleak: {n} new suspected memory leaks',
+]
+
+
+def generate_syslog(path, lines, error_ratio, seed):
+    rnd = random.Random(seed)
+    analyzer = AnsibleLogAnalyzer(RUN_ID, False)
+    with open(path, 'w') as log_file:
+        for n in range(lines // 10):
+            log_file.write('Jan  1 00:00:00.000000 sonic INFO noise before analysis range {}\n'.format(n))
+        log_file.write('Jan  1 00:00:01.000000 sonic INFO {}\n'.format(analyzer.create_start_marker()))
+        for n in range(lines):
+            template = rnd.choice(ERROR_MESSAGES if rnd.random() < error_ratio else NORMAL_MESSAGES)
+            log_file.write('Jan  1 00:00:02.{:06d} sonic {}\n'.format(n % 1000000, template.format(n=n % 128)))
+        log_file.write('Jan  1 00:00:03.000000 sonic INFO {}\n'.format(analyzer.create_end_marker()))
+
+
+def reference_analyze(analyzer, path, match_regex, ignore_regex, expect_regex):
+    '''
+    Per-line classification as done before MessageMatcher was introduced.
+    '''
+    start_marker = analyzer.create_start_marker()
+    end_marker = analyzer.create_end_marker()
+    matching_lines = []
+    expected_lines = []
+    in_analysis_range = False
+    with open(path) as log_file:
+        for line in reversed(log_file.readlines()):
+            if end_marker in line:
+                in_analysis_range = True
+                continue
+            if start_marker in line:
+                break
+            if in_analysis_range:
+                if analyzer.line_is_expected(line, expect_regex):
+                    expected_lines.append(line)
+                elif analyzer.line_matches(line, match_regex, ignore_regex):
+                    matching_lines.append(line)
+    return matching_lines, expected_lines
+
+
+def measure(name, lines, func):
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    print('{:<12} {:>10.2f} s {:>14,.0f} lines/sec'.format(name, elapsed, lines / elapsed))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log analyzer throughput benchmark')
+    parser.add_argument('--lines', type=int, default=1000000, help='number of lines in the analysis range')
+    parser.add_argument('--error_ratio', type=float, default=0.001, help='ratio of lines with error messages')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic syslog generator')
+    parser.add_argument('--log', default=None, help='analyze existing file instead of generating one')
+    args = parser.parse_args()
+
+    analyzer = AnsibleLogAnalyzer(RUN_ID, False)
+    match_regex, _ = analyzer.create_msg_regex([COMMON_MATCH])
+    ignore_regex, ignore_messages = analyzer.create_msg_regex([COMMON_IGNORE])
+    expect_regex, expect_messages = analyzer.create_msg_regex([COMMON_EXPECT])
+
+    if args.log:
+        path = args.log
+    else:
+        fd, path = tempfile.mkstemp(prefix='syslog.benchmark.')
+        os.close(fd)
+        generate_syslog(path, args.lines, args.error_ratio, args.seed)
+
+    try:
+        with open(path) as log_file:
+            total_lines = sum(1 for _ in log_file)
+        print('Analyzing {} ({:,} lines, {:,} bytes)'.format(path, total_lines, os.path.getsize(path)))
+
+        reference = measure('reference', total_lines,
+                            lambda: reference_analyze(analyzer, path, match_regex, ignore_regex, expect_regex))
+
+        matcher = MessageMatcher(match_regex, ignore_regex, expect_regex,
+                                 expect_messages=expect_messages, ignore_messages=ignore_messages)
+        result = measure('matcher', total_lines,
+                         lambda: analyzer.analyze_file(path, match_regex, ignore_regex, expect_regex, matcher=matcher))
+
+        unused = [regex for regex in expect_messages if not any(re.search(regex, line) for line in reference[1])]
+        if result != reference or matcher.unused_expect_messages() != unused:
+            print('ERROR: results differ from the reference implementation')
+            return 1
+        print('Results match: {} matching lines, {} expected lines'.format(len(result[0]), len(result[1])))
+    finally:
+        if not args.log:
+            os.remove(path)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
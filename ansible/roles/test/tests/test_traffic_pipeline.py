@@ -0,0 +1,191 @@
+"""
+Unit tests of the pipelined send/verify of the PTF tests, against a fake dataplane forwarding the sent packets back:
+
+    pytest ansible/roles/test/tests/test_traffic_pipeline.py
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import ptf.packet as scapy
+
+from ptf.dataplane import match_exp_pkt
+from ptf.mask import Mask
+from ptf.testutils import simple_tcp_packet
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files", "ptftests"))
+
+import traffic_pipeline                                             # noqa E402
+from traffic_pipeline import TrafficPipeline, compile_exp_pkt      # noqa E402
+
+DUT_MAC = "00:01:02:03:04:05"
+TIMEOUT = 0.5
+
+
+class FakeDataplane(object):
+    """
+    Forwards every sent packet to the port returned by 'route', after 'forward' changed it. 'forward' returns None
+    to drop the packet. The receiver side polls one packet per 'poll_delay' seconds at most.
+    """
+
+    PollSuccess = collections.namedtuple("PollSuccess", ["device", "port", "packet", "time"])
+    PollFailure = collections.namedtuple("PollFailure", [])
+
+    def __init__(self, route, forward=None, poll_delay=0):
+        self.route = route
+        self.forward = forward or (lambda pkt: pkt)
+        self.poll_delay = poll_delay
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.sent = 0
+        self.polled = 0
+        self.max_in_flight = 0
+
+    def send(self, device, port, pkt):
+        with self.cond:
+            self.sent += 1
+            self.max_in_flight = max(self.max_in_flight, self.sent - self.polled)
+            fwd = self.forward(scapy.Ether(pkt))
+            if fwd is not None:
+                fwd[scapy.IP].ttl -= 1
+                fwd.src = DUT_MAC
+                self.queue.append((self.route(fwd), bytes(fwd)))
+                self.cond.notify_all()
+        return len(pkt)
+
+    def poll(self, device_number=0, port_number=None, timeout=None, exp_pkt=None, filters=None):
+        if self.poll_delay:
+            time.sleep(self.poll_delay)
+        with self.cond:
+            if not self.queue:
+                self.cond.wait(timeout)
+            if not self.queue:
+                return self.PollFailure()
+            self.polled += 1
+            port, pkt = self.queue.popleft()
+        return self.PollSuccess(device_number, port, pkt, time.time())
+
+
+class FakeTest(object):
+
+    def __init__(self, dataplane):
+        self.dataplane = dataplane
+
+    def before_send(self, pkt, device_number=0, port_number=0):
+        pass
+
+    def at_receive(self, pkt, device_number=0, port_number=0):
+        pass
+
+    def fail(self, msg):
+        raise AssertionError(msg)
+
+
+def _packets(count, src_port=0, exp_ports=(1, 2, 3, 4)):
+    for i in range(count):
+        ip_dst = "192.168.{}.{}".format(i // 250, i % 250 + 1)
+        pkt = simple_tcp_packet(eth_dst=DUT_MAC, ip_src="10.0.0.1", ip_dst=ip_dst, tcp_sport=1000 + i, ip_ttl=64)
+        exp_pkt = simple_tcp_packet(eth_src=DUT_MAC, ip_src="10.0.0.1", ip_dst=ip_dst, tcp_sport=1000 + i, ip_ttl=63)
+        masked_exp_pkt = Mask(exp_pkt)
+        masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "dst")
+        masked_exp_pkt.set_do_not_care_scapy(scapy.IP, "chksum")
+        yield src_port, pkt, masked_exp_pkt, list(exp_ports)
+
+
+def _route_by_sport(pkt):
+    return 1 + pkt[scapy.TCP].sport % 4
+
+
+def _pipeline(dataplane, count, window=traffic_pipeline.DEFAULT_WINDOW, exp_ports=(1, 2, 3, 4)):
+    pipeline = TrafficPipeline(FakeTest(dataplane), window=window, timeout=TIMEOUT)
+    for src_port, pkt, masked_exp_pkt, dst_ports in _packets(count, exp_ports=exp_ports):
+        pipeline.add(src_port, pkt, masked_exp_pkt, dst_ports)
+    return pipeline
+
+
+def test_tag_round_trip():
+    pkt = simple_tcp_packet()
+    length = len(pkt)
+    traffic_pipeline.set_tag(pkt, 1234)
+    assert len(pkt) == length
+    assert traffic_pipeline.get_tag(bytes(pkt)) == 1234
+    assert traffic_pipeline.get_tag(bytes(simple_tcp_packet())) is None
+
+
+def test_tag_short_payload():
+    with pytest.raises(ValueError):
+        traffic_pipeline.set_tag(simple_tcp_packet(pktlen=54 + traffic_pipeline.TAG_LENGTH - 1), 1)
+
+
+@pytest.mark.parametrize("ttl", [63, 64])
+def test_compile_exp_pkt(ttl):
+    _, pkt, masked_exp_pkt, _ = next(_packets(1))
+    rcvd = simple_tcp_packet(eth_src=DUT_MAC, eth_dst="00:aa:bb:cc:dd:ee", ip_src="10.0.0.1", ip_dst="192.168.0.1",
+                             tcp_sport=1000, ip_ttl=ttl)
+    for exp_pkt in (masked_exp_pkt, masked_exp_pkt.exp_pkt):
+        assert compile_exp_pkt(exp_pkt)(bytes(rcvd)) == match_exp_pkt(exp_pkt, bytes(rcvd))
+    # Padding of short packets is ignored
+    short = simple_tcp_packet(pktlen=54)
+    assert compile_exp_pkt(short)(bytes(short) + b"\x00" * 6)
+
+
+def test_all_received():
+    dataplane = FakeDataplane(_route_by_sport)
+    pipeline = _pipeline(dataplane, 40)
+    results = pipeline.run()
+    assert len(results) == 40
+    for i, (rcvd_port, rcvd_pkt) in enumerate(results):
+        assert rcvd_port == 1 + (1000 + i) % 4
+        assert scapy.Ether(rcvd_pkt)[scapy.TCP].sport == 1000 + i
+
+
+def test_window_back_pressure():
+    dataplane = FakeDataplane(_route_by_sport, poll_delay=0.005)
+    pipeline = _pipeline(dataplane, 40, window=5)
+    assert len(pipeline.run()) == 40
+    assert 1 < dataplane.max_in_flight <= 5
+
+
+def test_other_packets_ignored():
+    # E.g. packets of other tests or late packets of a previous pipeline
+    dataplane = FakeDataplane(_route_by_sport)
+    dataplane.queue.append((1, bytes(simple_tcp_packet())))
+    pipeline = _pipeline(dataplane, 10)
+    assert len(pipeline.run()) == 10
+    assert pipeline._other_packets == 1
+
+
+def test_missing_packets():
+    dropped = set([1005, 1007])
+    dataplane = FakeDataplane(_route_by_sport,
+                              forward=lambda pkt: None if pkt[scapy.TCP].sport in dropped else pkt)
+    pipeline = _pipeline(dataplane, 20)
+    start = time.time()
+    with pytest.raises(AssertionError, match="Did not receive 2 of 20 expected packets"):
+        pipeline.run()
+    # Given up after the timeout since the last received packet
+    assert time.time() - start < 5 * TIMEOUT
+
+
+def test_not_matching_packets():
+    def forward(pkt):
+        if pkt[scapy.TCP].sport == 1003:
+            pkt[scapy.IP].ttl += 1      # Not decremented by the DUT
+        return pkt
+
+    dataplane = FakeDataplane(_route_by_sport, forward=forward)
+    pipeline = _pipeline(dataplane, 10)
+    with pytest.raises(AssertionError, match="Did not receive 1 of 10 expected packets"):
+        pipeline.run()
+    assert pipeline._other_packets == 1
+
+
+def test_unexpected_port():
+    dataplane = FakeDataplane(_route_by_sport)
+    pipeline = _pipeline(dataplane, 10, exp_ports=(1, 2, 3))
+    with pytest.raises(AssertionError, match="Received expected packet on port 4"):
+        pipeline.run()
@@ -9,13 +9,16 @@ import re
 import shlex
 import subprocess
 import sys
+import tempfile
 import threading
+import time
 import traceback
 
-from collections import defaultdict
+from collections import defaultdict, deque
 from logging.handlers import RotatingFileHandler
+from multiprocessing.pool import ThreadPool
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, g
 from flask.logging import default_handler
 from werkzeug.exceptions import HTTPException
 
@@ -29,6 +32,9 @@ DUMP_FLOW_CMD = 'ovs-ofctl --names dump-flows {}'
 DEL_FLOW_CMD = 'ovs-ofctl --names del-flows {} in_port="{}"'
 ADD_FLOW_CMD = 'ovs-ofctl --names add-flow {} in_port="{}",actions={}'
 MOD_FLOW_CMD = 'ovs-ofctl --names mod-flows {} in_port="{}",actions={}'
+FLOW_MODS_CMD = 'ovs-ofctl --names add-flows {} {}'
+DEL_FLOW_MOD = 'delete in_port="{}"'
+ADD_FLOW_MOD = 'add in_port="{}",actions={}'
 
 RANDOM = 'random'
 TOGGLE = 'toggle'
@@ -39,6 +45,9 @@ MUX_NIC_PREFIX = 'mu'      # With adaptive name, MUX NIC could be: muxy-vms21-1-
 OUTPUT = 'output'
 DROP = 'drop'
 
+MAX_WORKERS = 16            # Max number of mux bridges configured concurrently
+LATENCY_WINDOW = 1000       # Number of latest requests of an endpoint used for the latency percentiles
+
 app = Flask(__name__)
 
 g_muxes = None              # Global variable holding instance of the class Muxes
@@ -125,6 +134,45 @@ def run_cmd(cmdline):
     return stdout.decode('utf-8')
 
 
+def run_flow_mods(bridge, flow_mods):
+    """Apply flow mods to a bridge with one 'ovs-ofctl add-flows' command.
+
+    The flow mods are applied in order over a single OpenFlow connection, for example:
+        delete in_port="enp59s0f1.3216"
+        add in_port="enp59s0f1.3272",actions=output:"muxy-vms17-8-0"
+
+    Args:
+        bridge (string): Name of the bridge.
+        flow_mods (list): List of flow mods, each starts with 'add', 'modify' or 'delete'.
+
+    Returns:
+        string: The stdout of running the command.
+    """
+    app.logger.debug('bridge={}, flow mods:\n{}'.format(bridge, '\n'.join(flow_mods)))
+    with tempfile.NamedTemporaryFile(mode='w', prefix='mux-flows-', suffix='.txt', delete=False) as fp:
+        fp.write('\n'.join(flow_mods + ['']))
+    try:
+        return run_cmd(FLOW_MODS_CMD.format(bridge, fp.name))
+    finally:
+        os.remove(fp.name)
+
+
+def run_concurrently(func, items):
+    """Call func for each of the items in a pool of threads.
+
+    Returns:
+        list: Results of func in the order of items. The first exception raised by func is re-raised.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(len(items), MAX_WORKERS))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+
+
 def config_logging(http_port):
     """Configure log to rotating file
 
@@ -183,6 +231,9 @@ class Mux(object):
 
         self.flap_counter = 0
 
+        # Status is built on the first read and cached. Every change of the mux must reset it to None.
+        self._status = None
+
     def debug(self, msg):
         app.logger.debug('bridge={}, {}'.format(self.bridge, msg))
 
@@ -315,52 +366,62 @@ class Mux(object):
             if self.sides[in_port] == NIC:
                 # From NIC to TORs, upstream flow
                 self.flows['upstream']['in_side'] = NIC
-                self.flows['upstream']['out_sides'] = [self.sides[out_port] for out_port, action in flows[in_port].items() if action == OUTPUT]
+                self.flows['upstream']['out_sides'] = [
+                    self.sides[out_port] for out_port, action in flows[in_port].items() if action == OUTPUT
+                ]
             else:
                 # From TOR to NIC, downstream flow
                 self._active_standby_state_helper(self.sides[in_port])
                 self.flows['downstream']['in_side'] = self.sides[in_port]
-                self.flows['downstream']['out_sides'] = [self.sides[out_port] for out_port, action in flows[in_port].items() if action == OUTPUT]
+                self.flows['downstream']['out_sides'] = [
+                    self.sides[out_port] for out_port, action in flows[in_port].items() if action == OUTPUT
+                ]
 
     @property
     def status(self):
         """Property for status of the mux bridge.
 
         Status of the mux bridge is maintained in instance attributes. This property is to gather the attributes and
-        return them in a dict.
+        return them in a dict. The dict is cached till the mux is changed, it must not be modified by the caller.
         """
         with self.lock:
-            # Transform mux flows to json expected by mux simulator client
-            flows = {}
-            flows[self.ports[NIC]] = [
-                {'action': OUTPUT, 'out_port': self.ports[out_side]} for out_side in self.flows['upstream']['out_sides']
+            if self._status is None:
+                self._status = self._build_status()
+            return self._status
+
+    def _build_status(self):
+        # Transform mux flows to json expected by mux simulator client
+        flows = {}
+        flows[self.ports[NIC]] = [
+            {'action': OUTPUT, 'out_port': self.ports[out_side]} for out_side in self.flows['upstream']['out_sides']
+        ]
+
+        if self.flows['downstream']['in_side'] is not None:
+            in_side = self.flows['downstream']['in_side']
+            in_port = self.ports[in_side]
+            flows[in_port] = [
+                {'action': OUTPUT, 'out_port': self.ports[out_side]}
+                for out_side in self.flows['downstream']['out_sides']
             ]
 
-            if self.flows['downstream']['in_side'] is not None:
-                in_side = self.flows['downstream']['in_side']
-                in_port = self.ports[in_side]
-                flows[in_port] = [
-                    {'action': OUTPUT, 'out_port': self.ports[out_side]} for out_side in self.flows['downstream']['out_sides']
-                ]
-
-            healthy = True
-            if len(self.flows['downstream']['out_sides']) != 1 or len(self.flows['upstream']['out_sides']) != 2:
-                healthy = False
-
-            status = {
-                'bridge': self.bridge,
-                'vm_set': self.vm_set,
-                'port_index': self.port_index,
-                'ports': self.ports,
-                'active_port': self.active_port,
-                'active_side': self.active_side,
-                'standby_side': self.standby_side,
-                'standby_port': self.standby_port,
-                'flows': flows,
-                'flap_counter': self.flap_counter,
-                'healthy': healthy
-            }
-            return status
+        healthy = True
+        if len(self.flows['downstream']['out_sides']) != 1 or len(self.flows['upstream']['out_sides']) != 2:
+            healthy = False
+
+        status = {
+            'bridge': self.bridge,
+            'vm_set': self.vm_set,
+            'port_index': self.port_index,
+            'ports': self.ports,
+            'active_port': self.active_port,
+            'active_side': self.active_side,
+            'standby_side': self.standby_side,
+            'standby_port': self.standby_port,
+            'flows': flows,
+            'flap_counter': self.flap_counter,
+            'healthy': healthy
+        }
+        return status
 
     def set_active_side(self, new_active_side):
         """Set the active side of the mux bridge to the specified side.
@@ -375,30 +436,21 @@ class Mux(object):
                 new_active_side = random.choice([UPPER_TOR, LOWER_TOR])
 
             if self.active_side == new_active_side:
-                self.info('current active_side={}, new_active_side={}, no need to change. <<<<<<'.format(self.active_side, new_active_side))
+                self.info('current active_side={}, new_active_side={}, no need to change. <<<<<<'.format(
+                    self.active_side, new_active_side))
                 return
 
             # Need to toggle active side
             if new_active_side == TOGGLE:
                 new_active_side = UPPER_TOR if self.active_side == LOWER_TOR else LOWER_TOR
 
-            new_active_port = self.ports[new_active_side]
-
             if len(self.flows['downstream']['out_sides']) == 1:
-                action_desc = '{}:"{}"'.format(OUTPUT, self.ports[NIC])
-                run_cmd(DEL_FLOW_CMD.format(
-                    self.bridge,
-                    self.active_port))
-                # Immediately update state after flow config changed to ensure consistency
-                self._active_standby_state_helper(None)
-                self.flows['downstream']['in_side'] = self.active_side
-                self.flows['downstream']['out_sides'] = []
-
-                run_cmd(ADD_FLOW_CMD.format(
-                    self.bridge,
-                    new_active_port,
-                    action_desc))
-                # Immediately update state after flow config changed to ensure consistency
+                # Move the downstream flow to the new active port, removing the flow and adding the new flow are done
+                # by one ovs-ofctl command
+                self._apply_flow_mods([
+                    DEL_FLOW_MOD.format(self.active_port),
+                    ADD_FLOW_MOD.format(self.ports[new_active_side], '{}:"{}"'.format(OUTPUT, self.ports[NIC]))
+                ])
                 self._active_standby_state_helper(new_active_side)
                 self.flows['downstream']['in_side'] = self.active_side
                 self.flows['downstream']['out_sides'] = [NIC]
@@ -412,9 +464,23 @@ class Mux(object):
 
             # Increase flap counter
             self.flap_counter += 1
+            self._status = None
 
             self.info('updated mux active side to {} <<<<<<'.format(new_active_side))
 
+    def _apply_flow_mods(self, flow_mods):
+        """Apply flow mods to the bridge. If it fails, the flows may be partly changed, read them back from the
+        bridge to keep the state consistent with the flows.
+        """
+        try:
+            run_flow_mods(self.bridge, flow_mods)
+        except Exception:
+            self.error('failed to apply flow mods, reading back the flows')
+            self._status = None
+            self._init_flows()
+            self._get_flows()
+            raise
+
     def _update_downstream_flow(self, new_action):
         self.debug('updating downstream flow, new_action={}'.format(new_action))
 
@@ -449,7 +515,8 @@ class Mux(object):
             self.flows['downstream']['in_side'] = active_side
             self.flows['downstream']['out_sides'] = [NIC]
 
-        self.debug('updated downstream flow, new_action={}, flows={}'.format(new_action, json.dumps(self.flows, indent=2)))
+        self.debug('updated downstream flow, new_action={}, flows={}'.format(
+            new_action, json.dumps(self.flows, indent=2)))
 
     def _update_upstream_flow(self, new_action, out_sides=[]):
         """Update upstream flow. Apply new action to sides specified in out_sides.
@@ -466,7 +533,9 @@ class Mux(object):
 
         # Figure out target upstream out_sides
         if new_action == DROP:
-            target_out_sides = [out_side for out_side in self.flows['upstream']['out_sides'] if out_side not in out_sides]
+            target_out_sides = [
+                out_side for out_side in self.flows['upstream']['out_sides'] if out_side not in out_sides
+            ]
         else:
             target_out_sides = list(set(self.flows['upstream']['out_sides'] + out_sides))
 
@@ -502,7 +571,8 @@ class Mux(object):
                     self.ports[NIC],
                     action_desc))
             self.flows['upstream']['out_sides'] = target_out_sides
-        self.debug('updated upstream flow, new_action={}, out_sides={}, flows={}'.format(new_action, out_sides, json.dumps(self.flows, indent=2)))
+        self.debug('updated upstream flow, new_action={}, out_sides={}, flows={}'.format(
+            new_action, out_sides, json.dumps(self.flows, indent=2)))
 
     def update_flows(self, new_action, out_sides):
         """
@@ -511,7 +581,9 @@ class Mux(object):
         Item in out_sides could be any of: 'nic', 'upper_tor', 'lower_tor'.
         """
         with self.lock:
-            self.info('>>>>> calling update_flows, new_action={}, out_sides={}, current flow:\n{}'.format(new_action, out_sides, json.dumps(self.flows, indent=2)))
+            self.info('>>>>> calling update_flows, new_action={}, out_sides={}, current flow:\n{}'.format(
+                new_action, out_sides, json.dumps(self.flows, indent=2)))
+            self._status = None
             if NIC in out_sides:
                 self._update_downstream_flow(new_action)
             tor_sides = [out_side for out_side in out_sides if out_side != NIC]
@@ -530,6 +602,7 @@ class Mux(object):
         with self.lock:
             self.info('clear flap counter')
             self.flap_counter = 0
+            self._status = None
             self.info('clear flap counter done')
 
 
@@ -572,8 +645,26 @@ class Muxes(object):
             mux.set_active_side(new_active_side)
             return mux.status
         else:
-            [mux.set_active_side(new_active_side) for mux in self.muxes.values()]
-            return {mux.bridge: mux.status for mux in self.muxes.values()}
+            return self.bulk_set_active_side(new_active_side)
+
+    def bulk_set_active_side(self, new_active_side, port_indices=None):
+        """Set the active side of multiple mux bridges.
+
+        The bridges are configured concurrently, each of them with one ovs-ofctl command.
+
+        Args:
+            new_active_side (string): One of "upper_tor", "lower_tor", "toggle" or "random".
+            port_indices (list, optional): Index of the ports to change. Defaults to None for all the ports.
+
+        Returns:
+            dict: Status of the changed mux bridges.
+        """
+        if port_indices is None:
+            muxes = list(self.muxes.values())
+        else:
+            muxes = [self._port_to_mux(port_index) for port_index in port_indices]
+        run_concurrently(lambda mux: mux.set_active_side(new_active_side), muxes)
+        return {mux.bridge: mux.status for mux in muxes}
 
     def update_flows(self, new_action, out_sides, port_index=None):
         if port_index is not None:
@@ -581,7 +672,7 @@ class Muxes(object):
             mux.update_flows(new_action, out_sides)
             return mux.status
         else:
-            [mux.update_flows(new_action, out_sides) for mux in self.muxes.values()]
+            run_concurrently(lambda mux: mux.update_flows(new_action, out_sides), self.muxes.values())
             return {mux.bridge: mux.status for mux in self.muxes.values()}
 
     def reset_flows(self, port_index=None):
@@ -611,6 +702,58 @@ class Muxes(object):
             return len(self.muxes) > 0
 
 
+class Metrics(object):
+    '''Latency of the requests per endpoint
+
+    Requests are counted per method and url rule, like "GET /mux/<vm_set>". The percentiles are calculated from the
+    latest LATENCY_WINDOW requests of each endpoint.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, latency, failed=False):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'latest': deque(maxlen=LATENCY_WINDOW)}
+                self.endpoints[endpoint] = stats
+            stats['count'] += 1
+            if failed:
+                stats['errors'] += 1
+            stats['total'] += latency
+            stats['max'] = max(stats['max'], latency)
+            stats['latest'].append(latency)
+
+    def clear(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def report(self):
+        """Return the count, errors and latency in milliseconds of each endpoint"""
+        def percentile(latencies, pct):
+            return latencies[min(int(len(latencies) * pct / 100.0), len(latencies) - 1)]
+
+        res = {}
+        with self.lock:
+            for endpoint, stats in self.endpoints.items():
+                latest = sorted(stats['latest'])
+                res[endpoint] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(stats['total'] * 1000 / stats['count'], 3),
+                    'max_ms': round(stats['max'] * 1000, 3),
+                    'p50_ms': round(percentile(latest, 50) * 1000, 3),
+                    'p90_ms': round(percentile(latest, 90) * 1000, 3),
+                    'p99_ms': round(percentile(latest, 99) * 1000, 3)
+                }
+        return res
+
+
+g_metrics = Metrics()       # Latency of the requests
+
+
 def create_muxes(vm_set):
     app.logger.info('####################### COLLECTING BRIDGE STATUS #######################')
     global g_muxes
@@ -620,6 +763,20 @@ def create_muxes(vm_set):
 
 ###################################################### Views #########################################################
 
+@app.before_request
+def start_request_timer():
+    g.start_time = time.time()
+
+
+@app.after_request
+def record_request_latency(response):
+    # Requests to unknown urls have no url_rule, they are not recorded
+    if request.url_rule is not None and 'start_time' in g:
+        endpoint = '{} {}'.format(request.method, request.url_rule.rule)
+        g_metrics.record(endpoint, time.time() - g.start_time, failed=response.status_code >= 400)
+    return response
+
+
 def _validate_posted_data(request):
     """Validate json data in POST request.
 
@@ -765,6 +922,34 @@ def mux_cable_flow_update(vm_set, port_index, action):
         return g_muxes.update_flows(action, data['out_sides'], port_index)
 
 
+@app.route('/mux/<vm_set>/toggle', methods=['POST'])
+def bulk_toggle(vm_set):
+    """Handler for setting the active side of multiple mux bridges in one request.
+
+    Posted json data should be like:
+        {"active_side": "upper_tor|lower_tor|toggle|random", "port_indices": [0, 1, ...]}
+    "port_indices" is optional, all the mux bridges of the vm_set are changed if it is not specified.
+
+    Returns:
+        object: Return a flask response object.
+    """
+    _validate_vm_set(vm_set)
+    data = _validate_posted_data(request)
+    port_indices = data.get('port_indices')
+    if port_indices is not None:
+        if not isinstance(port_indices, list) \
+                or not all(isinstance(port_index, int) and g_muxes.has_mux(port_index) for port_index in port_indices):
+            abort(400, description='remote_addr={} method={} url={} data={} msg={}'.format(
+                request.remote_addr,
+                request.method,
+                request.url,
+                json.dumps(data),
+                'Expected "port_indices" to be a list of index of existing mux bridges'
+            ))
+    app.logger.info('===== {} POST {} with {} ====='.format(request.remote_addr, request.url, json.dumps(data)))
+    return g_muxes.bulk_set_active_side(data['active_side'], port_indices)
+
+
 @app.route('/mux/<vm_set>/reset', methods=['POST'])
 def reset_flow_handler(vm_set):
     _validate_vm_set(vm_set)
@@ -830,6 +1015,19 @@ def reload_muxes(vm_set):
     return g_muxes.get_mux_status()
 
 
+@app.route('/mux/<vm_set>/metrics', methods=['GET', 'DELETE'])
+def metrics(vm_set):
+    """Handler for the latency of the requests per endpoint.
+
+    For GET request, return count, errors and latency of the requests of each endpoint.
+    For DELETE request, clear the collected metrics.
+    """
+    _validate_vm_set(vm_set)
+    if request.method == 'DELETE':
+        g_metrics.clear()
+    return g_metrics.report()
+
+
 @app.route('/mux/<vm_set>/log', methods=['POST'])
 def log_message(vm_set):
     """
@@ -889,4 +1087,4 @@ if __name__ == '__main__':
     app.logger.info('Starting server on port {}'.format(sys.argv[1]))
     create_muxes(arg_vm_set)
     app.logger.info('####################### STARTING HTTP SERVER #######################')
-    app.run(host='0.0.0.0', port=http_port, threaded=False)
+    app.run(host='0.0.0.0', port=http_port, threaded=True)
@@ -7,6 +7,8 @@ import re
 import subprocess
 import shlex
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import logging
@@ -56,6 +58,10 @@ description:
       - disconnect all VM ports from the DUT
     - With cmd: 'disconnect-vms' the module:
       - reconnect all VM ports to the DUT
+    - In check mode the module returns the ovs commands and flows of cmd 'create', 'destroy', 'bind',
+      'renumber', 'unbind', 'connect-vms' or 'disconnect-vms' in ovs_plan, without running them.
+      For 'unbind' only the ovs port removals are returned, the ports are read from the bridges and the
+      bridges which are missing or can't be read are left out of the plan. The other commands are skipped
 
 
 Parameters:
@@ -200,9 +206,156 @@ def adaptive_temporary_interface(vm_set_name, interface_name, reserved_space=0):
     return t_int_if
 
 
+class OvsPortNames(dict):
+    """Port bindings used in dry run, the ports are referred by name"""
+
+    def __missing__(self, key):
+        return key
+
+
+class LinkBatch(object):
+    """
+    Links of the host and of the namespaces, the link changes are queued and applied with "ip -batch".
+
+    The links of a namespace are read with one "ip -json link show" on the first lookup. The queued changes
+    are applied to the snapshot as well, so the lookups return the links as they will be after apply(). Only
+    the changes to get to the wanted state are queued, on a server already set up nothing is run.
+
+    apply() runs the host batch first, since it creates the veths and moves them into the namespaces, then the
+    batches of the namespaces concurrently.
+    """
+
+    def __init__(self):
+        self.links = {}
+        self.batches = {}
+
+    @staticmethod
+    def ns_cmd(cmdline, pid=None, netns=None):
+        """Prefix cmdline to run it in the namespace of a docker or in a netns, pid takes precedence"""
+        if pid:
+            return 'nsenter -t %s -n %s' % (pid, cmdline)
+        elif netns:
+            return 'ip netns exec %s %s' % (netns, cmdline)
+        return cmdline
+
+    def ns_links(self, pid=None, netns=None):
+        ns = LinkBatch.ns_cmd('', pid=pid, netns=netns)
+        if ns not in self.links:
+            out = VMTopology.cmd(LinkBatch.ns_cmd('ip -d -json link show', pid=pid, netns=netns))
+            links = {}
+            for link in json.loads(out or '[]'):
+                links[link['ifname']] = {
+                    'mtu': link.get('mtu'),
+                    'up': 'UP' in link.get('flags', []),
+                    # veth peer in the same namespace, or lower device of a vlan
+                    'link': None if 'link_netnsid' in link else link.get('link'),
+                }
+            self.links[ns] = links
+        return self.links[ns]
+
+    def exists(self, intf, pid=None, netns=None):
+        return intf in self.ns_links(pid=pid, netns=netns)
+
+    def queue(self, cmdline, pid=None, netns=None):
+        ns = LinkBatch.ns_cmd('', pid=pid, netns=netns)
+        if ns not in self.batches:
+            self.batches[ns] = []
+        self.batches[ns].append(cmdline)
+
+    def add_veth(self, intf, peer):
+        links = self.ns_links()
+        self.queue('link add %s type veth peer name %s' % (intf, peer))
+        links[intf] = {'mtu': None, 'up': False, 'link': peer}
+        links[peer] = {'mtu': None, 'up': False, 'link': intf}
+
+    def add_vlan(self, intf, vlan_intf, vlan_id, pid=None, netns=None):
+        links = self.ns_links(pid=pid, netns=netns)
+        self.queue('link add link %s name %s type vlan id %s' % (intf, vlan_intf, vlan_id), pid=pid, netns=netns)
+        links[vlan_intf] = {'mtu': None, 'up': False, 'link': intf}
+
+    def delete(self, intf, pid=None, netns=None):
+        links = self.ns_links(pid=pid, netns=netns)
+        self.queue('link del dev %s' % intf, pid=pid, netns=netns)
+
+        # the veth peer and the vlans on top of the link go away as well
+        def remove(name):
+            links.pop(name, None)
+            for other in [k for k, v in links.items() if v['link'] == name]:
+                remove(other)
+        remove(intf)
+
+    def set_mtu(self, intf, mtu, pid=None, netns=None):
+        link = self.ns_links(pid=pid, netns=netns).get(intf)
+        if link is None or link['mtu'] != mtu:
+            self.queue('link set dev %s mtu %d' % (intf, mtu), pid=pid, netns=netns)
+        if link is not None:
+            link['mtu'] = mtu
+
+    def set_up(self, intf, pid=None, netns=None):
+        link = self.ns_links(pid=pid, netns=netns).get(intf)
+        if link is None or not link['up']:
+            self.queue('link set dev %s up' % intf, pid=pid, netns=netns)
+        if link is not None:
+            link['up'] = True
+
+    def move(self, intf, pid=None, netns=None):
+        """move a link of the host into the namespace of a docker or into a netns"""
+        links = self.ns_links()
+        ns_links = self.ns_links(pid=pid, netns=netns)
+        self.queue('link set dev %s netns %s' % (intf, pid if pid else netns))
+        link = links.pop(intf)
+        for other in links.values():
+            if other['link'] == intf:
+                other['link'] = None
+        link['link'] = None
+        ns_links[intf] = link
+
+    def rename(self, intf, new_intf, pid=None, netns=None):
+        links = self.ns_links(pid=pid, netns=netns)
+        self.queue('link set dev %s name %s' % (intf, new_intf), pid=pid, netns=netns)
+        links[new_intf] = links.pop(intf)
+        for other in links.values():
+            if other['link'] == intf:
+                other['link'] = new_intf
+
+    def apply(self):
+        batches, self.batches = self.batches, {}
+        # read the links again on the next lookup
+        self.links = {}
+        if '' in batches:
+            LinkBatch.run_batch('', batches.pop(''))
+
+        errors = []
+
+        def run(ns, cmds):
+            try:
+                LinkBatch.run_batch(ns, cmds)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(ns, cmds)) for ns, cmds in batches.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def run_batch(ns, cmds):
+        logging.info('=== Apply %d link changes%s ===\n%s'
+                     % (len(cmds), ' in "%s"' % ns.strip() if ns else '', '\n'.join(cmds)))
+        with tempfile.NamedTemporaryFile(mode='w', prefix='ip-links-', suffix='.txt', delete=False) as fp:
+            fp.write('\n'.join(cmds + ['']))
+        try:
+            VMTopology.cmd(ns + 'ip -batch %s' % fp.name)
+        finally:
+            os.remove(fp.name)
+
+
 class VMTopology(object):
 
-    def __init__(self, vm_names, vm_properties, fp_mtu, max_fp_num, topo):
+    def __init__(self, vm_names, vm_properties, fp_mtu, max_fp_num, topo, dry_run=False):
         self.vm_names = vm_names
         self.vm_properties = vm_properties
         self.fp_mtu = fp_mtu
@@ -211,6 +364,9 @@ class VMTopology(object):
         self._host_interfaces = None
         self._disabled_host_interfaces = None
         self._host_interfaces_active_active = None
+        # with dry_run the ovs commands are recorded in ovs_plan instead of being executed
+        self.dry_run = dry_run
+        self.ovs_plan = []
         return
 
     def init(self, vm_set_name, vm_base, duts_fp_ports, duts_name, ptf_exists=True, check_bridge=True):
@@ -384,12 +540,12 @@ class VMTopology(object):
 
     def create_ovs_bridge(self, bridge_name, mtu):
         logging.info('=== Create bridge %s with mtu %d ===' % (bridge_name, mtu))
-        VMTopology.cmd('ovs-vsctl --may-exist add-br %s' % bridge_name)
+        self.ovs_cmd(bridge_name, 'ovs-vsctl --may-exist add-br %s' % bridge_name)
 
         if mtu != DEFAULT_MTU:
-            VMTopology.cmd('ifconfig %s mtu %d' % (bridge_name, mtu))
+            self.ovs_cmd(bridge_name, 'ifconfig %s mtu %d' % (bridge_name, mtu))
 
-        VMTopology.cmd('ifconfig %s up' % bridge_name)
+        self.ovs_cmd(bridge_name, 'ifconfig %s up' % bridge_name)
 
     def destroy_bridges(self):
         for vm in self.vm_names:
@@ -404,7 +560,7 @@ class VMTopology(object):
 
     def destroy_ovs_bridge(self, bridge_name):
         logging.info('=== Destroy bridge %s ===' % bridge_name)
-        VMTopology.cmd('ovs-vsctl --if-exists del-br %s' % bridge_name)
+        self.ovs_cmd(bridge_name, 'ovs-vsctl --if-exists del-br %s' % bridge_name)
 
     def get_vm_bridges(self, vmname):
         brs = []
@@ -425,6 +581,7 @@ class VMTopology(object):
             PTF (int_if) ----------- injected port (ext_if)
 
         """
+        links = LinkBatch()
         for vm, vlans in self.injected_fp_ports.items():
             for vlan in vlans:
                 (_, _, ptf_index) = VMTopology.parse_vm_vlan_port(vlan)
@@ -438,11 +595,13 @@ class VMTopology(object):
                     self.add_veth_if_to_docker(
                         ext_if, int_if,
                         create_vlan_subintf=create_vlan_subintf,
+                        links=links,
                         sub_interface_separator=vlan_subintf_sep,
                         sub_interface_vlan_id=vlan_subintf_vlan_id
                     )
                 else:
-                    self.add_veth_if_to_docker(ext_if, int_if)
+                    self.add_veth_if_to_docker(ext_if, int_if, links=links)
+        links.apply()
 
     def add_mgmt_port_to_docker(self, mgmt_bridge, mgmt_ip, mgmt_gw, mgmt_ipv6_addr=None, mgmt_gw_v6=None, api_server_pid=None):
         if api_server_pid:
@@ -531,25 +690,32 @@ class VMTopology(object):
                     VMTopology.cmd("ip netns exec %s ip -6 route flush default" % (self.netns))
                     VMTopology.cmd("ip netns exec %s ip -6 route add default via %s dev %s" % (self.netns, default_gw_v6, int_if))
 
-    def add_dut_if_to_docker(self, iface_name, dut_iface):
+    def add_dut_if_to_docker(self, iface_name, dut_iface, links=None):
         logging.info("=== Add DUT interface %s to PTF docker as %s ===" % (dut_iface, iface_name))
-        if VMTopology.intf_exists(dut_iface) \
-            and VMTopology.intf_not_exists(dut_iface, pid=self.pid) \
-            and VMTopology.intf_not_exists(iface_name, pid=self.pid):
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.pid, dut_iface))
+        batch = links or LinkBatch()
+        if batch.exists(dut_iface) \
+            and not batch.exists(dut_iface, pid=self.pid) \
+            and not batch.exists(iface_name, pid=self.pid):
+            batch.move(dut_iface, pid=self.pid)
 
-        if VMTopology.intf_exists(dut_iface, pid=self.pid) and VMTopology.intf_not_exists(iface_name, pid=self.pid):
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, dut_iface, iface_name))
+        if batch.exists(dut_iface, pid=self.pid) and not batch.exists(iface_name, pid=self.pid):
+            batch.rename(dut_iface, iface_name, pid=self.pid)
 
-        VMTopology.iface_up(iface_name, pid=self.pid)
+        batch.set_up(iface_name, pid=self.pid)
+        if links is None:
+            batch.apply()
 
-    def add_dut_vlan_subif_to_docker(self, iface_name, vlan_separator, vlan_id):
+    def add_dut_vlan_subif_to_docker(self, iface_name, vlan_separator, vlan_id, links=None):
         """Create a vlan sub interface for the ptf interface."""
-        if VMTopology.intf_not_exists(iface_name, pid=self.pid):
+        batch = links or LinkBatch()
+        if not batch.exists(iface_name, pid=self.pid):
             raise ValueError("Interface %s not present in docker" % iface_name)
         vlan_sub_iface_name = iface_name + vlan_separator + vlan_id
-        VMTopology.cmd("nsenter -t %s -n ip link add link %s name %s type vlan id %s" % (self.pid, iface_name, vlan_sub_iface_name, vlan_id))
-        VMTopology.cmd("nsenter -t %s -n ip link set %s up" % (self.pid, vlan_sub_iface_name))
+        if not batch.exists(vlan_sub_iface_name, pid=self.pid):
+            batch.add_vlan(iface_name, vlan_sub_iface_name, vlan_id, pid=self.pid)
+        batch.set_up(vlan_sub_iface_name, pid=self.pid)
+        if links is None:
+            batch.apply()
 
     def remove_dut_if_from_docker(self, iface_name, dut_iface):
 
@@ -574,8 +740,11 @@ class VMTopology(object):
         if VMTopology.intf_exists(vlan_sub_iface_name, pid=self.pid):
             VMTopology.cmd("nsenter -t %s -n ip link del %s" % (self.pid, vlan_sub_iface_name))
 
-    def add_veth_if_to_docker(self, ext_if, int_if, create_vlan_subintf=False, **kwargs):
-        """Create vethernet devices (ext_if, int_if) and put int_if into the ptf docker."""
+    def add_veth_if_to_docker(self, ext_if, int_if, create_vlan_subintf=False, links=None, **kwargs):
+        """Create vethernet devices (ext_if, int_if) and put int_if into the ptf docker.
+
+        The link changes are queued in links and applied by the caller, without links they are applied here.
+        """
         logging.info('=== Create veth pair %s/%s, set %s to PTF docker namespace ===' % (ext_if, int_if, int_if))
         if create_vlan_subintf:
             try:
@@ -590,85 +759,94 @@ class VMTopology(object):
             int_sub_if = int_if + vlan_subintf_sep + vlan_subintf_vlan_id
             t_int_sub_if = t_int_if + vlan_subintf_sep + vlan_subintf_vlan_id
 
-        if VMTopology.intf_exists(t_int_if):
-            VMTopology.cmd("ip link del dev %s" % t_int_if)
+        batch = links or LinkBatch()
+        if batch.exists(t_int_if):
+            batch.delete(t_int_if)
 
-        if VMTopology.intf_not_exists(ext_if):
-            VMTopology.cmd("ip link add %s type veth peer name %s" % (ext_if, t_int_if))
+        if not batch.exists(ext_if):
+            batch.add_veth(ext_if, t_int_if)
             if create_vlan_subintf:
-                VMTopology.cmd("vconfig add %s %s" % (t_int_if, vlan_subintf_vlan_id))
+                batch.add_vlan(t_int_if, t_int_sub_if, vlan_subintf_vlan_id)
 
         if self.fp_mtu != DEFAULT_MTU:
-            VMTopology.cmd("ip link set dev %s mtu %d" % (ext_if, self.fp_mtu))
-            if VMTopology.intf_exists(t_int_if):
-                VMTopology.cmd("ip link set dev %s mtu %d" % (t_int_if, self.fp_mtu))
-            elif VMTopology.intf_exists(t_int_if, pid=self.pid):
-                VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, t_int_if, self.fp_mtu))
-            elif VMTopology.intf_exists(int_if, pid=self.pid):
-                VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, int_if, self.fp_mtu))
+            batch.set_mtu(ext_if, self.fp_mtu)
+            if batch.exists(t_int_if):
+                batch.set_mtu(t_int_if, self.fp_mtu)
+            elif batch.exists(t_int_if, pid=self.pid):
+                batch.set_mtu(t_int_if, self.fp_mtu, pid=self.pid)
+            elif batch.exists(int_if, pid=self.pid):
+                batch.set_mtu(int_if, self.fp_mtu, pid=self.pid)
             if create_vlan_subintf:
-                if VMTopology.intf_exists(t_int_sub_if):
-                    VMTopology.cmd("ip link set dev %s mtu %d" % (t_int_sub_if, self.fp_mtu))
-                elif VMTopology.intf_exists(t_int_sub_if, pid=self.pid):
-                    VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, t_int_sub_if, self.fp_mtu))
-                elif VMTopology.intf_exists(int_sub_if, pid=self.pid):
-                    VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, int_sub_if, self.fp_mtu))
-
-        VMTopology.iface_up(ext_if)
-
-        if VMTopology.intf_exists(t_int_if) \
-            and VMTopology.intf_not_exists(t_int_if, pid=self.pid) \
-            and VMTopology.intf_not_exists(int_if, pid=self.pid):
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.pid, t_int_if))
+                if batch.exists(t_int_sub_if):
+                    batch.set_mtu(t_int_sub_if, self.fp_mtu)
+                elif batch.exists(t_int_sub_if, pid=self.pid):
+                    batch.set_mtu(t_int_sub_if, self.fp_mtu, pid=self.pid)
+                elif batch.exists(int_sub_if, pid=self.pid):
+                    batch.set_mtu(int_sub_if, self.fp_mtu, pid=self.pid)
+
+        batch.set_up(ext_if)
+
+        if batch.exists(t_int_if) \
+            and not batch.exists(t_int_if, pid=self.pid) \
+            and not batch.exists(int_if, pid=self.pid):
+            batch.move(t_int_if, pid=self.pid)
         if create_vlan_subintf \
-            and VMTopology.intf_exists(t_int_sub_if) \
-            and VMTopology.intf_not_exists(t_int_sub_if, pid=self.pid) \
-            and VMTopology.intf_not_exists(int_sub_if, pid=self.pid):
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.pid, t_int_sub_if))
+            and batch.exists(t_int_sub_if) \
+            and not batch.exists(t_int_sub_if, pid=self.pid) \
+            and not batch.exists(int_sub_if, pid=self.pid):
+            batch.move(t_int_sub_if, pid=self.pid)
 
-        if VMTopology.intf_exists(t_int_if, pid=self.pid) and VMTopology.intf_not_exists(int_if, pid=self.pid):
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, t_int_if, int_if))
+        if batch.exists(t_int_if, pid=self.pid) and not batch.exists(int_if, pid=self.pid):
+            batch.rename(t_int_if, int_if, pid=self.pid)
         if create_vlan_subintf \
-            and VMTopology.intf_exists(t_int_sub_if, pid=self.pid) \
-            and VMTopology.intf_not_exists(int_sub_if, pid=self.pid):
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, t_int_sub_if, int_sub_if))
+            and batch.exists(t_int_sub_if, pid=self.pid) \
+            and not batch.exists(int_sub_if, pid=self.pid):
+            batch.rename(t_int_sub_if, int_sub_if, pid=self.pid)
 
-        VMTopology.iface_up(int_if, pid=self.pid)
+        batch.set_up(int_if, pid=self.pid)
         if create_vlan_subintf:
-            VMTopology.iface_up(int_sub_if, pid=self.pid)
+            batch.set_up(int_sub_if, pid=self.pid)
+        if links is None:
+            batch.apply()
 
-    def add_veth_if_to_netns(self, ext_if, int_if):
-        """Create vethernet devices (ext_if, int_if) and put int_if into the netns for active-active."""
+    def add_veth_if_to_netns(self, ext_if, int_if, links=None):
+        """Create vethernet devices (ext_if, int_if) and put int_if into the netns for active-active.
+
+        The link changes are queued in links and applied by the caller, without links they are applied here.
+        """
         logging.info('=== Create veth pair %s/%s, set %s to netns %s ===' % (ext_if, int_if, int_if, self.netns))
 
         t_int_if = adaptive_temporary_interface(self.vm_set_name, int_if)
 
-        if VMTopology.intf_exists(t_int_if):
-            VMTopology.cmd("ip link del dev %s" % t_int_if)
+        batch = links or LinkBatch()
+        if batch.exists(t_int_if):
+            batch.delete(t_int_if)
 
-        if VMTopology.intf_not_exists(ext_if):
-            VMTopology.cmd("ip link add %s type veth peer name %s" % (ext_if, t_int_if))
+        if not batch.exists(ext_if):
+            batch.add_veth(ext_if, t_int_if)
 
         if self.fp_mtu != DEFAULT_MTU:
-            VMTopology.cmd("ip link set dev %s mtu %d" % (ext_if, self.fp_mtu))
-            if VMTopology.intf_exists(t_int_if):
-                VMTopology.cmd("ip link set dev %s mtu %d" % (t_int_if, self.fp_mtu))
-            elif VMTopology.intf_exists(t_int_if, netns=self.netns):
-                VMTopology.cmd("ip netns exec %s ip link set dev %s mtu %d" % (self.netns, t_int_if, self.fp_mtu))
-            elif VMTopology.intf_exists(int_if, netns=self.netns):
-                VMTopology.cmd("ip netns exec %s ip link set dev %s mtu %d" % (self.netns, int_if, self.fp_mtu))
+            batch.set_mtu(ext_if, self.fp_mtu)
+            if batch.exists(t_int_if):
+                batch.set_mtu(t_int_if, self.fp_mtu)
+            elif batch.exists(t_int_if, netns=self.netns):
+                batch.set_mtu(t_int_if, self.fp_mtu, netns=self.netns)
+            elif batch.exists(int_if, netns=self.netns):
+                batch.set_mtu(int_if, self.fp_mtu, netns=self.netns)
 
-        VMTopology.iface_up(ext_if)
+        batch.set_up(ext_if)
 
-        if VMTopology.intf_exists(t_int_if) \
-            and VMTopology.intf_not_exists(t_int_if, netns=self.netns) \
-            and VMTopology.intf_not_exists(int_if, netns=self.netns):
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.netns, t_int_if))
+        if batch.exists(t_int_if) \
+            and not batch.exists(t_int_if, netns=self.netns) \
+            and not batch.exists(int_if, netns=self.netns):
+            batch.move(t_int_if, netns=self.netns)
 
-        if VMTopology.intf_exists(t_int_if, netns=self.netns) and VMTopology.intf_not_exists(int_if, netns=self.netns):
-            VMTopology.cmd("ip netns exec %s ip link set dev %s name %s" % (self.netns, t_int_if, int_if))
+        if batch.exists(t_int_if, netns=self.netns) and not batch.exists(int_if, netns=self.netns):
+            batch.rename(t_int_if, int_if, netns=self.netns)
 
-        VMTopology.iface_up(int_if, netns=self.netns)
+        batch.set_up(int_if, netns=self.netns)
+        if links is None:
+            batch.apply()
 
     def bind_mgmt_port(self, br_name, mgmt_port):
         logging.info('=== Bind mgmt port %s to bridge %s ===' % (mgmt_port, br_name))
@@ -703,18 +881,17 @@ class VMTopology(object):
             self.destroy_ovs_bridge(interconnection_bridge)
 
     def bind_devices_interconnect_ports(self, br_name, vlan1_iface, vlan2_iface):
-        ports = VMTopology.get_ovs_br_ports(br_name)
-        if vlan1_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, vlan1_iface))
-        if vlan2_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, vlan2_iface))
-        bindings = VMTopology.get_ovs_port_bindings(br_name)
-        vlan1_iface_id = bindings[vlan1_iface]
-        vlan2_iface_id = bindings[vlan2_iface]
-        # clear old bindings
-        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
-        VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, vlan1_iface_id, vlan2_iface_id))
-        VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, vlan2_iface_id, vlan1_iface_id))
+        self.add_ovs_ports(br_name, [vlan1_iface, vlan2_iface])
+        bindings = self.ovs_port_bindings(br_name)
+        flows = VMTopology.devices_interconnect_flows(bindings[vlan1_iface], bindings[vlan2_iface])
+        self.apply_ovs_flows(br_name, flows)
+
+    @staticmethod
+    def devices_interconnect_flows(vlan1_iface_id, vlan2_iface_id):
+        return [
+            "table=0,in_port=%s,action=output:%s" % (vlan1_iface_id, vlan2_iface_id),
+            "table=0,in_port=%s,action=output:%s" % (vlan2_iface_id, vlan1_iface_id),
+        ]
 
     def bind_fp_ports(self, disconnect_vm=False):
         """
@@ -792,26 +969,23 @@ class VMTopology(object):
         # 30 of each DUT together into bridge br_name
         # Also for vm, a dut's ports would be of the format <dut_hostname>-<port_num + 1>. So, port '30' on vm with
         # name 'vlab-02' would be 'vlab-02-31'
-        br_ports = VMTopology.get_ovs_br_ports(br_name)
+        port_names = []
         for dut_index, a_port in enumerate(dut_ports):
             dut_name = self.duts_name[dut_index]
-            port_name = "{}-{}".format(dut_name, (a_port + 1))
-            br = VMTopology.get_ovs_bridge_by_port(port_name)
-            if br is not None and br != br_name:
-                VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, port_name))
-
-            if port_name not in br_ports:
-                VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, port_name))
+            port_names.append("{}-{}".format(dut_name, (a_port + 1)))
+        self.add_ovs_ports(br_name, port_names)
 
     def unbind_vs_dut_ports(self, br_name, dut_ports):
         """unbind all ports except the vm port from an ovs bridge"""
-        if VMTopology.intf_exists(br_name):
-            ports = VMTopology.get_ovs_br_ports(br_name)
+        ports = self.existing_ovs_br_ports(br_name)
+        if ports is not None:
+            port_names = []
             for dut_index, a_port in enumerate(dut_ports):
                 dut_name = self.duts_name[dut_index]
                 port_name = "{}-{}".format(dut_name, (a_port + 1))
                 if port_name in ports:
-                    VMTopology.cmd('ovs-vsctl del-port %s %s' % (br_name, port_name))
+                    port_names.append(port_name)
+            self.del_ovs_ports(br_name, port_names)
 
     def bind_ovs_ports(self, br_name, dut_iface, injected_iface, vm_iface, disconnect_vm=False):
         """
@@ -823,79 +997,115 @@ class VMTopology(object):
                                    |                      +---- vm_iface
                                    +----------------------+
         """
-        br = VMTopology.get_ovs_bridge_by_port(injected_iface)
-        if br is not None and br != br_name:
-            VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, injected_iface))
-
-        br = VMTopology.get_ovs_bridge_by_port(dut_iface)
-        if br is not None and br != br_name:
-            VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, dut_iface))
-
-        ports = VMTopology.get_ovs_br_ports(br_name)
-        if injected_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, injected_iface))
-
-        if dut_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, dut_iface))
-
-        bindings = VMTopology.get_ovs_port_bindings(br_name, [dut_iface])
-        dut_iface_id = bindings[dut_iface]
-        injected_iface_id = bindings[injected_iface]
-        vm_iface_id = bindings[vm_iface]
-
-        # clear old bindings
-        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
+        self.add_ovs_ports(br_name, [injected_iface, dut_iface])
+        bindings = self.ovs_port_bindings(br_name, [dut_iface])
+        flows = VMTopology.fp_port_flows(bindings[dut_iface], bindings[injected_iface], bindings[vm_iface],
+                                         disconnect_vm)
+        self.apply_ovs_flows(br_name, flows)
 
+    @staticmethod
+    def fp_port_flows(dut_iface_id, injected_iface_id, vm_iface_id, disconnect_vm=False):
+        """Return the flows of a front panel port bridge, see bind_ovs_ports"""
+        flows = []
         if disconnect_vm:
             # Drop packets from VM
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=drop" % (br_name, vm_iface_id))
+            flows.append("table=0,in_port=%s,action=drop" % vm_iface_id)
+            # Add flow from external iface to ptf container
+            flows.append("table=0,in_port=%s,action=output:%s" % (dut_iface_id, injected_iface_id))
         else:
             # Add flow from a VM to an external iface
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, vm_iface_id, dut_iface_id))
+            flows.append("table=0,in_port=%s,action=output:%s" % (vm_iface_id, dut_iface_id))
 
-        if disconnect_vm:
-            # Add flow from external iface to ptf container
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, dut_iface_id, injected_iface_id))
-        else:
             # Add flow from external iface to a VM and a ptf container
             # Allow BGP, IPinIP, fragmented packets, ICMP, SNMP packets and layer2 packets from DUT to neighbors
             # Block other traffic from DUT to EOS for EOS's stability,
             # Allow all traffic from DUT to PTF.
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp,in_port=%s,tp_src=179,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp,in_port=%s,tp_dst=179,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp6,in_port=%s,tp_src=179,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp6,in_port=%s,tp_dst=179,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,ip,in_port=%s,nw_proto=4,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,ip,in_port=%s,nw_frag=yes,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,ipv6,in_port=%s,nw_frag=yes,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,icmp,in_port=%s,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,icmp6,in_port=%s,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp,in_port=%s,udp_src=161,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp,in_port=%s,udp_src=53,action=output:%s" % (br_name, dut_iface_id, vm_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp6,in_port=%s,udp_src=161,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=5,ip,in_port=%s,action=output:%s" % (br_name, dut_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=5,ipv6,in_port=%s,action=output:%s" % (br_name, dut_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=3,in_port=%s,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
+            to_both = "action=output:%s,%s" % (vm_iface_id, injected_iface_id)
+            to_vm = "action=output:%s" % vm_iface_id
+            to_ptf = "action=output:%s" % injected_iface_id
+            for match, action in [
+                    ("priority=10,tcp,in_port=%s,tp_src=179", to_both),
+                    ("priority=10,tcp,in_port=%s,tp_dst=179", to_both),
+                    ("priority=10,tcp6,in_port=%s,tp_src=179", to_both),
+                    ("priority=10,tcp6,in_port=%s,tp_dst=179", to_both),
+                    ("priority=10,ip,in_port=%s,nw_proto=4", to_both),
+                    ("priority=8,ip,in_port=%s,nw_frag=yes", to_both),
+                    ("priority=8,ipv6,in_port=%s,nw_frag=yes", to_both),
+                    ("priority=8,icmp,in_port=%s", to_both),
+                    ("priority=8,icmp6,in_port=%s", to_both),
+                    ("priority=8,udp,in_port=%s,udp_src=161", to_both),
+                    ("priority=8,udp,in_port=%s,udp_src=53", to_vm),
+                    ("priority=8,udp6,in_port=%s,udp_src=161", to_both),
+                    ("priority=5,ip,in_port=%s", to_ptf),
+                    ("priority=5,ipv6,in_port=%s", to_ptf),
+                    ("priority=3,in_port=%s", to_both)]:
+                flows.append("table=0," + (match % dut_iface_id) + "," + action)
 
         # Add flow from a ptf container to an external iface
-        VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, injected_iface_id, dut_iface_id))
+        flows.append("table=0,in_port=%s,action=output:%s" % (injected_iface_id, dut_iface_id))
+        return flows
+
+    def add_ovs_ports(self, br_name, ports):
+        """add the ports to an ovs bridge in one transaction, a port bound to another bridge is moved"""
+        br_ports = set() if self.dry_run else VMTopology.get_ovs_br_ports(br_name)
+        cmds = []
+        for port in ports:
+            if port not in br_ports:
+                cmds.append('-- --if-exists del-port %s -- add-port %s %s' % (port, br_name, port))
+        if cmds:
+            self.ovs_cmd(br_name, 'ovs-vsctl %s' % ' '.join(cmds))
+
+    def del_ovs_ports(self, br_name, ports):
+        """remove the ports from an ovs bridge in one transaction"""
+        if ports:
+            cmds = ['-- del-port %s %s' % (br_name, port) for port in ports]
+            self.ovs_cmd(br_name, 'ovs-vsctl %s' % ' '.join(cmds))
+
+    def ovs_port_bindings(self, br_name, vlan_iface=[]):
+        if self.dry_run:
+            return OvsPortNames()
+        return VMTopology.get_ovs_port_bindings(br_name, vlan_iface)
+
+    def apply_ovs_flows(self, br_name, flows):
+        """replace all the flows of an ovs bridge with one ovs-ofctl replace-flows"""
+        if self.dry_run:
+            self.ovs_plan.append({'bridge': br_name, 'cmd': 'ovs-ofctl replace-flows %s' % br_name, 'flows': flows})
+            return
+        with tempfile.NamedTemporaryFile(mode='w', prefix='ovs-flows-', suffix='.txt', delete=False) as fp:
+            fp.write('\n'.join(flows + ['']))
+        try:
+            VMTopology.cmd('ovs-ofctl replace-flows %s %s' % (br_name, fp.name))
+        finally:
+            os.remove(fp.name)
+
+    def ovs_cmd(self, br_name, cmdline):
+        if self.dry_run:
+            self.ovs_plan.append({'bridge': br_name, 'cmd': cmdline})
+            return ""
+        return VMTopology.cmd(cmdline)
+
+    def existing_ovs_br_ports(self, br_name):
+        """ports of an ovs bridge, None if the bridge doesn't exist or, in dry run, can't be read"""
+        try:
+            if VMTopology.intf_exists(br_name):
+                return VMTopology.get_ovs_br_ports(br_name)
+        except Exception as e:
+            if not self.dry_run:
+                raise
+            logging.warning('Skip bridge %s, failed to read its ports: %s' % (br_name, repr(e)))
+        return None
 
     def unbind_ovs_ports(self, br_name, vm_port):
         """unbind all ports except the vm port from an ovs bridge"""
-        if VMTopology.intf_exists(br_name):
-            ports = VMTopology.get_ovs_br_ports(br_name)
-
-            for port in ports:
-                if port != vm_port:
-                    VMTopology.cmd('ovs-vsctl del-port %s %s' % (br_name, port))
+        ports = self.existing_ovs_br_ports(br_name)
+        if ports is not None:
+            self.del_ovs_ports(br_name, [port for port in ports if port != vm_port])
 
     def unbind_ovs_port(self, br_name, port):
         """unbind a port from an ovs bridge"""
-        if VMTopology.intf_exists(br_name):
-            ports = VMTopology.get_ovs_br_ports(br_name)
-
-            if port in ports:
-                VMTopology.cmd('ovs-vsctl del-port %s %s' % (br_name, port))
+        ports = self.existing_ovs_br_ports(br_name)
+        if ports is not None and port in ports:
+            self.del_ovs_ports(br_name, [port])
 
     def create_dualtor_cable(self, host_ifindex, host_if, upper_if, lower_if, active_if_index=0, nic_if=None):
         """
@@ -921,42 +1131,32 @@ class VMTopology(object):
 
         self.create_ovs_bridge(br_name, self.fp_mtu)
 
-        for intf in [host_if, upper_if, lower_if]:
-            br = VMTopology.get_ovs_bridge_by_port(intf)
-            if br is not None and br != br_name:
-                VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, intf))
-
-        ports = VMTopology.get_ovs_br_ports(br_name)
         ports_to_be_attached = [host_if, upper_if, lower_if]
         if nic_if is not None:
             ports_to_be_attached.append(nic_if)
-        for intf in ports_to_be_attached:
-            if intf not in ports:
-                VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, intf))
+        self.add_ovs_ports(br_name, ports_to_be_attached)
 
         bridge_ports = [upper_if, lower_if]
         if nic_if is not None:
             bridge_ports.append(nic_if)
-        bindings = VMTopology.get_ovs_port_bindings(br_name, bridge_ports)
-        host_if_id = bindings[host_if]
-        upper_if_id = bindings[upper_if]
-        lower_if_id = bindings[lower_if]
-        if nic_if is not None:
-            nic_if_id = bindings[nic_if]
-
-        # clear old bindings
-        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
+        bindings = self.ovs_port_bindings(br_name, bridge_ports)
 
         if nic_if is not None:
             # TODO: open-flow configuration for ovs-bridge simulating server smart NIC
-            pass
+            flows = []
         else:
             # open-flow configuration for ovs-bridge simulating mux of dualtor y-cable
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s,%s" % (br_name, host_if_id, upper_if_id, lower_if_id))
-            if active_if_index == 0:
-                VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, upper_if_id, host_if_id))
-            else:
-                VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, lower_if_id, host_if_id))
+            flows = VMTopology.dualtor_cable_flows(bindings[host_if], bindings[upper_if], bindings[lower_if],
+                                                   active_if_index)
+        self.apply_ovs_flows(br_name, flows)
+
+    @staticmethod
+    def dualtor_cable_flows(host_if_id, upper_if_id, lower_if_id, active_if_index=0):
+        active_if_id = upper_if_id if active_if_index == 0 else lower_if_id
+        return [
+            "table=0,in_port=%s,action=output:%s,%s" % (host_if_id, upper_if_id, lower_if_id),
+            "table=0,in_port=%s,action=output:%s" % (active_if_id, host_if_id),
+        ]
 
     def remove_dualtor_cable(self, host_ifindex, is_active_active=False):
         """
@@ -973,7 +1173,11 @@ class VMTopology(object):
 
         for non-dual topo, inject the dut port into ptf docker.
         for dual-tor topo, create ovs port and add to ptf docker.
+
+        The links are set up first with one batch per namespace, then the dualtor cables are created.
         """
+        links = LinkBatch()
+        cables = []
         for i, intf in enumerate(self.host_interfaces):
             if self._is_multi_duts and not self._is_cable:
                 if isinstance(intf, list):
@@ -988,25 +1192,23 @@ class VMTopology(object):
                     dual_if_template = ACTIVE_ACTIVE_INTERFACES_TEMPLATE if is_active_active else MUXY_INTERFACES_TEMPLATE
                     dual_if = adaptive_name(dual_if_template, self.vm_set_name, host_ifindex)
                     ptf_if = PTF_FP_IFACE_TEMPLATE % host_ifindex
-                    self.add_veth_if_to_docker(dual_if, ptf_if)
+                    self.add_veth_if_to_docker(dual_if, ptf_if, links=links)
 
                     if is_active_active:
                         nic_if = adaptive_name(SERVER_NIC_INTERFACE_TEMPLATE, self.vm_set_name, host_ifindex)
                         ns_if = NETNS_IFACE_TEMPLATE % host_ifindex
-                        self.add_veth_if_to_netns(nic_if, ns_if)
-                        self.add_ip_to_netns_if(ns_if, self.mux_cable_facts[host_ifindex]["soc_ipv4"])
+                        self.add_veth_if_to_netns(nic_if, ns_if, links=links)
                     else:
                         nic_if = None
 
                     upper_tor_if = self.duts_fp_ports[self.duts_name[intf[0][0]]][str(intf[0][1])]
                     lower_tor_if = self.duts_fp_ports[self.duts_name[intf[1][0]]][str(intf[1][1])]
-                    # create muxy cable or active_active_cable for dualtor
-                    self.create_dualtor_cable(host_ifindex, dual_if, upper_tor_if, lower_tor_if, nic_if=nic_if)
+                    cables.append((host_ifindex, dual_if, upper_tor_if, lower_tor_if, nic_if))
                 else:
                     host_ifindex = intf[2] if len(intf) == 3 else i
                     fp_port = self.duts_fp_ports[self.duts_name[intf[0]]][str(intf[1])]
                     ptf_if = PTF_FP_IFACE_TEMPLATE % host_ifindex
-                    self.add_dut_if_to_docker(ptf_if, fp_port)
+                    self.add_dut_if_to_docker(ptf_if, fp_port, links=links)
             elif self._is_multi_duts and self._is_cable:
                 # Since there could be multiple ToR's in cable topology, some Ports
                 # can be connected to muxcable and some to a DAC cable. But it could
@@ -1020,22 +1222,31 @@ class VMTopology(object):
                 if self.duts_fp_ports[self.duts_name[intf[0][0]]].get(str(intf[0][1])) is not None:
                     fp_port = self.duts_fp_ports[self.duts_name[intf[0][0]]][str(intf[0][1])]
                     ptf_if = PTF_FP_IFACE_TEMPLATE % host_ifindex
-                    self.add_dut_if_to_docker(ptf_if, fp_port)
+                    self.add_dut_if_to_docker(ptf_if, fp_port, links=links)
 
                 host_ifindex = intf[1][2]
                 if self.duts_fp_ports[self.duts_name[intf[1][0]]].get(str(intf[1][1])) is not None:
                     fp_port = self.duts_fp_ports[self.duts_name[intf[1][0]]][str(intf[1][1])]
                     ptf_if = PTF_FP_IFACE_TEMPLATE % host_ifindex
-                    self.add_dut_if_to_docker(ptf_if, fp_port)
+                    self.add_dut_if_to_docker(ptf_if, fp_port, links=links)
             else:
                 fp_port = self.duts_fp_ports[self.duts_name[0]][str(intf)]
                 ptf_if = PTF_FP_IFACE_TEMPLATE % intf
-                self.add_dut_if_to_docker(ptf_if, fp_port)
+                self.add_dut_if_to_docker(ptf_if, fp_port, links=links)
                 # only create sub interface for enabled ports defined in t0-backend
                 if self.dut_type == BACKEND_TOR_TYPE and intf not in self.disabled_host_interfaces:
                     vlan_separator = self.topo.get("DUT", {}).get("sub_interface_separator", SUB_INTERFACE_SEPARATOR)
                     vlan_id = self.vlan_ids[str(intf)]
-                    self.add_dut_vlan_subif_to_docker(ptf_if, vlan_separator, vlan_id)
+                    self.add_dut_vlan_subif_to_docker(ptf_if, vlan_separator, vlan_id, links=links)
+
+        links.apply()
+
+        for host_ifindex, dual_if, upper_tor_if, lower_tor_if, nic_if in cables:
+            if nic_if is not None:
+                ns_if = NETNS_IFACE_TEMPLATE % host_ifindex
+                self.add_ip_to_netns_if(ns_if, self.mux_cable_facts[host_ifindex]["soc_ipv4"])
+            # create muxy cable or active_active_cable for dualtor
+            self.create_dualtor_cable(host_ifindex, dual_if, upper_tor_if, lower_tor_if, nic_if=nic_if)
 
     def enable_netns_loopback(self):
         """Enable loopback device in the netns."""
@@ -1495,6 +1706,48 @@ def check_params(module, params, mode):
             raise Exception("Parameter %s is required in %s mode" % (param, mode))
 
 
+def plan_ovs(module, net, cmd):
+    """Return the ovs commands and flows of cmd, net must be in dry run. None if cmd can't be planned"""
+    if cmd == 'create':
+        net.create_bridges()
+    elif cmd == 'destroy':
+        net.destroy_bridges()
+    elif cmd in ['bind', 'renumber', 'connect-vms', 'disconnect-vms', 'unbind']:
+        check_params(module, ['vm_set_name',
+                              'topo',
+                              'duts_fp_ports'], cmd)
+
+        topo = module.params['topo']
+        duts_name = module.params['duts_name']
+        is_multi_duts = True if len(duts_name) > 1 else False
+        _, vms_exists = check_topo(topo, is_multi_duts)
+
+        if vms_exists:
+            check_params(module, ['vm_base'], cmd)
+            vm_base = module.params['vm_base']
+        else:
+            vm_base = None
+
+        net.init(module.params['vm_set_name'], vm_base, module.params['duts_fp_ports'], duts_name,
+                 ptf_exists=False, check_bridge=False)
+
+        if cmd == 'unbind':
+            # the ports to remove are read from the bridges
+            if vms_exists:
+                net.unbind_fp_ports()
+            return net.ovs_plan
+
+        if vms_exists:
+            net.bind_fp_ports(cmd == 'disconnect-vms')
+
+        if cmd in ['bind', 'renumber'] and check_devices_interconnect(topo, is_multi_duts):
+            net.bind_devices_interconnect()
+    else:
+        return None
+
+    return net.ovs_plan
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
@@ -1519,7 +1772,7 @@ def main():
             max_fp_num=dict(required=False, type='int', default=NUM_FP_VLANS_PER_FP),
             netns_mgmt_ip_addr=dict(required=False, type='str', default=None)
         ),
-        supports_check_mode=False)
+        supports_check_mode=True)
 
     cmd = module.params['cmd']
     vm_set_name = module.params['vm_set_name']
@@ -1536,7 +1789,13 @@ def main():
     try:
 
         topo = module.params['topo']
-        net = VMTopology(vm_names, vm_properties, fp_mtu, max_fp_num, topo)
+        net = VMTopology(vm_names, vm_properties, fp_mtu, max_fp_num, topo, dry_run=module.check_mode)
+
+        if module.check_mode:
+            ovs_plan = plan_ovs(module, net, cmd)
+            if ovs_plan is None:
+                module.exit_json(changed=False, skipped=True, msg="Check mode is not supported for cmd: %s" % cmd)
+            module.exit_json(changed=bool(ovs_plan), ovs_plan=ovs_plan)
 
         if cmd == 'create':
             net.create_bridges()
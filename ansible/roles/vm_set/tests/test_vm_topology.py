@@ -0,0 +1,144 @@
+"""
+Unit tests of the ovs commands and flows planned by vm_topology in check mode,
+no ovs bridge is touched:
+
+    pytest ansible/roles/vm_set/tests/test_vm_topology.py
+"""
+import importlib
+import os
+import re
+import sys
+import types
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+LIBRARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "library")
+
+VM_SET_NAME = "test"
+VM_NAMES = ["VM0100", "VM0101", "VM0102"]
+TOPO = {
+    "VMs": {
+        "ARISTA01T1": {"vlans": [0], "vm_offset": 0},
+        "ARISTA02T1": {"vlans": [1, 2], "vm_offset": 1}
+    }
+}
+DUTS_FP_PORTS = {"dut": {"0": "Ethernet0", "1": "Ethernet4", "2": "Ethernet8"}}
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+@pytest.fixture(scope="module")
+def vm_topology():
+    # docker and the module_utils are only needed to run the commands on the test server
+    modules = {
+        "docker": _module("docker"),
+        "ansible": _module("ansible"),
+        "ansible.module_utils": _module("ansible.module_utils"),
+        "ansible.module_utils.basic": _module("ansible.module_utils.basic"),
+        "ansible.module_utils.debug_utils": _module("ansible.module_utils.debug_utils",
+                                                    config_module_logging=lambda *args: None),
+        "ansible.module_utils.dualtor_utils": _module("ansible.module_utils.dualtor_utils",
+                                                      generate_mux_cable_facts=lambda topo: {})
+    }
+    with mock.patch.dict(sys.modules, modules), mock.patch.object(sys, "path", [LIBRARY_DIR] + sys.path):
+        sys.modules.pop("vm_topology", None)
+        module = importlib.import_module("vm_topology")
+        sys.modules.pop("vm_topology", None)
+    return module
+
+
+@pytest.fixture
+def net(vm_topology):
+    def no_cmd(cmdline, *args, **kwargs):
+        raise AssertionError("command run in check mode: %s" % cmdline)
+
+    with mock.patch.object(vm_topology.VMTopology, "cmd", staticmethod(no_cmd)):
+        yield vm_topology.VMTopology(VM_NAMES, {}, vm_topology.DEFAULT_MTU, vm_topology.NUM_FP_VLANS_PER_FP,
+                                     TOPO, dry_run=True)
+
+
+def plan(vm_topology, net, cmd):
+    module = mock.Mock(params={
+        "vm_set_name": VM_SET_NAME,
+        "topo": TOPO,
+        "vm_base": VM_NAMES[0],
+        "duts_fp_ports": DUTS_FP_PORTS,
+        "duts_name": ["dut"]
+    })
+    return vm_topology.plan_ovs(module, net, cmd)
+
+
+def test_bind(vm_topology, net):
+    ovs_plan = plan(vm_topology, net, "bind")
+
+    bridges = [("br-VM0100-0", "VM0100-t0", "inje-test-0", "Ethernet0"),
+               ("br-VM0101-0", "VM0101-t0", "inje-test-1", "Ethernet4"),
+               ("br-VM0101-1", "VM0101-t1", "inje-test-2", "Ethernet8")]
+    assert len(ovs_plan) == 2 * len(bridges)
+    for (br_name, vm_iface, injected_iface, dut_iface), ports, flows in zip(bridges, ovs_plan[::2], ovs_plan[1::2]):
+        # the ports are added in one transaction, then the flows are replaced in one go
+        assert ports == {
+            "bridge": br_name,
+            "cmd": "ovs-vsctl -- --if-exists del-port %s -- add-port %s %s -- --if-exists del-port %s -- add-port %s %s"
+                   % (injected_iface, br_name, injected_iface, dut_iface, br_name, dut_iface)
+        }
+        assert flows["bridge"] == br_name
+        assert flows["cmd"] == "ovs-ofctl replace-flows %s" % br_name
+        assert flows["flows"] == vm_topology.VMTopology.fp_port_flows(dut_iface, injected_iface, vm_iface)
+        assert "table=0,in_port=%s,action=output:%s" % (vm_iface, dut_iface) in flows["flows"]
+
+
+def test_disconnect_vms(vm_topology, net):
+    ovs_plan = plan(vm_topology, net, "disconnect-vms")
+
+    flows = ovs_plan[1]["flows"]
+    assert flows == vm_topology.VMTopology.fp_port_flows("Ethernet0", "inje-test-0", "VM0100-t0", True)
+    assert "table=0,in_port=VM0100-t0,action=drop" in flows
+
+
+def test_unbind(vm_topology, net):
+    vm_ports = {"br-VM0100-0": "VM0100-t0", "br-VM0101-0": "VM0101-t0", "br-VM0101-1": "VM0101-t1"}
+    br_ports = {
+        "br-VM0100-0": {"VM0100-t0", "inje-test-0", "Ethernet0"},
+        "br-VM0101-0": {"VM0101-t0", "inje-test-1", "Ethernet4"},
+        "br-VM0101-1": {"VM0101-t1"}
+    }
+    with mock.patch.object(vm_topology.VMTopology, "intf_exists", staticmethod(lambda intf: intf in br_ports)), \
+            mock.patch.object(vm_topology.VMTopology, "get_ovs_br_ports", staticmethod(lambda br: br_ports[br])):
+        ovs_plan = plan(vm_topology, net, "unbind")
+
+    # all the ports but the vm port are removed in one transaction, nothing is run for a bridge with only the vm port
+    assert [step["bridge"] for step in ovs_plan] == ["br-VM0100-0", "br-VM0101-0"]
+    for step in ovs_plan:
+        br_name = step["bridge"]
+        assert step["cmd"].startswith("ovs-vsctl -- del-port ")
+        removed = re.findall(r"-- del-port %s (\S+)" % br_name, step["cmd"])
+        assert len(removed) == step["cmd"].count(" -- ")
+        assert sorted(removed) == sorted(br_ports[br_name] - {vm_ports[br_name]})
+
+
+def test_unbind_unreadable_bridge(vm_topology, net):
+    def get_ovs_br_ports(br):
+        if br == "br-VM0100-0":
+            raise Exception("ovs-vsctl: no bridge named %s" % br)
+        return {"VM0101-t0", "inje-test-1"} if br == "br-VM0101-0" else set()
+
+    with mock.patch.object(vm_topology.VMTopology, "intf_exists", staticmethod(lambda intf: True)), \
+            mock.patch.object(vm_topology.VMTopology, "get_ovs_br_ports", staticmethod(get_ovs_br_ports)):
+        ovs_plan = plan(vm_topology, net, "unbind")
+
+    # the bridge whose ports can't be read is left out of the plan instead of failing the dry run
+    assert ovs_plan == [{"bridge": "br-VM0101-0", "cmd": "ovs-vsctl -- del-port br-VM0101-0 inje-test-1"}]
+
+
+def test_unsupported_cmd(vm_topology, net):
+    assert plan(vm_topology, net, "bind_keysight_api_server_ip") is None
@@ -3,7 +3,9 @@ import re
 import sys
 import csv
 import shutil
+import heapq
 import logging
+from collections import OrderedDict
 from random import randint
 from random import Random
 from operator import itemgetter
@@ -137,6 +139,49 @@ def init_type_nodes():
 def is_deadnode_recovery():
     return bool(env.get("SPYTEST_BUCKETS_DEADNODE_RECOVERY", "1") != "0")
 
+def is_lpt_scheduling():
+    return bool(env.get("SPYTEST_BATCH_LPT_SCHEDULING", "1") != "0")
+
+def get_durations_csv(logs_path=None):
+    return os.path.join(logs_path or wa.logs_path, "batch_durations.csv")
+
+def load_module_durations():
+    durations, files, totals = {}, [], {}
+    history = env.get("SPYTEST_BATCH_DURATIONS_CSV")
+    if not history: return durations
+
+    # the history is the durations csv or modules report csv of previous runs
+    # or the logs folders of previous runs containing the durations csv
+    for entry in history.split(","):
+        entry = entry.strip()
+        if os.path.isdir(entry):
+            entry = get_durations_csv(entry)
+        files.extend(utils.list_files(entry))
+
+    for filepath in files:
+        rows = utils.read_csv(filepath)
+        if not rows: continue
+        header = rows.pop(0)
+        if "Module" in header and "Actual" in header:
+            name_col, time_col = header.index("Module"), header.index("Actual")
+        elif "Module Name" in header and "Exec Time" in header:
+            name_col, time_col = header.index("Module Name"), header.index("Exec Time")
+        else:
+            trace("module durations not found in {}".format(filepath))
+            continue
+        for row in rows:
+            if len(row) <= max(name_col, time_col): continue
+            secs = utils.time_parse(row[time_col])
+            if secs <= 0: continue
+            total, count = totals.get(row[name_col], (0, 0))
+            totals[row[name_col]] = (total + secs, count + 1)
+
+    # average of the runs
+    for name, (total, count) in totals.items():
+        durations[name] = total // count
+    trace("Loaded durations of {} modules from {}".format(len(durations), " ".join(files)))
+    return durations
+
 def ftrace(msg):
     if wa.logs_path:
         if not wa.trace_file:
@@ -220,6 +265,9 @@ def save_report():
     align = {col: True for col in ["Module", "Function", "TestCase", "Nodes"]}
     utils.write_html_table3(header, rows, filepath, align=align, total=False)
 
+    # show durations
+    wa.sched.save_durations()
+
 def report(op, nodeid, node_name):
     if op == "load":
         wa.executed[nodeid] = ["", "Pending"]
@@ -252,6 +300,39 @@ def report(op, nodeid, node_name):
 def shutdown():
     pass
 
+class NodeQueue(object):
+    """
+    Test indexes assigned to a node in the order of execution,
+    with constant time lookup and removal of any test index
+    """
+    def __init__(self):
+        self._items = OrderedDict()
+
+    def append(self, item_index):
+        self._items[item_index] = True
+
+    def extend(self, item_indexes):
+        for item_index in item_indexes:
+            self._items[item_index] = True
+
+    def remove(self, item_index):
+        del self._items[item_index]
+
+    def __contains__(self, item_index):
+        return item_index in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index):
+        return list(self._items)[index]
+
+    def __repr__(self):
+        return repr(list(self._items))
+
 class SpyTestScheduling(object):
     def __init__(self, config, wa, log=None):
         self.config = config
@@ -263,6 +344,7 @@ class SpyTestScheduling(object):
         self.topo_support = True
         self.node_modules = {}
         self.collection = []
+        self.collection_index = {}
         self.collection_is_completed = False
         self.main_modules = SpyTestDict()
         self.rerun_modules = SpyTestDict()
@@ -275,6 +357,22 @@ class SpyTestScheduling(object):
         self.max_order = self.default_order
         self._load_buckets()
 
+        # memoized testbed topology compatibility of the modules
+        self.topo_matrix = {}
+        self.testbed_topos = {}
+
+        # longest processing time first scheduling
+        self.lpt_support = is_lpt_scheduling()
+        self.durations = load_module_durations()
+        self.default_duration = 60
+        self.predicted = {}
+        self.predicted_nodes = {}
+        self.predicted_loads = {}
+        self.item_modules = {}
+        self.assigned_modules = SpyTestDict()
+        self.actual = {}
+        self.node_clock = {}
+
         self.test_spytest_infra_first = None
         self.test_spytest_infra_second = None
         self.test_spytest_infra_last = None
@@ -313,7 +411,7 @@ class SpyTestScheduling(object):
                     self.base_names[basename] = name
 
     def add_node(self, node):
-        self.node_modules[node] = []
+        self.node_modules[node] = NodeQueue()
 
     def remove_node(self, node):
         self.node_modules.pop(node)
@@ -400,8 +498,10 @@ class SpyTestScheduling(object):
             if md.default and action == "load":
                 warn("Module {} is not found in {}".format(mname, wa.module_csv))
                 warn(self.module_data)
-        modules[mname].node_indexes.append(self.collection.index(nodeid))
+        item_index = self.collection_index[nodeid]
+        modules[mname].node_indexes.append(item_index)
         modules[mname].used_tpref = md.tpref
+        self.item_modules[item_index] = mname
 
     def add_node_collection(self, node, collection):
         self.count = self.count - 1
@@ -412,18 +512,22 @@ class SpyTestScheduling(object):
         # generate module list
         self.collection_is_completed = True
         self.collection = collection
+        for item_index, nodeid in enumerate(collection):
+            # index of the first occurrence, same as list.index
+            self.collection_index.setdefault(nodeid, item_index)
         for nodeid in collection:
             rv = is_infra_test(nodeid)
             if rv == 1:
-                self.test_spytest_infra_first = self.collection.index(nodeid)
+                self.test_spytest_infra_first = self.collection_index[nodeid]
             elif rv == 2:
-                self.test_spytest_infra_second = self.collection.index(nodeid)
+                self.test_spytest_infra_second = self.collection_index[nodeid]
             elif rv == 3:
-                self.test_spytest_infra_last = self.collection.index(nodeid)
+                self.test_spytest_infra_last = self.collection_index[nodeid]
             else:
                 self.add_nodeid(nodeid, "load", self.main_modules)
         report("save", "", "")
         self.update_matching_modes(self.main_modules, True)
+        self._predict_makespan()
 
     def find_active_nodes(self, names):
         active = []
@@ -439,6 +543,20 @@ class SpyTestScheduling(object):
         nodes = self.find_active_nodes(nodes)
         return " ".join(nodes)
 
+    def get_testbed_topo(self, slave):
+        if slave.testbed_index not in self.testbed_topos:
+            self.testbed_topos[slave.testbed_index] = slave.tb_obj.get_topo(name0=False)
+        return self.testbed_topos[slave.testbed_index]
+
+    def is_topo_compatible(self, slave, topo, match_dut_name=0):
+        # slaves created for same testbed share the testbed object
+        key = (slave.testbed_index, topo, match_dut_name)
+        if key not in self.topo_matrix:
+            [errs, _] = slave.tb_obj.ensure_min_topology_norandom(topo, match_dut_name=match_dut_name)
+            slave.tb_obj.reset_derived()
+            self.topo_matrix[key] = not errs
+        return self.topo_matrix[key]
+
     def update_matching_modes(self, modules, init):
 
         #smallest,largest,larger,equal
@@ -446,6 +564,10 @@ class SpyTestScheduling(object):
         match_order_list = match_order.split(",")
         match_order_list.insert(0, "matching")
 
+        bucket_slaves = OrderedDict()
+        for slave in wa.slaves.values():
+            bucket_slaves.setdefault(slave.bucket, []).append(slave)
+
         nes_modules = []
         for mname, minfo in modules.items():
             minfo.nodes = []
@@ -463,14 +585,11 @@ class SpyTestScheduling(object):
                             if md.bucket <= slave.bucket and \
                                md.bucket >= slave.min_bucket:
                                 debug("MATCH-1 {} {} {} with {} {}".format(mname, tpref, md.topo,\
-                                         slave.name, slave.tb_obj.get_topo(name0=False)))
-                                if md.topo:
-                                    [errs, _] = slave.tb_obj.ensure_min_topology_norandom(md.topo, match_dut_name=1)
-                                    slave.tb_obj.reset_derived()
-                                    if errs:
-                                        msg = "non matching testbed {} to execute bucket {} {} {}"
-                                        debug(msg.format(slave.name, md.bucket, mname, md.topo))
-                                        continue
+                                         slave.name, self.get_testbed_topo(slave)))
+                                if md.topo and not self.is_topo_compatible(slave, md.topo, 1):
+                                    msg = "non matching testbed {} to execute bucket {} {} {}"
+                                    debug(msg.format(slave.name, md.bucket, mname, md.topo))
+                                    continue
                                 msg = "matched testbed {} to execute bucket {} {} {}"
                                 trace(msg.format(slave.name, md.bucket, mname, md.topo))
                                 minfo.nodes.append(slave.name)
@@ -505,11 +624,8 @@ class SpyTestScheduling(object):
                         trace("TRY-3 {} {} {}".format(mname, tpref, md.topo))
                         for bucket in range(md.bucket+1, 100):
                             if minfo.nodes: break
-                            for slave in wa.slaves.values():
-                                if slave.bucket != bucket: continue
-                                [errs, _] = slave.tb_obj.ensure_min_topology_norandom(md.topo)
-                                slave.tb_obj.reset_derived()
-                                if errs: continue
+                            for slave in bucket_slaves.get(bucket, []):
+                                if not self.is_topo_compatible(slave, md.topo): continue
                                 if not minfo.nodes:
                                     msg = "Using higher bucket {} testbed {} to execute {} {}"
                                     trace(msg.format(slave.bucket, slave.name, mname, md.topo))
@@ -569,9 +685,116 @@ class SpyTestScheduling(object):
 
         return retval
 
+    def _history_duration(self, mname):
+        if mname in self.durations:
+            return self.durations[mname]
+        return self.durations.get(os.path.basename(mname))
+
+    def get_predicted_duration(self, mname, minfo):
+        if mname not in self.predicted:
+            secs = self._history_duration(mname)
+            if secs is None:
+                secs = len(minfo.node_indexes) * self.default_duration
+            self.predicted[mname] = secs
+        return self.predicted[mname]
+
+    def _predict_makespan(self):
+        # modules without history take the average time per test of the modules with history
+        (secs, count, known) = (0, 0, 0)
+        for mname, minfo in self.main_modules.items():
+            duration = self._history_duration(mname)
+            if duration is None: continue
+            secs = secs + duration
+            count = count + len(minfo.node_indexes)
+            known = known + 1
+        if count > 0:
+            self.default_duration = max(secs // count, 1)
+
+        # modules each node can run, in the order _select_module picks them
+        (loads, candidates, orders) = (SpyTestDict(), SpyTestDict(), {})
+        for slave in wa.slaves.values():
+            if slave.node_type == "Main":
+                (loads[slave.name], candidates[slave.name]) = (0, [])
+        for mname, minfo in self.main_modules.items():
+            key = (self.get_predicted_duration(mname, minfo), -len(minfo.nodes))
+            for name in minfo.nodes:
+                if name not in candidates: continue
+                order = 0
+                if self.order_support:
+                    if (name, minfo.used_tpref) not in orders:
+                        md = self.get_module_data(name, minfo.used_tpref)
+                        orders[(name, minfo.used_tpref)] = md.order
+                    order = orders[(name, minfo.used_tpref)]
+                    if order < 0 or order > self.max_order: continue
+                candidates[name].append((order, key if self.lpt_support else (0, 0), mname))
+
+        # simulate the scheduling: the least loaded node picks the next module
+        (heap, taken) = ([], set())
+        for position, name in enumerate(candidates):
+            cands = sorted(candidates[name], key=lambda c: (c[0], -c[1][0], -c[1][1]))
+            heap.append((0, position, name, iter(cands)))
+        heapq.heapify(heap)
+        while heap:
+            (load, position, name, cands) = heapq.heappop(heap)
+            for _, _, mname in cands:
+                if mname not in taken: break
+            else:
+                continue
+            taken.add(mname)
+            loads[name] = load + self.predicted[mname]
+            self.predicted_nodes[mname] = name
+            heapq.heappush(heap, (loads[name], position, name, cands))
+
+        self.predicted_loads = loads
+        makespan = max(loads.values()) if loads else 0
+        msg = "Predicted makespan {} for {} modules ({} with history) on {} nodes"
+        trace(msg.format(utils.time_format(makespan), len(self.main_modules), known, len(loads)))
+
+    def show_makespan(self, show=True):
+        header = ["Node", "Modules", "Predicted", "Busy", "Actual"]
+        (rows, predicted_makespan, actual_makespan, node_modules) = ([], 0, 0, {})
+        for mname, assigned in self.assigned_modules.items():
+            node_modules.setdefault(assigned.node, []).append(mname)
+        for slave in wa.slaves.values():
+            predicted = self.predicted_loads.get(slave.name, 0)
+            modules = node_modules.get(slave.name, [])
+            busy = sum([self.actual.get(m, 0) for m in modules])
+            actual = 0
+            if slave.start_time:
+                actual = get_elapsed(slave.start_time, False, 0, slave.complete_time)
+            if not predicted and not modules: continue
+            predicted_makespan = max(predicted_makespan, predicted)
+            actual_makespan = max(actual_makespan, actual)
+            rows.append([slave.name, len(modules), utils.time_format(predicted),
+                         utils.time_format(int(busy)), utils.time_format(actual)])
+        retval = utils.sprint_vtable(header, rows)
+        if show:
+            trace("Makespan Predicted: {} Actual: {}\n{}".format(utils.time_format(predicted_makespan),
+                  utils.time_format(actual_makespan), retval))
+        return retval
+
+    def save_durations(self):
+        header = ["#", "Module", "Node", "Tests", "Predicted Node", "Predicted", "Actual"]
+        rows = []
+        for mname, assigned in self.assigned_modules.items():
+            rows.append([len(rows)+1, mname, assigned.node, assigned.tests,
+                         self.predicted_nodes.get(mname, ""),
+                         utils.time_format(self.predicted.get(mname, 0)),
+                         utils.time_format(int(self.actual.get(mname, 0)))])
+        filepath = get_durations_csv()
+        utils.write_csv_file(header, rows, filepath)
+
     def mark_test_complete(self, node, item_index, duration=0):
         debug("Remove", item_index, "From", node, self.node_modules[node])
         if item_index in self.node_modules[node]:
+            # the node runs the tests one after another, the time since
+            # the previous test completed is the time of this test
+            now = get_timenow()
+            mname = self.item_modules.get(item_index)
+            if mname and node in self.node_clock:
+                elapsed = (now - self.node_clock[node]).total_seconds()
+                self.actual[mname] = self.actual.get(mname, 0) + elapsed
+            self.node_clock[node] = now
             self.node_modules[node].remove(item_index)
             report("finish", self.collection[item_index], node.gateway.id)
             debug("============== completed", item_index, self.collection[item_index])
@@ -592,24 +815,44 @@ class SpyTestScheduling(object):
                 return True
         return False
 
-    def _assign_test(self, node, name, modules):
-        slave = self.wa.slaves[name]
+    def _select_module(self, name, modules):
+        orders = {}
         for order in range(0, self.max_order + 1):
+            (selected, selected_key) = (None, None)
             for mname,minfo in modules.items():
                 if name not in minfo.nodes: continue
-                md = self.get_module_data(name, minfo.used_tpref)
-                if self.order_support and md.order != order:
+                if minfo.used_tpref not in orders:
+                    md = self.get_module_data(name, minfo.used_tpref)
+                    orders[minfo.used_tpref] = md.order
+                if self.order_support and orders[minfo.used_tpref] != order:
                     continue
-                if not self._assign_pretest(node, name):
-                    del modules[mname]
-                    self.node_modules[node].extend(minfo.node_indexes)
-                    slave.assigned = slave.assigned + len(minfo.node_indexes)
-                    debug("ASSIGNED", name, md.order, mname, minfo.node_indexes)
-                    for item_index in minfo.node_indexes:
-                        report("add", self.collection[item_index], node.gateway.id)
-                    report("save", "", "")
-                return True
-        return False
+                if not self.lpt_support:
+                    return mname
+                # longest module first, the one with less nodes to run on first
+                key = (self.get_predicted_duration(mname, minfo), -len(minfo.nodes))
+                if selected is None or key > selected_key:
+                    (selected, selected_key) = (mname, key)
+            if selected is not None:
+                return selected
+        return None
+
+    def _assign_test(self, node, name, modules):
+        slave = self.wa.slaves[name]
+        mname = self._select_module(name, modules)
+        if mname is None:
+            return False
+        if not self.node_modules[node]:
+            self.node_clock[node] = get_timenow()
+        if not self._assign_pretest(node, name):
+            minfo = modules.pop(mname)
+            self.node_modules[node].extend(minfo.node_indexes)
+            slave.assigned = slave.assigned + len(minfo.node_indexes)
+            self.assigned_modules[mname] = SpyTestDict(node=name, tests=len(minfo.node_indexes))
+            debug("ASSIGNED", name, self.get_predicted_duration(mname, minfo), mname, minfo.node_indexes)
+            for item_index in minfo.node_indexes:
+                report("add", self.collection[item_index], node.gateway.id)
+            report("save", "", "")
+        return True
 
     def _schedule_node(self, node):
         name = node.gateway.id
@@ -1136,6 +1379,7 @@ def finish_node(node, error, reader):
     wa.sched.schedule(node.gateway.id, error)
     _show_testbed_info()
     save_report()
+    wa.sched.show_makespan()
 
     if error:
         wa.dead_slaves.append(slave)
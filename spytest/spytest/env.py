@@ -3,6 +3,9 @@ import os
 defaults = {
     "SPYTEST_LOGS_TIME_FMT_ELAPSED": "0",
     "SPYTEST_LOGS_MODULE_ONLY_SUPPORT" : "0",
+    "SPYTEST_LOGS_ASYNC": "1",
+    "SPYTEST_LOGS_QUEUE_SIZE": "10000",
+    "SPYTEST_LOGS_QUEUE_POLICY": "block",
     "SPYTEST_NO_CONSOLE_LOG": "0",
     "SPYTEST_PROMPTS_FILENAME": None,
     "SPYTEST_TEXTFSM_INDEX_FILENAME": "index",
@@ -54,6 +57,7 @@ defaults = {
     "SPYTEST_ONCONSOLE_HANG": "recover",
     "SPYTEST_CONNECT_DEVICES_RETRY": "10",
     "SPYTEST_OPENCONFIG_API": "GNMI",
+    "SPYTEST_GNMI_CLIENT": "binary",
     "SPYTEST_IFA_ENABLE": "0",
     "SPYTEST_ROUTING_CONFIG_MODE": None,
     "SPYTEST_CLEAR_MGMT_INTERFACE": "0",
@@ -86,6 +90,8 @@ dev_defaults = {
     "SPYTEST_BATCH_MODULE_TOPO_PREF": None,
     "SPYTEST_BATCH_MATCHING_BUCKET_ORDER": "larger,largest",
     "SPYTEST_BATCH_RERUN": None,
+    "SPYTEST_BATCH_LPT_SCHEDULING": "1",
+    "SPYTEST_BATCH_DURATIONS_CSV": None,
     "SPYTEST_TESTBED_FILE": "testbed.yaml",
     "SPYTEST_FILE_MODE": "0",
     "SPYTEST_SCHEDULING": None,
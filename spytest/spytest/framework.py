@@ -3208,6 +3208,15 @@ class WorkArea(object):
     def gnmi_send(self, dut, path, *args, **kwargs):
         return self.net.gnmi_send(dut, path, *args, **kwargs)
 
+    def gnmi_get_many(self, dut, paths, *args, **kwargs):
+        return self.net.gnmi_get_many(dut, paths, *args, **kwargs)
+
+    def gnmi_set_many(self, dut, ops, *args, **kwargs):
+        return self.net.gnmi_set_many(dut, ops, *args, **kwargs)
+
+    def gnmi_subscribe(self, dut, paths, *args, **kwargs):
+        return self.net.gnmi_subscribe(dut, paths, *args, **kwargs)
+
     def rest_init(self, dut, username, password, altpassword):
         return self.net.rest_init(dut, username, password, altpassword)
 
@@ -3,6 +3,8 @@ import json, pprint
 
 from spytest.dicts import SpyTestDict
 from spytest.gnmi.wrapper import _gnmi_get, _gnmi_set, gnmiReplaceData, gnmiCreateJsonFile
+from spytest.gnmi.wrapper import use_client
+from spytest.gnmi.client import GnmiClient, GnmiError
 
 class gNMI(object):
 
@@ -14,6 +16,7 @@ class gNMI(object):
         self.timeout    = 10
         self.ip         = None
         self.inSecure   = True
+        self.client     = None
 
     def configure(self, ip=None, port=8080, targetName=None, username='admin',
                   password=None, ca=None, cert=None, inSecure=True, noTls=False,
@@ -28,6 +31,7 @@ class gNMI(object):
         self.timeout    = timeout
         self.defTimeout = timeout
         self.params     = params
+        self.close()
 
         if ip:
             self.reinit(ip , port=port)
@@ -36,9 +40,34 @@ class gNMI(object):
     def reinit(self, ip, port=8080):
         self.ip     = ip.decode('utf-8') if type(ip) == bytes else str(ip)
         self.port   = int(port)
-        self.target_addr = "{}:{}".format(self.ip, self.port)
+        target_addr = "{}:{}".format(self.ip, self.port)
+        if target_addr != self.target_addr:
+            self.close()
+        self.target_addr = target_addr
         return self
 
+    def _client(self):
+        if not self.client:
+            self.client = GnmiClient(self.target_addr, username=self.username,
+                                     password=self.password, ca=self.ca, cert=self.cert,
+                                     inSecure=self.inSecure, noTls=self.noTls,
+                                     target_name=self.target_name, timeout=self.timeout)
+        return self.client
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    def _client_call(self, func, items, single=True):
+        try:
+            retval = func(items, timeout=self.timeout)
+            if not retval:
+                return {"ok": False, "return": ""}
+            return {"ok": True, "return": retval[0] if single else retval}
+        except GnmiError as exp:
+            return {"ok": False, 'errorCode': exp.code, 'message': exp.message}
+
     def _compose_params(self, action, path, *args):
         param = [action, path]
         if self.target_addr: param.extend(['-target_addr', self.target_addr])
@@ -78,6 +107,10 @@ class gNMI(object):
         return resp
 
     def get(self, path, params=''):
+        if use_client(self.logger):
+            self._log("GNMI [GET]: {}".format(path))
+            ret_val = self._client_call(self._client().get, [path])
+            return self._result('GET', path, ret_val)
         param = self._compose_params('-xpath', path, "-alsologtostderr")
         if params: param.extend(params.split())
         self._log("GNMI [GET]: {}".format(path))
@@ -90,6 +123,11 @@ class gNMI(object):
             raise e
 
     def _set(self, path, action, params='', data={}):
+        if use_client(self.logger):
+            self._log("GNMI [{}]: {}".format(action.upper(), path))
+            if data: self._log("data:\n{}".format(pprint.pformat(data)))
+            ret_val = self._client_call(self._client().set, [(action, path, data)])
+            return self._result(action.upper(), path, ret_val, data)
         data_path = None
         if data and len(data):
             data_path = gnmiCreateJsonFile(data, '{}-{}'.format(self.dev_name, int(round(time.time() * 1000))))
@@ -121,6 +159,55 @@ class gNMI(object):
     def delete(self, path, params='', data={}):
         return self._set(path, 'delete', params=params, data=data)
 
+    def get_many(self, paths, params=''):
+        """
+        Get the given paths, in one request with the gNMI client.
+        :return: list of results, one for each path
+        """
+        if not use_client(self.logger):
+            return [self.get(path, params=params) for path in paths]
+        self._log("GNMI [GET]: {}".format(", ".join(paths)))
+        ret_val = self._client_call(self._client().get, paths, single=False)
+        if not ret_val["ok"]:
+            return [self._result('GET', path, ret_val) for path in paths]
+        values = ret_val["return"]
+        if len(values) != len(paths):
+            # can't tell which notification belongs to which path
+            msg = "{} notifications for {} paths".format(len(values), len(paths))
+            ret_val = {"ok": False, "errorCode": -1, "message": msg}
+            return [self._result('GET', path, ret_val) for path in paths]
+        return [self._result('GET', path, {"ok": True, "return": value})
+                for path, value in zip(paths, values)]
+
+    def set_many(self, ops, params=''):
+        """
+        Apply the given (action, path, data) operations, in one
+        request with the gNMI client, in which case the target applies
+        all the deletes then replaces and then updates.
+        :return: list of results, one for each operation
+        """
+        if not use_client(self.logger):
+            return [self._set(path, action, params=params, data=data)
+                    for action, path, data in ops]
+        for action, path, data in ops:
+            self._log("GNMI [{}]: {}".format(action.upper(), path))
+            if data: self._log("data:\n{}".format(pprint.pformat(data)))
+        ret_val = self._client_call(self._client().set, ops, single=False)
+        return [self._result(action.upper(), path, ret_val, data)
+                for action, path, data in ops]
+
+    def subscribe(self, paths, mode="stream", submode="sample", interval=10, **kwargs):
+        """
+        Subscribe to the given paths, only supported with the gNMI client.
+        :return: GnmiSubscription, the caller needs to close it
+        """
+        if not use_client(self.logger):
+            raise GnmiError(-1, "subscribe needs SPYTEST_GNMI_CLIENT=grpc")
+        paths = [paths] if not isinstance(paths, (list, tuple)) else paths
+        self._log("GNMI [SUBSCRIBE {}/{}]: {}".format(mode, submode, ", ".join(paths)))
+        return self._client().subscribe(paths, mode=mode, submode=submode,
+                                        interval=interval, **kwargs)
+
     def send(self, path, action='', params='', data=None, timeout=None):
         self.timeout = timeout if timeout else self.defTimeout
         if action.lower() in ['create', 'update', 'replace', 'delete']:
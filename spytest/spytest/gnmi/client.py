@@ -0,0 +1,454 @@
+"""
+In-process gNMI client, used instead of the gnmi_get/gnmi_set binaries
+when SPYTEST_GNMI_CLIENT is set to grpc.
+
+The channel to the target is created on first use and kept open, a Get
+takes any number of paths and a Set any number of delete/replace/update
+operations in one RPC. Subscribe supports STREAM (sample/on_change),
+ONCE and POLL modes.
+
+The gNMI python bindings are taken from gnmi_pb2/gnmi_pb2_grpc modules
+generated from gnmi.proto when found in the python path, else from the
+pygnmi package.
+
+Example:
+    client = GnmiClient("10.11.97.10:8080", username="admin", password="...")
+    client.get(["/openconfig-interfaces:interfaces/interface[name=Ethernet0]/config",
+                "/openconfig-interfaces:interfaces/interface[name=Ethernet4]/config"])
+    client.set([("replace", "/openconfig-interfaces:interfaces/interface[name=Ethernet0]/config/mtu",
+                 {"openconfig-interfaces:mtu": 9100}),
+                ("delete", "/openconfig-acl:acl/acl-sets/acl-set[name=MyACL4][type=ACL_IPV4]", None)])
+    with client.subscribe(["/openconfig-interfaces:interfaces/interface[name=Ethernet0]/state/counters"],
+                          submode="sample", interval=1) as sub:
+        for path, value, timestamp in sub.updates(count=10, timeout=30):
+            print(path, value)
+"""
+
+import re
+import ssl
+import json
+import time
+import threading
+import importlib
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+PB2_MODULES = [("gnmi_pb2", "gnmi_pb2_grpc"),
+               ("gnmi.gnmi_pb2", "gnmi.gnmi_pb2_grpc"),
+               ("pygnmi.spec.v080.gnmi_pb2", "pygnmi.spec.v080.gnmi_pb2_grpc"),
+               ("pygnmi.spec.gnmi_pb2", "pygnmi.spec.gnmi_pb2_grpc")]
+
+gnmi_pb2, gnmi_pb2_grpc, import_error = None, None, None
+
+def _load_pb2():
+    global gnmi_pb2, gnmi_pb2_grpc, import_error
+    if grpc is None:
+        import_error = "grpc module is not installed"
+        return
+    for pb2, pb2_grpc in PB2_MODULES:
+        try:
+            gnmi_pb2 = importlib.import_module(pb2)
+            gnmi_pb2_grpc = importlib.import_module(pb2_grpc)
+            if hasattr(gnmi_pb2, "GetRequest"):
+                return
+        except Exception:
+            pass
+        gnmi_pb2, gnmi_pb2_grpc = None, None
+    import_error = "gnmi_pb2 module is not found, install pygnmi"
+
+_load_pb2()
+
+def is_supported():
+    return bool(gnmi_pb2 and gnmi_pb2_grpc)
+
+def get_import_error():
+    return import_error
+
+class GnmiError(Exception):
+    def __init__(self, code, message):
+        super(GnmiError, self).__init__("{}: {}".format(code, message))
+        self.code = code
+        self.message = message
+
+    @classmethod
+    def from_rpc_error(cls, exp):
+        try:
+            code = exp.code()
+            return cls(code.value[0] if code else -1, exp.details() or str(code))
+        except Exception:
+            return cls(-1, str(exp))
+
+def _split_xpath(xpath):
+    # split on the '/' not within the key values i.e. [prefix=10.0.0.0/24]
+    (elems, elem, depth, escape) = ([], [], False, False)
+    for ch in xpath:
+        if escape:
+            elem.append(ch)
+            escape = False
+        elif ch == "\\":
+            elem.append(ch)
+            escape = True
+        elif ch == "[":
+            depth = True
+            elem.append(ch)
+        elif ch == "]":
+            depth = False
+            elem.append(ch)
+        elif ch == "/" and not depth:
+            elems.append("".join(elem))
+            elem = []
+        else:
+            elem.append(ch)
+    elems.append("".join(elem))
+    return [e for e in elems if e]
+
+key_re = re.compile(r"\[([^=\]]+)=((?:\\.|[^\]\\])*)\]")
+esc_re = re.compile(r"\\(.)")
+
+def to_path(xpath, origin=None):
+    if isinstance(xpath, gnmi_pb2.Path):
+        return xpath
+    path = gnmi_pb2.Path(origin=origin) if origin else gnmi_pb2.Path()
+    for elem in _split_xpath(xpath):
+        name, _, keys = elem.partition("[")
+        path_elem = path.elem.add(name=name)
+        for key, value in key_re.findall("[" + keys if keys else ""):
+            path_elem.key[key] = esc_re.sub(r"\1", value)
+    return path
+
+def to_xpath(path, prefix=None):
+    elems = list(prefix.elem) if prefix else []
+    elems.extend(path.elem)
+    parts = [""]
+    for elem in elems:
+        keys = "".join(["[{}={}]".format(k, elem.key[k].replace("]", "\\]"))
+                        for k in sorted(elem.key)])
+        parts.append(elem.name + keys)
+    if not elems:
+        parts.extend(getattr(path, "element", []))
+    return "/".join(parts) or "/"
+
+def decode_value(val):
+    kind = val.WhichOneof("value")
+    if kind in ["json_ietf_val", "json_val"]:
+        data = getattr(val, kind)
+        if not data or data.strip() == b'""':
+            return ""
+        return json.loads(data.decode("utf-8") if isinstance(data, bytes) else data)
+    if kind == "decimal_val":
+        return float(val.decimal_val.digits) / (10 ** val.decimal_val.precision)
+    if kind == "leaflist_val":
+        return [decode_value(v) for v in val.leaflist_val.element]
+    if kind == "any_val":
+        return val.any_val.value
+    return getattr(val, kind) if kind else None
+
+def encode_value(data, encoding="json_ietf"):
+    if encoding in ["json_ietf", "json"]:
+        kwargs = {"{}_val".format(encoding): json.dumps(data).encode("utf-8")}
+        return gnmi_pb2.TypedValue(**kwargs)
+    if isinstance(data, bool):
+        return gnmi_pb2.TypedValue(bool_val=data)
+    if isinstance(data, int):
+        return gnmi_pb2.TypedValue(int_val=data)
+    if isinstance(data, float):
+        return gnmi_pb2.TypedValue(double_val=data)
+    return gnmi_pb2.TypedValue(string_val=str(data))
+
+def _get_cert_name(pem):
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.backends import default_backend
+        cert = x509.load_pem_x509_certificate(pem.encode("utf-8"), default_backend())
+        names = cert.subject.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)
+        return names[0].value if names else None
+    except Exception:
+        return None
+
+def _read_file(filepath):
+    with open(filepath, "rb") as fh:
+        return fh.read()
+
+class GnmiClient(object):
+
+    def __init__(self, target_addr, username=None, password=None, ca=None,
+                 cert=None, key=None, inSecure=True, noTls=False,
+                 target_name=None, timeout=10, encoding="json_ietf"):
+        self.target_addr = target_addr
+        self.username = username
+        self.password = password
+        self.ca = ca
+        self.cert = cert
+        self.key = key
+        self.inSecure = inSecure
+        self.noTls = noTls
+        self.target_name = target_name
+        self.timeout = timeout
+        self.encoding = encoding
+        self.channel = None
+        self.stub = None
+        self.lock = threading.Lock()
+        self.stats = {"get": 0, "set": 0, "subscribe": 0, "connect": 0}
+
+    def _credentials(self):
+        (host, port) = self.target_addr.rsplit(":", 1)
+        options = []
+        root = _read_file(self.ca) if self.ca else None
+        chain = _read_file(self.cert) if self.cert else None
+        pkey = _read_file(self.key) if self.key else None
+        if not root and self.inSecure:
+            # skip the verification by trusting the certificate of the target
+            pem = ssl.get_server_certificate((host.strip("[]"), int(port)))
+            root = pem.encode("utf-8")
+            name = self.target_name or _get_cert_name(pem)
+            if name:
+                options.append(("grpc.ssl_target_name_override", name))
+        elif self.target_name:
+            options.append(("grpc.ssl_target_name_override", self.target_name))
+        creds = grpc.ssl_channel_credentials(root_certificates=root,
+                            private_key=pkey, certificate_chain=chain)
+        return creds, options
+
+    def connect(self):
+        with self.lock:
+            if self.stub:
+                return self.stub
+            if not is_supported():
+                raise GnmiError(-1, import_error)
+            options = [("grpc.max_receive_message_length", 256 * 1024 * 1024)]
+            try:
+                if self.noTls:
+                    self.channel = grpc.insecure_channel(self.target_addr, options=options)
+                else:
+                    # fetching the target certificate fails when the target is unreachable
+                    creds, extra = self._credentials()
+                    self.channel = grpc.secure_channel(self.target_addr, creds, options=options + extra)
+                self.stub = gnmi_pb2_grpc.gNMIStub(self.channel)
+            except Exception as exp:
+                self.channel = None
+                raise GnmiError(-1, str(exp))
+            self.stats["connect"] += 1
+            return self.stub
+
+    def close(self):
+        with self.lock:
+            if self.channel:
+                try:
+                    self.channel.close()
+                except Exception:
+                    pass
+            self.channel = None
+            self.stub = None
+
+    def _metadata(self):
+        metadata = []
+        if self.username:
+            metadata.append(("username", str(self.username)))
+        if self.password:
+            metadata.append(("password", str(self.password)))
+        return metadata
+
+    def _encoding(self, encoding=None):
+        return gnmi_pb2.Encoding.Value((encoding or self.encoding).upper())
+
+    def _call(self, name, request, timeout=None):
+        stub = self.connect()
+        try:
+            return getattr(stub, name)(request, timeout=timeout or self.timeout,
+                                       metadata=self._metadata())
+        except grpc.RpcError as exp:
+            raise GnmiError.from_rpc_error(exp)
+
+    def capabilities(self, timeout=None):
+        resp = self._call("Capabilities", gnmi_pb2.CapabilityRequest(), timeout)
+        models = [m.name for m in resp.supported_models]
+        encodings = [gnmi_pb2.Encoding.Name(e) for e in resp.supported_encodings]
+        return {"models": models, "encodings": encodings, "version": resp.gNMI_version}
+
+    def get(self, paths, encoding=None, timeout=None, data_type=None):
+        """
+        Get the given paths in one RPC.
+        :param paths: xpath or list of xpaths
+        :return: list of values, one for each notification of the response
+                 i.e. one for each path, a dict of xpath to value when the
+                 notification has multiple updates
+        """
+        paths = [paths] if not isinstance(paths, (list, tuple)) else paths
+        request = gnmi_pb2.GetRequest(path=[to_path(p) for p in paths],
+                                      encoding=self._encoding(encoding))
+        if data_type:
+            request.type = gnmi_pb2.GetRequest.DataType.Value(data_type.upper())
+        resp = self._call("Get", request, timeout)
+        self.stats["get"] += 1
+        retval = []
+        for notif in resp.notification:
+            values = [(to_xpath(u.path, notif.prefix), decode_value(u.val)) for u in notif.update]
+            if len(values) == 1:
+                retval.append(values[0][1])
+            else:
+                retval.append(dict(values))
+        return retval
+
+    def set(self, ops, encoding=None, timeout=None):
+        """
+        Apply the given operations in one RPC.
+        The target applies all the deletes then replaces and then updates.
+        :param ops: list of (action, xpath, data) action being one of
+                    delete, replace, update or create (same as update)
+        :return: list of the operation names in the response
+        """
+        encoding = encoding or self.encoding
+        request = gnmi_pb2.SetRequest()
+        for action, xpath, data in ops:
+            action = action.lower()
+            if action == "delete":
+                request.delete.extend([to_path(xpath)])
+            elif action == "replace":
+                request.replace.add(path=to_path(xpath), val=encode_value(data, encoding))
+            elif action in ["update", "create"]:
+                request.update.add(path=to_path(xpath), val=encode_value(data, encoding))
+            else:
+                raise GnmiError(-1, "invalid set operation {}".format(action))
+        resp = self._call("Set", request, timeout)
+        self.stats["set"] += 1
+        return [gnmi_pb2.UpdateResult.Operation.Name(r.op) for r in resp.response]
+
+    def subscribe(self, paths, mode="stream", submode="sample", interval=10,
+                  encoding=None, updates_only=False, suppress_redundant=False):
+        """
+        Subscribe to the given paths.
+        :param mode: stream, once or poll
+        :param submode: sample, on_change or target_defined (stream mode)
+        :param interval: sample interval in seconds
+        :return: GnmiSubscription
+        """
+        self.connect()
+        paths = [paths] if not isinstance(paths, (list, tuple)) else paths
+        sublist = gnmi_pb2.SubscriptionList(mode=gnmi_pb2.SubscriptionList.Mode.Value(mode.upper()),
+                                            encoding=self._encoding(encoding),
+                                            updates_only=updates_only)
+        for path in paths:
+            sublist.subscription.add(path=to_path(path),
+                                     mode=gnmi_pb2.SubscriptionMode.Value(submode.upper()),
+                                     sample_interval=int(interval * 1e9),
+                                     suppress_redundant=suppress_redundant)
+        self.stats["subscribe"] += 1
+        return GnmiSubscription(self, gnmi_pb2.SubscribeRequest(subscribe=sublist))
+
+class GnmiSubscription(object):
+    """
+    Subscribe RPC, the responses are read by a thread so that the
+    updates can be waited for with timeout.
+    """
+    END = object()
+    SYNC = object()
+
+    def __init__(self, client, request):
+        self.requests = queue.Queue()
+        self.responses = queue.Queue()
+        self.requests.put(request)
+        self.error = None
+        self.synced = False
+        self.call = client.stub.Subscribe(self._request_iter(), metadata=client._metadata())
+        self.reader = threading.Thread(target=self._read, name="gnmi-subscribe")
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _request_iter(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            yield request
+
+    def _read(self):
+        try:
+            for resp in self.call:
+                if resp.HasField("sync_response"):
+                    self.responses.put(self.SYNC)
+                    continue
+                notif = resp.update
+                for upd in notif.update:
+                    self.responses.put((to_xpath(upd.path, notif.prefix),
+                                        decode_value(upd.val), notif.timestamp))
+                for path in notif.delete:
+                    self.responses.put((to_xpath(path, notif.prefix), None, notif.timestamp))
+        except grpc.RpcError as exp:
+            if exp.code() != grpc.StatusCode.CANCELLED:
+                self.error = GnmiError.from_rpc_error(exp)
+        except Exception as exp:
+            self.error = GnmiError(-1, str(exp))
+        finally:
+            self.responses.put(self.END)
+
+    def updates(self, count=None, timeout=None, until_sync=False):
+        """
+        Generate the updates as (xpath, value, timestamp) tuples until the
+        given count is reached, the timeout expires, the sync response is
+        received (until_sync) or the RPC ends.
+        """
+        (received, deadline) = (0, time.time() + timeout if timeout else None)
+        while count is None or received < count:
+            wait = max(deadline - time.time(), 0) if deadline else None
+            try:
+                item = self.responses.get(timeout=wait)
+            except queue.Empty:
+                break
+            if item is self.END:
+                self.responses.put(self.END)
+                if self.error:
+                    raise self.error
+                break
+            if item is self.SYNC:
+                self.synced = True
+                if until_sync:
+                    break
+                continue
+            received = received + 1
+            yield item
+
+    def poll(self, timeout=None):
+        """
+        Poll the target (poll mode) and return the updates of the poll.
+        """
+        self.requests.put(gnmi_pb2.SubscribeRequest(poll=gnmi_pb2.Poll()))
+        return list(self.updates(timeout=timeout, until_sync=True))
+
+    def close(self):
+        self.requests.put(None)
+        self.call.cancel()
+        self.reader.join(5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+clients = dict()
+clients_lock = threading.Lock()
+
+def get_client(target_addr, **kwargs):
+    """
+    Long-lived client for the target, shared by the callers using the
+    same target and credentials.
+    """
+    key = (target_addr, tuple(sorted(kwargs.items())))
+    with clients_lock:
+        if key not in clients:
+            clients[key] = GnmiClient(target_addr, **kwargs)
+        return clients[key]
+
+def close_clients():
+    with clients_lock:
+        for client in clients.values():
+            client.close()
+        clients.clear()
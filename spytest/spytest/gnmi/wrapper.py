@@ -3,6 +3,10 @@ import sys
 import json
 import yaml
 import os
+import logging
+
+import spytest.env as env
+from spytest.gnmi import client as gnmi_client
 
 """
 Example: GET
@@ -52,6 +56,82 @@ VAL_SPLIT = "_val:"
 OP_KEY  = "op:"  #expected return with successfull SET operation
 CONFIG_YAML = os.path.join(BASE_DIR, "conf.yaml")
 TEMP_FILE_PATH = "/tmp/"
+CLIENT_FLAGS = {"-insecure": "inSecure", "-notls": "noTls"}
+CLIENT_OPTIONS = {"-target_addr": "target_addr", "-username": "username",
+                  "-password": "password", "-ca": "ca", "-cert": "cert",
+                  "-key": "key", "-target_name": "target_name", "-time_out": "timeout"}
+SET_ACTIONS = ["-delete", "-replace", "-update", "-create"]
+
+# whether the gNMI client is supported, checked once
+client_supported = None
+
+def use_client(logger=None):
+    """
+    In-process gNMI client is used instead of the gnmi_get/gnmi_set
+    binaries when SPYTEST_GNMI_CLIENT is grpc and the grpc is installed.
+    """
+    global client_supported
+    if env.get("SPYTEST_GNMI_CLIENT", "binary") != "grpc":
+        return False
+    if client_supported is None:
+        client_supported = gnmi_client.is_supported()
+        if not client_supported:
+            msg = "gNMI client not supported: {}, using gnmi binaries".format(gnmi_client.get_import_error())
+            (logger or logging.getLogger()).warning(msg)
+    return client_supported
+
+def _client_params(param):
+    # convert the gnmi_get/gnmi_set parameters to client arguments
+    (kwargs, ops, paths, index) = ({"inSecure": False}, [], [], 0)
+    while index < len(param):
+        arg = param[index]
+        if arg in CLIENT_FLAGS:
+            kwargs[CLIENT_FLAGS[arg]] = True
+        elif arg in CLIENT_OPTIONS and index + 1 < len(param):
+            index = index + 1
+            kwargs[CLIENT_OPTIONS[arg]] = param[index]
+        elif arg == "-xpath" and index + 1 < len(param):
+            index = index + 1
+            paths.append(param[index])
+        elif arg in SET_ACTIONS and index + 1 < len(param):
+            index = index + 1
+            (xpath, data) = (param[index], None)
+            if arg != "-delete" and ":@" in xpath:
+                (xpath, data_file) = xpath.rsplit(":@", 1)
+                with open(data_file) as fh:
+                    data = json.load(fh)
+            ops.append((arg[1:], xpath, data))
+        elif not arg.startswith("-"):
+            paths.append(arg)
+        index = index + 1
+    if "timeout" in kwargs:
+        kwargs["timeout"] = int(str(kwargs["timeout"]).rstrip("s"))
+    target_addr = kwargs.pop("target_addr", "")
+    return gnmi_client.get_client(target_addr, **kwargs), paths, ops
+
+def _client_get(param, pretty=False):
+    try:
+        client, paths, _ = _client_params(param)
+        values = client.get(paths)
+    except gnmi_client.GnmiError as exp:
+        return {"ok": False, 'errorCode': exp.code, 'message': exp.message}
+    rval = values[0] if len(values) == 1 else values
+    if rval == "" or rval == []:
+        return {"ok": False, "return": ""}
+    if pretty:
+        return json.dumps(rval, indent=4, sort_keys=True)
+    return {"ok": True, "return": rval}
+
+def _client_set(param, pretty=False):
+    try:
+        client, _, ops = _client_params(param)
+        result = client.set(ops)
+    except gnmi_client.GnmiError as exp:
+        return {"ok": False, 'errorCode': exp.code, 'message': exp.message}
+    rval = result[0] if len(result) == 1 else result
+    if pretty:
+        return json.dumps(rval, indent=4, sort_keys=True)
+    return {"ok": True, "return": rval}
 
 def gnmiSend( action="GET", xpath="", target_addr="", inSecure=True, parameters=""  ):
     ret_val = ""
@@ -98,6 +178,12 @@ def _gnmi_get(param, display=False, default_param=False):
         display = True
         param.remove("-display")
 
+    if use_client():
+        ret_val = _client_get(param, pretty)
+        if display :
+            print (str(ret_val))
+        return ret_val
+
     execution = [GNMI_GET] + list(map(str, param))
     #print ("Executing GET %s"%(execution))
 
@@ -176,6 +262,12 @@ def _gnmi_set(param, display=False, default_param=False):
         display = True
         param.remove("-display")
 
+    if use_client():
+        ret_val = _client_set(param, pretty)
+        if display :
+            print( str(ret_val))
+        return ret_val
+
     execution = [GNMI_SET] + list(map(str, param))
     #print("Executing SET %s"%(execution))
 
@@ -372,6 +372,15 @@ def gnmi_get(dut, path, *args, **kwargs):
 def gnmi_send(dut, path, *args, **kwargs):
     return getwa().gnmi_send(dut, path, *args, **kwargs)
 
+def gnmi_get_many(dut, paths, *args, **kwargs):
+    return getwa().gnmi_get_many(dut, paths, *args, **kwargs)
+
+def gnmi_set_many(dut, ops, *args, **kwargs):
+    return getwa().gnmi_set_many(dut, ops, *args, **kwargs)
+
+def gnmi_subscribe(dut, paths, *args, **kwargs):
+    return getwa().gnmi_subscribe(dut, paths, *args, **kwargs)
+
 def rest_create(dut, path, data, *args, **kwargs):
     return getwa().rest_create(dut, path, data, *args, **kwargs)
 
@@ -6,11 +6,16 @@ import threading
 import os
 import time
 import datetime
+import atexit
+import collections
 from spytest.st_time import get_timestamp
 import spytest.env as env
 
-def get_thread_name():
-    name = threading.current_thread().name
+ansi_escape_re = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')
+non_ascii_re = re.compile(r'[^\x00-\x7F]+')
+
+def get_thread_name(name=None):
+    name = name or threading.current_thread().name
     name = name.replace("MainThread", "Thread-0")
     try:
         num = int(name.replace("Thread-", ""))
@@ -46,12 +51,150 @@ class LogFormatter(object):
             elapsed = datetime.timedelta(seconds=elapsed_seconds)
             time_stamp = time_delta(elapsed)
         else:
-            time_stamp = get_timestamp(True)
-        thid = get_thread_name()
+            # the record may be formatted later by the log writer thread
+            this = datetime.datetime.utcfromtimestamp(record.created)
+            time_stamp = get_timestamp(True, this)
+        thid = get_thread_name(record.threadName)
         lvl = get_log_lvl_name(record.levelname)
         msg = record.getMessage()
         return "{} {}{} {}".format(time_stamp, thid, lvl, msg)
 
+class LogWriter(threading.Thread):
+    """
+    Background thread formatting and writing the log records of the
+    AsyncFileHandler objects. The files are written with buffered writes
+    and flushed when there are no more records to write.
+
+    The queue is bounded, when it is full the threads logging are either
+    slowed down until there is room in the queue (policy "block") or their
+    records are dropped (policy "drop"). The number of dropped records is
+    written to the log files.
+    """
+
+    def __init__(self, size=10000, policy="block"):
+        threading.Thread.__init__(self, name="LogWriter")
+        self.daemon = True
+        self.pid = os.getpid()
+        # deque append and popleft are thread safe and cheaper than a Queue
+        self.records = collections.deque()
+        self.pending = threading.Event()
+        self.size = size
+        self.policy = policy
+        self.dropped = 0
+        self.dirty = set()
+
+    def put(self, handler, record):
+        if self.size > 0 and len(self.records) >= self.size:
+            if self.policy == "drop":
+                self.dropped = self.dropped + 1
+                return
+            while len(self.records) >= self.size and self.is_alive():
+                time.sleep(0.001)
+        self.records.append((handler, record))
+        if not self.pending.is_set():
+            self.pending.set()
+
+    def flush(self):
+        # wait for the records queued so far to be written and flushed
+        if not self.is_alive():
+            return
+        done = threading.Event()
+        self.records.append((None, done))
+        self.pending.set()
+        done.wait()
+
+    def run(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            while self.records:
+                (handler, record) = self.records.popleft()
+                if handler is None:
+                    self._flush()
+                    record.set()
+                    continue
+                if self.dropped:
+                    (dropped, self.dropped) = (self.dropped, 0)
+                    msg = "{} log messages dropped as the log queue was full".format(dropped)
+                    handler.write(logging.makeLogRecord({"msg": msg, "levelname": "WARNING",
+                                                         "levelno": logging.WARNING}))
+                handler.write(record)
+                self.dirty.add(handler)
+            self._flush()
+
+    def _flush(self):
+        for handler in self.dirty:
+            try:
+                handler.sync()
+            except Exception:
+                pass
+        self.dirty.clear()
+
+log_writer = None
+
+def _flush_before_fork():
+    # the child would write again the records buffered at fork time
+    if log_writer is not None and log_writer.pid == os.getpid():
+        log_writer.flush()
+
+def get_log_writer():
+    global log_writer
+    if log_writer is None or log_writer.pid != os.getpid():
+        if log_writer is None and hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=_flush_before_fork)
+        size = env.get("SPYTEST_LOGS_QUEUE_SIZE", "10000")
+        policy = env.get("SPYTEST_LOGS_QUEUE_POLICY", "block")
+        log_writer = LogWriter(int(size), policy)
+        log_writer.start()
+        atexit.register(log_writer.flush)
+    return log_writer
+
+class AsyncFileHandler(logging.FileHandler):
+    """
+    File handler queueing the records to the log writer thread
+    """
+
+    def __init__(self, writer, filename, mode='a'):
+        logging.FileHandler.__init__(self, filename, mode)
+        self.writer = writer
+
+    def handle(self, record):
+        # no handler lock here, the writer thread takes it to write
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        # the message arguments may change after the call, render them now
+        record.msg = record.getMessage()
+        record.args = None
+        if self.writer.pid != os.getpid():
+            # forked, the writer thread of the parent does not run here
+            self.writer = get_log_writer()
+        self.writer.put(self, record)
+
+    def write(self, record):
+        self.acquire()
+        try:
+            if self.stream is None: return
+            self.stream.write("{}\n".format(self.format(record)))
+        except Exception:
+            self.handleError(record)
+        finally:
+            self.release()
+
+    def sync(self):
+        logging.FileHandler.flush(self)
+
+    def flush(self):
+        # flushed by the log writer thread
+        pass
+
+    def close(self):
+        self.writer.flush()
+        logging.FileHandler.close(self)
+
 class Logger(object):
 
     def __init__(self, file_prefix=None, filename=None, name='', level=logging.INFO, tlog=False, mlog=True):
@@ -78,6 +221,9 @@ class Logger(object):
         self.file_prefix = file_prefix
         self.use_elapsed_time_fmt = bool(env.get("SPYTEST_LOGS_TIME_FMT_ELAPSED", "0") == "1")
         self.module_only_log_support = bool(env.get("SPYTEST_LOGS_MODULE_ONLY_SUPPORT", "0") == "1")
+        self.log_writer = None
+        if env.get("SPYTEST_LOGS_ASYNC", "1") != "0":
+            self.log_writer = get_log_writer()
 
         logfile = filename if filename else "spytest.log"
         logfile = self._add_prefix(logfile)
@@ -108,7 +254,10 @@ class Logger(object):
         if logdir and not os.path.exists(logdir):
             os.makedirs(logdir)
 
-        file_handler = logging.FileHandler(logfile, 'w')
+        if self.log_writer:
+            file_handler = AsyncFileHandler(self.log_writer, logfile, 'w')
+        else:
+            file_handler = logging.FileHandler(logfile, 'w')
         fmt = LogFormatter(self.use_elapsed_time_fmt)
         file_handler.setFormatter(fmt)
         logger.addHandler(file_handler)
@@ -162,8 +311,14 @@ class Logger(object):
                     self.flush_handlers(self.module_logger)
 
     def _tostring(self, msg):
-        msg = re.sub(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]', ' ', msg)
-        msg = re.sub(r'[^\x00-\x7F]+', ' ', msg)
+        try:
+            # most of the lines are plain ascii without escape sequences
+            if "\x1B" not in msg:
+                return msg.encode('ascii').decode('ascii')
+        except Exception:
+            pass
+        msg = ansi_escape_re.sub(' ', msg)
+        msg = non_ascii_re.sub(' ', msg)
         try:
             return msg.encode('ascii', 'ignore').decode('ascii')
         except Exception as exp:
@@ -224,6 +379,10 @@ class Logger(object):
         for handler in logger.handlers:
             handler.flush()
 
+    def flush(self):
+        if self.log_writer:
+            self.log_writer.flush()
+
     def close_handler(self, handler, logger=None):
         if handler:
             handler.close()
@@ -232,6 +391,7 @@ class Logger(object):
         return None
 
     def tc_log_init(self, test_name):
+        self.flush()
         if not self.tc_log_support: return
         self.tc_log_handler = self.close_handler(self.tc_log_handler)
         if not test_name: return
@@ -240,6 +400,7 @@ class Logger(object):
         self.tc_log_handler = rv
 
     def module_log_init(self, module_name):
+        self.flush()
         if not self.module_log_support: return
         self.module_log_handler = self.close_handler(self.module_log_handler,
                                                      self.module_logger)
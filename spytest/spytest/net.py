@@ -350,6 +350,8 @@ class Net(object):
     def unregister_devices(self):
         for _devname in self.topo["duts"]:
             self._disconnect_device(_devname)
+            if _devname in self.gnmi:
+                self.gnmi[_devname].close()
         self.topo["duts"] = {}
 
     def register_templates(self):
@@ -4660,6 +4662,15 @@ class Net(object):
     def gnmi_send(self, dut, path, *args, **kwargs):
         return self.gnmi[dut].send(path, *args, **kwargs)
 
+    def gnmi_get_many(self, dut, paths, *args, **kwargs):
+        return self.gnmi[dut].get_many(paths, *args, **kwargs)
+
+    def gnmi_set_many(self, dut, ops, *args, **kwargs):
+        return self.gnmi[dut].set_many(ops, *args, **kwargs)
+
+    def gnmi_subscribe(self, dut, paths, *args, **kwargs):
+        return self.gnmi[dut].subscribe(paths, *args, **kwargs)
+
     def rest_init(self, dut, username, password, altpassword, cached=False):
         access = self._get_dev_access(dut)
         access["curr_pwd"] = None
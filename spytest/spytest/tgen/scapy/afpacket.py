@@ -6,10 +6,18 @@ in the data returned by recv. Instead, it delivers the VLAN TCI in a control
 message. Python 2.x doesn't have built-in support for recvmsg, so we have to
 use ctypes to call it. The recv function exported by this module reconstructs
 the VLAN tag if it was offloaded.
+
+RxRing receives the packets through a PACKET_RX_RING (TPACKET_V3) shared with
+the kernel, a block of packets at a time, the VLAN tag is reconstructed from
+the packet header same as recv. The sendmmsg function sends a list of packets
+in one system call.
 """
 
+import mmap
+import select
 import struct
 from ctypes import sizeof
+from ctypes import addressof
 from ctypes import get_errno
 from ctypes import byref
 from ctypes import c_void_p
@@ -27,8 +35,14 @@ from ctypes import c_uint32
 
 ETH_P_8021Q = 0x8100
 SOL_PACKET = 263
+PACKET_RX_RING = 5
 PACKET_AUXDATA = 8
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1 << 0
 TP_STATUS_VLAN_VALID = 1 << 4
+TP_STATUS_VLAN_TPID_VALID = 1 << 6
 
 class struct_iovec(Structure):
     _fields_ = [
@@ -65,10 +79,48 @@ class struct_tpacket_auxdata(Structure):
         ("tp_padding", c_ushort),
     ]
 
-libc = CDLL("libc.so.6")
+class struct_mmsghdr(Structure):
+    _fields_ = [
+        ("msg_hdr", struct_msghdr),
+        ("msg_len", c_uint),
+    ]
+
+class struct_tpacket_req3(Structure):
+    _fields_ = [
+        ("tp_block_size", c_uint),
+        ("tp_block_nr", c_uint),
+        ("tp_frame_size", c_uint),
+        ("tp_frame_nr", c_uint),
+        ("tp_retire_blk_tov", c_uint),
+        ("tp_sizeof_priv", c_uint),
+        ("tp_feature_req_word", c_uint),
+    ]
+
+# struct tpacket_block_desc: version, offset_to_priv and tpacket_hdr_v1
+# block_status, num_pkts, offset_to_first_pkt
+block_desc = struct.Struct("=IIIII")
+
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len,
+# tp_status, tp_mac, tp_net and tpacket_hdr_variant1 tp_rxhash,
+# tp_vlan_tci, tp_vlan_tpid
+tpacket3_hdr = struct.Struct("=IIIIIIHHIIH")
+
+libc = CDLL("libc.so.6", use_errno=True)
 recvmsg = libc.recvmsg
 recvmsg.argtypes = [c_int, POINTER(struct_msghdr), c_int]
 recvmsg.retype = c_int
+sendmmsg_func = getattr(libc, "sendmmsg", None)
+if sendmmsg_func:
+    sendmmsg_func.argtypes = [c_int, c_void_p, c_uint, c_int]
+    sendmmsg_func.restype = c_int
+
+# native layout of struct iovec and struct mmsghdr used to pack the arrays
+iovec_fmt = "PL"
+iovec_size = struct.calcsize("@" + iovec_fmt)
+mmsghdr_fmt = "PIPLPLiI0P"
+mmsghdr_size = struct.calcsize("@" + mmsghdr_fmt)
+if iovec_size != sizeof(struct_iovec) or mmsghdr_size != sizeof(struct_mmsghdr):
+    sendmmsg_func = None
 
 def enable_auxdata(sk):
     """
@@ -124,3 +176,110 @@ def recv(sk, bufsize):
         return buf.raw[:12] + tag + buf.raw[12:rv]
     else:
         return buf.raw[:rv]
+
+def vlan_tag(tpid, tci):
+    return struct.pack("!HH", tpid or ETH_P_8021Q, tci)
+
+def sendmmsg(sk, frames):
+    """
+    Send the packets on a bound AF_PACKET socket in one system call
+    @sk Socket
+    @frames List of packets
+    Returns the number of packets sent, which is less than the
+    number of packets when the sending fails part way
+    """
+    count = len(frames)
+    if not count:
+        return 0
+    if not sendmmsg_func:
+        for frame in frames:
+            sk.send(frame)
+        return count
+    # the iovec and mmsghdr arrays are packed in one go, setting
+    # the ctypes structure fields per packet costs more than the
+    # system calls saved
+    data = b"".join(frames)
+    buf = create_string_buffer(data, len(data))
+    (iov_args, offset, base) = ([], 0, addressof(buf))
+    for frame in frames:
+        iov_args.extend([base + offset, len(frame)])
+        offset = offset + len(frame)
+    iovs = create_string_buffer(struct.pack("@" + iovec_fmt * count, *iov_args))
+    (msg_args, base) = ([], addressof(iovs))
+    for index in range(count):
+        msg_args.extend([0, 0, base + index * iovec_size, 1, 0, 0, 0, 0])
+    msgs = create_string_buffer(struct.pack("@" + mmsghdr_fmt * count, *msg_args))
+    sent = 0
+    while sent < count:
+        rv = sendmmsg_func(sk.fileno(), addressof(msgs) + sent * mmsghdr_size, count - sent, 0)
+        if rv <= 0:
+            if sent:
+                break
+            raise RuntimeError("sendmmsg failed: rv=%d errno=%d" % (rv, get_errno()))
+        sent = sent + rv
+    return sent
+
+class RxRing(object):
+    """
+    PACKET_RX_RING (TPACKET_V3) receive
+
+    The kernel fills the blocks of the ring with the packets and hands a block
+    over when it is full or when the block timeout expires.
+    """
+
+    def __init__(self, sk, block_size=1 << 20, block_nr=16, frame_size=1 << 14, timeout=10):
+        self.sk = sk
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block = 0
+        sk.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        req = struct_tpacket_req3()
+        req.tp_block_size = block_size
+        req.tp_block_nr = block_nr
+        req.tp_frame_size = frame_size
+        req.tp_frame_nr = (block_size // frame_size) * block_nr
+        req.tp_retire_blk_tov = timeout
+        sk.setsockopt(SOL_PACKET, PACKET_RX_RING, bytes(bytearray(req)))
+        self.ring = mmap.mmap(sk.fileno(), block_size * block_nr,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.poller = select.poll()
+        self.poller.register(sk.fileno(), select.POLLIN | select.POLLERR)
+
+    def close(self):
+        try: self.ring.close()
+        except Exception: pass
+
+    def recv(self, timeout=1.0):
+        """
+        Receive the packets of the next block
+        @timeout Seconds to wait for a block
+        Returns the list of packets, empty on timeout
+        """
+        offset = self.block * self.block_size
+        status = block_desc.unpack_from(self.ring, offset)[2]
+        if not status & TP_STATUS_USER:
+            self.poller.poll(int(timeout * 1000))
+            status = block_desc.unpack_from(self.ring, offset)[2]
+            if not status & TP_STATUS_USER:
+                return []
+
+        (_, _, _, num_pkts, first) = block_desc.unpack_from(self.ring, offset)
+        (frames, pos) = ([], offset + first)
+        for _ in range(num_pkts):
+            (next_offset, _, _, snaplen, _, tp_status, tp_mac, _, _,
+             tci, tpid) = tpacket3_hdr.unpack_from(self.ring, pos)
+            start = pos + tp_mac
+            if tci != 0 or tp_status & TP_STATUS_VLAN_VALID:
+                # Insert VLAN tag
+                if not tp_status & TP_STATUS_VLAN_TPID_VALID:
+                    tpid = ETH_P_8021Q
+                frames.append(self.ring[start:start + 12] + vlan_tag(tpid, tci)
+                              + self.ring[start + 12:start + snaplen])
+            else:
+                frames.append(self.ring[start:start + snaplen])
+            pos = pos + next_offset
+
+        # hand the block back to the kernel
+        struct.pack_into("=I", self.ring, offset + 8, TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % self.block_nr
+        return frames
@@ -4,6 +4,7 @@ import traceback
 import threading
 
 from packet import ScapyPacket
+from pacer import monotonic
 from or_event import OrEvent
 from utils import Utils
 from logger import Logger
@@ -64,6 +65,7 @@ class ScapyDriver(object):
         self.protocolState.clear()
         self.statState = threading.Event()
         self.statState.clear()
+        self.rx_time = 0
         self.rxThread = threading.Thread(target=self.rxThreadMain, args=())
         self.rxThread.daemon = True
         self.rxThread.start()
@@ -118,8 +120,10 @@ class ScapyDriver(object):
             # read packets
             while self.rx_any_enable():
                 try:
-                    packet = self.packet.readp(iface=self.iface)
-                    if packet:
+                    parse = self.captureState.is_set()
+                    packets = self.packet.readp_batch(self.iface, parse)
+                    self.rx_time = monotonic()
+                    for packet in packets:
                         self.handle_recv(None, packet)
                 except Exception as e:
                     if str(e) != "[Errno 100] Network is down":
@@ -146,6 +150,7 @@ class ScapyDriver(object):
         pktlen = 0 if not packet else len(packet)
         framesReceived = self.port.incrStat('framesReceived')
         self.port.incrStat('bytesReceived', pktlen)
+        self.port.markRate('rx', self.rx_time)
         if self.dbg > 2:
             self.logger.debug("{} framesReceived: {}".format(self.iface, framesReceived))
         if pktlen > 1518:
@@ -154,6 +159,7 @@ class ScapyDriver(object):
             if self.packet.match_stream(stream, packet):
                 stream.incrStat('framesReceived')
                 stream.incrStat('bytesReceived', pktlen)
+                stream.markRate('rx', self.rx_time)
                 break # no need to check in other streams
 
     def handle_capture(self, packet):
@@ -301,7 +307,10 @@ class ScapyDriver(object):
                     self.logger.debug(" start {} {}/{}".format(stream.stream_id, stream.enable, stream.enable2))
                 if stream.enable and stream.enable2:
                     pwa = self.packet.build_first(stream)
-                    pwa.tx_time = time.clock()
+                    pwa.pacer = self.packet.build_pacer(pwa)
+                    pwa.credit = 0
+                    stream.rate_pps = pwa.configured_pps
+                    stream.pacing_pps = int(pwa.pacer.rate)
                     pwa_list.append(pwa)
                     sids[stream.stream_id] = 0
                     self.stop_ack_wait(stream.stream_id)
@@ -320,75 +329,75 @@ class ScapyDriver(object):
             return
 
         tx_count = 0
+        quantum = max(self.packet.tx_batch, 1)
         while (self.txState.is_set()):
             # call start again to see if new streams are created
             # while there are transmitting streams
             if not self.txThreadMainInnerStart(pwa_list, sids):
                 break
 
-            # sort based on next packet send time
-            pwa_list.sort(key=self.pwa_sort)
-
+            # round robin over the streams, in every round a stream sends
+            # at most quantum of the packets granted by its token bucket
+            now = monotonic()
             pwa_next_list = []
             for pwa in pwa_list:
                 if not pwa.stream.enable or not pwa.stream.enable2:
                     continue
-                self.pwa_wait(pwa)
-                try:
-                    send_start_time = time.clock()
-                    pkt = self.send_packet(pwa, pwa.stream.stream_id)
-                    bytesSent = len(pkt)
-                    send_time = time.clock() - send_start_time
-
-                    # increment port counters
-                    framesSent = self.port.incrStat('framesSent')
-                    self.port.incrStat('bytesSent', bytesSent)
-                    if self.dbg > 2:
-                        self.logger.debug("{} framesSent: {}".format(self.iface, framesSent))
-                    pwa.stream.incrStat('framesSent')
-                    pwa.stream.incrStat('bytesSent', bytesSent)
+                pwa.credit = pwa.credit + pwa.pacer.take(now)
+                for _ in range(min(pwa.credit, quantum)):
+                    pwa.credit = pwa.credit - 1
                     tx_count = tx_count + 1
-
-                    # increment stream counters
-                    stream_tx = self.stream_pkts[pwa.stream.stream_id] + 1
-                    self.stream_pkts[pwa.stream.stream_id] = stream_tx
-                    if self.dbg > 2 or (self.dbg > 1 and stream_tx%100 == 99):
-                        self.logger.debug("{}/{} framesSent: {}".format(self.iface,
-                                            pwa.stream.stream_id, stream_tx))
-                except Exception as e:
-                    self.logger.log_exception(e, traceback.format_exc())
-                    pwa.stream.enable2 = False
-                else:
-                    build_start_time = time.clock()
-                    pwa = self.packet.build_next(pwa)
-                    if not pwa: continue
-                    build_time = time.clock() - build_start_time
-                    ipg = self.packet.build_ipg(pwa)
-                    pwa.tx_time = time.clock() + ipg - build_time - send_time
+                    pwa = self.txPacket(pwa)
+                    if not pwa or not pwa.stream.enable2:
+                        break
+                if pwa:
                     pwa_next_list.append(pwa)
-            pwa_list = pwa_next_list
+            self.packet.flush_tx(self.iface)
+
+            # rotate the streams so that none of them is always first
+            pwa_list = pwa_next_list[1:] + pwa_next_list[:1]
+            self.pwa_wait(pwa_list)
         self.logger.debug("txThreadMainInner {} Completed {}".format(self.iface, tx_count))
 
-    def pwa_sort(self, pwa):
-        return pwa.tx_time
-
-    def pwa_wait(self, pwa):
-        delay = pwa.tx_time - time.clock()
-        if self.dbg > 2 or (self.dbg > 1 and pwa.left != 0):
-            self.logger.debug("stream: {} delay: {} pps: {}".format(pwa.stream.stream_id, delay, pwa.rate_pps))
-        if delay <= 0:
-            # yield
-            time.sleep(0)
-        elif delay > 1.0/10:
-            self.utils.msleep(delay * 1000, 10)
-        elif delay > 1.0/100:
-            self.utils.msleep(delay * 1000, 1)
-        elif delay > 1.0/200:
-            self.utils.usleep(delay * 1000 * 1000, 100)
-        elif delay > 1.0/500:
-            self.utils.usleep(delay * 1000 * 1000, 10)
-        else:
-            self.utils.usleep(delay * 1000 * 1000)
+    def txPacket(self, pwa):
+        try:
+            pkt = self.send_packet(pwa, pwa.stream.stream_id)
+            bytesSent = len(pkt)
+            now = monotonic()
+
+            # increment port counters
+            framesSent = self.port.incrStat('framesSent')
+            self.port.incrStat('bytesSent', bytesSent)
+            self.port.markRate('tx', now)
+            if self.dbg > 2:
+                self.logger.debug("{} framesSent: {}".format(self.iface, framesSent))
+            pwa.stream.incrStat('framesSent')
+            pwa.stream.incrStat('bytesSent', bytesSent)
+            pwa.stream.markRate('tx', now)
+
+            # increment stream counters
+            stream_tx = self.stream_pkts[pwa.stream.stream_id] + 1
+            self.stream_pkts[pwa.stream.stream_id] = stream_tx
+            if self.dbg > 2 or (self.dbg > 1 and stream_tx%100 == 99):
+                self.logger.debug("{}/{} framesSent: {}".format(self.iface,
+                                    pwa.stream.stream_id, stream_tx))
+        except Exception as e:
+            self.logger.log_exception(e, traceback.format_exc())
+            pwa.stream.enable2 = False
+            return None
+
+        return self.packet.build_next(pwa)
+
+    def pwa_wait(self, pwa_list):
+        # sleep till the first of the streams has packets to send
+        now = monotonic()
+        delay = 0.1
+        for pwa in pwa_list:
+            wait = 0 if pwa.credit else pwa.pacer.wait_time(now)
+            if self.dbg > 2 or (self.dbg > 1 and pwa.left != 0):
+                self.logger.debug("stream: {} delay: {} pps: {}".format(pwa.stream.stream_id, wait, pwa.rate_pps))
+            delay = min(delay, wait)
+        time.sleep(delay)
 
     def send_packet(self, pwa, stream_name):
         return self.packet.send_packet(pwa, self.iface, stream_name, pwa.left)
@@ -0,0 +1,74 @@
+import os
+import time
+import ctypes
+
+# Stream pacing against a monotonic clock. Every stream owns a token
+# bucket filled at the stream rate, the TX thread sends the packets the
+# bucket grants and sleeps till the next grant, so the oversleeping and
+# the time taken to build and send the packets don't lower the rate.
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+def _clock_gettime():
+    for name in ["libc.so.6", "librt.so.1"]:
+        try:
+            func = ctypes.CDLL(name).clock_gettime
+            func.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+            return func
+        except Exception:
+            pass
+    return None
+
+if hasattr(time, "monotonic"):
+    monotonic = time.monotonic
+else:
+    _ts = timespec()
+    _gettime = _clock_gettime()
+
+    def monotonic():
+        if not _gettime or _gettime(CLOCK_MONOTONIC, ctypes.byref(_ts)) != 0:
+            return os.times()[4]
+        return _ts.tv_sec + _ts.tv_nsec * 1e-9
+
+class TokenBucket(object):
+    """
+    Token bucket of a stream, filled at rate tokens per second up to
+    depth tokens. The tokens are granted in units of a burst, so that
+    the packets of a burst go back to back and the bursts are spaced
+    at the stream rate.
+    """
+
+    def __init__(self, rate, unit=1, window=0.1, now=None):
+        self.rate = float(max(rate, 1))
+        self.unit = max(int(unit), 1)
+        # allow catching up after being late by the window
+        self.depth = max(self.unit, self.rate * window)
+        self.last = monotonic() if now is None else now
+        # first burst is sent right away
+        self.tokens = float(self.unit)
+
+    def refill(self, now):
+        if now > self.last:
+            self.tokens = min(self.depth, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+    def take(self, now):
+        """
+        Returns the number of packets that can be sent now
+        """
+        self.refill(now)
+        if self.tokens < self.unit:
+            return 0
+        count = int(self.tokens // self.unit) * self.unit
+        self.tokens = self.tokens - count
+        return count
+
+    def wait_time(self, now):
+        """
+        Returns the seconds till the next packets can be sent
+        """
+        self.refill(now)
+        return max((self.unit - self.tokens) / self.rate, 0)
@@ -22,6 +22,8 @@ from scapy.config import Conf
 from dicts import SpyTestDict
 from utils import Utils
 from logger import Logger
+from pktgen import PacketTemplate
+from pacer import TokenBucket
 
 try: print("SCAPY VERSION = {}".format(Conf().version))
 except Exception: print("SCAPY VERSION = UNKNOWN")
@@ -130,6 +132,9 @@ class ScapyPacket(object):
         except Exception: self.logger.info("SCAPY VERSION = UNKNOWN")
         self.utils = Utils(self.dry, logger=self.logger)
         self.max_rate_pps = self.utils.get_env_int("SPYTEST_SCAPY_MAX_RATE_PPS", 100)
+        self.compile_streams = self.utils.get_env_int("SPYTEST_SCAPY_COMPILE_STREAMS", 1)
+        self.rx_ring_enable = self.utils.get_env_int("SPYTEST_SCAPY_RX_RING", 1)
+        self.tx_batch = self.utils.get_env_int("SPYTEST_SCAPY_TX_BATCH", 64)
         self.dbg = dbg
         self.show_summary = bool(self.dbg > 2)
         self.hex = hex
@@ -138,7 +143,10 @@ class ScapyPacket(object):
         self.tx_count = 0
         self.rx_count = 0
         self.rx_sock = None
+        self.rx_ring = None
         self.tx_sock = None
+        self.tx_raw = None
+        self.tx_queue = []
         self.finished = False
         self.exabgp_nslist = []
         self.cleanup()
@@ -225,8 +233,11 @@ class ScapyPacket(object):
         self.logger.info("ScapyPacket {} cleanup...".format(self.iface))
         self.exabgpd_stop_all()
         self.finished = True
+        self.rx_ring = self.close_sock(self.rx_ring)
         self.rx_sock = self.close_sock(self.rx_sock)
         self.tx_sock = self.close_sock(self.tx_sock)
+        self.tx_raw = self.close_sock(self.tx_raw)
+        self.tx_queue = []
         self.init_bridge(self.iface)
         self.finished = False
 
@@ -236,6 +247,13 @@ class ScapyPacket(object):
         self.rx_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
         self.rx_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 12 * 1024)
         self.rx_sock.bind((self.iface+"-rx", 3))
+        if self.rx_ring_enable:
+            try:
+                self.rx_ring = afpacket.RxRing(self.rx_sock)
+                return
+            except Exception as exp:
+                self.logger.debug("Failed to create RX ring {} {}".format(self.iface, exp))
+                self.rx_ring = None
         afpacket.enable_auxdata(self.rx_sock)
 
     def set_link(self, status):
@@ -271,6 +289,36 @@ class ScapyPacket(object):
 
         return packet
 
+    def readp_batch(self, iface, parse=True):
+
+        if not self.rx_ring:
+            packet = self.readp(iface)
+            return [packet] if packet else []
+
+        try:
+            frames = self.rx_ring.recv(1.0)
+        except Exception as exp:
+            if self.finished:
+                return []
+            raise exp
+        self.rx_count = self.rx_count + len(frames)
+        self.trace_stats()
+
+        if not parse and self.dbg <= 1:
+            return frames
+
+        packets = []
+        for data in frames:
+            packet = Ether(data)
+            if self.dbg > 1:
+                cmd = "" if not self.show_summary else packet.command()
+                msg = "readp:{} len:{} count:{} {}".format
+                self.logger.debug(msg(iface, len(data), self.rx_count, cmd))
+            if self.dbg > 2:
+                self.trace_packet(packet, self.hex)
+            packets.append(packet if parse else data)
+        return packets
+
     def sendp(self, pkt, data, iface, stream_name, left):
         self.tx_count = self.tx_count + 1
         self.trace_stats()
@@ -283,21 +331,45 @@ class ScapyPacket(object):
         if self.dbg > 2:
             self.trace_packet(pkt, self.hex)
 
+        if not self.dry and self.tx_batch > 1:
+            self.tx_queue.append(data)
+            if len(self.tx_queue) >= self.tx_batch:
+                self.flush_tx(iface)
+            return
+
         if not self.dry:
-            if not self.tx_sock:
-                try:
-                    self.tx_sock = L2Socket(iface)
-                except Exception as exp:
-                    self.logger.debug("Failed to create L2Socket {} {}".format(iface, exp))
-
-            if self.tx_sock:
-                try: return self.tx_sock.send(data)
-                except Exception: pass
+            self.send_frame(data, iface)
+
+    def flush_tx(self, iface):
+        if not self.tx_queue: return
+        (frames, self.tx_queue) = (self.tx_queue, [])
+        try:
+            if not self.tx_raw:
+                self.tx_raw = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                self.tx_raw.bind((iface, 0))
+            frames = frames[afpacket.sendmmsg(self.tx_raw, frames):]
+            if not frames: return
+        except Exception as exp:
+            self.logger.debug("Failed to send batch {} {}".format(iface, exp))
+            self.tx_raw = self.close_sock(self.tx_raw)
+        for data in frames:
+            self.send_frame(data, iface)
+
+    def send_frame(self, data, iface):
+        if not self.tx_sock:
             try:
-                sendp(data, iface=iface, verbose=False)
+                self.tx_sock = L2Socket(iface)
             except Exception as exp:
-                self.logger.debug("Failed to send legacy {} {}".format(iface, exp))
-                if self.is_vde: self.os_system("ip link set dev {0} up".format(iface))
+                self.logger.debug("Failed to create L2Socket {} {}".format(iface, exp))
+
+        if self.tx_sock:
+            try: return self.tx_sock.send(data)
+            except Exception: pass
+        try:
+            sendp(data, iface=iface, verbose=False)
+        except Exception as exp:
+            self.logger.debug("Failed to send legacy {} {}".format(iface, exp))
+            if self.is_vde: self.os_system("ip link set dev {0} up".format(iface))
 
     def trace_stats(self):
         #self.logger.debug("Name: {} RX: {} TX: {}".format(self.iface, self.rx_count, self.tx_count))
@@ -317,6 +389,12 @@ class ScapyPacket(object):
         if hex: hexdump(pkt)
 
     def send_packet(self, pwa, iface, stream_name, left):
+        if pwa.template:
+            bstr = pwa.template.frame()
+            pkt = Ether(bstr) if self.dbg > 1 else pwa.pkt
+            self.sendp(pkt, bstr, iface, stream_name, left)
+            return bstr
+
         if pwa.padding:
             strpkt = str(pwa.pkt/pwa.padding)
         else:
@@ -737,6 +815,7 @@ class ScapyPacket(object):
         pwa.burst_sent = 0
         pwa.pkts_per_burst = pkts_per_burst
         pwa.transmit_mode = transmit_mode
+        pwa.configured_pps = rate_pps
         if rate_pps > self.max_rate_pps:
             self.error("drop the rate from {} to {}".format(rate_pps, self.max_rate_pps))
             rate_pps = self.max_rate_pps
@@ -767,9 +846,19 @@ class ScapyPacket(object):
         pwa.frame_size_max = frame_size_max
         pwa.frame_size_step = frame_size_step
         self.add_padding(pwa, True)
+        pwa.template = self.compile_stream(pwa)
 
         return pwa
 
+    def compile_stream(self, pwa):
+        if not self.compile_streams:
+            return None
+        try:
+            return PacketTemplate(pwa)
+        except Exception as exp:
+            self.logger.info("stream {} not compiled: {}".format(pwa.stream.stream_id, exp))
+        return None
+
     def add_padding(self, pwa, first):
         pwa.padding = None
         if pwa.length_mode == "random":
@@ -796,6 +885,10 @@ class ScapyPacket(object):
 
     def build_next_dma(self, pwa):
 
+        if pwa.template:
+            pwa.template.build_next()
+            return pwa
+
         # Change Ether SRC MAC
         mac_src_mode  = pwa.stream.kws.get("mac_src_mode", "fixed").strip()
         mac_src_step  = pwa.stream.kws.get("mac_src_step", "00:00:00:00:00:01")
@@ -985,9 +1078,9 @@ class ScapyPacket(object):
             tcp_dst_port_count  = self.utils.intval(pwa.stream.kws, "tcp_dst_port_count", 0)
             if tcp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if tcp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport + tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport + tcp_dst_port_step
                 else:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport - tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport - tcp_dst_port_step
                 pwa.tcp_dst_port_count = pwa.tcp_dst_port_count + 1
                 if tcp_dst_port_count > 0 and pwa.tcp_dst_port_count >= tcp_dst_port_count:
                     pwa.pkt[TCP].dport = self.utils.intval(pwa.stream.kws, "tcp_dst_port", 0)
@@ -1019,9 +1112,9 @@ class ScapyPacket(object):
             udp_dst_port_count  = self.utils.intval(pwa.stream.kws, "udp_dst_port_count", 0)
             if udp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if udp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport + udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport + udp_dst_port_step
                 else:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport - udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport - udp_dst_port_step
                 pwa.udp_dst_port_count = pwa.udp_dst_port_count + 1
                 if udp_dst_port_count > 0 and pwa.udp_dst_port_count >= udp_dst_port_count:
                     pwa.pkt[UDP].dport = self.utils.intval(pwa.stream.kws, "udp_dst_port", 0)
@@ -1065,12 +1158,10 @@ class ScapyPacket(object):
 
         return None
 
-    def build_ipg(self, pwa):
-        if pwa.burst_sent != 0 and pwa.burst_sent < pwa.pkts_per_burst:
-            return 0
-        pwa.burst_sent = 0
+    def build_pacer(self, pwa, now=None):
         pps = self.utils.min_value(pwa.rate_pps, self.max_rate_pps)
-        return (1.0 * pwa.pkts_per_burst)/float(pps)
+        unit = pwa.pkts_per_burst if pwa.transmit_mode in ["continuous_burst", "single_burst"] else 1
+        return TokenBucket(pps, unit, now=now)
 
     def match_stream(self, stream, pkt):
         sid = stream.get_sid()
@@ -1578,6 +1669,7 @@ if __name__ == '__main__':
         # wait to proceed
         #if iface: raw_input("press any key to send packet")
         packet.send_packet(pwa, iface, "NA", pwa.left)
+        packet.flush_tx(iface)
         pwa = packet.build_next(pwa)
         if pwa: time.sleep(1)
 
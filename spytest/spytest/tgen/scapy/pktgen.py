@@ -0,0 +1,244 @@
+import zlib
+import random
+import socket
+import struct
+
+from scapy.layers.l2 import Dot1Q, ARP
+from scapy.layers.inet import IP, UDP, TCP
+from scapy.layers.inet6 import IPv6
+from utils import Utils
+
+# Stream compiled into the bytes of the first packet and a list of field
+# mutators. The mutators patch the fields in place, along with the IPv4
+# header and L4 checksums covering them (RFC 1624), so the next packets
+# are built without scapy. The frames are the same as the scapy built ones
+# except that the field values wrap around, where scapy produces invalid
+# MACs or fails on port overflow.
+
+modes_inc = ["increment", "incr"]
+modes_dec = ["decrement", "decr"]
+
+def mac2int(mac):
+    return int(mac.replace(':', '').replace(".", ''), 16)
+
+def ipv42int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+def int2bytes(value, width):
+    if width == 2:
+        return struct.pack("!H", value)
+    if width == 4:
+        return struct.pack("!I", value)
+    if width == 6:
+        return struct.pack("!HI", value >> 32, value & 0xFFFFFFFF)
+    return struct.pack("!QQ", value >> 64, value & 0xFFFFFFFFFFFFFFFF)
+
+def bytes2int(data):
+    value = 0
+    for byte in bytearray(data):
+        value = (value << 8) | byte
+    return value
+
+def csum_words(value):
+    # one's complement sum of the 16 bit words of the field value
+    total = 0
+    while value:
+        total = total + (value & 0xFFFF)
+        value = value >> 16
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+def fcs(data):
+    crc = zlib.crc32(data) & 0xFFFFFFFF
+    return struct.pack("!I", socket.htonl(crc))
+
+class FieldMutator(object):
+
+    def __init__(self, name, offset, width, mode, step, count, mask=None, values=None):
+        self.name = name
+        self.offset = offset
+        self.width = width
+        self.mask = mask or (1 << (width * 8)) - 1
+        self.step = step if mode in modes_inc else -step
+        self.count = count
+        self.values = values
+        self.index = 0
+        self.start = None
+        self.current = None
+        self.other = 0
+        self.csums = []
+
+    def add_csum(self, offset, is_udp=False):
+        self.csums.append((offset, is_udp))
+
+    def init(self, buf):
+        if self.values:
+            self.values = [mac2int(v) for v in self.values]
+            self.count = len(self.values)
+        word = bytes2int(buf[self.offset:self.offset + self.width])
+        self.start = self.current = word & self.mask
+        self.other = word & ~self.mask
+
+    def next_value(self):
+        self.index = self.index + 1
+        if self.count > 0 and self.index >= self.count:
+            self.index = 0
+        if self.values:
+            return self.values[self.index]
+        return (self.start + self.index * self.step) & self.mask
+
+    def apply(self, buf):
+        value = self.next_value()
+        if value == self.current:
+            return
+        (old, self.current) = (self.current, value)
+        buf[self.offset:self.offset + self.width] = int2bytes(self.other | value, self.width)
+        if not self.csums:
+            return
+        (old_sum, new_sum) = (csum_words(old), csum_words(value))
+        for offset, is_udp in self.csums:
+            csum = (buf[offset] << 8) | buf[offset + 1]
+            if is_udp and csum == 0:
+                continue
+            total = (~csum & 0xFFFF) + (~old_sum & 0xFFFF) + new_sum
+            total = (total & 0xFFFF) + (total >> 16)
+            total = (total & 0xFFFF) + (total >> 16)
+            csum = ~total & 0xFFFF
+            if is_udp and csum == 0:
+                csum = 0xFFFF
+            buf[offset] = csum >> 8
+            buf[offset + 1] = csum & 0xFF
+
+class PacketTemplate(object):
+    """
+    Compiled stream, built from the first packet of ScapyPacket.build_first.
+    build_next() moves to the next packet, frame() gives its bytes with the
+    padding, signature and CRC same as ScapyPacket.send_packet.
+    """
+
+    def __init__(self, pwa):
+        pkt = pwa.pkt
+        kws = pwa.stream.kws
+        self.buf = bytearray(bytes(pkt))
+        self.pkt_len = len(self.buf)
+        self.mutators = []
+        self.length_mode = pwa.length_mode
+        self.frame_size_min = pwa.frame_size_min
+        self.frame_size_max = pwa.frame_size_max
+        self.frame_size_step = pwa.frame_size_step
+        self.frame_size_current = pwa.frame_size_current
+        self.pad_len = len(pwa.padding) if pwa.padding else 0
+        self.zeros = bytearray(max(self.frame_size_max - self.pkt_len, 0))
+        self.add_signature = pwa.add_signature
+        sid = pwa.stream.get_sid() or "DeadBeef"
+        self.sid = bytearray(sid.encode() if not isinstance(sid, bytes) else sid)
+
+        (ip_csum, l4_csum, is_udp) = (None, None, False)
+        if IP in pkt:
+            ip_off = self.offset(pkt, IP)
+            ip_csum = ip_off + 10
+            l4_csum, is_udp = self.l4_csum(pkt, IP)
+        elif IPv6 in pkt:
+            ip_off = self.offset(pkt, IPv6)
+            l4_csum, is_udp = self.l4_csum(pkt, IPv6)
+
+        self.add_mac(kws, "mac_src", 6)
+        self.add_mac(kws, "mac_dst", 0)
+        if ARP in pkt:
+            arp_off = self.offset(pkt, ARP)
+            self.add(kws, "arp_src_hw", arp_off + 8, 6, mac2int, "00:00:00:00:00:01")
+            self.add(kws, "arp_dst_hw", arp_off + 18, 6, mac2int, "00:00:00:00:00:01")
+        if IP in pkt:
+            for name, offset in [("ip_src", ip_off + 12), ("ip_dst", ip_off + 16)]:
+                mutator = self.add(kws, name, offset, 4, ipv42int, "0.0.0.1")
+                self.add_csum(mutator, ip_csum)
+                self.add_csum(mutator, l4_csum, is_udp)
+        if IPv6 in pkt:
+            for name, offset in [("ipv6_src", ip_off + 8), ("ipv6_dst", ip_off + 24)]:
+                mutator = self.add(kws, name, offset, 16, Utils.ipv6_ip2long, "::1")
+                self.add_csum(mutator, l4_csum, is_udp)
+        if Dot1Q in pkt:
+            self.add(kws, "vlan_id", self.offset(pkt, Dot1Q), 2, int, 1, 0x0FFF)
+        for proto, name in [(TCP, "tcp"), (UDP, "udp")]:
+            if proto in pkt:
+                l4_off = self.offset(pkt, proto)
+                for port, offset in [("src", l4_off), ("dst", l4_off + 2)]:
+                    mutator = self.add(kws, "{}_{}_port".format(name, port), offset, 2, int, 1)
+                    self.add_csum(mutator, l4_csum, is_udp)
+
+        for mutator in self.mutators:
+            mutator.init(self.buf)
+
+    @staticmethod
+    def offset(pkt, layer):
+        return len(pkt) - len(pkt[layer])
+
+    def l4_csum(self, pkt, layer):
+        # L4 checksums covering the addresses in the pseudo header
+        payload = pkt[layer].payload
+        if isinstance(payload, TCP):
+            return self.offset(pkt, TCP) + 16, False
+        if isinstance(payload, UDP):
+            return self.offset(pkt, UDP) + 6, True
+        if layer == IPv6 and "cksum" in [f.name for f in payload.fields_desc]:
+            return self.offset(pkt, IPv6) + 40 + 2, False
+        for proto in [TCP, UDP]:
+            if proto in pkt:
+                raise ValueError("{} after extension headers".format(proto.__name__))
+        return None, False
+
+    def add_csum(self, mutator, offset, is_udp=False):
+        if mutator and offset is not None:
+            mutator.add_csum(offset, is_udp)
+
+    def add(self, kws, name, offset, width, conv, step, mask=None):
+        mode = kws.get("{}_mode".format(name), "fixed").strip()
+        if mode == "fixed":
+            return None
+        supported = modes_inc + modes_dec if name.endswith("_port") else ["increment", "decrement"]
+        if mode not in supported:
+            raise ValueError("unhandled {}_mode = {}".format(name, mode))
+        step = conv(str(kws.get("{}_step".format(name), step)))
+        count = Utils.intval(kws, "{}_count".format(name), 0)
+        mutator = FieldMutator(name, offset, width, mode, step, count, mask)
+        self.mutators.append(mutator)
+        return mutator
+
+    def add_mac(self, kws, name, offset):
+        mode = kws.get("{}_mode".format(name), "fixed").strip()
+        if mode != "list":
+            return self.add(kws, name, offset, 6, mac2int, "00:00:00:00:00:01")
+        mutator = FieldMutator(name, offset, 6, mode, 0, 0, values=list(kws[name]))
+        self.mutators.append(mutator)
+        return mutator
+
+    def build_next(self):
+        for mutator in self.mutators:
+            mutator.apply(self.buf)
+
+        # same as ScapyPacket.add_padding
+        if self.length_mode == "random":
+            frame_size = random.randrange(self.frame_size_min, self.frame_size_max+1)
+            self.set_padding(frame_size)
+        elif self.length_mode in ["increment", "incr"]:
+            frame_size = self.frame_size_current + self.frame_size_step
+            if frame_size > self.frame_size_max:
+                self.frame_size_current = self.frame_size_min
+            else:
+                self.frame_size_current = frame_size
+            self.set_padding(self.frame_size_current)
+
+    def set_padding(self, frame_size):
+        self.pad_len = int(frame_size - self.pkt_len - 4)
+        if self.pad_len > 0:
+            self.add_signature = True
+        else:
+            self.pad_len = 0
+
+    def frame(self):
+        data = self.buf + self.zeros[:self.pad_len] if self.pad_len else self.buf[:]
+        if self.add_signature:
+            data[-len(self.sid):] = self.sid
+        data = bytes(data)
+        return data + fcs(data)
@@ -23,6 +23,19 @@ def incrStat(stats, name, val = 1):
     stats[name] = val
     return val
 
+def markRate(stats, name, now):
+    # time of the first and last packet
+    if not stats.get(name + "FirstTime"):
+        stats[name + "FirstTime"] = now
+    stats[name + "LastTime"] = now
+
+def getRate(stats, name):
+    frames = stats.get("framesSent" if name == "tx" else "framesReceived", 0)
+    span = stats.get(name + "LastTime", 0) - stats.get(name + "FirstTime", 0)
+    if frames < 2 or span <= 0:
+        return 0
+    return int(round((frames - 1) / span))
+
 class ScapyStream(object):
     def __init__(self, port, index, stream_id, track_port, *args, **kws):
         self.port = port
@@ -33,6 +46,9 @@ class ScapyStream(object):
         self.kws = copy.copy(kws)
         self.enable = True
         self.enable2 = False
+        # configured rate and the rate actually used to pace the packets
+        self.rate_pps = 0
+        self.pacing_pps = 0
         self.stats = SpyTestDict()
         initStatistics(self.stats)
         #print("ScapyStream: {} {} {}".format(self.port, self.stream_id, kws))
@@ -60,6 +76,9 @@ class ScapyStream(object):
         #print("incrStat: {} {} {} = {}".format(self.port, self.stream_id, name, val))
         return val
 
+    def markRate(self, name, now):
+        markRate(self.stats, name, now)
+
     def __str__(self):
         return ''.join([('%s=%s' % x) for x in self.kws.items()])
 
@@ -165,9 +184,16 @@ class ScapyPort(object):
     def incrStat(self, name, val = 1):
         return incrStat(self.stats, name, val)
 
+    def markRate(self, name, now):
+        markRate(self.stats, name, now)
+
     def getStats(self):
         return self.stats
 
+    def getRate(self):
+        # configured rate of the enabled streams
+        return sum([stream.rate_pps for stream in self.streams.values() if stream.enable])
+
     def getStreamStats(self):
         res = []
         for _, stream in self.streams.items():
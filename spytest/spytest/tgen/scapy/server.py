@@ -5,7 +5,7 @@ import time
 from datetime import datetime
 
 from dicts import SpyTestDict
-from port import ScapyPort
+from port import ScapyPort, getRate
 from logger import Logger
 from utils import Utils
 
@@ -496,14 +496,15 @@ class ScapyServer(object):
                 for stream, stats in port.getStreamStats():
                     if stream_id == stream.stream_id:
                         res[mode] = SpyTestDict()
-                        self.fill_stats(res[mode], stats, stats, True)
+                        self.fill_stats(res[mode], stats, stats, True, stream.rate_pps)
         elif mode == "aggregate":
             if not port_handle or port_handle not in self.ports:
                 self.error("Invalid", "port_handle", port_handle)
             stats = self.ports[port_handle].getStats()
             res[port_handle] = SpyTestDict()
             res[port_handle][mode] = SpyTestDict()
-            self.fill_stats(res[port_handle][mode], stats, stats)
+            self.fill_stats(res[port_handle][mode], stats, stats,
+                            rate=self.ports[port_handle].getRate())
         elif mode == "traffic_item":
             res[mode] = SpyTestDict()
             for port in self.ports.values():
@@ -511,7 +512,7 @@ class ScapyServer(object):
                 for stream, stats in port.getStreamStats():
                     stream_id = stream.stream_id
                     res[mode][stream_id] = SpyTestDict()
-                    self.fill_stats(res[mode][stream_id], stats, stats)
+                    self.fill_stats(res[mode][stream_id], stats, stats, rate=stream.rate_pps)
         elif mode in ["stream", "streams"]:
             res[port_handle] = SpyTestDict()
             res[port_handle]["stream"] = SpyTestDict()
@@ -519,7 +520,8 @@ class ScapyServer(object):
                 for stream, stats in port.getStreamStats():
                     stream_id = stream.stream_id
                     res[port_handle]["stream"][stream_id] = SpyTestDict()
-                    self.fill_stats(res[port_handle]["stream"][stream_id], stats, stats)
+                    self.fill_stats(res[port_handle]["stream"][stream_id], stats, stats,
+                                    rate=stream.rate_pps)
         elif mode == "flow":
             if not port_handle or port_handle not in self.ports:
                 self.error("Invalid", "port_handle", port_handle)
@@ -556,14 +558,15 @@ class ScapyServer(object):
             return val
         return {"count":val, "max":0, "min":0, "sum":0, "avg":0}
 
-    def fill_stats(self, res, tx_stats, rx_stats, detailed=False):
+    def fill_stats(self, res, tx_stats, rx_stats, detailed=False, rate=0):
         res["tx"] = SpyTestDict()
-        res["tx"]["total_pkt_rate"] = self.stat_value(1, detailed)
+        res["tx"]["total_pkt_rate"] = self.stat_value(getRate(tx_stats, "tx"), detailed)
+        res["tx"]["configured_pkt_rate"] = self.stat_value(rate, detailed)
         res["tx"]["raw_pkt_count"] = self.stat_value(tx_stats.framesSent, detailed)
         res["tx"]["pkt_byte_count"] = self.stat_value(tx_stats.bytesSent, detailed)
         res["tx"]["total_pkts"] = self.stat_value(tx_stats.framesSent, detailed)
         res["rx"] = SpyTestDict()
-        res["rx"]["raw_pkt_rate"] = self.stat_value(1, detailed)
+        res["rx"]["raw_pkt_rate"] = self.stat_value(getRate(rx_stats, "rx"), detailed)
         res["rx"]["raw_pkt_count"] = self.stat_value(rx_stats.framesReceived, detailed)
         res["rx"]["pkt_byte_count"] = self.stat_value(rx_stats.bytesReceived, detailed)
         res["rx"]["total_pkts"] = self.stat_value(rx_stats.framesReceived, detailed)
@@ -0,0 +1,57 @@
+import os
+import sys
+import copy
+import time
+import random
+
+from packet import ScapyPacket
+from ut_streams import ut_stream_get
+
+# packets per second of the unit test streams, built by scapy
+# and by the compiled stream templates, the frames are compared
+#
+#   python ut_pktgen.py [count]
+
+class UtStream(object):
+    def __init__(self, index, **kws):
+        self.port = 1
+        self.index = index
+        self.stream_id = "stream-{}".format(index)
+        self.kws = kws
+
+    def get_sid(self):
+        return '{:08x}'.format((int(self.port)<<16) + (int(self.index)))
+
+def run(index, count, compiled):
+    os.environ["SPYTEST_SCAPY_COMPILE_STREAMS"] = "1" if compiled else "0"
+    packet = ScapyPacket("", dry=True)
+    stream = UtStream(index, **copy.deepcopy(ut_stream_get(index)))
+    random.seed(index)
+    pwa = packet.build_first(stream)
+    if not pwa or bool(pwa.template) != compiled:
+        return None, 0, None
+    frames = []
+    start = time.time()
+    for _ in range(count):
+        frames.append(packet.send_packet(pwa, "", stream.stream_id, 0))
+        packet.build_next_dma(pwa)
+    return frames, count / (time.time() - start), stream.kws
+
+def main(count):
+    result = []
+    for index in range(100):
+        if not ut_stream_get(index):
+            break
+        (frames0, pps0, kws) = run(index, count, False)
+        (frames1, pps1, _) = run(index, count, True)
+        if not frames1:
+            result.append("{:4d} {:>10.0f} {:>10s} {:>8s}".format(index, pps0, "-", "-"))
+            continue
+        same = "yes" if frames0 == frames1 else "NO"
+        desc = " ".join(sorted([k for k in kws if k.endswith("_mode") or k.endswith("protocol")]))
+        result.append("{:4d} {:>10.0f} {:>10.0f} {:>8s} {}".format(index, pps0, pps1, same, desc))
+    print("{:>4s} {:>10s} {:>10s} {:>8s}".format("#", "scapy-pps", "tmpl-pps", "same"))
+    print("\n".join(result))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
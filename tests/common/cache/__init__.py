@@ -1,4 +1,5 @@
 from .facts_cache import FactsCache
 from .facts_cache import cached
+from .facts_cache import fingerprint_getter_factory
 
-__all__ = [FactsCache, cached]
+__all__ = [FactsCache, cached, fingerprint_getter_factory]
@@ -1,13 +1,16 @@
 from __future__ import print_function, division, absolute_import
 
+import hashlib
 import inspect
 import logging
 import os
 import pickle
 import shutil
 import sys
+import tempfile
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from functools import partial
 from threading import Lock
 from six import with_metaclass
 
@@ -19,6 +22,9 @@ CACHE_LOCATION = os.path.join(CURRENT_PATH, '../../../_cache')
 
 SIZE_LIMIT = 1000000000  # 1G bytes, max disk usage allowed by cache
 ENTRY_LIMIT = 1000000    # Max number of pickle files allowed in cache.
+MEMORY_ENTRY_LIMIT = 512  # Max number of facts held in memory, least recently used facts are dropped first.
+
+FINGERPRINT_KEY = "__facts_cache_fingerprint__"
 
 
 class Singleton(type):
@@ -39,6 +45,12 @@ class FactsCache(with_metaclass(Singleton, object)):
 
     Used singleton design pattern. Only a single instance of this class can be initialized.
 
+    Disk usage is tracked by an index of cached files which is built once and then updated on every write and cleanup.
+    When SIZE_LIMIT or ENTRY_LIMIT is exceeded, the least recently used cached facts are evicted. At most
+    MEMORY_ENTRY_LIMIT facts are held in memory, the least recently used ones are dropped and loaded from disk again
+    when needed. Cache files are written to a temporary file and renamed, so that parallel readers (e.g. xdist workers)
+    never load a partially written pickle file.
+
     Args:
         with_metaclass ([function]): Python 2&3 compatible function from the six library for adding metaclass.
     """
@@ -50,29 +62,125 @@ class FactsCache(with_metaclass(Singleton, object)):
         self._cache = defaultdict(dict)
         self._write_lock = Lock()
 
-    def _check_usage(self):
-        """Check cache usage, raise exception if usage exceeds the limitations.
+        # (zone, key) => (size, digest) of cache files in the order of usage, least recently used first.
+        # Digest is None for files which are not written by this process.
+        self._usage_index = None
+        self._total_size = 0
+        self._memory_lru = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0, "unchanged_writes": 0, "evictions": 0}
+
+        # mkstemp creates owner only files, cache files get the mode open() would give them
+        umask = os.umask(0)
+        os.umask(umask)
+        self._file_mode = 0o666 & ~umask
+
+    def _cache_file(self, zone, key):
+        return os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+
+    def _load_usage_index(self):
+        """Build index of cached files. Called only once, then the index is updated incrementally.
         """
-        total_size = 0
-        total_entries = 0
+        entries = []
         for root, _, files in os.walk(self._cache_location):
             for f in files:
+                if not f.endswith('.pickle'):
+                    continue
                 fp = os.path.join(root, f)
-                total_size += os.path.getsize(fp)
-                total_entries += 1
+                try:
+                    stat = os.stat(fp)
+                except OSError:
+                    continue
+                zone = os.path.relpath(root, self._cache_location)
+                entries.append((stat.st_mtime, (zone, f[:-len('.pickle')]), stat.st_size))
+
+        self._usage_index = OrderedDict()
+        self._total_size = 0
+        for _, entry, size in sorted(entries):
+            self._usage_index[entry] = (size, None)
+            self._total_size += size
+
+    def _touch(self, zone, key):
+        """Mark cached facts as most recently used.
+        """
+        entry = (zone, key)
+        if self._usage_index is not None and entry in self._usage_index:
+            self._usage_index[entry] = self._usage_index.pop(entry)
+
+        self._memory_lru.pop(entry, None)
+        self._memory_lru[entry] = True
+        while len(self._memory_lru) > MEMORY_ENTRY_LIMIT:
+            lru_zone, lru_key = self._memory_lru.popitem(last=False)[0]
+            self._cache[lru_zone].pop(lru_key, None)
+
+    def _forget(self, zone, key):
+        entry = (zone, key)
+        if self._usage_index is not None and entry in self._usage_index:
+            self._total_size -= self._usage_index.pop(entry)[0]
+        self._memory_lru.pop(entry, None)
+        if zone in self._cache:
+            self._cache[zone].pop(key, None)
+
+    def _check_usage(self, new_size=0):
+        """Evict least recently used cached facts until the new file fits into the limitations.
+
+        Args:
+            new_size (int): Size of the file to be written.
+        """
+        if self._usage_index is None:
+            self._load_usage_index()
 
-        if total_size > SIZE_LIMIT or total_entries > ENTRY_LIMIT:
-            msg = 'Cache usage exceeds limitations. total_size={}, SIZE_LIMIT={}, total_entries={}, ENTRY_LIMIT={}' \
-                .format(total_size, SIZE_LIMIT, total_entries, ENTRY_LIMIT)
-            raise Exception(msg)
+        while self._usage_index and \
+                (self._total_size + new_size > SIZE_LIMIT or len(self._usage_index) + 1 > ENTRY_LIMIT):
+            zone, key = next(iter(self._usage_index))
+            self._forget(zone, key)
+            try:
+                os.remove(self._cache_file(zone, key))
+            except OSError as e:
+                logger.debug('Evict cache file "{}.{}" failed with exception: {}'.format(zone, key, repr(e)))
+            self._stats["evictions"] += 1
+            logger.info('Evicted least recently used cached facts "{}.{}"'.format(zone, key))
 
-    def read(self, zone, key):
+    def stats(self):
+        """Get cache usage counters.
+
+        Returns:
+            dict: Number of hits, misses, reads of facts with outdated fingerprint, writes, writes skipped because the
+                content is unchanged and evictions.
+        """
+        return dict(self._stats)
+
+    def _validate(self, zone, key, facts, fingerprint):
+        """Unwrap cached facts and check that their fingerprint matches.
+        """
+        stamped = isinstance(facts, dict) and FINGERPRINT_KEY in facts
+        if stamped and callable(fingerprint):
+            try:
+                fingerprint = fingerprint()
+            except Exception as e:
+                # E.g. the host is unreachable, the cached facts are the best we have
+                logger.warning('Failed to get fingerprint of cached facts "{}.{}", use them anyway: {}'
+                               .format(zone, key, repr(e)))
+                fingerprint = None
+        if fingerprint is not None and (not stamped or facts[FINGERPRINT_KEY] != fingerprint):
+            logger.info('Cached facts "{}.{}" are outdated, fingerprint changed'.format(zone, key))
+            self._stats["stale"] += 1
+            return self.NOTEXIST
+
+        self._stats["hits"] += 1
+        self._touch(zone, key)
+        return facts["facts"] if stamped else facts
+
+    def read(self, zone, key, fingerprint=None):
         """Read cached facts.
 
         Args:
             zone (str): Cached facts are organized by zones. This argument is to specify the zone name.
                 The zone name could be hostname.
             key (str): Name of cached facts.
+            fingerprint (obj): Fingerprint of the state the facts depend on, e.g. image version and configuration of
+                the host. If specified, facts cached with a different fingerprint are considered not existing.
+                A function returning the fingerprint is called only when there are cached facts to check, and the
+                cached facts are used as they are when it fails.
 
         Returns:
             obj: Cached object, usually a dictionary.
@@ -80,20 +188,21 @@ class FactsCache(with_metaclass(Singleton, object)):
         # Lazy load
         if zone in self._cache and key in self._cache[zone]:
             logger.debug('Read cached facts "{}.{}"'.format(zone, key))
-            return self._cache[zone][key]
+            return self._validate(zone, key, self._cache[zone][key], fingerprint)
         else:
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+            facts_file = self._cache_file(zone, key)
             try:
                 with open(facts_file, 'rb') as f:
                     self._cache[zone][key] = pickle.load(f)
                     logger.debug('Loaded cached facts "{}.{}" from {}'.format(zone, key, facts_file))
-                    return self._cache[zone][key]
-            except (IOError, ValueError) as e:
+                    return self._validate(zone, key, self._cache[zone][key], fingerprint)
+            except (IOError, ValueError, EOFError, pickle.UnpicklingError) as e:
                 logger.info('Load cache file "{}" failed with exception: {}'
                             .format(os.path.abspath(facts_file), repr(e)))
+                self._stats["misses"] += 1
                 return self.NOTEXIST
 
-    def write(self, zone, key, value):
+    def write(self, zone, key, value, fingerprint=None):
         """Store facts to cache.
 
         Args:
@@ -101,25 +210,65 @@ class FactsCache(with_metaclass(Singleton, object)):
                 The zone name could be hostname.
             key (str): Name of cached facts.
             value (obj): Value of cached facts. Usually a dictionary.
+            fingerprint (obj): Fingerprint of the state the facts depend on, or a function returning it. Stored
+                together with the facts and compared by read.
 
         Returns:
             boolean: Caching facts is successful or not.
         """
+        if callable(fingerprint):
+            fingerprint = fingerprint()
+        if fingerprint is not None:
+            value = {FINGERPRINT_KEY: fingerprint, "facts": value}
+
         with self._write_lock:
-            self._check_usage()
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+            facts_file = self._cache_file(zone, key)
             try:
-                cache_subfolder = os.path.join(self._cache_location, zone)
-                if not os.path.exists(cache_subfolder):
-                    logger.info('Create cache dir {}'.format(cache_subfolder))
-                    os.makedirs(cache_subfolder)
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                digest = hashlib.sha1(data).hexdigest()
 
-                with open(facts_file, 'wb') as f:
-                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                if self._usage_index is None:
+                    self._load_usage_index()
+                indexed = self._usage_index.get((zone, key))
+                if indexed and indexed[1] == digest and os.path.exists(facts_file):
                     self._cache[zone][key] = value
-                    logger.info('Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
+                    self._touch(zone, key)
+                    logger.debug('Cached facts "{}.{}" are unchanged'.format(zone, key))
+                    self._stats["unchanged_writes"] += 1
                     return True
-            except (IOError, ValueError) as e:
+
+                # The file is going to be replaced, it must not be counted by the usage check
+                self._forget(zone, key)
+                self._check_usage(len(data))
+
+                cache_subfolder = os.path.join(self._cache_location, zone)
+                if not os.path.exists(cache_subfolder):
+                    logger.info('Create cache dir {}'.format(cache_subfolder))
+                    try:
+                        os.makedirs(cache_subfolder)
+                    except OSError:
+                        # Could be created by another process in the meantime
+                        if not os.path.isdir(cache_subfolder):
+                            raise
+
+                fd, tmp_file = tempfile.mkstemp(prefix='.{}.'.format(key), suffix='.tmp', dir=cache_subfolder)
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        os.fchmod(f.fileno(), self._file_mode)
+                        f.write(data)
+                    os.rename(tmp_file, facts_file)
+                except Exception:
+                    os.remove(tmp_file)
+                    raise
+
+                self._usage_index[(zone, key)] = (len(data), digest)
+                self._total_size += len(data)
+                self._cache[zone][key] = value
+                self._touch(zone, key)
+                self._stats["writes"] += 1
+                logger.info('Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
+                return True
+            except (IOError, OSError, ValueError, pickle.PicklingError) as e:
                 logger.error('Dump cache file "{}" failed with exception: {}'.format(facts_file, repr(e)))
                 return False
 
@@ -135,18 +284,23 @@ class FactsCache(with_metaclass(Singleton, object)):
         if zone:
             if key:
                 if zone in self._cache and key in self._cache[zone]:
-                    del self._cache[zone][key]
                     logger.debug('Removed "{}.{}" from cache.'.format(zone, key))
+                self._forget(zone, key)
                 try:
-                    cache_file = os.path.join(self._cache_location, zone, '{}.pickle'.format(key))
+                    cache_file = self._cache_file(zone, key)
                     os.remove(cache_file)
                     logger.debug('Removed cache file "{}.pickle"'.format(cache_file))
                 except OSError as e:
                     logger.error('Cleanup cache {}.{}.pickle failed with exception: {}'.format(zone, key, repr(e)))
             else:
                 if zone in self._cache:
-                    del self._cache[zone]
                     logger.debug('Removed zone "{}" from cache'.format(zone))
+                zone_keys = set(self._cache.get(zone, {}).keys())
+                if self._usage_index is not None:
+                    zone_keys.update(k for z, k in self._usage_index if z == zone)
+                for zone_key in zone_keys:
+                    self._forget(zone, zone_key)
+                self._cache.pop(zone, None)
                 try:
                     cache_subfolder = os.path.join(self._cache_location, zone)
                     shutil.rmtree(cache_subfolder)
@@ -155,6 +309,9 @@ class FactsCache(with_metaclass(Singleton, object)):
                     logger.error('Remove cache subfolder "{}" failed with exception: {}'.format(zone, repr(e)))
         else:
             self._cache = defaultdict(dict)
+            self._memory_lru = OrderedDict()
+            self._usage_index = None
+            self._total_size = 0
             try:
                 shutil.rmtree(self._cache_location)
                 logger.debug('Removed all cache files under "{}"'.format(self._cache_location))
@@ -192,7 +349,26 @@ def _get_default_zone(function, func_args, func_kargs):
     return zone
 
 
-def cached(name, zone_getter=None, after_read=None, before_write=None):
+def fingerprint_getter_factory(*components):
+    """Get fingerprint getter for methods of host classes implementing 'get_facts_fingerprint()', like SonicHost.
+
+    Args:
+        components (str): Names of fingerprint components the cached facts depend on. When not specified, the whole
+            fingerprint is used.
+
+    Returns:
+        function: Fingerprint getter for decorator cached.
+    """
+    def _fingerprint_getter(function, func_args, func_kargs):
+        fingerprint = func_args[0].get_facts_fingerprint()
+        if not components:
+            return fingerprint
+        return dict((component, fingerprint.get(component)) for component in components)
+
+    return _fingerprint_getter
+
+
+def cached(name, zone_getter=None, after_read=None, before_write=None, fingerprint_getter=None):
     """Decorator for enabling cache for facts.
 
     The cached facts are to be stored by <name>.pickle. Because the cached pickle files must be stored under subfolder
@@ -203,12 +379,16 @@ def cached(name, zone_getter=None, after_read=None, before_write=None):
     With default zone getter function, this decorator can try to find zone:
     if the function is a bound method of class AnsibleHostBase and its derivatives, it will try to use its
     attribute 'hostname' as zone, or raises an error if 'hostname' doesn't exists or is not a string.
+    When a fingerprint getter is passed, cached facts are stamped with the fingerprint and refetched when it changes.
+    The fingerprint is got only to check facts found in cache and to stamp gathered facts.
+    The fingerprint getter function has the same signature as the zone getter function.
 
     Args:
         name ([str]): Name of the cached facts.
         zone_getter ([function]): Function used to get hostname used as zone.
         after_read ([function]): Hook function used to process facts after read from cache.
         before_write ([function]): Hook function used to process facts before write into cache.
+        fingerprint_getter ([function]): Function used to get fingerprint of the state the facts depend on.
     Returns:
         [function]: Decorator function.
     """
@@ -218,8 +398,10 @@ def cached(name, zone_getter=None, after_read=None, before_write=None):
         def wrapper(*args, **kargs):
             _zone_getter = zone_getter or _get_default_zone
             zone = _zone_getter(target, args, kargs)
+            # Collected only when needed, cached facts of unreachable hosts can still be used
+            fingerprint = partial(fingerprint_getter, target, args, kargs) if fingerprint_getter else None
 
-            cached_facts = cache.read(zone, name)
+            cached_facts = cache.read(zone, name, fingerprint=fingerprint)
             if after_read:
                 cached_facts = after_read(cached_facts, target, args, kargs)
             if cached_facts is not FactsCache.NOTEXIST:
@@ -228,9 +410,9 @@ def cached(name, zone_getter=None, after_read=None, before_write=None):
                 facts = target(*args, **kargs)
                 if before_write:
                     _facts = before_write(facts, target, args, kargs)
-                    cache.write(zone, name, _facts)
+                    cache.write(zone, name, _facts, fingerprint=fingerprint)
                 else:
-                    cache.write(zone, name, facts)
+                    cache.write(zone, name, facts, fingerprint=fingerprint)
                 return facts
         return wrapper
     return decorator
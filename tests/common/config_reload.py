@@ -117,6 +117,9 @@ def config_reload(duthost, config_source='config_db', wait=120, start_bgp=True,
             cmd = 'config reload -y -f -l /etc/sonic/running_golden_config.json &>/dev/null'
         duthost.shell(cmd, executable="/bin/bash")
 
+    # Saved configuration could be changed, cached facts have to be revalidated
+    duthost.invalidate_facts_fingerprint()
+
     modular_chassis = duthost.get_facts().get("modular_chassis")
     wait = max(wait, 240) if modular_chassis else wait
 
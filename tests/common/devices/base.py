@@ -1,9 +1,11 @@
 import inspect
 import json
 import logging
+import time
 
 from multiprocessing.pool import ThreadPool
 
+from tests.common.devices.connection_pool import connection_pool
 from tests.common.errors import RunAnsibleModuleFail
 
 logger = logging.getLogger(__name__)
@@ -38,6 +40,7 @@ class AnsibleHostBase(object):
         else:
             self.host = ansible_adhoc(become=True, *args, **kwargs)[hostname]
             self.mgmt_ip = self.host.options["inventory_manager"].get_host(hostname).vars["ansible_host"]
+            connection_pool.register(self.host, hostname)
         self.hostname = hostname
 
     def __getattr__(self, module_name):
@@ -50,6 +53,20 @@ class AnsibleHostBase(object):
             "'%s' object has no attribute '%s'" % (self.__class__, module_name)
             )
 
+    def check_connection(self):
+        """
+        @summary: Health check of the pooled ssh connection to the host. Stale connections are cleaned up.
+        @return: True if there is a healthy connection to the host.
+        """
+        return connection_pool.check(self.hostname)
+
+    def reset_connection(self):
+        """
+        @summary: Close the pooled ssh connection to the host. Call it when the host is going to be rebooted, the
+            next module run will set up a new connection.
+        """
+        connection_pool.reset(self.hostname)
+
     def _run(self, *module_args, **complex_args):
 
         previous_frame = inspect.currentframe().f_back
@@ -75,7 +92,12 @@ class AnsibleHostBase(object):
             result = pool.apply_async(run_module, (module_args, complex_args))
             return pool, result
 
-        res = self.module(*module_args, **complex_args)[self.hostname]
+        connected = connection_pool.is_connected(self.hostname)
+        start = time.time()
+        try:
+            res = self.module(*module_args, **complex_args)[self.hostname]
+        finally:
+            connection_pool.record(self.hostname, time.time() - start, connected)
 
         if verbose:
             logging.debug("{}::{}#{}: [{}] AnsibleModule::{} Result => {}"
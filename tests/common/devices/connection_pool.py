@@ -0,0 +1,191 @@
+"""Pool of persistent SSH connections to the hosts of AnsibleHostBase objects.
+
+Every ansible module run by an AnsibleHostBase object is a new ansible adhoc run. Without a live SSH master
+connection, each run pays for TCP connection, key exchange and authentication. The pool makes all the ssh based
+connections of a host share one multiplexed SSH master connection (ControlMaster) for the whole test session:
+
+* ControlPersist is long enough to keep the master connection alive between tests and fixtures.
+* Keep-alive (ServerAliveInterval) detects dead masters, for example after the host is rebooted.
+* Control sockets are in a directory of the session, so processes forked by parallel_run share the connections.
+
+The pool also counts the modules run on each host, and the time spent on runs which had to set up a new connection.
+"""
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTROL_PERSIST = 1800      # Seconds
+KEEPALIVE_INTERVAL = 15             # Seconds
+KEEPALIVE_COUNT_MAX = 4
+SSH_CHECK_TIMEOUT = 10              # Seconds
+SSH_CONNECTIONS = ("ssh", "smart", "multi_passwd_ssh")
+
+
+class ConnectionPool(object):
+
+    def __init__(self, control_persist=DEFAULT_CONTROL_PERSIST):
+        """Initialize the connection pool.
+
+        Args:
+            control_persist: Seconds an idle master connection is kept alive. 0 disables the pool.
+        """
+        self.control_persist = control_persist
+        self._control_dir = None
+        self._owner_pid = os.getpid()
+        self._stats = {}
+
+    @property
+    def enabled(self):
+        return self.control_persist > 0
+
+    @property
+    def control_dir(self):
+        if self._control_dir is None:
+            # Keep the path short, length of unix socket path is limited to 108 characters
+            self._control_dir = tempfile.mkdtemp(prefix="ansible-cp-")
+        return self._control_dir
+
+    def _control_path_prefix(self, hostname):
+        return os.path.join(self.control_dir, hostname)
+
+    def ssh_args(self, hostname):
+        """Get the ssh arguments for sharing the master connection of a host.
+
+        The remote user and port are part of the control path, so connections using different credentials are not
+        mixed up.
+        """
+        return " ".join([
+            "-o ControlMaster=auto",
+            "-o ControlPersist={}s".format(self.control_persist),
+            "-o ControlPath={}-%r-%p".format(self._control_path_prefix(hostname)),
+            "-o ServerAliveInterval={}".format(KEEPALIVE_INTERVAL),
+            "-o ServerAliveCountMax={}".format(KEEPALIVE_COUNT_MAX),
+            "-o UserKnownHostsFile=/dev/null",
+            "-o StrictHostKeyChecking=no"
+        ])
+
+    def register(self, ansible_host, hostname):
+        """Make the ssh based ansible connections of a host use the pool.
+
+        Args:
+            ansible_host: The pytest-ansible host object filtered from the ansible_adhoc fixture.
+            hostname: Inventory hostname of the host.
+        """
+        if not self.enabled:
+            return
+        # Each call of ansible_adhoc creates its own variable manager, so the variable is always set.
+        variable_manager = ansible_host.options["variable_manager"]
+        inventory_host = ansible_host.options["inventory_manager"].get_host(hostname)
+        if inventory_host is None:
+            return
+        host_vars = variable_manager.get_vars(host=inventory_host)
+        if host_vars.get("ansible_connection", "smart") not in SSH_CONNECTIONS or "ansible_ssh_args" in host_vars:
+            return
+
+        variable_manager.set_host_variable(inventory_host, "ansible_ssh_args", self.ssh_args(hostname))
+        self._stats.setdefault(hostname, {
+            "commands": 0,
+            "command_time": 0.0,
+            "connects": 0,
+            "connect_time": 0.0,
+            "resets": 0
+        })
+
+    def is_registered(self, hostname):
+        return hostname in self._stats
+
+    def _sockets(self, hostname):
+        if self._control_dir is None:
+            return []
+        return glob.glob(self._control_path_prefix(hostname) + "-*")
+
+    def is_connected(self, hostname):
+        """Whether the host has a master connection, without checking whether the connection is healthy."""
+        return len(self._sockets(hostname)) > 0
+
+    def _control(self, command, control_path, hostname):
+        try:
+            return subprocess.call(["ssh", "-O", command, "-o", "ControlPath={}".format(control_path), hostname],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   timeout=SSH_CHECK_TIMEOUT) == 0
+        except Exception as e:
+            logger.warning("Failed to run 'ssh -O {}' for {}: {}".format(command, hostname, repr(e)))
+            return False
+
+    def check(self, hostname):
+        """Health check of the master connections of a host. Stale control sockets are removed.
+
+        Returns:
+            True if the host has a healthy master connection.
+        """
+        healthy = False
+        for control_path in self._sockets(hostname):
+            if self._control("check", control_path, hostname):
+                healthy = True
+            else:
+                logger.info("Removing stale ssh control socket {}".format(control_path))
+                try:
+                    os.remove(control_path)
+                except OSError:
+                    pass
+        return healthy
+
+    def reset(self, hostname):
+        """Close the master connections of a host, the next module run will set up a new connection.
+
+        Needs to be called when the host is rebooted, otherwise the next module run may use the broken master
+        connection until keep-alive finds it dead.
+        """
+        sockets = self._sockets(hostname)
+        for control_path in sockets:
+            self._control("exit", control_path, hostname)
+        if sockets and hostname in self._stats:
+            self._stats[hostname]["resets"] += 1
+        logger.debug("Reset {} ssh master connection(s) of {}".format(len(sockets), hostname))
+
+    def record(self, hostname, elapsed, connected):
+        """Record a module run on a host.
+
+        Args:
+            hostname: Inventory hostname of the host.
+            elapsed: Seconds spent on the module run.
+            connected: Whether the host had a master connection before the module run. If not, the module run
+                included connection setup.
+        """
+        stats = self._stats.get(hostname)
+        if stats is None:
+            return
+        stats["commands"] += 1
+        stats["command_time"] += elapsed
+        if not connected:
+            stats["connects"] += 1
+            stats["connect_time"] += elapsed
+
+    def stats(self):
+        """Get counters of the hosts in the pool.
+
+        Counters of modules run in processes forked by parallel_run are not included.
+
+        Returns:
+            Dictionary keyed by hostname. Values are dictionaries with the number of modules run ("commands"), the
+            time spent on them ("command_time"), the number of runs which had to set up a new connection
+            ("connects"), the time spent on these runs ("connect_time") and the number of resets ("resets").
+        """
+        return dict((hostname, dict(stats)) for hostname, stats in self._stats.items())
+
+    def close(self):
+        """Close all the master connections and remove the control directory."""
+        if self._control_dir is None or os.getpid() != self._owner_pid:
+            return
+        for hostname in list(self._stats):
+            self.reset(hostname)
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+        self._control_dir = None
+
+
+connection_pool = ConnectionPool()
@@ -16,14 +16,22 @@ from ansible.plugins.loader import connection_loader
 from tests.common.devices.base import AnsibleHostBase
 from tests.common.helpers.dut_utils import is_supervisor_node
 from tests.common.utilities import get_host_visible_vars
-from tests.common.cache import cached
+from tests.common.cache import cached, fingerprint_getter_factory
 from tests.common.helpers.constants import DEFAULT_ASIC_ID, DEFAULT_NAMESPACE
 from tests.common.helpers.platform_api.chassis import is_inband_port
+from tests.common.helpers.show_parser import parse_column_positions, parse_show
 from tests.common.errors import RunAnsibleModuleFail
 from tests.common import constants
 
 logger = logging.getLogger(__name__)
 
+# Seconds the facts fingerprint is trusted, changes not done through SonicHost are noticed after that
+FACTS_FINGERPRINT_TTL = 600
+
+# Module runs which may change the saved configuration or the image, the facts fingerprint is collected again after them
+FACTS_FINGERPRINT_CHANGES = re.compile(r"\bconfig\s+(save|reload|load|load_minigraph)\b|sonic[-_]installer|"
+                                       r"/etc/sonic/(config_db|minigraph)")
+
 
 class SonicHost(AnsibleHostBase):
     """
@@ -70,6 +78,8 @@ class SonicHost(AnsibleHostBase):
             }
             self.host.options['variable_manager'].extra_vars.update(evars)
 
+        self._facts_fingerprint = None
+        self._facts_fingerprint_time = 0
         self._facts = self._gather_facts()
         self._os_version = self._get_os_version()
         if 'router_type' in self.facts and self.facts['router_type'] == 'spinerouter':
@@ -172,7 +182,66 @@ class SonicHost(AnsibleHostBase):
 
         self.critical_services = service_list
 
-    @cached(name='basic_facts')
+    def get_facts_fingerprint(self):
+        """
+        Get fingerprint of the installed image and saved configuration of this SONiC device.
+
+        Cached facts are stamped with the fingerprint and gathered again when it changes. The fingerprint is collected
+        by a single command when cached facts are read or written. It is kept for FACTS_FINGERPRINT_TTL seconds, or
+        until invalidate_facts_fingerprint() is called, which is done after every module run that may change the
+        saved configuration or the image.
+
+        Returns:
+            dict: SONiC build version and md5 checksums of saved config_db and minigraph files. For example:
+            {
+                "build_version": "20220531.14",
+                "config_db": [["/etc/sonic/config_db.json", "3b4a2a5e3e1d3b2b1f0f0c9e1e6f3b1a"]],
+                "minigraph": "9e107d9d372bb6826bd81d3542a419d6"
+            }
+        """
+        if self._facts_fingerprint is None or time.time() - self._facts_fingerprint_time > FACTS_FINGERPRINT_TTL:
+            cmd = "grep '^build_version' /etc/sonic/sonic_version.yml; " \
+                  "md5sum /etc/sonic/config_db*.json /etc/sonic/minigraph.xml"
+            res = self.shell(cmd, module_ignore_errors=True)
+            if res.get("unreachable") or "stdout_lines" not in res:
+                raise RunAnsibleModuleFail("Failed to get facts fingerprint of {}".format(self.hostname), res)
+            output = res["stdout_lines"]
+            fingerprint = {"build_version": None, "config_db": [], "minigraph": None}
+            for line in output:
+                if line.startswith("build_version"):
+                    fingerprint["build_version"] = line.split(":", 1)[1].strip().strip("'\"")
+                    continue
+                fields = line.split()
+                if len(fields) != 2:
+                    continue
+                checksum, path = fields
+                if path.endswith("minigraph.xml"):
+                    fingerprint["minigraph"] = checksum
+                else:
+                    fingerprint["config_db"].append([path, checksum])
+            logging.debug("Facts fingerprint of {}: {}".format(self.hostname, fingerprint))
+            self._facts_fingerprint = fingerprint
+            self._facts_fingerprint_time = time.time()
+        return self._facts_fingerprint
+
+    def invalidate_facts_fingerprint(self):
+        """
+        Drop the collected facts fingerprint, e.g. after config reload or reboot. It is collected again when cached
+        facts are read next time, so that facts depending on changed image or configuration are gathered again.
+        """
+        self._facts_fingerprint = None
+
+    def _run(self, *module_args, **complex_args):
+        module_name = self.module_name
+        try:
+            return AnsibleHostBase._run(self, *module_args, **complex_args)
+        finally:
+            # E.g. 'config save', 'sonic-installer install' or a minigraph copied to /etc/sonic
+            if getattr(self, "_facts_fingerprint", None) is not None and \
+                    FACTS_FINGERPRINT_CHANGES.search("{} {} {}".format(module_name, module_args, complex_args)):
+                self.invalidate_facts_fingerprint()
+
+    @cached(name='basic_facts', fingerprint_getter=fingerprint_getter_factory("build_version", "config_db"))
     def _gather_facts(self):
         """
         Gather facts about the platform for this SONiC device.
@@ -479,28 +548,65 @@ class SonicHost(AnsibleHostBase):
 
         return monit_services_status
 
-    def get_critical_group_and_process_lists(self, container_name):
+    def shell_batch(self, cmds, continue_on_fail=True):
         """
-        @summary: Get critical group and process lists by parsing the
-                  critical_processes file in the specified container
-        @return: Two lists which include the critical groups and critical processes respectively
+        @summary: Run a batch of shell commands in one remote invocation of the 'shell_cmds' module.
+
+        Each command keeps its own output and return code, so the results can be parsed as if the
+        commands were run one by one, without paying the connection overhead for each of them.
+        If the 'shell_cmds' module itself fails, the commands are run one by one with 'shell'.
+
+        @param cmds: Commands to run, either a list of commands or a list of (key, command) tuples.
+        @param continue_on_fail: Whether to run the rest of the commands if a command failed.
+        @return: A dictionary of command results keyed by command (or by the given key), each result
+            has the "cmd", "rc", "stdout", "stdout_lines", "stderr" and "stderr_lines" fields. Commands
+            not run because of an earlier failure are missing from the dictionary.
+        """
+        keys = []
+        commands = []
+        for item in cmds:
+            if isinstance(item, tuple):
+                key, cmd = item
+            else:
+                key, cmd = item, item
+            keys.append(key)
+            commands.append(cmd)
+        if not commands:
+            return {}
+
+        res = self.shell_cmds(cmds=commands, continue_on_fail=continue_on_fail, module_ignore_errors=True)
+        results = res.get('results')
+        if results is None:
+            # The module itself failed, e.g. it is missing on the DUT, run the commands one by one instead
+            logging.warning("Running commands in batch failed on {}, run them one by one: {}".format(
+                self.hostname, res.get('msg')))
+            results = []
+            for cmd in commands:
+                result = self.shell(cmd, module_ignore_errors=True)
+                results.append(result)
+                if not continue_on_fail and result.get('rc') != 0:
+                    break
+        return dict(zip(keys, results))
+
+    @staticmethod
+    def _critical_processes_cmd(container_name):
+        return "docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ]" \
+               " && cat /etc/supervisor/critical_processes'".format(container_name)
+
+    def _parse_critical_processes(self, lines):
+        """
+        @summary: Parse the content of critical_processes file of a container.
+        @return: Critical group list, critical process list and whether the file content is valid.
         """
         critical_group_list = []
         critical_process_list = []
-        succeeded = True
-
-        file_content = self.shell("docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ] \
-                && cat /etc/supervisor/critical_processes'".format(container_name), module_ignore_errors=True)
-        for line in file_content["stdout_lines"]:
+        for line in lines:
             line_info = line.strip().split(':')
             if len(line_info) != 2:
                 if '201811' in self._os_version and len(line_info) == 1:
-                    identifier_value = line_info[0].strip()
-                    critical_process_list.append(identifier_value)
+                    critical_process_list.append(line_info[0].strip())
                     continue
-
-                succeeded = False
-                break
+                return critical_group_list, critical_process_list, False
 
             identifier_key = line_info[0].strip()
             identifier_value = line_info[1].strip()
@@ -509,75 +615,80 @@ class SonicHost(AnsibleHostBase):
             elif identifier_key == "program" and identifier_value:
                 critical_process_list.append(identifier_value)
             else:
-                succeeded = False
-                break
+                return critical_group_list, critical_process_list, False
 
-        # For PMon container, since different daemons are enabled in different platforms, we need find common processes
-        # which are not only in the critical_processes file and also are configured to run on that platform.
-        if succeeded and container_name == "pmon":
-            expected_critical_group_list = []
-            expected_critical_process_list = []
-            process_list = self.shell("docker exec {} supervisorctl status"
-                                      .format(container_name), module_ignore_errors=True)
-            for process_info in process_list["stdout_lines"]:
-                process_name = process_info.split()[0].strip()
-                process_status = process_info.split()[1].strip()
-                if ":" in process_name:
-                    group_name = process_name.split(":")[0]
-                    process_name = process_name.split(":")[1]
-                    if process_status == "RUNNING" and group_name in critical_group_list:
-                        expected_critical_group_list.append(process_name)
-                else:
-                    if process_status == "RUNNING" and process_name in critical_process_list:
-                        expected_critical_process_list.append(process_name)
+        return critical_group_list, critical_process_list, True
 
-            critical_group_list = expected_critical_group_list
-            critical_process_list = expected_critical_process_list
+    @staticmethod
+    def _filter_running_critical_processes(critical_group_list, critical_process_list, status_lines):
+        """
+        @summary: Only keep critical groups and processes which are running according to the output of
+                  "supervisorctl status". Used for PMon container, because different daemons are enabled
+                  on different platforms.
+        """
+        expected_critical_group_list = []
+        expected_critical_process_list = []
+        for process_info in status_lines:
+            fields = process_info.split()
+            if len(fields) < 2:
+                continue
+            process_name = fields[0].strip()
+            process_status = fields[1].strip()
+            if ":" in process_name:
+                group_name = process_name.split(":")[0]
+                process_name = process_name.split(":")[1]
+                if process_status == "RUNNING" and group_name in critical_group_list:
+                    expected_critical_group_list.append(process_name)
+            else:
+                if process_status == "RUNNING" and process_name in critical_process_list:
+                    expected_critical_process_list.append(process_name)
 
-        return critical_group_list, critical_process_list, succeeded
+        return expected_critical_group_list, expected_critical_process_list
 
-    def critical_group_process(self):
-        # Get critical group and process definitions by running cmds in batch to save overhead
-        cmds = []
-        for service in self.critical_services:
-            cmd = "docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ]" \
-                  " && cat /etc/supervisor/critical_processes'".format(service)
+    def get_critical_group_and_process_lists(self, container_name):
+        """
+        @summary: Get critical group and process lists by parsing the
+                  critical_processes file in the specified container
+        @return: Two lists which include the critical groups and critical processes respectively
+        """
+        cmds = [("critical_processes", self._critical_processes_cmd(container_name))]
+        if container_name == "pmon":
+            cmds.append(("status", "docker exec {} supervisorctl status".format(container_name)))
+        results = self.shell_batch(cmds)
+
+        file_content = results.get("critical_processes", {}).get("stdout_lines", [])
+        critical_group_list, critical_process_list, succeeded = self._parse_critical_processes(file_content)
 
-            cmds.append(cmd)
-        results = self.shell_cmds(cmds=cmds, continue_on_fail=True, module_ignore_errors=True)['results']
+        # For PMon container, since different daemons are enabled in different platforms, we need find common processes
+        # which are not only in the critical_processes file and also are configured to run on that platform.
+        if succeeded and container_name == "pmon":
+            critical_group_list, critical_process_list = self._filter_running_critical_processes(
+                critical_group_list, critical_process_list, results.get("status", {}).get("stdout_lines", []))
 
-        # Extract service name of each command result, transform results list to a dict keyed by service name
-        service_results = {}
-        for res in results:
-            service = res['cmd'].split()[2]
-            service_results[service] = res
+        return critical_group_list, critical_process_list, succeeded
 
-        # Parse critical group and service definition of all services
+    def _parse_critical_group_process(self, service_results):
+        """
+        @summary: Parse critical group and process definitions from the batched results of
+                  critical_processes file of all critical services.
+        """
         group_process_results = {}
         for service in self.critical_services:
-            if service not in service_results or service_results[service]['rc'] != 0:
+            res = service_results.get(service)
+            if res is None or res['rc'] != 0:
                 continue
 
-            service_group_process = {'groups': [], 'processes': []}
-
-            file_content = service_results[service]['stdout_lines']
-            for line in file_content:
-                line_info = line.strip().split(':')
-                if len(line_info) != 2:
-                    if '201811' in self._os_version and len(line_info) == 1:
-                        process_name = line_info[0].strip()
-                        service_group_process['processes'].append(process_name)
-                else:
-                    group_or_process = line_info[0].strip()
-                    group_process_name = line_info[1].strip()
-                    if group_or_process == 'group' and group_process_name:
-                        service_group_process['groups'].append(group_process_name)
-                    elif group_or_process == 'program' and group_process_name:
-                        service_group_process['processes'].append(group_process_name)
-            group_process_results[service] = service_group_process
+            critical_group_list, critical_process_list, _ = self._parse_critical_processes(res['stdout_lines'])
+            group_process_results[service] = {'groups': critical_group_list, 'processes': critical_process_list}
 
         return group_process_results
 
+    def critical_group_process(self):
+        # Get critical group and process definitions by running cmds in batch to save overhead
+        results = self.shell_batch([(service, self._critical_processes_cmd(service))
+                                    for service in self.critical_services])
+        return self._parse_critical_group_process(results)
+
     def critical_process_status(self, service):
         """
         @summary: Check whether critical process status of a service.
@@ -590,24 +701,34 @@ class SonicHost(AnsibleHostBase):
             'running_critical_process': []
         }
 
+        # Get container state, critical process definition and process status in one batch
+        results = self.shell_batch([
+            ("running", r"docker inspect -f \{\{.State.Running\}\} %s" % service),
+            ("critical_processes", self._critical_processes_cmd(service)),
+            ("status", "docker exec {} supervisorctl status".format(service))
+        ])
+
         # return false if the service is not started
-        service_status = self.is_service_fully_started(service)
-        if service_status is False:
+        if results.get("running", {}).get("stdout", "").strip() != "true":
             result['status'] = False
             return result
 
         # get critical group and process lists for the service
-        critical_group_list, critical_process_list, succeeded = self.get_critical_group_and_process_lists(service)
+        critical_group_list, critical_process_list, succeeded = self._parse_critical_processes(
+            results["critical_processes"]["stdout_lines"])
         if succeeded is False:
             result['status'] = False
             return result
 
-        # get process status for the service
-        output = self.command("docker exec {} supervisorctl status".format(service), module_ignore_errors=True)
+        status_lines = results["status"]["stdout_lines"]
+        if service == "pmon":
+            critical_group_list, critical_process_list = self._filter_running_critical_processes(
+                critical_group_list, critical_process_list, status_lines)
+
         logging.info("====== supervisor process status for service {} ======".format(service))
 
         return self.parse_service_status_and_critical_process(
-            service_result=output,
+            service_result=results["status"],
             critical_group_list=critical_group_list,
             critical_process_list=critical_process_list
         )
@@ -616,21 +737,16 @@ class SonicHost(AnsibleHostBase):
         """
         @summary: Check whether all critical processes status for all critical services
         """
-        # Get critical process definition of all services
-        group_process_results = self.critical_group_process()
-
-        # Get process status of all services. Run cmds in batch to save overhead
+        # Get critical process definition and process status of all services in a single batch
         cmds = []
         for service in self.critical_services:
-            cmd = 'docker exec {} supervisorctl status'.format(service)
-            cmds.append(cmd)
-        results = self.shell_cmds(cmds=cmds, continue_on_fail=True, module_ignore_errors=True)['results']
+            cmds.append((("critical_processes", service), self._critical_processes_cmd(service)))
+            cmds.append((("status", service), "docker exec {} supervisorctl status".format(service)))
+        results = self.shell_batch(cmds)
 
-        # Extract service name of each command result, transform results list to a dict keyed by service name
-        service_results = {}
-        for res in results:
-            service = res['cmd'].split()[2]
-            service_results[service] = res
+        group_process_results = self._parse_critical_group_process(
+            dict((key[1], res) for key, res in results.items() if key[0] == "critical_processes"))
+        service_results = dict((key[1], res) for key, res in results.items() if key[0] == "status")
 
         # Parse critical process status of all services
         all_critical_process = {}
@@ -1388,60 +1504,10 @@ Totals               6450                 6449
             Returns a list. Each item is a tuple with two elements. The first element is start position of a column. The
             second element is the end position of the column.
         """
-        prev = ' ',
-        positions = []
-        for pos, char in enumerate(sep_line + ' '):
-            if char == sep_char:
-                if char != prev:
-                    left = pos
-            else:
-                if char != prev:
-                    right = pos
-                    positions.append((left, right))
-            prev = char
-        return positions
-
-    def _parse_show(self, output_lines):
-
-        result = []
-
-        sep_line_pattern = re.compile(r"^( *-+ *)+$")
-        sep_line_found = False
-        for idx, line in enumerate(output_lines):
-            if sep_line_pattern.match(line):
-                sep_line_found = True
-                header_line = output_lines[idx-1]
-                sep_line = output_lines[idx]
-                content_lines = output_lines[idx+1:]
-                break
-
-        if not sep_line_found:
-            logging.error('Failed to find separation line in the show command output')
-            return result
-
-        try:
-            positions = self._parse_column_positions(sep_line)
-        except Exception as e:
-            logging.error('Possibly bad command output, exception: {}'.format(repr(e)))
-            return result
+        return parse_column_positions(sep_line, sep_char)
 
-        headers = []
-        for (left, right) in positions:
-            headers.append(header_line[left:right].strip().lower())
-
-        for content_line in content_lines:
-            # When an empty line is encountered while parsing the tabulate content, it is highly possible that the
-            # tabulate content has been drained. The empty line and rest of the lines should not be parsed.
-            if len(content_line) == 0:
-                break
-            item = {}
-            for idx, (left, right) in enumerate(positions):
-                k = headers[idx]
-                v = content_line[left:right].strip()
-                item[k] = v
-            result.append(item)
-
-        return result
+    def _parse_show(self, output_lines, columnar=False):
+        return parse_show(output_lines, columnar=columnar)
 
     def show_and_parse(self, show_cmd, **kwargs):
         """Run a show command and parse the output using a generic pattern.
@@ -1503,6 +1569,12 @@ Totals               6450                 6449
 
         Args:
             show_cmd: The show command that will be executed.
+            columnar: Return a ShowTable which stores the parsed output by column and only converts rows to
+                dictionaries when they are accessed. Much cheaper for tables with thousands of rows.
+            json_arg: Argument appended to the show command to request JSON output where the CLI supports it,
+                for example 'json' for 'show ip route' or '--json' for 'show interfaces counters'. The decoded JSON
+                is returned as is. If the output can't be decoded, the command is run again without the argument
+                and the tabulate output is parsed.
 
         Returns:
             Return the parsed output of the show command in a list of dictionary. Each list item is a dictionary,
@@ -1511,14 +1583,22 @@ Totals               6450                 6449
         """
         start_line_index = kwargs.pop("start_line_index", 0)
         end_line_index = kwargs.pop("end_line_index", None)
+        columnar = kwargs.pop("columnar", False)
+        json_arg = kwargs.pop("json_arg", None)
+        if json_arg:
+            output = self.shell("{} {}".format(show_cmd, json_arg), **kwargs)["stdout"]
+            try:
+                return json.loads(output)
+            except ValueError:
+                logging.warning("'{}' does not support JSON output, parsing tabulate output".format(show_cmd))
         output = self.shell(show_cmd, **kwargs)["stdout_lines"]
         if end_line_index is None:
             output = output[start_line_index:]
         else:
             output = output[start_line_index:end_line_index]
-        return self._parse_show(output)
+        return self._parse_show(output, columnar=columnar)
 
-    @cached(name='mg_facts')
+    @cached(name='mg_facts', fingerprint_getter=fingerprint_getter_factory("build_version", "minigraph"))
     def get_extended_minigraph_facts(self, tbinfo, namespace=DEFAULT_NAMESPACE):
         mg_facts = self.minigraph_facts(host=self.hostname, namespace=namespace)['ansible_facts']
         mg_facts['minigraph_ptf_indices'] = mg_facts['minigraph_port_indices'].copy()
@@ -15,6 +15,7 @@ from operator import itemgetter
 from itertools import groupby
 
 from tests.common.dualtor.dual_tor_common import CableType
+from tests.common.helpers.capture_analysis import PcapFile, iter_tcp_flow, find_sequence_gaps, mac_to_int
 from tests.common.utilities import wait_until
 from natsort import natsorted
 from collections import defaultdict
@@ -116,7 +117,7 @@ class DualTorIO:
         else:
             self.packets_per_server = self.packets_to_send // len(self.test_interfaces)
 
-        self.all_packets = []
+        self.server_to_records = {}
 
     def setup_ptf_sniffer(self):
         """Setup ptf sniffer supervisor config."""
@@ -493,11 +494,12 @@ class DualTorIO:
                     format(str(datetime.datetime.now() - self.sniffer_start)))
 
     def fetch_captured_packets(self):
-        """Fetch the captured packet file generated by the ptf sniffer."""
+        """Fetch the captured packet file generated by the ptf sniffer.
+
+        The capture is not loaded here, examine_flow() streams it from the file.
+        """
         logger.info('Fetching pcap file from ptf')
         self.ptfhost.fetch(src=self.capture_pcap, dest='/tmp/', flat=True, fail_on_missing=False)
-        self.all_packets = scapyall.rdpcap(self.capture_pcap)
-        logger.info("Number of all packets captured: {}".format(len(self.all_packets)))
 
     def send_packets(self):
         """Send packets generated."""
@@ -543,6 +545,16 @@ class DualTorIO:
             server_addr = packet[scapyall.IP].src
         return server_addr
 
+    def get_flow_server_address(self, packet):
+        """Same as get_server_address(), for a FlowPacket of the capture analysis."""
+        if self.traffic_direction in ("t1_to_server", "t1_to_soc"):
+            server_addr = packet.ip_dst
+        else:
+            server_addr = packet.ip_src
+        if packet.ip_version == 6:
+            return socket.inet_ntop(socket.AF_INET6, struct.pack("!QQ", server_addr >> 64, server_addr & (2**64 - 1)))
+        return socket.inet_ntoa(struct.pack("!I", server_addr))
+
     def get_test_results(self):
         return self.test_results
 
@@ -559,47 +571,43 @@ class DualTorIO:
         examine_start = datetime.datetime.now()
         logger.info("Packet flow examine started {}".format(str(examine_start)))
 
-        if not self.all_packets:
-            logger.error("self.all_packets not defined.")
+        if not os.path.exists(self.capture_pcap):
+            logger.error("Captured pcap file {} not found.".format(self.capture_pcap))
             return None
 
-        # Filter out packets:
-        filtered_packets = [pkt for pkt in self.all_packets if
-                            scapyall.TCP in pkt and
-                            scapyall.ICMP not in pkt and
-                            pkt[scapyall.TCP].sport == 1234 and
-                            pkt[scapyall.TCP].dport == TCP_DST_PORT and
-                            self.check_tcp_payload(pkt) and
-                            (
-                                pkt[scapyall.Ether].dst == self.sent_pkt_dst_mac or
-                                pkt[scapyall.Ether].src in self.received_pkt_src_mac
-                            )]
-        logger.info("Number of filtered packets captured: {}".format(len(filtered_packets)))
-        if not filtered_packets or len(filtered_packets) == 0:
-            logger.error("Sniffer failed to capture any traffic")
-            return
+        sent_pkt_dst_mac = mac_to_int(self.sent_pkt_dst_mac)
+        received_pkt_src_mac = set(mac_to_int(mac) for mac in self.received_pkt_src_mac)
 
+        # Read the capture once, only keep (payload_id, timestamp, is_sent, pcap record) of the packets
+        # of each server.
         server_to_packet_map = defaultdict(list)
-
-        # Split packets into separate lists based on server IP
-        for packet in filtered_packets:
-            server_addr = self.get_server_address(packet)
-            server_to_packet_map[server_addr].append(packet)
+        filtered_packets = 0
+        with PcapFile(self.capture_pcap) as pcap:
+            logger.info("Number of all packets captured: {}".format(len(pcap)))
+            for packet in iter_tcp_flow(pcap, sport=1234, dport=TCP_DST_PORT, payload_pad="X"):
+                if packet.eth_dst == sent_pkt_dst_mac:
+                    is_sent = True
+                elif packet.eth_src in received_pkt_src_mac:
+                    is_sent = False
+                else:
+                    continue
+                filtered_packets += 1
+                server_to_packet_map[self.get_flow_server_address(packet)].append(
+                    (packet.payload_id, packet.time, is_sent, packet.record))
+
+        logger.info("Number of filtered packets captured: {}".format(filtered_packets))
+        if filtered_packets == 0:
+            logger.error("Sniffer failed to capture any traffic")
+            return
 
         # For each server's packet list, sort by payload then timestamp
         # (in case of duplicates)
-        for server in server_to_packet_map.keys():
-            server_to_packet_map[server].sort(
-                key=lambda packet: (int(str(packet[scapyall.TCP].payload).replace('X', '')),
-                                    packet.time)
-            )
+        for packet_list in server_to_packet_map.values():
+            packet_list.sort(key=itemgetter(0, 1))
+        self.server_to_records = dict((server_ip, [packet[3] for packet in packet_list])
+                                      for server_ip, packet_list in server_to_packet_map.items())
 
         logger.info("Measuring traffic disruptions...")
-        for server_ip, packet_list in server_to_packet_map.items():
-            filename = '/tmp/capture_filtered_{}.pcap'.format(server_ip)
-            scapyall.wrpcap(filename, packet_list)
-            logger.info("Filtered pcap dumped to {}".format(filename))
-
         self.test_results = {}
 
         for server_ip in natsorted(server_to_packet_map.keys()):
@@ -607,49 +615,50 @@ class DualTorIO:
             logger.info("Server {} results:\n{}"
                         .format(server_ip, json.dumps(result, indent=4)))
             self.test_results[server_ip] = result
+            # Keep the filtered packets of the servers with problems for debugging
+            if result['disruptions'] or result['duplications'] or \
+                    result['disruption_before_traffic'] is not False or \
+                    result['disruption_after_traffic'] is not False or \
+                    result['sent_packets'] < self.packets_sent_per_server.get(server_ip, 0):
+                self.dump_filtered_pcap(server_ip)
+
+    def dump_filtered_pcap(self, server_ip):
+        """Dump the filtered packets of a server, sorted by payload, to a pcap file.
+
+        Returns:
+            Name of the pcap file.
+        """
+        filename = '/tmp/capture_filtered_{}.pcap'.format(server_ip)
+        with PcapFile(self.capture_pcap) as pcap:
+            pcap.write(filename, self.server_to_records.get(server_ip, []))
+        logger.info("Filtered pcap dumped to {}".format(filename))
+        return filename
 
     def examine_each_packet(self, server_ip, packets):
-        num_sent_packets = 0
-        received_packet_list = list()
-        duplicate_packet_list = list()
-        disruption_ranges = list()
+        """Examine the packets of a server.
+
+        Args:
+            server_ip: IP address of the server.
+            packets: List of (payload_id, timestamp, is_sent, pcap_record) of the packets of the server, sorted by
+                payload ID and timestamp.
+        """
+        received_packet_list = [(payload, timestamp) for payload, timestamp, is_sent, _ in packets if not is_sent]
+        num_sent_packets = len(packets) - len(received_packet_list)
         disruption_before_traffic = False
         disruption_after_traffic = False
         duplicate_ranges = []
 
-        for packet in packets:
-            if packet[scapyall.Ether].dst == self.sent_pkt_dst_mac:
-                # This is a sent packet
-                num_sent_packets += 1
-                continue
-            if packet[scapyall.Ether].src in self.received_pkt_src_mac:
-                # This is a received packet.
-                # scapy 2.4.5 will use Decimal to calulcate time, but json.dumps
-                # can't recognize Decimal, transform to float here
-                curr_time = float(packet.time)
-                curr_payload = int(str(packet[scapyall.TCP].payload).replace('X', ''))
-
-                # Look back at the previous received packet to check for gaps/duplicates
-                # Only if we've already received some packets
-                if len(received_packet_list) > 0:
-                    prev_payload, prev_time = received_packet_list[-1]
-
-                    if prev_payload == curr_payload:
-                        # Duplicate packet detected, increment the counter
-                        duplicate_packet_list.append((curr_payload, curr_time))
-                    if prev_payload + 1 < curr_payload:
-                        # Non-sequential packets indicate a disruption
-                        disruption_dict = {
-                            'start_time': prev_time,
-                            'end_time': curr_time,
-                            'start_id': prev_payload,
-                            'end_id': curr_payload
-                        }
-                        disruption_ranges.append(disruption_dict)
-
-                # Save packets as (payload_id, timestamp) tuples
-                # for easier timing calculations later
-                received_packet_list.append((curr_payload, curr_time))
+        # Non-sequential packets indicate a disruption
+        gaps, duplicate_packet_list = find_sequence_gaps(received_packet_list)
+        disruption_ranges = [
+            {
+                'start_time': prev_time,
+                'end_time': curr_time,
+                'start_id': prev_payload,
+                'end_id': curr_payload
+            }
+            for prev_payload, prev_time, curr_payload, curr_time in gaps
+        ]
 
         if len(received_packet_list) == 0:
             logger.error("Sniffer failed to filter any traffic from DUT")
@@ -658,7 +667,7 @@ class DualTorIO:
             # All packets within the same consecutive range will have the same
             # difference between the packet index and the sequence number
             for _, grouper in groupby(enumerate(duplicate_packet_list), lambda t: t[0] - t[1][0]):
-                group = map(itemgetter(1), grouper)
+                group = list(map(itemgetter(1), grouper))
                 duplicate_start, duplicate_end = group[0], group[-1]
                 duplicate_dict = {
                     'start_time': duplicate_start[1],
@@ -688,24 +697,9 @@ class DualTorIO:
         }
 
         if num_sent_packets < self.packets_sent_per_server.get(server_ip):
-            server_addr = self.get_server_address(packet)
             logger.error('Not all sent packets were captured. '
                          'Something went wrong!')
             logger.error('Dumping server {} results and continuing:\n{}'
-                         .format(server_addr, json.dumps(result, indent=4)))
+                         .format(server_ip, json.dumps(result, indent=4)))
 
         return result
-
-    def check_tcp_payload(self, packet):
-        """
-        @summary: Helper method
-
-        Returns: Bool: True if a packet is not corrupted and has a valid TCP
-            sequential TCP Payload
-        """
-        try:
-            int(str(packet[scapyall.TCP].payload).replace('X', '')) in range(
-                self.packets_to_send)
-            return True
-        except Exception:
-            return False
@@ -228,31 +228,49 @@ def set_output(url):
     return _set_output
 
 
+def _toggle_simulator_ports(url, duthost, tbinfo, interface_names, side):
+    """
+    Helper function to toggle y_cable simulator ports to the given side.
+
+    A single interface is toggled with the url of its port. A list of interfaces is toggled with one request to the
+    bulk toggle endpoint of the mux simulator, which changes the mux bridges concurrently.
+
+    Args:
+        interface_names: a str, the name of an interface, or a list of interface names
+        side: "upper_tor" or "lower_tor"
+    """
+    # Skip on non dualtor testbed
+    if 'dualtor' not in tbinfo['topo']['name']:
+        return
+    data = {"active_side": side}
+    if not isinstance(interface_names, (list, tuple)):
+        server_url = url(interface_names)
+    else:
+        mg_facts = duthost.get_extended_minigraph_facts(tbinfo)
+        data["port_indices"] = [mg_facts['minigraph_ptf_indices'][name] for name in interface_names]
+        server_url = url(action=TOGGLE)
+    pytest_assert(_post(server_url, data), "Failed to toggle to {} on interface {}".format(side, interface_names))
+
+
 @pytest.fixture(scope='module')
-def toggle_simulator_port_to_upper_tor(url, tbinfo):
+def toggle_simulator_port_to_upper_tor(url, duthost, tbinfo):
     """
     Returns _toggle_simulator_port_to_upper_tor to make fixture accept arguments
     """
 
     def _toggle_simulator_port_to_upper_tor(interface_name):
         """
-        A helper function to toggle y_cable simulator ports
+        A helper function to toggle y_cable simulator ports to upper_tor
         Args:
-            interface_name: a str, the name of interface
-            target: "upper_tor" or "lower_tor"
+            interface_name: a str, the name of interface, or a list of interface names toggled in one request
         """
-        # Skip on non dualtor testbed
-        if 'dualtor' not in tbinfo['topo']['name']:
-            return
-        server_url = url(interface_name)
-        data = {"active_side": UPPER_TOR}
-        pytest_assert(_post(server_url, data), "Failed to toggle to upper_tor on interface {}".format(interface_name))
+        _toggle_simulator_ports(url, duthost, tbinfo, interface_name, UPPER_TOR)
 
     return _toggle_simulator_port_to_upper_tor
 
 
 @pytest.fixture(scope='module')
-def toggle_simulator_port_to_lower_tor(url, tbinfo):
+def toggle_simulator_port_to_lower_tor(url, duthost, tbinfo):
     """
     Returns _toggle_simulator_port_to_lower_tor to make fixture accept arguments
     """
@@ -261,14 +279,10 @@ def toggle_simulator_port_to_lower_tor(url, tbinfo):
         """
         Function to toggle a given y_cable ports to lower_tor
         Args:
-            interface_name: a str, the name of interface to control
+            interface_name: a str, the name of interface to control, or a list of interface names toggled in one
+                request
         """
-        # Skip on non dualtor testbed
-        if 'dualtor' not in tbinfo['topo']['name']:
-            return
-        server_url = url(interface_name)
-        data = {"active_side": LOWER_TOR}
-        pytest_assert(_post(server_url, data), "Failed to toggle to lower_tor on interface {}".format(interface_name))
+        _toggle_simulator_ports(url, duthost, tbinfo, interface_name, LOWER_TOR)
 
     return _toggle_simulator_port_to_lower_tor
 
@@ -0,0 +1 @@
+../../../ansible/roles/test/files/ptftests/capture_analysis.py
\ No newline at end of file
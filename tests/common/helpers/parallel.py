@@ -1,55 +1,98 @@
-import datetime
 import logging
-import math
 import os
+import pickle
 import shutil
 import tempfile
 import signal
+import time
 import traceback
 
-from multiprocessing import Process, Manager, Pipe
-from psutil import wait_procs
+from collections import deque
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
 
 from tests.common.helpers.assertions import pytest_assert as pt_assert
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for a worker to exit after SIGTERM before killing it
+TERMINATE_TIMEOUT = 5
+
 
 class SonicProcess(Process):
     """
-    Wrapper class around multiprocessing.Process that would capture the exception thrown if the Process throws
-    an exception when run.
-
-    This exception (including backtrace) can be logged in test log
-    to provide better info of why a particular Process failed.
+    Persistent worker process of parallel_run.
+
+    The worker is forked once and runs tasks until it is told to stop, so the target function, its arguments and the
+    nodes are inherited from the parent and never pickled. Each task is the index of a node received over a pipe. The
+    worker calls the target function with a private results dict and sends back the results together with the
+    exception (including backtrace) if the target function throws one, so that it can be logged in test log to provide
+    better info of why a particular task failed. The state left in the worker by the task of a node is kept for the
+    next tasks.
     """
-    def __init__(self, *args, **kwargs):
-        Process.__init__(self, *args, **kwargs)
+    def __init__(self, target, args, kwargs, nodes, name=None):
+        Process.__init__(self, name=name)
         self._pconn, self._cconn = Pipe()
-        self._exception = None
+        self._task_target = target
+        self._task_args = args
+        self._task_kwargs = kwargs
+        self._nodes = nodes
+
+    def start(self):
+        Process.start(self)
+        # Only the worker keeps its end of the pipe open, so the parent gets EOF if the worker exits
+        self._cconn.close()
 
     def run(self):
+        self._pconn.close()
+        worker_name = self.name
+        while True:
+            try:
+                index = self._cconn.recv()
+            except EOFError:
+                break
+            if index is None:
+                break
+            node = self._nodes[index]
+            self.name = "{}--{}".format(self._task_target.__name__, node)
+            results = {}
+            kwargs = dict(self._task_kwargs)
+            kwargs['node'] = node
+            kwargs['results'] = results
+            exception = None
+            try:
+                self._task_target(*self._task_args, **kwargs)
+            except BaseException as e:
+                exception = (e, traceback.format_exc())
+            self.name = worker_name
+            self._send_result(index, results, exception)
+
+    def _send_result(self, index, results, exception):
         try:
-            Process.run(self)
-            self._cconn.send(None)
-        except Exception as e:
-            tb = traceback.format_exc()
-            self._cconn.send((e, tb))
-            raise e
-
-    # for wait_procs
-    def wait(self, timeout):
-        return self.join(timeout=timeout)
+            self._cconn.send((index, results, exception))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # The exception or the results of the target function cannot be pickled, send their string instead
+            if exception is not None:
+                exception = (repr(exception[0]), exception[1])
+                try:
+                    self._cconn.send((index, results, exception))
+                    return
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    pass
+            self._cconn.send((index, {}, (repr(e), "Results of the task cannot be returned: {}".format(results))))
 
-    # for wait_procs
-    def is_running(self):
-        return self.is_alive()
+    def submit(self, index):
+        self._pconn.send(index)
 
     @property
-    def exception(self):
-        if self._pconn.poll():
-            self._exception = self._pconn.recv()
-        return self._exception
+    def conn(self):
+        return self._pconn
+
+    def stop(self):
+        try:
+            self._pconn.send(None)
+        except (OSError, IOError, ValueError):
+            pass
 
 
 def parallel_run(
@@ -57,172 +100,183 @@ def parallel_run(
 ):
     """Run target function on nodes in parallel
 
+    A pool of up to 'concurrent_tasks' worker processes is forked and each worker runs the target function for one node
+    after another. A worker takes the next node as soon as it is done with the previous one, so the total time is
+    bounded by the slowest nodes instead of the slowest node of each batch of nodes.
+
+    Unlike a process forked for each node, a worker is reused for the next nodes. Any state the target function leaves
+    in the worker, e.g. module globals, caches or environment variables, is seen by the target function running for
+    the next node on the same worker. The target function must not depend on a fresh process for each node.
+
     Args:
         target (function): The target function to be executed in parallel.
         args (list of tuple): List of arguments for the target function.
         kwargs (dict): Keyword arguments for the target function. It will be extended with two keys: 'node' and
-            'results'. The 'node' key will hold an item of the nodes list. The 'result' key will hold an instance of
-            multiprocessing.Manager().dict(). It is a proxy of the shared dict that will be used by each process for
-            returning execution results.
+            'results'. The 'node' key will hold an item of the nodes list. The 'result' key will hold a dict for
+            returning execution results. The items set in it by the target function are sent back to the parent
+            process when the target function returns or throws.
         nodes (list of nodes): List of nodes to be used by the target function
-        timeout (int or float, optional): Total time allowed for the spawned multiple processes to run. Defaults to
-            None. When timeout is specified, this function will wait at most 'timeout' seconds for the processes to
-            run. When time is up, this function will try to terminate or even kill all the processes.
+        timeout (int or float, optional): Time allowed for the target function to run on each node. Defaults to None.
+            When timeout is specified, the worker running the target function for a node for more than 'timeout'
+            seconds is terminated or even killed, and a new worker is forked for the remaining nodes.
+        concurrent_tasks (int, optional): Max number of worker processes. Defaults to 24.
+        init_result (dict, optional): Initial result of each node, set to results[node.hostname] before the target
+            function runs. If the worker running the target function for a node is terminated, 'failed' of the
+            initial result of the node is set to True.
 
     Raises:
-        flag.: In case any of the spawned process cannot be terminated, fail the test.
+        flag.: In case any of the target functions throws or any of the worker processes cannot be terminated, fail
+            the test.
 
     Returns:
-        dict: An instance of multiprocessing.Manager().dict(). It is a proxy to the shared dict that is used by all the
-            spawned processes.
+        dict: Merged results set by the target function for all the nodes.
     """
     nodes = [node for node in nodes_list]
+    task_names = ["{}--{}".format(target.__name__, node) for node in nodes]
 
-    # Callback API for wait_procs
-    def on_terminate(worker):
-        logger.info("process {} terminated with exit code {}".format(
-            worker.name, worker.returncode)
-        )
+    results = {}
+    timing = {}
+    failed_processes = {}
+    pending = deque(range(len(nodes)))
+    idle = []
+    busy = {}  # worker -> (node index, start time)
+    worker_count = 0
+    pool_size = max(1, min(concurrent_tasks, len(nodes)))
+    start_time = time.time()
+
+    def set_failed(index):
+        # If sanity check process is killed, it still has init results.
+        # set its failed to True.
+        if init_result:
+            results[nodes[index].hostname]['failed'] = True
+        else:
+            results[task_names[index]] = {'failed': True}
 
-    def force_terminate(workers, init_result):
+    def finish_task(worker, status):
+        index, task_start = busy.pop(worker)
+        timing[task_names[index]] = (time.time() - task_start, status)
+        logger.debug('Task "{}" {} in {:.1f} seconds on worker {}'.format(
+            task_names[index], status, timing[task_names[index]][0], worker.name
+        ))
+        return index
+
+    def force_terminate(worker):
+        if not worker.is_alive():
+            worker.join()
+            return
+        worker.terminate()
+        worker.join(TERMINATE_TIMEOUT)
+        if not worker.is_alive():
+            return
         # Some processes cannot be terminated. Try to kill them and raise flag.
-        running_processes = [worker for worker in workers if worker.is_alive()]
-        if len(running_processes) > 0:
-            logger.info(
-                'Found processes still running: {}. Try to kill them.'.format(str(running_processes))
-            )
-            for p in running_processes:
-                # If sanity check process is killed, it still has init results.
-                # set its failed to True.
-                if init_result:
-                    init_result['failed'] = True
-                    results[results.keys()[0]] = init_result
-                else:
-                    results[p.name] = {'failed': True}
-                try:
-                    os.kill(p.pid, signal.SIGKILL)
-                except OSError as err:
-                    logger.error("Unable to kill {}:{}, error:{}".format(
-                        p.pid, p.name, err
-                    ))
-
-                    pt_assert(
-                        False,
-                        """Processes running target "{}" could not be terminated.
-                        Unable to kill {}:{}, error:{}""".format(target.__name__, p.pid, p.name, err)
-                    )
+        logger.info('Found process still running: {}. Try to kill it.'.format(worker.name))
+        try:
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.join(TERMINATE_TIMEOUT)
+        except OSError as err:
+            logger.error("Unable to kill {}:{}, error:{}".format(
+                worker.pid, worker.name, err
+            ))
 
-    workers = []
-    results = Manager().dict()
-    start_time = datetime.datetime.now()
-    tasks_done = 0
-    total_tasks = len(nodes)
-    tasks_running = 0
-    total_timeout = timeout * math.ceil(
-        len(nodes)/float(concurrent_tasks)
-    ) if timeout else None
-    failed_processes = {}
+            pt_assert(
+                False,
+                """Processes running target "{}" could not be terminated.
+                Unable to kill {}:{}, error:{}""".format(target.__name__, worker.pid, worker.name, err)
+            )
 
-    while tasks_done < total_tasks:
-        # If execution time of processes exceeds timeout, need to force
-        # terminate them all.
-        if total_timeout is not None:
-            if (datetime.datetime.now() - start_time).seconds > total_timeout:
-                logger.error('Process execution time exceeds {} seconds.'.format(
-                    str(total_timeout)
-                ))
-                break
+    if init_result:
+        for node in nodes:
+            results[node.hostname] = dict(init_result, host=node.hostname)
 
-        while len(nodes) and tasks_running < concurrent_tasks:
-            node = nodes.pop(0)
-            # For sanity check process, initial results in case of timeout.
-            if init_result:
-                init_result["host"] = node.hostname
-                results[node.hostname] = init_result
-            kwargs['node'] = node
-            kwargs['results'] = results
-            process_name = "{}--{}".format(target.__name__, node)
-            worker = SonicProcess(
-                        name=process_name, target=target, args=args,
-                        kwargs=kwargs
+    try:
+        while pending or busy:
+            while pending and (idle or len(busy) < pool_size):
+                if idle:
+                    worker = idle.pop()
+                else:
+                    worker = SonicProcess(
+                        target, args, kwargs, nodes, name="{}-worker-{}".format(target.__name__, worker_count)
                     )
-            worker.start()
-            tasks_running += 1
-            logger.debug('Started process {} running target "{}"'.format(
-                worker.pid, process_name
-            ))
-            workers.append(worker)
-
-        gone, alive = wait_procs(workers, timeout=timeout, callback=on_terminate)
-        workers = alive
-
-        logger.debug("task completed {}, running {}".format(
-            len(gone), len(alive)
+                    worker.start()
+                    worker_count += 1
+                    logger.debug('Started process {} running target "{}"'.format(worker.pid, worker.name))
+                index = pending.popleft()
+                worker.submit(index)
+                busy[worker] = (index, time.time())
+
+            wait_timeout = None
+            if timeout is not None:
+                wait_timeout = max(0, min(task_start for _, task_start in busy.values()) + timeout - time.time())
+            ready = set(wait([worker.conn for worker in busy] + [worker.sentinel for worker in busy], wait_timeout))
+
+            for worker in list(busy):
+                if worker.conn in ready or worker.sentinel in ready:
+                    try:
+                        index, task_results, exception = worker.conn.recv()
+                    except (EOFError, OSError, IOError):
+                        # The worker exited without results, e.g. the target function called os._exit()
+                        worker.join()
+                        index = finish_task(worker, 'exited')
+                        set_failed(index)
+                        failed_processes[task_names[index]] = {'exit_code': worker.exitcode, 'exception': None}
+                        continue
+                    results.update(task_results)
+                    if exception is not None:
+                        finish_task(worker, 'failed')
+                        failed_processes[task_names[index]] = {'exit_code': None, 'exception': exception}
+                    else:
+                        finish_task(worker, 'done')
+                    idle.append(worker)
+                elif timeout is not None and time.time() - busy[worker][1] >= timeout:
+                    logger.error('Process {} exceeds {} seconds, force terminate it.'.format(
+                        task_names[busy[worker][0]], timeout
+                    ))
+                    index = finish_task(worker, 'timed out')
+                    force_terminate(worker)
+                    set_failed(index)
+    finally:
+        for worker in idle:
+            worker.stop()
+        for worker in idle:
+            worker.join(TERMINATE_TIMEOUT)
+        for worker in list(busy) + idle:
+            force_terminate(worker)
+
+    delta_time = time.time() - start_time
+    if timing:
+        logger.info('Time of target "{}" on each node:\n{}'.format(
+            target.__name__,
+            "\n".join(
+                "    {}: {:.1f} seconds, {}".format(name, duration, status)
+                for name, (duration, status) in sorted(timing.items(), key=lambda item: -item[1][0])
+            )
         ))
 
-        if len(gone) == 0:
-            logger.debug("all processes have timedout")
-            tasks_running -= len(workers)
-            tasks_done += len(workers)
-            force_terminate(workers, init_result)
-            del workers[:]
-        else:
-            tasks_running -= len(gone)
-            tasks_done += len(gone)
-
-        # check if we have any processes that failed - have exitcode non-zero
-        for worker in gone:
-            if worker.exitcode != 0:
-                failed_processes[worker.name] = {}
-                failed_processes[worker.name]['exit_code'] = worker.exitcode
-                failed_processes[worker.name]['exception'] = worker.exception
-
-    # In case of timeout force terminate spawned processes
-    for worker in workers:
-        if worker.is_alive():
-            logger.error('Process {} is alive, force terminate it.'.format(
-                worker.name
-            ))
-            worker.terminate()
-            # If sanity check process is killed, it still has init results.
-            # set its failed to True.
-            if init_result:
-                init_result['failed'] = True
-                results[results.keys()[0]] = init_result
-            else:
-                results[worker.name] = {'failed': True}
-
-    end_time = datetime.datetime.now()
-    delta_time = end_time - start_time
-
-    # force terminate any workers still running
-    force_terminate(workers, init_result)
-
     # if we have failed processes, we should log the exception and exit code
     # of each Process and fail
     if len(failed_processes.keys()):
+        messages = []
         for process_name, process in failed_processes.items():
-            p_exitcode = ""
             p_exception = ""
             p_traceback = ""
-            if 'exception' in process and process['exception']:
+            if process['exception']:
                 p_exception = process['exception'][0]
                 p_traceback = process['exception'][1]
-                p_exitcode = process['exit_code']
-            pt_assert(
-                False,
-                'Processes "{}" failed with exit code "{}"\nException:\n{}\nTraceback:\n{}'.format(
-                    list(failed_processes.keys()), p_exitcode, p_exception, p_traceback
-                )
-            )
+            messages.append('Process "{}" failed with exit code "{}"\nException:\n{}\nTraceback:\n{}'.format(
+                process_name, process['exit_code'], p_exception, p_traceback
+            ))
+        pt_assert(
+            False,
+            'Processes "{}" failed\n{}'.format(list(failed_processes.keys()), "\n".join(messages))
+        )
 
     logger.info(
-        'Completed running processes for target "{}" in {} seconds'.format(
-            target.__name__, str(delta_time)
+        'Completed running processes for target "{}" in {:.1f} seconds with {} workers'.format(
+            target.__name__, delta_time, worker_count
         )
     )
 
-    return dict(results)
+    return results
 
 
 def reset_ansible_local_tmp(target):
@@ -0,0 +1,134 @@
+"""Parser of the tabulate output of SONiC 'show' commands.
+
+The output is expected to have a line of headers, followed by a separation line with '-' under each column header.
+Column slices are computed once from the separation line and applied to all content lines.
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+SEP_LINE_PATTERN = re.compile(r"^( *-+ *)+$")
+
+
+class ShowTable(object):
+    """Parsed output of a show command, stored by column.
+
+    Rows are only converted to dictionaries when they are accessed, which keeps parsing of tables with thousands of
+    rows cheap when the caller only needs a few columns, for example:
+
+        table = duthost.show_and_parse("show arp", columnar=True)
+        macs = table.column("macaddress")
+
+    Iterating the table or indexing it by integer yields rows as dictionaries keyed by the lowercase headers, the same
+    as the items returned by the non-columnar parser.
+    """
+    __slots__ = ("headers", "columns", "_index")
+
+    def __init__(self, headers, columns):
+        self.headers = headers
+        self.columns = columns
+        # When headers are duplicated, the last column wins, as in the row dictionaries.
+        self._index = dict((header, idx) for idx, header in enumerate(headers))
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        headers = self.headers
+        for values in zip(*self.columns):
+            yield dict(zip(headers, values))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [dict(zip(self.headers, values)) for values in zip(*[col[index] for col in self.columns])]
+        return dict(zip(self.headers, [col[index] for col in self.columns]))
+
+    def __repr__(self):
+        return "ShowTable(headers={}, rows={})".format(self.headers, len(self))
+
+    def column(self, header):
+        """Get values of a column.
+
+        Args:
+            header: Column header in lowercase.
+
+        Returns:
+            List of the column values, one item per row.
+        """
+        return self.columns[self._index[header]]
+
+    def to_list(self):
+        """Convert the table to a list of dictionaries, same as the result of the non-columnar parser."""
+        return list(self)
+
+
+def parse_column_positions(sep_line, sep_char='-'):
+    """Parse the position of each columns in the command output
+
+    Args:
+        sep_line: The output line separating actual data and column headers
+        sep_char: The character used in separation line. Defaults to '-'.
+
+    Returns:
+        Returns a list. Each item is a tuple with two elements. The first element is start position of a column. The
+        second element is the end position of the column.
+    """
+    return [m.span() for m in re.finditer(re.escape(sep_char) + "+", sep_line)]
+
+
+def _split_table(output_lines):
+    """Locate the headers, column positions and content lines of a tabulate output.
+
+    Returns:
+        Tuple of (headers, positions, content_lines), or None if the output is not a table.
+    """
+    for idx, line in enumerate(output_lines):
+        if SEP_LINE_PATTERN.match(line):
+            header_line = output_lines[idx - 1] if idx > 0 else ""
+            sep_line = line
+            content_start = idx + 1
+            break
+    else:
+        logger.error('Failed to find separation line in the show command output')
+        return None
+
+    try:
+        positions = parse_column_positions(sep_line)
+    except Exception as e:
+        logger.error('Possibly bad command output, exception: {}'.format(repr(e)))
+        return None
+
+    headers = [header_line[left:right].strip().lower() for left, right in positions]
+
+    # When an empty line is encountered while parsing the tabulate content, it is highly possible that the
+    # tabulate content has been drained. The empty line and rest of the lines should not be parsed.
+    content_lines = []
+    for content_line in output_lines[content_start:]:
+        if len(content_line) == 0:
+            break
+        content_lines.append(content_line)
+
+    return headers, positions, content_lines
+
+
+def parse_show(output_lines, columnar=False):
+    """Parse the tabulate output of a show command.
+
+    Args:
+        output_lines: List of output lines.
+        columnar: Return a ShowTable instead of a list of dictionaries.
+
+    Returns:
+        List of dictionaries keyed by the lowercase column headers, one per content line. Or a ShowTable if columnar is
+        True. Empty result if the output does not contain a table.
+    """
+    table = _split_table(output_lines)
+    if table is None:
+        return ShowTable([], []) if columnar else []
+    headers, positions, content_lines = table
+
+    columns = [[line[left:right].strip() for line in content_lines] for left, right in positions]
+    if columnar:
+        return ShowTable(headers, columns)
+    return [dict(zip(headers, values)) for values in zip(*columns)]
@@ -0,0 +1,138 @@
+"""Micro-benchmark of the show command output parser.
+
+Parses synthetic 'show arp' and 'show interfaces status' outputs (or captured outputs given by --file) with the
+previous per-line parser of SonicHost and with show_parser, verifies the results are the same and reports rows/sec.
+
+Usage:
+    python show_parser_benchmark.py --rows 20000
+    python show_parser_benchmark.py --file show_ip_route.txt --file show_arp.txt
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import show_parser  # noqa: E402
+
+
+def generate_show_arp(rows):
+    lines = [
+        "Address        MacAddress         Iface            Vlan",
+        "-------------  -----------------  ---------------  ------",
+    ]
+    for n in range(rows):
+        lines.append("{:<13}  {:<17}  {:<15}  {:<6}".format(
+            "10.{}.{}.{}".format(n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff),
+            "00:11:22:{:02x}:{:02x}:{:02x}".format(n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff),
+            "Ethernet{}".format(n % 64 * 4), "1000" if n % 2 else "-"))
+    lines.append("Total number of entries {}".format(rows))
+    return lines
+
+
+def generate_show_interfaces_status(rows):
+    lines = [
+        "      Interface            Lanes    Speed    MTU    FEC    Alias             Vlan    Oper    Admin"
+        "             Type    Asym PFC",
+        "---------------  ---------------  -------  -----  -----  -------  ---------------  ------  -------"
+        "  ---------------  ----------",
+    ]
+    for n in range(rows):
+        lines.append("{:>15}  {:>15}  {:>7}  {:>5}  {:>5}  {:>7}  {:>15}  {:>6}  {:>7}  {:>15}  {:>10}".format(
+            "Ethernet{}".format(n * 4), ",".join(str(n * 4 + i) for i in range(4)), "100G", "9100", "rs",
+            "etp{}".format(n + 1), "PortChannel{:04d}".format(n % 16), "up" if n % 3 else "down", "up",
+            "QSFP28 or later", "off"))
+    return lines
+
+
+def legacy_parse_show(output_lines):
+    """The line by line parser used by SonicHost before show_parser."""
+    result = []
+    sep_line_pattern = re.compile(r"^( *-+ *)+$")
+    for idx, line in enumerate(output_lines):
+        if sep_line_pattern.match(line):
+            header_line = output_lines[idx-1]
+            sep_line = output_lines[idx]
+            content_lines = output_lines[idx+1:]
+            break
+    else:
+        return result
+
+    prev = ' ',
+    positions = []
+    for pos, char in enumerate(sep_line + ' '):
+        if char == '-':
+            if char != prev:
+                left = pos
+        else:
+            if char != prev:
+                right = pos
+                positions.append((left, right))
+        prev = char
+
+    headers = []
+    for (left, right) in positions:
+        headers.append(header_line[left:right].strip().lower())
+
+    for content_line in content_lines:
+        if len(content_line) == 0:
+            break
+        item = {}
+        for idx, (left, right) in enumerate(positions):
+            item[headers[idx]] = content_line[left:right].strip()
+        result.append(item)
+    return result
+
+
+def measure(name, rows, repeat, func):
+    start = time.time()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.time() - start) / repeat
+    print("  {:<16} {:>10.4f} s {:>14,.0f} rows/sec".format(name, elapsed, rows / elapsed if elapsed else 0))
+    return result
+
+
+def benchmark(name, lines, repeat):
+    rows = len(legacy_parse_show(lines))
+    print("{} ({:,} rows)".format(name, rows))
+    reference = measure("legacy", rows, repeat, lambda: legacy_parse_show(lines))
+    rows_result = measure("rows", rows, repeat, lambda: show_parser.parse_show(lines))
+    table = measure("columnar", rows, repeat, lambda: show_parser.parse_show(lines, columnar=True))
+    if table.headers:
+        measure("columnar+column", rows, repeat,
+                lambda: show_parser.parse_show(lines, columnar=True).column(table.headers[0]))
+    if rows_result != reference or table.to_list() != reference:
+        print("ERROR: results of {} differ from the legacy parser".format(name))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="show command output parser benchmark")
+    parser.add_argument("--rows", type=int, default=20000, help="number of rows of the synthetic outputs")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times each output is parsed")
+    parser.add_argument("--file", action="append", default=[], help="captured show command output to parse")
+    args = parser.parse_args()
+
+    if args.file:
+        outputs = []
+        for path in args.file:
+            with open(path) as f:
+                outputs.append((os.path.basename(path), f.read().splitlines()))
+    else:
+        outputs = [("show arp", generate_show_arp(args.rows)),
+                   ("show interfaces status", generate_show_interfaces_status(args.rows))]
+
+    ok = True
+    for name, lines in outputs:
+        ok = benchmark(name, lines, args.repeat) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import logging
 import pytest
 
-from .loganalyzer import LogAnalyzer, DisableLogrotateCronContext
+from .loganalyzer import LogAnalyzer, LogAnalyzerError, DisableLogrotateCronContext
 from tests.common.errors import RunAnsibleModuleFail
 from tests.common.helpers.parallel import parallel_run, reset_ansible_local_tmp
 
@@ -9,6 +9,9 @@ from tests.common.helpers.parallel import parallel_run, reset_ansible_local_tmp
 def pytest_addoption(parser):
     parser.addoption("--disable_loganalyzer", action="store_true", default=False,
                      help="disable loganalyzer analysis for 'loganalyzer' fixture")
+    parser.addoption("--loganalyzer_incremental", action="store_true", default=False,
+                     help="analyze only log content appended since the start of the test, tracked by inode and "
+                          "byte offset, instead of searching for the start marker in all rotated log files")
 
 
 @reset_ansible_local_tmp
@@ -36,7 +39,26 @@ def analyzer_add_marker(analyzers, node=None, results=None):
 @reset_ansible_local_tmp
 def analyze_logs(analyzers, markers, node=None, results=None):
     dut_analyzer = analyzers[node.hostname]
-    dut_analyzer.analyze(markers[node.hostname])
+    results[node.hostname] = dut_analyzer.analyze(markers[node.hostname], fail=False)
+
+
+def verify_log_analysis(analyzers, summaries):
+    """
+    Verify analysis results of all DUTs and report failures of all of them in one LogAnalyzerError.
+    """
+    errors = []
+    for hostname, dut_analyzer in analyzers.items():
+        summary = summaries.get(hostname)
+        if not summary or "total" not in summary:
+            errors.append("{}: Log analyzer failed - no result.".format(hostname))
+            continue
+        try:
+            dut_analyzer._verify_log(summary)
+        except LogAnalyzerError as err:
+            errors.append("{}:\n{}".format(hostname, err))
+
+    if errors:
+        raise LogAnalyzerError("\n\n".join(errors))
 
 
 @pytest.fixture(autouse=True)
@@ -50,7 +72,8 @@ def loganalyzer(duthosts, request):
     analyzers = {}
     parallel_run(analyzer_logrotate, [], {}, duthosts, timeout=120)
     for duthost in duthosts:
-        analyzer = LogAnalyzer(ansible_host=duthost, marker_prefix=request.node.name)
+        analyzer = LogAnalyzer(ansible_host=duthost, marker_prefix=request.node.name,
+                               incremental=request.config.getoption("--loganalyzer_incremental"))
         analyzer.load_common_config()
         analyzers[duthost.hostname] = analyzer
     markers = parallel_run(analyzer_add_marker, [analyzers], {}, duthosts, timeout=120)
@@ -62,4 +85,5 @@ def loganalyzer(duthosts, request):
             "rep_setup" in request.node.__dict__ and request.node.rep_setup.skipped:
         return
     logging.info("Starting to analyse on all DUTs")
-    parallel_run(analyze_logs, [analyzers, markers], {}, duthosts, timeout=120)
+    summaries = parallel_run(analyze_logs, [analyzers, markers], {}, duthosts, timeout=120)
+    verify_log_analysis(analyzers, summaries)
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import re
@@ -7,6 +8,7 @@ import pprint
 from . import system_msg_handler
 
 from .system_msg_handler import AnsibleLogAnalyzer as ansible_loganalyzer
+from .system_msg_handler import MessageMatcher
 from os.path import join, split
 
 ANSIBLE_LOGANALYZER_MODULE = system_msg_handler.__file__.replace(r".pyc", ".py")
@@ -14,6 +16,7 @@ COMMON_MATCH = join(split(__file__)[0], "loganalyzer_common_match.txt")
 COMMON_IGNORE = join(split(__file__)[0], "loganalyzer_common_ignore.txt")
 COMMON_EXPECT = join(split(__file__)[0], "loganalyzer_common_expect.txt")
 SYSLOG_TMP_FOLDER = "/tmp/syslog"
+SYSLOG = "/var/log/syslog"
 
 
 class DisableLogrotateCronContext:
@@ -70,7 +73,8 @@ class LogAnalyzerError(Exception):
 
 
 class LogAnalyzer:
-    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp", start_marker=None, additional_files={}):
+    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp", start_marker=None, additional_files={},
+                 incremental=False):
         self.ansible_host = ansible_host
         self.dut_run_dir = dut_run_dir
         self.extracted_syslog = os.path.join(self.dut_run_dir, "syslog")
@@ -88,6 +92,8 @@ class LogAnalyzer:
 
         self.additional_files = list(additional_files.keys())
         self.additional_start_str = list(additional_files.values())
+        # Record inode and byte offset of log files on init and extract only appended content on analyze
+        self.incremental = incremental
 
     def _add_end_marker(self, marker):
         """
@@ -270,11 +276,47 @@ class LogAnalyzer:
         cmd = "python {run_dir}/loganalyzer.py --action init --run_id {start_marker}".format(run_dir=self.dut_run_dir, start_marker=start_marker)
         if log_files:
             cmd += " --logs {}".format(','.join(log_files))
+        if self.incremental:
+            cmd += " --offsets_file {}".format(self._offsets_file(start_marker))
+            if self._offset_tracked_files():
+                cmd += " --track_logs {}".format(','.join(self._offset_tracked_files()))
 
         logging.debug("Adding start marker '{}'".format(start_marker))
         self.ansible_host.command(cmd)
         return start_marker
 
+    def _offsets_file(self, marker):
+        """
+        @summary: Path to the file on the DUT with log file positions recorded on init.
+        """
+        return os.path.join(self.dut_run_dir, "loganalyzer.offsets.{}".format(marker.replace(' ', '_')))
+
+    def _offset_tracked_files(self):
+        """
+        @summary: Additional files which are analyzed from the start marker and can be tracked by offset.
+        """
+        return [path for idx, path in enumerate(self.additional_files)
+                if not self.additional_start_str or self.additional_start_str[idx] == '']
+
+    def _extract_appended_logs(self, marker):
+        """
+        @summary: Extract content appended to tracked log files since init into the DUT run directory.
+
+        @return: Map <log file path, True if extracted>. Log files missing in the map or reported as False
+                 have to be extracted by searching for the start marker.
+        """
+        cmd = "python {run_dir}/loganalyzer.py --action extract --run_id {marker} --offsets_file {offsets_file} " \
+              "--out_dir {run_dir}".format(run_dir=self.dut_run_dir, marker=marker,
+                                           offsets_file=self._offsets_file(marker))
+        output = self.ansible_host.command(cmd)["stdout"]
+        try:
+            extracted = json.loads(output.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            logging.warning("Failed to parse loganalyzer extract output: {}".format(output))
+            return {}
+        logging.debug("Extracted appended logs: {}".format(extracted))
+        return extracted
+
     def analyze(self, marker, fail=True):
         """
         @summary: Extract syslog logs based on the start/stop markers and compose one file. Download composed file, analyze file based on defined regular expressions.
@@ -305,10 +347,16 @@ class LogAnalyzer:
             # Add end marker into DUT syslog
             self._add_end_marker(marker)
 
+            extracted = self._extract_appended_logs(marker) if self.incremental else {}
+
             # On DUT extract syslog files from /var/log/ and create one file by location - /tmp/syslog
-            self.ansible_host.extract_log(directory='/var/log', file_prefix='syslog', start_string=start_string,
-                                          target_filename=self.extracted_syslog)
+            # Custom start marker may have been logged before init, so it is searched for in the whole syslog
+            if self.start_marker or not extracted.get(SYSLOG):
+                self.ansible_host.extract_log(directory='/var/log', file_prefix='syslog', start_string=start_string,
+                                              target_filename=self.extracted_syslog)
             for idx, path in enumerate(self.additional_files):
+                if extracted.get(path):
+                    continue
                 file_dir, file_name = split(path)
                 extracted_file_name = os.path.join(self.dut_run_dir, file_name)
                 if self.additional_start_str and self.additional_start_str[idx] != '':
@@ -337,16 +385,17 @@ class LogAnalyzer:
         logging.debug('    match_regex="{}"'.format(match_messages_regex.pattern if match_messages_regex else ''))
         logging.debug('    ignore_regex="{}"'.format(ignore_messages_regex.pattern if ignore_messages_regex else ''))
         logging.debug('    expect_regex="{}"'.format(expect_messages_regex.pattern if expect_messages_regex else ''))
-        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list(file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex)
+        matcher = MessageMatcher(match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                                 expect_messages=self.expect_regex, ignore_messages=self.ignore_regex)
+        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list(
+            file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex, matcher=matcher,
+            processes=system_msg_handler.default_processes)
         # Print file content and remove the file
         for folder in file_list:
             with open(folder) as fo:
                 logging.debug("{} file content:\n\n{}".format(folder, fo.read()))
             os.remove(folder)
 
-        expected_lines_total = []
-        unused_regex_messages = []
-
         for key, value in analyzer_parse_result.items():
             matching_lines, expecting_lines = value
             analyzer_summary["total"]["match"] += len(matching_lines)
@@ -354,15 +403,8 @@ class LogAnalyzer:
             analyzer_summary["match_files"][key] = {"match": len(matching_lines), "expected_match": len(expecting_lines)}
             analyzer_summary["match_messages"][key] = matching_lines
             analyzer_summary["expect_messages"][key] = expecting_lines
-            expected_lines_total.extend(expecting_lines)
 
-        # Find unused regex matches
-        for regex in self.expect_regex:
-            for line in expected_lines_total:
-                if re.search(regex, line):
-                    break
-            else:
-                unused_regex_messages.append(regex)
+        unused_regex_messages = matcher.unused_expect_messages()
         analyzer_summary["total"]["expected_missing_match"] = len(unused_regex_messages)
         analyzer_summary["unused_expected_regexp"] = unused_regex_messages
         logging.debug("Analyzer summary: {}".format(pprint.pformat(analyzer_summary)))
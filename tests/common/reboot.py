@@ -228,6 +228,10 @@ def reboot(duthost, localhost, reboot_type='cold', delay=10,
     reboot_res, dut_datetime = perform_reboot(duthost, pool, reboot_command, reboot_helper, reboot_kwargs, reboot_type)
 
     wait_for_shutdown(duthost, localhost, delay, timeout, reboot_res)
+    # The pooled ssh connection is broken by the reboot
+    duthost.reset_connection()
+    # Image could be changed by the reboot, cached facts have to be revalidated
+    duthost.invalidate_facts_fingerprint()
     # if wait_for_ssh flag is False, do not wait for dut to boot up
     if not wait_for_ssh:
         return
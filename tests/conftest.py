@@ -24,6 +24,7 @@ from tests.common.devices.k8s import K8sMasterCluster
 from tests.common.devices.duthosts import DutHosts
 from tests.common.devices.vmhost import VMHost
 from tests.common.devices.base import NeighborDevice
+from tests.common.devices.connection_pool import connection_pool, DEFAULT_CONTROL_PERSIST
 from tests.common.devices.cisco import CiscoHost
 from tests.common.helpers.parallel import parallel_run
 from tests.common.fixtures.duthost_utils import backup_and_restore_config_db_session    # noqa F401
@@ -182,10 +183,32 @@ def pytest_addoption(parser):
     parser.addoption("--public_docker_registry", action="store_true", default=False,
                      help="To use public docker registry for syncd swap, by default is disabled (False)")
 
+    ############################
+    #   connection options     #
+    ############################
+    parser.addoption("--ssh_control_persist", action="store", default=DEFAULT_CONTROL_PERSIST, type=int,
+                     help="Seconds to keep the pooled ssh connections to hosts alive when idle, 0 to disable the pool")
+
 
 def pytest_configure(config):
     if config.getoption("enable_macsec"):
         config.pluginmanager.register(MacsecPlugin())
+    connection_pool.control_persist = config.getoption("ssh_control_persist")
+
+
+def pytest_unconfigure(config):
+    connection_pool.close()
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    stats = cache.stats()
+    terminalreporter.write_line("Facts cache: {}".format(
+        ", ".join("{}={}".format(name, value) for name, value in sorted(stats.items()))))
+    for hostname, host_stats in sorted(connection_pool.stats().items()):
+        terminalreporter.write_line(
+            "Connections to {}: commands={} ({:.1f}s), new connections={} ({:.1f}s), resets={}".format(
+                hostname, host_stats["commands"], host_stats["command_time"], host_stats["connects"],
+                host_stats["connect_time"], host_stats["resets"]))
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -0,0 +1,25 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    '''
+        Adds options to FIB pytest
+
+        Args:
+            parser: pytest parser object
+
+        Returns:
+            None
+    '''
+    parser.addoption(
+        "--pipelined_traffic",
+        action="store_true",
+        default=False,
+        help="Send the packets of the balancing checks back-to-back and verify them by the tag in payload, "
+             "instead of one by one"
+    )
+
+
+@pytest.fixture(scope="module")
+def pipelined_traffic(request):
+    return request.config.getoption("--pipelined_traffic")
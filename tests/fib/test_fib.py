@@ -72,7 +72,8 @@ def test_basic_fib(duthosts, ptfhost, ipv4, ipv6, mtu,
                    fib_info_files_per_function,
                    updated_tbinfo, mux_server_url,
                    mux_status_from_nic_simulator,
-                   ignore_ttl, single_fib_for_duts, duts_running_config_facts, duts_minigraph_facts):
+                   ignore_ttl, single_fib_for_duts, duts_running_config_facts, duts_minigraph_facts,
+                   pipelined_traffic):
 
     if 'dualtor' in updated_tbinfo['topo']['name']:
         wait(30, 'Wait some time for mux active/standby state to be stable after toggled mux state')
@@ -108,7 +109,8 @@ def test_basic_fib(duthosts, ptfhost, ipv4, ipv6, mtu,
             "test_balancing": test_balancing,
             "ignore_ttl": ignore_ttl,
             "single_fib_for_duts": single_fib_for_duts,
-            "switch_type": switch_type
+            "switch_type": switch_type,
+            "pipelined": pipelined_traffic
         },
         log_file=log_file,
         qlen=PTF_QLEN,
@@ -277,7 +279,7 @@ def add_default_route_to_dut(duts_running_config_facts, duthosts, tbinfo):
 def test_hash(add_default_route_to_dut, duthosts, fib_info_files_per_function, setup_vlan, hash_keys, ptfhost, ipver,
               toggle_all_simulator_ports_to_rand_selected_tor_m,
               updated_tbinfo, mux_server_url, mux_status_from_nic_simulator,
-              ignore_ttl, single_fib_for_duts, duts_running_config_facts, duts_minigraph_facts):
+              ignore_ttl, single_fib_for_duts, duts_running_config_facts, duts_minigraph_facts, pipelined_traffic):
 
     if 'dualtor' in updated_tbinfo['topo']['name']:
         wait(30, 'Wait some time for mux active/standby state to be stable after toggled mux state')
@@ -309,7 +311,8 @@ def test_hash(add_default_route_to_dut, duthosts, fib_info_files_per_function, s
                 "vlan_ids": VLANIDS,
                 "ignore_ttl":ignore_ttl,
                 "single_fib_for_duts": single_fib_for_duts,
-                "switch_type": switch_type
+                "switch_type": switch_type,
+                "pipelined": pipelined_traffic
                 },
         log_file=log_file,
         qlen=PTF_QLEN,